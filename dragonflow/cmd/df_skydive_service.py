@@ -9,6 +9,7 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+import collections
 import sys
 import uuid
 
@@ -20,6 +21,7 @@ from skydive.websocket import client as skydive_client
 
 from dragonflow.common import utils as df_utils
 from dragonflow import conf as cfg
+from dragonflow.controller.common import constants as ctrl_const
 from dragonflow.controller import df_config
 from dragonflow.controller import service as df_service
 from dragonflow.db import api_nb
@@ -32,6 +34,18 @@ LOG = log.getLogger(__name__)
 DRAGONFLOW_HOST_ID = 'dragonflow-skydive'
 DF_SKYDIVE_NAMESPACE_UUID = uuid.UUID('8a527b24-f0f5-4c1f-8f3d-6de400aa0145')
 
+# Actions after which the changes received may be incomplete
+SYNC_ACTIONS = (
+    ctrl_const.CONTROLLER_REINITIALIZE,
+    ctrl_const.CONTROLLER_SYNC,
+    ctrl_const.CONTROLLER_SYNC_TOPIC,
+    ctrl_const.CONTROLLER_DBRESTART,
+)
+
+
+def _get_node_id(obj_id):
+    return "DF-{}".format(obj_id)
+
 
 class SkydiveClient(cotyledon.Service):
     """Main class that manages all the skydive operation."""
@@ -105,11 +119,31 @@ class SkydiveClient(cotyledon.Service):
 class WSClientDragonflowProtocol(skydive_client.WSClientDebugProtocol):
     """Protocol handler for the SkyDive client.
 
-    This class does the actual work of sending the updates to the analyzer
+    This class does the actual work of sending the updates to the analyzer.
+    It keeps a mirror of the nodes and edges sent to the analyzer. Once
+    connected, it sends all the objects in the database. From then on, it
+    follows the changes published on the pub/sub, and sends only the nodes
+    and edges that were added, updated or deleted.
+
+    When pub/sub is disabled, or with selective topology distribution (where
+    the changes of unknown topics are not received), the database is read
+    every update_interval seconds instead, and compared with the mirror.
     """
     def __init__(self, nb_api):
         super(WSClientDragonflowProtocol, self).__init__()
         self.nb_api = nb_api
+        # Node ID -> node
+        self._nodes = {}
+        # Node ID -> edge ID -> edge, of the edges whose child is the node
+        self._edges = {}
+        # Node ID -> {(child node ID, edge ID)}, of the edges whose parent
+        # is the node
+        self._parent_edges = collections.defaultdict(set)
+        self._connected = False
+        self._streaming = (nb_api.support_publish_subscribe() and
+                           not nb_api.enable_selective_topo_dist)
+        if self._streaming:
+            nb_api.set_db_change_callback(self._db_change_callback)
 
     def reschedule_send(self):
         # Schedule next update
@@ -118,31 +152,116 @@ class WSClientDragonflowProtocol(skydive_client.WSClientDebugProtocol):
         loop.call_later(wait_time, self.send_df_updates)
 
     def send_df_updates(self):
-        """Callback that is called when the client connects to the analyzer
+        """Send the changes in the database since the last update, and
+        schedule the next update.
+        """
+        if not self._connected:
+            return
+        self._sync()
+        self.reschedule_send()
 
-        As the client is working asynchronously, this is where our work is
-        actually being done.
-        We now start sending the updates to skydive periodically.
+    def _send(self, msg_type, obj):
+        msg = skydive_client.WSMessage("Graph", msg_type, obj)
+        self.sendWSMessage(msg)
+
+    def _db_change_callback(self, table, key, action, value, topic=None):
+        """Called by the subscriber thread on every published change. The
+        change is handled in the loop of the websocket client.
         """
-        df_objects = self._get_df_objects()
-        LOG.debug('Sending to skydive: %s', df_objects)
-        for node in df_objects["Nodes"]:
-            node_add_msg = skydive_client.WSMessage(
-                "Graph",
-                skydive_client.NodeAddedMsgType,
-                node
-            )
-            self.sendWSMessage(node_add_msg)
+        if not self._connected:
+            # Handled by the full sync once connected
+            return
+        loop = self.factory.client.loop
+        loop.call_soon_threadsafe(self._handle_db_change, table, key, action,
+                                  value)
 
-        for edge in df_objects["Edges"]:
-            edge_add_msg = skydive_client.WSMessage(
-                "Graph",
-                skydive_client.EdgeAddedMsgType,
-                edge
-            )
-            self.sendWSMessage(edge_add_msg)
+    def _handle_db_change(self, table, key, action, value):
+        if not self._connected:
+            return
+        if action in SYNC_ACTIONS:
+            self._sync()
+            return
+        if table is None:
+            return
+        try:
+            model = mf.get_model(table)
+        except KeyError:
+            return
+        if action == 'delete':
+            self._delete_node(_get_node_id(key))
+        else:
+            instance = self.nb_api.codec.decode(model, value)
+            node, edges = self._get_instance_graph(instance)
+            self._update_node(node)
+            self._update_edges(node['ID'], edges)
 
-        self.reschedule_send()
+    def _get_instance_graph(self, instance):
+        nodes = []
+        edges = []
+        self._output_table_node(nodes, edges, instance)
+        node, = nodes
+        return node, {edge['ID']: edge for edge in edges}
+
+    def _update_node(self, node):
+        node_id = node['ID']
+        old_node = self._nodes.get(node_id)
+        if old_node is None:
+            self._send(skydive_client.NodeAddedMsgType, node)
+        elif old_node != node:
+            self._send(skydive_client.NodeUpdatedMsgType, node)
+        self._nodes[node_id] = node
+
+    def _update_edges(self, node_id, edges):
+        """Send the differences between the edges whose child is node_id,
+        and the given edges. Edge IDs are derived from their child and
+        parent, so that edges with the same ID are the same.
+        """
+        old_edges = self._edges.pop(node_id, {})
+        for edge_id, edge in old_edges.items():
+            if edge_id not in edges:
+                self._send(skydive_client.EdgeDeletedMsgType, edge)
+                self._parent_edges[edge['Parent']].discard(
+                    (node_id, edge_id))
+        for edge_id, edge in edges.items():
+            if edge_id not in old_edges:
+                self._send(skydive_client.EdgeAddedMsgType, edge)
+                self._parent_edges[edge['Parent']].add((node_id, edge_id))
+        if edges:
+            self._edges[node_id] = edges
+
+    def _delete_node(self, node_id):
+        node = self._nodes.pop(node_id, None)
+        if node is None:
+            return
+        # The analyzer deletes the edges of the node along with it
+        for edge in self._edges.pop(node_id, {}).values():
+            self._parent_edges[edge['Parent']].discard(
+                (node_id, edge['ID']))
+        for child_id, edge_id in self._parent_edges.pop(node_id, ()):
+            child_edges = self._edges.get(child_id, {})
+            child_edges.pop(edge_id, None)
+            if not child_edges:
+                self._edges.pop(child_id, None)
+        self._send(skydive_client.NodeDeletedMsgType, node)
+
+    def _sync(self):
+        """Read all the objects in the database, and send their differences
+        from the mirror. Nodes are sent before the edges between them.
+        """
+        graph = {}
+        for table_name in mf.iter_tables():
+            model = mf.get_model(table_name)
+            for instance in self.nb_api.get_all(model):
+                node, edges = self._get_instance_graph(instance)
+                graph[node['ID']] = (node, edges)
+        LOG.debug('Syncing %d nodes to skydive', len(graph))
+
+        for node_id in set(self._nodes) - set(graph):
+            self._delete_node(node_id)
+        for node, edges in graph.values():
+            self._update_node(node)
+        for node_id, (node, edges) in graph.items():
+            self._update_edges(node_id, edges)
 
     def _build_edge_message(self, src_type, src_id, dst_type, dst_id):
         id_str = '{}->{}'.format(src_id, dst_id)
@@ -153,8 +272,8 @@ class WSClientDragonflowProtocol(skydive_client.WSClientDebugProtocol):
         }
         result = {
             'ID': str(uuid.uuid5(DF_SKYDIVE_NAMESPACE_UUID, id_str)),
-            'Child': "DF-{}".format(src_id),
-            'Parent': "DF-{}".format(dst_id),
+            'Child': _get_node_id(src_id),
+            'Parent': _get_node_id(dst_id),
             'Host': 'dragonflow',
             'Metadata': metadata,
         }
@@ -200,7 +319,7 @@ class WSClientDragonflowProtocol(skydive_client.WSClientDebugProtocol):
 
     def _output_table_node(self, nodes, edges, instance):
         metadata = {
-            'ID': "DF-{}".format(instance.id),
+            'ID': _get_node_id(instance.id),
             'Type': WSClientDragonflowProtocol._get_instance_type(instance),
             'source': 'dragonflow',
             'data': instance.to_struct(),
@@ -208,7 +327,7 @@ class WSClientDragonflowProtocol(skydive_client.WSClientDebugProtocol):
         }
         result = {
             'Metadata': metadata,
-            'ID': "DF-{}".format(instance.id),
+            'ID': _get_node_id(instance.id),
             'Host': 'dragonflow'}
         nodes.append(result)
         self._output_table_node_edges(edges, instance)
@@ -225,34 +344,23 @@ class WSClientDragonflowProtocol(skydive_client.WSClientDebugProtocol):
                                             instance.id)
             edges.append(edge)
 
-    def _output_table(self, nodes, edges, table_name):
-        model = mf.get_model(table_name)
-        instances = self.nb_api.get_all(model)
-        for instance in instances:
-            self._output_table_node(nodes, edges, instance)
-
-    def _get_df_objects(self):
-        nodes = []
-        edges = []
-        for table_name in mf.iter_tables():
-            self._output_table(nodes, edges, table_name)
-        result = {
-            'Nodes': nodes,
-            'Edges': edges,
-        }
-        return result
-
     def onOpen(self):
         """Callback that is called when the client connects to the analyzer
 
         As the client is working asynchronously, this is where our work is
         actually being done.
-        We now start sending the updates to skydive periodically.
+        We now send a snapshot of all the objects, and then their changes.
+        The analyzer may not have the nodes sent before a reconnect, so the
+        snapshot is sent in full.
         """
         LOG.debug('onOpen')
-        # TODO(snapiri) have to handle a case in which we got disconnected
-        # and then reconnected.
-        self.reschedule_send()
+        self._nodes.clear()
+        self._edges.clear()
+        self._parent_edges.clear()
+        self._connected = True
+        self._sync()
+        if not self._streaming:
+            self.reschedule_send()
 
     def onClose(self, wasClean, code, reason):
         """Callback that is called when the client disconnects
@@ -270,6 +378,7 @@ class WSClientDragonflowProtocol(skydive_client.WSClientDebugProtocol):
         :type reason: string
         """
         LOG.debug("Client closing %s %s %s", wasClean, code, reason)
+        self._connected = False
         if not wasClean:
             self.factory.loop.stop()
         super(WSClientDragonflowProtocol, self).onClose(wasClean, code, reason)
@@ -123,3 +123,13 @@ class CookieOverflowExcpetion(DragonflowException):
 
 class InvalidEtherTypeException(DragonflowException):
     message = _('Unsupported ethertype: %(ethertype)')
+
+
+class GroupIdOverflowException(DragonflowException):
+    message = _('Group ID overflow: network %(network_id)s is beyond the '
+                'largest network %(max_network_id)s with groups')
+
+
+class ConntrackPermissionDenied(DragonflowException):
+    message = _('Not permitted to delete conntrack entries over netlink: '
+                '%(reason)s')
@@ -0,0 +1,353 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""A lightweight, always enabled, in-process metrics registry.
+
+Metrics are declared once (usually at module level) and updated in place, so
+recording a value costs a dict lookup and a few additions. The registry can
+be rendered in the Prometheus text exposition format, and served over a unix
+socket or a TCP port by MetricsServer.
+
+    >>> UPDATES = metrics.counter('df_updates_total', 'Updates received',
+                                  labelnames=('table',))
+    >>> UPDATES.labels('lport').inc()
+"""
+import bisect
+import collections
+import contextlib
+import os
+import socket
+import threading
+import time
+
+import eventlet
+from oslo_log import log
+
+from dragonflow._i18n import _
+
+
+LOG = log.getLogger(__name__)
+
+# Seconds, suitable for event handlers that are expected to take few ms
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return (str(value).replace('\\', r'\\')
+                      .replace('\n', r'\n')
+                      .replace('"', r'\"'))
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(
+        '{0}="{1}"'.format(name, _escape(value))
+        for name, value in zip(names, values)
+    ) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric(object):
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _create_child(self):
+        raise NotImplementedError()
+
+    def labels(self, *values):
+        '''Returns the metric for the given label values'''
+        try:
+            return self._children[values]
+        except KeyError:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    _('{name} expects labels {labels}').format(
+                        name=self.name, labels=self.labelnames))
+            with self._lock:
+                return self._children.setdefault(values,
+                                                 self._create_child())
+
+    def _samples(self):
+        '''Yields (name suffix, label names, label values, value)'''
+        for values, child in list(self._children.items()):
+            yield '', self.labelnames, values, child.value
+
+    def render(self):
+        lines = [
+            '# HELP {0} {1}'.format(self.name, _escape(self.documentation)),
+            '# TYPE {0} {1}'.format(self.name, self.type_name),
+        ]
+        for suffix, names, values, value in self._samples():
+            lines.append('{0}{1}{2} {3}'.format(
+                self.name, suffix, _format_labels(names, values),
+                _format_value(value)))
+        return '\n'.join(lines)
+
+
+class _CounterChild(object):
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    '''A monotonically increasing value'''
+    type_name = 'counter'
+
+    def _create_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class _GaugeChild(object):
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class Gauge(_Metric):
+    '''A value that can go up and down. If func is given, it is called on
+       each render, and returns the value, or a dict of label values tuple to
+       value for gauges with labels.
+    '''
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), func=None):
+        super(Gauge, self).__init__(name, documentation, labelnames)
+        self.func = func
+
+    def _create_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def _samples(self):
+        if self.func is None:
+            for sample in super(Gauge, self)._samples():
+                yield sample
+            return
+
+        try:
+            result = self.func()
+        except Exception:
+            LOG.exception('Failed to compute metric %s', self.name)
+            return
+
+        if not self.labelnames:
+            result = {(): result}
+        for values, value in sorted(result.items()):
+            yield '', self.labelnames, values, value
+
+
+class _HistogramChild(object):
+    __slots__ = ('upper_bounds', 'buckets', 'sum', 'count')
+
+    def __init__(self, upper_bounds):
+        self.upper_bounds = upper_bounds
+        self.buckets = [0] * len(upper_bounds)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.upper_bounds, value)
+        if index < len(self.buckets):
+            self.buckets[index] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextlib.contextmanager
+    def time(self):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - start)
+
+
+class Histogram(_Metric):
+    '''Counts observed values (e.g. latencies) in cumulative buckets'''
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.upper_bounds = tuple(sorted(buckets))
+
+    def _create_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _samples(self):
+        names = self.labelnames + ('le',)
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.upper_bounds, child.buckets):
+                cumulative += count
+                yield '_bucket', names, values + (_format_value(bound),), \
+                    cumulative
+            yield '_bucket', names, values + ('+Inf',), child.count
+            yield '_sum', self.labelnames, values, child.sum
+            yield '_count', self.labelnames, values, child.count
+
+
+class Registry(object):
+    def __init__(self):
+        self._metrics = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        '''Adds metric to the registry. If a metric of the same name and type
+           is already registered, it is returned instead.
+        '''
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is None:
+                self._metrics[metric.name] = metric
+                return metric
+
+        if type(existing) is not type(metric):
+            raise ValueError(
+                _('Metric {name} is already registered as {type}').format(
+                    name=metric.name, type=existing.type_name))
+        return existing
+
+    def unregister(self, name):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        '''Returns all metrics in the Prometheus text exposition format'''
+        return ''.join(metric.render() + '\n'
+                       for metric in list(self._metrics.values()))
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=(), func=None):
+    metric = REGISTRY.register(Gauge(name, documentation, labelnames))
+    if func is not None:
+        metric.func = func
+    return metric
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(
+        Histogram(name, documentation, labelnames, buckets))
+
+
+class MetricsServer(object):
+    '''Serves the metrics of a registry over HTTP, on a unix socket and/or a
+       TCP port, for Prometheus or e.g.
+
+        curl --unix-socket /var/run/df-metrics.sock http://localhost/metrics
+    '''
+
+    _MAX_REQUEST_SIZE = 8192
+    _TIMEOUT = 5
+
+    def __init__(self, registry=REGISTRY, socket_path=None, host=None,
+                 port=None):
+        self._registry = registry
+        self._socket_path = socket_path
+        self._host = host
+        self._port = port
+        self._servers = []
+
+    def start(self):
+        if self._socket_path:
+            if os.path.exists(self._socket_path):
+                os.unlink(self._socket_path)
+            self._start_server(eventlet.listen(self._socket_path,
+                                               family=socket.AF_UNIX))
+            LOG.info('Serving metrics on %s', self._socket_path)
+        if self._port:
+            self._start_server(eventlet.listen((self._host, self._port)))
+            LOG.info('Serving metrics on %s:%s', self._host, self._port)
+
+    def _start_server(self, sock):
+        thread = eventlet.spawn(self._serve, sock)
+        self._servers.append((sock, thread))
+
+    def stop(self):
+        for sock, thread in self._servers:
+            thread.kill()
+            sock.close()
+        self._servers = []
+        if self._socket_path and os.path.exists(self._socket_path):
+            os.unlink(self._socket_path)
+
+    def _serve(self, sock):
+        while True:
+            conn, _addr = sock.accept()
+            eventlet.spawn_n(self._handle, conn)
+
+    def _read_request(self, conn):
+        request = b''
+        while b'\r\n\r\n' not in request and b'\n\n' not in request:
+            data = conn.recv(1024)
+            if not data:
+                break
+            request += data
+            if len(request) > self._MAX_REQUEST_SIZE:
+                break
+        return request
+
+    def _handle(self, conn):
+        try:
+            conn.settimeout(self._TIMEOUT)
+            self._read_request(conn)
+            body = self._registry.render().encode('utf-8')
+            conn.sendall(
+                b'HTTP/1.0 200 OK\r\n'
+                b'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                b'Content-Length: ' + str(len(body)).encode('ascii') +
+                b'\r\n\r\n' + body)
+        except Exception:
+            LOG.exception('Failed to serve metrics')
+        finally:
+            conn.close()
@@ -25,6 +25,7 @@ from dragonflow.conf import df_metadata_service
 from dragonflow.conf import df_os_ken
 from dragonflow.conf import df_provider_networks
 from dragonflow.conf import df_redis
+from dragonflow.conf import df_sg
 from dragonflow.conf import df_skydive
 from dragonflow.conf import df_snat
 from dragonflow.conf import df_zmq
@@ -43,6 +44,7 @@ df_l2.register_opts()
 df_l3.register_opts()
 df_dnat.register_opts()
 df_redis.register_opts()
+df_sg.register_opts()
 df_zmq.register_opts()
 df_os_ken.register_opts()
 df_provider_networks.register_opts()
@@ -50,6 +50,13 @@ df_cassandra_opts = [
         help=_('The hosts to permit connections to for wl_rr load balancing '
                'policy. Please specify a list of hosts by comma.'),
     ),
+    cfg.IntOpt(
+        'fetch_size',
+        default=1000,
+        min=1,
+        help=_('The number of rows fetched in each page when reading whole '
+               'tables, or all the objects of a topic.'),
+    ),
 ]
 
 
@@ -30,6 +30,26 @@ df_opts = [
     cfg.StrOpt('nb_db_class',
                default='etcd_nb_db_driver',
                help=_('The driver to use for the NB database')),
+    cfg.IntOpt('unique_key_block_size',
+               default=64,
+               min=1,
+               help=_('Number of unique keys the NB database driver allocates '
+                      'at once, and hands out to the objects created by the '
+                      'process. Unused keys are returned to the database '
+                      'when the process exits, if no keys were allocated '
+                      'since. Used by the etcd, ZooKeeper and Cassandra '
+                      'drivers.')),
+    cfg.IntOpt('zookeeper_max_concurrent_reads',
+               default=64,
+               min=1,
+               help=_('Maximal number of reads the ZooKeeper NB database '
+                      'driver keeps in flight when reading many keys.')),
+    cfg.BoolOpt('zookeeper_topic_index',
+                default=False,
+                help=_('Index the keys of the ZooKeeper NB database by topic, '
+                       'so that reading the objects of a topic only reads '
+                       'that topic. Must be set on all nodes writing to the '
+                       'NB database, before any object is written.')),
     cfg.IPOpt('local_ip',
               default='127.0.0.1',
               help=_('Local host VTEP IP')),
@@ -62,6 +82,13 @@ df_opts = [
     cfg.StrOpt('pub_sub_driver',
                default='zmq_pubsub_driver',
                help=_('Drivers to use for the Dragonflow pub/sub')),
+    cfg.BoolOpt('etcd_pubsub_single_watch',
+                default=False,
+                help=_('With the etcd pub/sub driver, watch all the topics '
+                       'with a single prefix watch, instead of a watch (and '
+                       'a thread) per topic. Events of other topics are '
+                       'received and dropped locally. After a reconnect, '
+                       'the watch resumes from the last seen revision.')),
     cfg.BoolOpt('enable_neutron_notifier',
                 default=False,
                 help=_('Enable notifier for Dragonflow controller sending '
@@ -94,6 +121,42 @@ df_opts = [
         default=120,
         help=_('Min periodically db comparison time')
     ),
+    cfg.BoolOpt(
+        'enable_incremental_sync',
+        default=False,
+        help=_('When enabled, the periodic db comparison only re-reads NB '
+               'tables whose revision changed since the last comparison. '
+               'Requires an NB database driver that reports table '
+               'revisions, other drivers always re-read all tables. Must be '
+               'set on all nodes writing to the NB database.')
+    ),
+    cfg.StrOpt(
+        'metrics_socket',
+        default='',
+        help=_('Path of a unix socket on which the local controller serves '
+               'its metrics in the Prometheus text format, over HTTP. '
+               'Disabled when empty.')
+    ),
+    cfg.HostAddressOpt(
+        'metrics_host',
+        default='127.0.0.1',
+        help=_('Address on which the local controller serves its metrics, '
+               'if metrics_port is set.')
+    ),
+    cfg.PortOpt(
+        'metrics_port',
+        default=0,
+        help=_('TCP port on which the local controller serves its metrics in '
+               'the Prometheus text format. Disabled when 0.')
+    ),
+    cfg.BoolOpt(
+        'compact_db_store',
+        default=False,
+        help=_('Keep the objects in the local cache as compact records '
+               'instead of model instances. This reduces the memory used '
+               'for large deployments, at the cost of re-creating objects '
+               'on lookup.')
+    ),
     cfg.IntOpt(
         'publisher_rate_limit_timeout',
         default=180,
@@ -110,6 +173,41 @@ df_opts = [
             'this many times per $publisher_rate_limit_timeout seconds.'
         )
     ),
+    cfg.IntOpt(
+        'publisher_batch_max_size',
+        default=100,
+        min=1,
+        help=_('Maximal number of updates the publisher service sends in a '
+               'single message, per topic. 1 disables batching.')
+    ),
+    cfg.FloatOpt(
+        'publisher_batch_max_latency',
+        default=0.0,
+        min=0.0,
+        help=_('Seconds the publisher service waits for more updates to '
+               'batch with the first one. With 0, only the updates already '
+               'queued are batched.')
+    ),
+    cfg.StrOpt(
+        'pub_sub_compression',
+        default='none',
+        choices=('none', 'zlib', 'zstd', 'lz4'),
+        help=_('Compression of the pub/sub messages sent by publishers. '
+               'zstd and lz4 require the zstandard and lz4 python packages, '
+               'on the publishers and on all the subscribers.')
+    ),
+    cfg.StrOpt(
+        'model_codec',
+        default='trusted_json',
+        choices=('json', 'trusted_json', 'msgpack'),
+        help=_('Encoding of the objects in the NB database and in pub/sub '
+               'messages. json validates the objects it reads. '
+               'trusted_json skips the validation of the objects read, '
+               'which were validated when written. msgpack is like '
+               'trusted_json, but pub/sub messages carry the objects as '
+               'msgpack structs rather than JSON strings. Subscribers '
+               'decode objects of any of them.')
+    ),
     cfg.FloatOpt('monitor_table_poll_time',
                  default=30,
                  help=_('Poll monitored tables every this number of seconds')),
@@ -158,6 +256,18 @@ df_opts = [
                default=10,
                help=_('The max delay in seconds for Neutron to report heart'
                       'beat to df-db')),
+    cfg.IntOpt('neutron_listener_cache_ttl',
+               default=60,
+               help=_('The max age in seconds of the Neutron listeners '
+                      'cached by the local controller to choose where to '
+                      'send notifications. The cache is also updated by '
+                      'listener events.')),
+    cfg.FloatOpt('neutron_notify_flush_interval',
+                 default=0.1,
+                 help=_('Interval in seconds in which notifications to '
+                        'Neutron, e.g. port status updates, are collected '
+                        'and sent in one message per Neutron listener. '
+                        'Notifications are sent immediately when 0.')),
     cfg.StrOpt('external_host_ip',
                help=_("Compute node external IP")),
     cfg.BoolOpt('auto_detect_port_behind_port',
@@ -22,7 +22,29 @@ df_os_ken_opts = [
     cfg.IPOpt('of_listen_address', default='127.0.0.1',
               help=_("Address to listen on for OpenFlow connections.")),
     cfg.PortOpt('of_listen_port', default=ofproto_common.OFP_TCP_PORT,
-                help=_("Port to listen on for OpenFlow connections."))
+                help=_("Port to listen on for OpenFlow connections.")),
+    cfg.BoolOpt('enable_flow_batching', default=True,
+                help=_("Send the flow and group modifications made while "
+                       "handling a single controller event or packet-in "
+                       "together, in one write to the switch.")),
+    cfg.IntOpt('flow_batch_max_size', default=1000, min=1,
+               help=_("Maximal number of OpenFlow messages sent to the "
+                      "switch in one batched write.")),
+    cfg.BoolOpt('enable_flow_bundles', default=False,
+                help=_("Wrap each batch of flow and group modifications in "
+                       "an atomic, ordered OpenFlow bundle, so that the "
+                       "switch applies all of them or none. Requires a "
+                       "switch supporting the ONF bundle extension, e.g. "
+                       "Open vSwitch 2.6 or later.")),
+    cfg.IntOpt('flow_dump_attempts', default=3, min=1,
+               help=_("Number of attempts to dump the switch flows when "
+                      "reconciling them after a resync. If all of them "
+                      "fail, all the flows of the switch are replaced.")),
+    cfg.IntOpt('flow_reconcile_timeout', default=120, min=1,
+               help=_("Maximal time, in seconds, that flow modifications are "
+                      "held back while the switch resyncs. If the resync "
+                      "does not finish in time, the flows are reconciled "
+                      "and sent anyway.")),
 ]
 
 
@@ -0,0 +1,39 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo_config import cfg
+
+from dragonflow._i18n import _
+
+
+df_sg_app_opts = [
+    cfg.StrOpt(
+        'conntrack_driver',
+        default='conntrack_cli',
+        choices=['netlink', 'conntrack_cli'],
+        help=_('How connection tracking entries are deleted when security '
+               'group rules or port addresses are removed. conntrack_cli '
+               'runs the conntrack tool as root once per filter. netlink '
+               'dumps the conntrack table once per batch of deletions, and '
+               'deletes the matching entries over netlink (requires '
+               'pyroute2, and the CAP_NET_ADMIN capability in the '
+               'controller). When netlink is not permitted, the conntrack '
+               'tool is used instead.')),
+]
+
+
+def register_opts():
+    cfg.CONF.register_opts(df_sg_app_opts, group='df_sg_app')
+
+
+def list_opts():
+    return {'df_sg_app': df_sg_app_opts}
@@ -26,7 +26,8 @@ df_skydive_app_opts = [
                help=_('password to authenticate to the skydive analyzer.')),
     cfg.IntOpt('update_interval',
                default=10,
-               help=_('Interval (in seconds) between data updates.')),
+               help=_('Interval (in seconds) between data updates, when '
+                      'the changes are not received over pub/sub.')),
 ]
 
 
@@ -16,81 +16,100 @@
 import eventlet
 from oslo_log import log
 
+from dragonflow import conf as cfg
 from dragonflow.controller.common import constants as const
-from dragonflow.controller.common import cookies
 from dragonflow.controller import df_base_app
 
 LOG = log.getLogger(__name__)
 
 
-AGING_COOKIE_NAME = 'aging'
+class AgingApp(df_base_app.DFlowApp):
+    """Removes the stale flows and groups of a previous run (or connection)
+    from the switch, without re-installing the ones that are still in use.
 
+    The switch keeps its flows and groups while the controller is
+    disconnected, since its fail mode is secure. The canary flow tells
+    whether the switch has flows of a previous run. If it has, the flow and
+    group modifications of the apps during the switch sync only update the
+    desired flows and groups of the flow_reconciler, and when the sync is
+    done, the flows and groups on the switch are dumped, and only the
+    difference is sent. If it has not, any groups left on the switch are
+    deleted, so that the apps can add theirs.
 
-class AgingApp(df_base_app.DFlowApp):
+    If the switch sync does not finish within flow_reconcile_timeout, e.g.
+    the vswitch failed to initialize, the flows are reconciled anyway, so
+    that flow modifications are not held back forever.
+    """
 
     def __init__(self, *args, **kwargs):
         super(AgingApp, self).__init__(*args, **kwargs)
-        self.do_aging = True
-        self._aging_cookie = 0
-        cookies.add_global_cookie_modifier(AGING_COOKIE_NAME, 1,
-                                           lambda x: self._aging_cookie)
+        self._reconcile_timer = None
 
-    """
-    check_aging_needed()
-        -> get_canary_flow()
-            -> canary flow exist, get canary cookie
-            -> no canary flow, i.e., first boot or ovs restart, no need to do
-               aging
-        -> renew_aging_cookie()
-        -> add canary flows with new cookie
-    after all apps flushed flows with new cookie, switch_sync_finished() will
-    be called
-    """
     def switch_sync_started(self):
-        LOG.info("start aging")
         canary_flow = self._get_canary_flow()
         if not canary_flow:
-            self.do_aging = False
-            self._aging_cookie = 1
-            LOG.info("no canary table, don't do aging")
+            LOG.info("no canary flow, don't reconcile flows")
+            # Without flows, no flow forwards to the groups left
+            self.del_group(self.ofproto.OFPG_ALL, self.ofproto.OFPGT_ALL)
         else:
-            self.do_aging = True
-            canary_cookie = canary_flow.cookie
-            old_cookie = cookies.extract_value_from_cookie(AGING_COOKIE_NAME,
-                                                           canary_cookie)
-            self._aging_cookie = self._invert_cookie(old_cookie)
-            LOG.info("renew cookie, old: %(old)x new: %(new)x",
-                     {'old': canary_cookie, 'new': self._aging_cookie})
-        # NOTE(oanson) cookie will be set automatically with _aging_cookie
+            LOG.info("start reconciling flows")
+            self.api.flow_reconciler.start()
+            self._start_reconcile_timer()
         self.mod_flow(table_id=const.CANARY_TABLE)
 
-    """
-    now all apps had flushed flows with new cookie
-    delete flows with old cookie
-    """
     def switch_sync_finished(self):
-        if self.do_aging:
-            # Give apps a few more seconds to finish their magic
-            eventlet.spawn_after(5, self._start_aging)
-            LOG.info("Scheduled aged flows deletion")
-
-    def _invert_cookie(self, cookie):
-        return 1 ^ cookie
-
-    def _start_aging(self):
-        inverted_cookie = self._invert_cookie(self._aging_cookie)
-        old_cookie, old_mask = cookies.get_cookie(AGING_COOKIE_NAME,
-                                                  inverted_cookie)
-        self._cleanup_flows(old_cookie, old_mask)
-        LOG.info("Scheduled aged flows deletion completed!")
-
-    def _cleanup_flows(self, cookie, cookie_mask):
-        self.mod_flow(cookie=cookie,
-                      cookie_mask=cookie_mask,
-                      table_id=self.ofproto.OFPTT_ALL,
-                      match=self.parser.OFPMatch(),
-                      command=self.ofproto.OFPFC_DELETE,
-                      priority=0)
+        self._cancel_reconcile_timer()
+        reconciler = self.api.flow_reconciler
+        if not reconciler.reconciling:
+            return
+
+        actual_flows = self._dump_flows()
+        actual_groups = self.get_groups()
+        if actual_flows is None or actual_groups is None:
+            LOG.error("Failed to dump the switch flows or groups, replacing "
+                      "all of them")
+        changes = reconciler.get_changes(self.datapath, actual_flows,
+                                         actual_groups)
+        # The changes are already applied to the desired flows
+        flow_batcher = self.api.flow_batcher
+        with flow_batcher.batch():
+            for message in changes:
+                flow_batcher.send_msg(self.datapath, message)
+
+    def _dump_flows(self):
+        """Returns the flows on the switch, or None if they could not be
+        dumped. get_flows() returns no flows on error, and the switch has at
+        least the canary flow of the previous run, so no flows is a failure.
+        """
+        attempts = cfg.CONF.df_os_ken.flow_dump_attempts
+        for attempt in range(1, attempts + 1):
+            flows = self.get_flows()
+            if flows:
+                return flows
+            LOG.warning("No flows dumped from the switch, attempt "
+                        "%(attempt)d of %(attempts)d",
+                        {'attempt': attempt, 'attempts': attempts})
+        return None
+
+    def _start_reconcile_timer(self):
+        self._cancel_reconcile_timer()
+        self._reconcile_timer = eventlet.spawn_after(
+            cfg.CONF.df_os_ken.flow_reconcile_timeout,
+            self._reconcile_timed_out)
+
+    def _cancel_reconcile_timer(self):
+        if self._reconcile_timer is not None:
+            self._reconcile_timer.cancel()
+            self._reconcile_timer = None
+
+    def _reconcile_timed_out(self):
+        self._reconcile_timer = None
+        LOG.warning("The switch sync did not finish in %d seconds, "
+                    "reconciling the flows",
+                    cfg.CONF.df_os_ken.flow_reconcile_timeout)
+        # Finish on the controller's event loop, like a switch sync
+        self.api.db_change_callback(
+            None, None, const.CONTROLLER_SWITCH_SYNC_FINISHED, None)
 
     def _get_canary_flow(self):
         canary_flow = self.get_flows(table_id=const.CANARY_TABLE)
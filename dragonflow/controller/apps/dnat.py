@@ -376,12 +376,11 @@ class DNATApp(df_base_app.DFlowApp):
 
     def _get_external_subnet(self, fip):
         floating_lport = fip.floating_lport
-        subnets = self.db_store.get_all(
-            l2.Subnet(lswitch=floating_lport.lswitch.id),
-            index=l2.Subnet.get_index('lswitch'))
-        for subnet in subnets:
-            if fip.floating_ip_address in subnet.cidr:
-                return subnet
+        subnets = self.db_store.query(
+            l2.Subnet,
+            equals={'lswitch.id': floating_lport.lswitch.id},
+            contains={'cidr': fip.floating_ip_address})
+        return next(subnets, None)
 
     def _get_external_cidr(self, fip):
         return self._get_external_subnet(fip).cidr
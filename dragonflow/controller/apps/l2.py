@@ -21,9 +21,11 @@ from os_ken.lib.packet import in_proto
 from os_ken.ofproto import ether
 from oslo_log import log
 
+from dragonflow.common import exceptions
 from dragonflow import conf as cfg
 from dragonflow.controller.common import arp_responder
 from dragonflow.controller.common import constants as const
+from dragonflow.controller.common import logical_networks
 from dragonflow.controller.common import nd_advertisers
 from dragonflow.controller import df_base_app
 from dragonflow.db.models import constants as model_constants
@@ -31,20 +33,67 @@ from dragonflow.db.models import l2
 
 LOG = log.getLogger(__name__)
 
+# Broadcast, unknown unicast and multicast (BUM) traffic of a network is
+# replicated to its local ports by OpenFlow ALL groups. The ports are spread
+# over port groups of up to _BUM_PORTS_PER_GROUP buckets, and a network group
+# has one bucket per port group. A port joining or leaving a network modifies
+# one port group, so the group modification does not grow with the number of
+# ports in the network.
+_BUM_PORTS_PER_GROUP = 32
+# Group IDs of a network are 1<<31 | network_id<<8 | index<<1 | direction,
+# where index 0 is the network group. Bit 31 keeps them apart from the SFC
+# group IDs. network_id has the 23 bits left, less the last network, whose
+# group IDs would be the reserved OFPG_* IDs.
+_BUM_GROUP_ID_BASE = 1 << 31
+_BUM_MAX_NETWORK_ID = (1 << 23) - 2
+_BUM_MAX_PORT_GROUPS = 127
+_BUM_EGRESS = 0
+_BUM_INGRESS = 1
+
+
+def _get_bum_group_id(network_id, direction, index=0):
+    if not 0 <= network_id <= _BUM_MAX_NETWORK_ID:
+        raise exceptions.GroupIdOverflowException(
+            network_id=network_id, max_network_id=_BUM_MAX_NETWORK_ID)
+    return _BUM_GROUP_ID_BASE | (network_id << 8) | (index << 1) | direction
+
 
 class _LocalNetwork(object):
     def __init__(self):
-        self.local_ports = {}
-        self.remote_ports = {}
-
-    def is_empty(self):
-        return not self.local_ports and not self.remote_ports
+        # BUM port group index -> {lport_id: port_key}
+        self.port_groups = {}
+        # lport_id -> BUM port group index
+        self.port_group_index = {}
+
+    def add_to_port_group(self, lport_id, port_key):
+        '''Returns the index of the port group the port was added to, or
+           None if all the port groups are full
+        '''
+        for index in range(1, _BUM_MAX_PORT_GROUPS + 1):
+            ports = self.port_groups.setdefault(index, {})
+            if len(ports) < _BUM_PORTS_PER_GROUP:
+                ports[lport_id] = port_key
+                self.port_group_index[lport_id] = index
+                return index
+        return None
+
+    def remove_from_port_group(self, lport_id):
+        '''Returns the index of the port group the port was removed from'''
+        index = self.port_group_index.pop(lport_id, None)
+        if index is None:
+            return None
+        ports = self.port_groups[index]
+        del ports[lport_id]
+        if not ports:
+            del self.port_groups[index]
+        return index
 
 
 class L2App(df_base_app.DFlowApp):
     def __init__(self, *args, **kwargs):
         super(L2App, self).__init__(*args, **kwargs)
         self.local_networks = collections.defaultdict(_LocalNetwork)
+        self.logical_networks = logical_networks.LogicalNetworks()
         self.integration_bridge = cfg.CONF.df.integration_bridge
         self.is_install_l2_responder = cfg.CONF.df_l2_app.l2_responder
 
@@ -86,6 +135,7 @@ class L2App(df_base_app.DFlowApp):
         # Clear local networks cache so the multicast/broadcast flows
         # are installed correctly
         self.local_networks.clear()
+        self.logical_networks = logical_networks.LogicalNetworks()
 
     def _add_l2_responders(self, lport):
         if not self.is_install_l2_responder:
@@ -160,34 +210,41 @@ class L2App(df_base_app.DFlowApp):
             match=match)
 
         # Update multicast and broadcast
-        self._del_multicast_broadcast_handling_for_local(
-            lport.id,
-            lport.topic,
-            local_network_id)
-
-    def _del_multicast_broadcast_handling_for_local(self,
-                                                    lport_id,
-                                                    topic,
-                                                    local_network_id):
-        # update local ports
-        network = self.local_networks.get(local_network_id)
-        if network is None:
-            return
+        self._del_multicast_broadcast_handling_for_local(lport.id)
 
-        if lport_id not in network.local_ports:
+    def _del_multicast_broadcast_handling_for_local(self, lport_id):
+        # update local ports, of the network the port was added to
+        port_network = self.logical_networks.get_local_port_network(lport_id)
+        if port_network is None:
             return
 
-        del network.local_ports[lport_id]
+        local_network_id, network_type = port_network
+        self.logical_networks.remove_local_port(port_id=lport_id,
+                                                network_id=local_network_id,
+                                                network_type=network_type)
+        network = self.local_networks[local_network_id]
+        index = network.remove_from_port_group(lport_id)
 
-        if not network.local_ports:
+        if not self.logical_networks.get_local_port_count(local_network_id):
             self._del_multicast_broadcast_flows_for_local(local_network_id)
-            if network.is_empty():
-                del self.local_networks[local_network_id]
+            self._mod_bum_groups(local_network_id, 0,
+                                 self.ofproto.OFPGC_DELETE)
+            if index is not None:
+                self._mod_bum_groups(local_network_id, index,
+                                     self.ofproto.OFPGC_DELETE)
+            del self.local_networks[local_network_id]
+        elif index is None:
+            return
+        elif index not in network.port_groups:
+            # The port group is empty. Remove it from the network groups
+            # before deleting it
+            self._mod_bum_groups(local_network_id, 0,
+                                 self.ofproto.OFPGC_MODIFY, network)
+            self._mod_bum_groups(local_network_id, index,
+                                 self.ofproto.OFPGC_DELETE)
         else:
-            self._update_multicast_broadcast_flows_for_local(
-                network.local_ports,
-                topic,
-                local_network_id)
+            self._mod_bum_groups(local_network_id, index,
+                                 self.ofproto.OFPGC_MODIFY, network)
 
     def _del_multicast_broadcast_flows_for_local(self, local_network_id):
         ofproto = self.ofproto
@@ -210,56 +267,88 @@ class L2App(df_base_app.DFlowApp):
             priority=const.PRIORITY_HIGH,
             match=match)
 
-    def _update_multicast_broadcast_flows_for_local(self, local_ports, topic,
-                                                    local_network_id):
+    def _add_multicast_broadcast_flows_for_local(self, local_network_id):
         parser = self.parser
         ofproto = self.ofproto
-        command = ofproto.OFPFC_MODIFY
-
-        # Ingress broadcast
-        ingress = []
-        egress = []
 
-        for port_id_in_network in local_ports:
-            lean_lport = l2.LogicalPort(id=port_id_in_network, topic=topic)
-            lport = self.db_store.get_one(lean_lport)
-            if lport is None:
-                continue
-            port_key_in_network = local_ports[port_id_in_network]
-
-            egress.append(parser.OFPActionSetField(reg7=port_key_in_network))
-            egress.append(parser.NXActionResubmitTable(
-                table_id=const.EGRESS_TABLE))
-
-            ingress.append(parser.OFPActionSetField(reg7=port_key_in_network))
-            ingress.append(parser.NXActionResubmitTable(
-                table_id=const.INGRESS_CONNTRACK_TABLE))
-
-        egress.append(parser.OFPActionSetField(reg7=0))
-        egress.append(parser.NXActionResubmitTable(
-            table_id=const.EGRESS_TABLE))
         # Egress broadcast
         match = self._get_multicast_broadcast_match(local_network_id)
         egress_inst = [parser.OFPInstructionActions(
-            ofproto.OFPIT_APPLY_ACTIONS, egress)]
+            ofproto.OFPIT_APPLY_ACTIONS,
+            [parser.OFPActionGroup(
+                _get_bum_group_id(local_network_id, _BUM_EGRESS))])]
         self.mod_flow(
             inst=egress_inst,
             table_id=const.L2_LOOKUP_TABLE,
-            command=command,
+            command=ofproto.OFPFC_ADD,
             priority=const.PRIORITY_MEDIUM,
             match=match)
 
         # Ingress broadcast
         match = self._get_multicast_broadcast_match(local_network_id)
         ingress_inst = [parser.OFPInstructionActions(
-            ofproto.OFPIT_APPLY_ACTIONS, ingress)]
+            ofproto.OFPIT_APPLY_ACTIONS,
+            [parser.OFPActionGroup(
+                _get_bum_group_id(local_network_id, _BUM_INGRESS))])]
         self.mod_flow(
             inst=ingress_inst,
             table_id=const.INGRESS_DESTINATION_PORT_LOOKUP_TABLE,
-            command=command,
+            command=ofproto.OFPFC_ADD,
             priority=const.PRIORITY_HIGH,
             match=match)
 
+    def _get_bum_buckets(self, network, local_network_id, direction, index):
+        parser = self.parser
+        if index:
+            # Port group: a copy per port, to the egress table or to the
+            # ingress pipeline of the port
+            if direction == _BUM_EGRESS:
+                table_id = const.EGRESS_TABLE
+            else:
+                table_id = const.INGRESS_CONNTRACK_TABLE
+            return [
+                parser.OFPBucket(actions=[
+                    parser.OFPActionSetField(reg7=port_key),
+                    parser.NXActionResubmitTable(table_id=table_id),
+                ])
+                for port_key in network.port_groups[index].values()
+            ]
+
+        # Network group: a copy per port group
+        buckets = [
+            parser.OFPBucket(actions=[parser.OFPActionGroup(
+                _get_bum_group_id(local_network_id, direction,
+                                  port_group_index))])
+            for port_group_index in sorted(network.port_groups)
+        ]
+        if direction == _BUM_EGRESS:
+            # and a copy to the egress table for the remote ports
+            buckets.append(parser.OFPBucket(actions=[
+                parser.OFPActionSetField(reg7=0),
+                parser.NXActionResubmitTable(table_id=const.EGRESS_TABLE),
+            ]))
+        return buckets
+
+    def _mod_bum_groups(self, local_network_id, index, command,
+                        network=None):
+        '''Adds, modifies or deletes the egress and ingress BUM groups of
+           a network. Index 0 is the network group, other indexes are port
+           groups.
+        '''
+        ofproto = self.ofproto
+        for direction in (_BUM_EGRESS, _BUM_INGRESS):
+            group_id = _get_bum_group_id(local_network_id, direction, index)
+            if command == ofproto.OFPGC_DELETE:
+                self.del_group(group_id, ofproto.OFPGT_ALL)
+                continue
+
+            buckets = self._get_bum_buckets(network, local_network_id,
+                                            direction, index)
+            # Groups left on the switch by a previous run are reconciled by
+            # the flow reconciler, and are not deleted and added again, since
+            # that would delete the flows that forward to them
+            self._mod_group(command, group_id, ofproto.OFPGT_ALL, buckets)
+
     def _add_dst_classifier_flow_for_port(self, network_id, mac, port_key):
         parser = self.parser
         ofproto = self.ofproto
@@ -311,7 +400,7 @@ class L2App(df_base_app.DFlowApp):
         mac = lport.mac
         port_key = lport.unique_key
         network_id = lport.lswitch.unique_key
-        topic = lport.topic
+        network_type = lport.lswitch.network_type
 
         parser = self.parser
         ofproto = self.ofproto
@@ -343,73 +432,53 @@ class L2App(df_base_app.DFlowApp):
         self._add_multicast_broadcast_handling_for_local_port(lport_id,
                                                               port_key,
                                                               network_id,
-                                                              topic)
+                                                              network_type)
 
     def _add_multicast_broadcast_handling_for_local_port(self,
                                                          lport_id,
                                                          port_key,
                                                          network_id,
-                                                         topic):
-        parser = self.parser
+                                                         network_type):
         ofproto = self.ofproto
-        command = ofproto.OFPFC_MODIFY
-
-        local_network = self.local_networks[network_id]
-        if not local_network.local_ports:
-            command = ofproto.OFPFC_ADD
-
-        local_network.local_ports[lport_id] = port_key
-
-        ingress = []
-        ingress.append(parser.OFPActionSetField(reg7=port_key))
-        ingress.append(parser.NXActionResubmitTable(
-            table_id=const.INGRESS_CONNTRACK_TABLE))
-
-        egress = []
 
-        egress.append(parser.OFPActionSetField(reg7=port_key))
-        egress.append(parser.NXActionResubmitTable(
-            table_id=const.EGRESS_TABLE))
+        if self.logical_networks.get_local_port_network(lport_id):
+            # Re-added, possibly to another network
+            self._del_multicast_broadcast_handling_for_local(lport_id)
 
-        for port_id_in_network in local_network.local_ports:
-            lean_lport = l2.LogicalPort(id=port_id_in_network, topic=topic)
-            lport = self.db_store.get_one(lean_lport)
-            if lport is None or lport_id == lport.id:
-                continue
-            port_key_in_network = local_network.local_ports[port_id_in_network]
-
-            egress.append(parser.OFPActionSetField(reg7=port_key_in_network))
-            egress.append(parser.NXActionResubmitTable(
-                table_id=const.EGRESS_TABLE))
+        if network_id > _BUM_MAX_NETWORK_ID:
+            LOG.error('Broadcast and multicast traffic of network %(net)s '
+                      'is not replicated to port %(port)s: networks beyond '
+                      '%(max)s have no group IDs',
+                      {'net': network_id, 'port': lport_id,
+                       'max': _BUM_MAX_NETWORK_ID})
+            return
 
-            ingress.append(parser.OFPActionSetField(reg7=port_key_in_network))
-            ingress.append(parser.NXActionResubmitTable(
-                table_id=const.INGRESS_CONNTRACK_TABLE))
+        is_first_port = not self.logical_networks.get_local_port_count(
+            network_id)
+        self.logical_networks.add_local_port(port_id=lport_id,
+                                             network_id=network_id,
+                                             network_type=network_type)
+        local_network = self.local_networks[network_id]
 
-        egress.append(parser.OFPActionSetField(reg7=0))
-        egress.append(parser.NXActionResubmitTable(
-            table_id=const.EGRESS_TABLE))
-        # Egress broadcast
-        match = self._get_multicast_broadcast_match(network_id)
-        egress_inst = [parser.OFPInstructionActions(
-            ofproto.OFPIT_APPLY_ACTIONS, egress)]
-        self.mod_flow(
-            inst=egress_inst,
-            table_id=const.L2_LOOKUP_TABLE,
-            command=command,
-            priority=const.PRIORITY_MEDIUM,
-            match=match)
+        index = local_network.add_to_port_group(lport_id, port_key)
+        if index is None:
+            LOG.error('Broadcast and multicast traffic of network %(net)s '
+                      'is not replicated to port %(port)s: too many local '
+                      'ports', {'net': network_id, 'port': lport_id})
+        elif len(local_network.port_groups[index]) == 1:
+            # A new port group, added to the network groups
+            self._mod_bum_groups(network_id, index, ofproto.OFPGC_ADD,
+                                 local_network)
+            self._mod_bum_groups(
+                network_id, 0,
+                ofproto.OFPGC_ADD if is_first_port else ofproto.OFPGC_MODIFY,
+                local_network)
+        else:
+            self._mod_bum_groups(network_id, index, ofproto.OFPGC_MODIFY,
+                                 local_network)
 
-        # Ingress broadcast
-        match = self._get_multicast_broadcast_match(network_id)
-        ingress_inst = [parser.OFPInstructionActions(
-            ofproto.OFPIT_APPLY_ACTIONS, ingress)]
-        self.mod_flow(
-            inst=ingress_inst,
-            table_id=const.INGRESS_DESTINATION_PORT_LOOKUP_TABLE,
-            command=command,
-            priority=const.PRIORITY_HIGH,
-            match=match)
+        if is_first_port:
+            self._add_multicast_broadcast_flows_for_local(network_id)
 
     @df_base_app.register_event(l2.LogicalSwitch,
                                 model_constants.EVENT_DELETED)
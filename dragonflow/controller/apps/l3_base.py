@@ -668,10 +668,16 @@ class L3AppMixin(object):
         @param port_ip: The ip of lport
         @return Router and the router port that is the gateway of lport
         """
-        for router in self.db_store.get_all(l3.LogicalRouter):
+        if port_ip is None:
+            return None, None
+
+        port_ip = netaddr.IPAddress(port_ip)
+        routers = self.db_store.query(l3.LogicalRouter,
+                                      contains={'ports.network': port_ip})
+        for router in routers:
             for port in router.ports:
                 if (lswitch_id == port.lswitch.id and
-                        netaddr.IPAddress(port_ip) in port.network):
+                        port_ip in port.network):
                     return router, port
         return None, None
 
@@ -25,7 +25,6 @@ from oslo_log import log
 from dragonflow.controller.apps import l3_base
 from dragonflow.controller.common import constants as const
 from dragonflow.controller import df_base_app
-from dragonflow.db.models import l2
 from dragonflow.db.models import l3
 
 
@@ -82,22 +81,23 @@ class L3ReactiveApp(df_base_app.DFlowApp, l3_base.L3AppMixin):
         """
         ip_addr = netaddr.IPAddress(pkt_ip.dst)
         router_unique_key = msg.match.get('reg5')
-        router = self.db_store.get_all(
-            l3.LogicalRouter(unique_key=router_unique_key),
-            l3.LogicalRouter.get_index('unique_key'))
-        for router_port in router.ports:
-            if ip_addr in router_port.network:
-                index = l2.LogicalPort.get_index('lswitch_id')
-                dst_ports = self.db_store.get_all(
-                    l2.LogicalPort(lswitch=l2.LogicalSwitch(
-                        id=router_port.lswitch.id)),
-                    index=index)
-                for out_port in dst_ports:
-                    if out_port.ip == ip_addr:
-                        self._install_flow_by_ports_and_continue(router_port,
-                                                                 out_port, msg,
-                                                                 network_id)
-                        return
+        router = next(self.db_store.query(
+            l3.LogicalRouter,
+            equals={'unique_key': router_unique_key},
+            contains={'ports.network': ip_addr},
+        ), None)
+        if router is None:
+            return
+
+        router_port = max(
+            (p for p in router.ports if ip_addr in p.network),
+            key=lambda p: p.network.prefixlen,
+        )
+        dst_port = self._get_port_by_lswitch_and_ip(ip_addr,
+                                                    router_port.lswitch.id)
+        if dst_port is not None:
+            self._install_flow_by_ports_and_continue(router_port, dst_port,
+                                                     msg, network_id)
 
     def _install_flow_by_ports_and_continue(self, dst_router_port, dst_port,
                                             msg, src_network_id):
@@ -15,13 +15,17 @@
 
 import collections
 import copy
+import functools
 
 import netaddr
 from neutron_lib import constants as n_const
 from os_ken.ofproto import ether
 from oslo_log import log
 
+from dragonflow.common import metrics
+from dragonflow.controller.common import conntrack
 from dragonflow.controller.common import constants as const
+from dragonflow.controller.common import sg_compiler
 from dragonflow.controller.common import utils
 from dragonflow.controller import df_base_app
 from dragonflow.db.models import constants as model_constants
@@ -31,9 +35,11 @@ from dragonflow.db.models import secgroups as sg_model
 
 LOG = log.getLogger(__name__)
 
-SG_CT_STATE_MASK = const.CT_STATE_NEW | const.CT_STATE_EST | \
-                   const.CT_STATE_REL | const.CT_STATE_INV | const.CT_STATE_TRK
+SG_CT_STATE_MASK = sg_compiler.SG_CT_STATE_MASK
 SG_PRIORITY_OFFSET = 2
+# The priority of the conjunctions of rules with a remote group. Security
+# group unique keys start at 1, so no security group has this priority.
+SG_REMOTE_GROUP_PRIORITY = SG_PRIORITY_OFFSET
 COOKIE_NAME = 'sg rule'
 DIRECTION_INGRESS = 'ingress'
 DIRECTION_EGRESS = 'egress'
@@ -44,6 +50,17 @@ DEST_FIELD_NAME_BY_PROTOCOL_NUMBER = {
 }
 
 
+def _apply_pending_ports_first(func):
+    '''Applies the ports bound during a northbound database sync before the
+       decorated event handler, which may depend on them.
+    '''
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        self._apply_pending_ports()
+        return func(self, *args, **kwargs)
+    return wrapper
+
+
 class SGApp(df_base_app.DFlowApp):
 
     def __init__(self, *args, **kwargs):
@@ -57,6 +74,20 @@ class SGApp(df_base_app.DFlowApp):
         )
         self.secgroup_ip_refs = collections.defaultdict(set)
         self.register_local_cookie_bits(COOKIE_NAME, 32)
+        self._conntrack_flusher = conntrack.ConntrackFlusher()
+        self._sg_compiler = sg_compiler.SecurityGroupCompiler()
+        # rule_id -> (secgroup_id, number of flows), for the rules that are
+        # not compiled to conjunctions
+        self._rule_flow_counts = {}
+        metrics.gauge(
+            'df_sg_rule_flows',
+            'Flows installed for security group rules, per security group',
+            labelnames=('security_group',),
+            func=self._get_flow_counts,
+        )
+        # (lport, is_local) of the ports bound during a northbound database
+        # sync, which are applied together. None when not in a sync.
+        self._pending_ports = None
 
     @staticmethod
     def _get_cidr_difference(cidr_set, new_cidr_set):
@@ -303,8 +334,10 @@ class SGApp(df_base_app.DFlowApp):
                                                 |OFPFC_MODIFY_STRICT
                                                 |OFPFC_DELETE
                                                 |OFPFC_DELETE_STRICT}
+        :return:             the number of flows
         """
         parser = self.parser
+        flow_count = 0
         for cidr_item in addresses_list:
             if (not cidr_item or netaddr.IPNetwork(cidr_item).version ==
                     utils.ethertype_to_ip_version(ethertype)):
@@ -324,6 +357,8 @@ class SGApp(df_base_app.DFlowApp):
                         priority=priority,
                         match=match,
                         command=command)
+                    flow_count += 1
+        return flow_count
 
     def _install_security_group_permit_flow_by_direction(self,
                                                          security_group_id,
@@ -475,6 +510,8 @@ class SGApp(df_base_app.DFlowApp):
         self._install_associating_flow_by_direction(security_group_id,
                                                     lport,
                                                     DIRECTION_EGRESS)
+        self._apply_compiled_flow_changes(
+            self._sg_compiler.add_port(security_group_id, lport.unique_key))
 
     def _uninstall_associating_flows(self, security_group_id, lport):
         self._uninstall_associating_flow_by_direction(security_group_id,
@@ -483,6 +520,9 @@ class SGApp(df_base_app.DFlowApp):
         self._uninstall_associating_flow_by_direction(security_group_id,
                                                       lport,
                                                       DIRECTION_EGRESS)
+        self._apply_compiled_flow_changes(
+            self._sg_compiler.remove_port(security_group_id,
+                                          lport.unique_key))
 
     def _install_connection_track_flow_by_direction(self, lport, direction):
         parser = self.parser
@@ -542,63 +582,66 @@ class SGApp(df_base_app.DFlowApp):
         self._uninstall_connection_track_flow_by_direction(lport,
                                                            DIRECTION_EGRESS)
 
-    def _update_security_group_rule_flows_by_addresses(self,
-                                                       secgroup_id,
-                                                       secgroup_rule,
-                                                       added_cidr,
-                                                       removed_cidr):
-        if self._is_sg_not_associated_with_local_port(secgroup_id):
-            return
-
-        conj_id, priority = self._get_secgroup_conj_id_and_priority(
-            secgroup_id)
-
+    def _apply_compiled_flow_changes(self, changes):
+        """
+        Install, modify and delete the flows of the rules with a remote
+        group, as returned by the security group compiler.
+        """
         parser = self.parser
         ofproto = self.ofproto
-        rule_id = self._get_security_rule_mapping(secgroup_rule.id)
-        ethertype = secgroup_rule.ethertype
-
-        match_list = \
-            self._get_rule_flows_match_except_net_addresses(secgroup_rule)
-
-        if secgroup_rule.direction == DIRECTION_INGRESS:
-            table_id = const.INGRESS_SECURITY_GROUP_TABLE
-        else:
-            table_id = const.EGRESS_SECURITY_GROUP_TABLE
-        ip_match_item = self._get_security_rule_by_addresses_match_item(
-                                ethertype,
-                                secgroup_rule.direction)
-        if not ip_match_item:
-            LOG.error("wrong ethernet type")
-            return
-
-        actions = [parser.NXActionConjunction(clause=1,
-                                              n_clauses=2,
-                                              id_=conj_id)]
-        action_inst = parser.OFPInstructionActions(
-            ofproto.OFPIT_APPLY_ACTIONS, actions)
-        inst = [action_inst]
-
-        self._install_flows_from_address_list(
-                addresses_list=added_cidr,
-                ethertype=ethertype,
-                inst=inst,
+        for change in changes:
+            if change.direction == DIRECTION_INGRESS:
+                table_id = const.INGRESS_SECURITY_GROUP_TABLE
+                recirc_table = const.INGRESS_DISPATCH_TABLE
+            else:
+                table_id = const.EGRESS_SECURITY_GROUP_TABLE
+                recirc_table = const.SERVICES_CLASSIFICATION_TABLE
+            match = parser.OFPMatch(**dict(change.match))
+
+            if not change.actions:
+                self.mod_flow(
+                    table_id=table_id,
+                    priority=SG_REMOTE_GROUP_PRIORITY,
+                    match=match,
+                    command=ofproto.OFPFC_DELETE_STRICT)
+                continue
+
+            if sg_compiler.COMMIT in change.actions:
+                actions = [parser.NXActionCT(actions=[],
+                                             alg=0,
+                                             flags=const.CT_FLAG_COMMIT,
+                                             recirc_table=recirc_table,
+                                             zone_ofs_nbits=15,
+                                             zone_src=const.CT_ZONE_REG)]
+            else:
+                actions = [
+                    parser.NXActionConjunction(
+                        clause=conjunction.clause,
+                        n_clauses=sg_compiler.N_CLAUSES,
+                        id_=conjunction.conj_id)
+                    for conjunction in sorted(change.actions)
+                ]
+            action_inst = parser.OFPInstructionActions(
+                ofproto.OFPIT_APPLY_ACTIONS, actions)
+            self.mod_flow(
+                inst=[action_inst],
                 table_id=table_id,
-                priority=priority,
-                rule_id=rule_id,
-                ip_match_item=ip_match_item,
-                match_list=match_list,
+                priority=SG_REMOTE_GROUP_PRIORITY,
+                match=match,
                 command=ofproto.OFPFC_ADD)
 
-        self._install_flows_from_address_list(
-                addresses_list=removed_cidr,
-                ethertype=ethertype,
-                table_id=table_id,
-                priority=priority,
-                rule_id=rule_id,
-                ip_match_item=ip_match_item,
-                match_list=match_list,
-                command=ofproto.OFPFC_DELETE_STRICT)
+    def _update_remote_group_addresses(self, remote_group_id, added_cidr,
+                                       removed_cidr):
+        """
+        Update the address flows of the rules which use this security group
+        as their remote group. The flows are shared by all those rules.
+        """
+        self._apply_compiled_flow_changes(
+            self._sg_compiler.update_addresses(
+                remote_group_id,
+                self.secgroup_aggregate_addresses.get(remote_group_id),
+                added_cidr,
+                removed_cidr))
 
     def _install_security_group_rule_flows(self, secgroup_id, secgroup_rule):
         conj_id, priority = self._get_secgroup_conj_id_and_priority(
@@ -627,6 +670,13 @@ class SGApp(df_base_app.DFlowApp):
         match_list = \
             self._get_rule_flows_match_except_net_addresses(secgroup_rule)
 
+        if remote_group_id is not None:
+            # The rules with the same remote group share its address flows
+            self._apply_compiled_flow_changes(
+                self._sg_compiler.add_rule(secgroup_id, secgroup_rule,
+                                           match_list))
+            return
+
         actions = [parser.NXActionConjunction(clause=1,
                                               n_clauses=2,
                                               id_=conj_id)]
@@ -635,34 +685,33 @@ class SGApp(df_base_app.DFlowApp):
         inst = [action_inst]
 
         addresses_list = [""]
-        if remote_group_id is not None:
-            addresses_list = []
-            aggregate_addresses_range = \
-                self.secgroup_aggregate_addresses.get(remote_group_id)
-            if aggregate_addresses_range is not None:
-                cidr_list = aggregate_addresses_range.iter_cidrs()
-                for aggregate_address in cidr_list:
-                    if netaddr.IPNetwork(aggregate_address).version == \
-                            utils.ethertype_to_ip_version(ethertype):
-                        addresses_list.append(aggregate_address)
-        elif remote_ip_prefix is not None:
+        if remote_ip_prefix is not None:
             if netaddr.IPNetwork(remote_ip_prefix).version == \
                     utils.ethertype_to_ip_version(ethertype):
                 addresses_list = [remote_ip_prefix]
 
-        self._install_flows_from_address_list(addresses_list=addresses_list,
-                                              ethertype=ethertype,
-                                              inst=inst,
-                                              table_id=table_id,
-                                              priority=priority,
-                                              rule_id=rule_id,
-                                              ip_match_item=ip_match_item,
-                                              match_list=match_list,
-                                              command=ofproto.OFPFC_ADD)
-
-    def _uninstall_security_group_rule_flows(self, secgroup_rule):
+        flow_count = self._install_flows_from_address_list(
+            addresses_list=addresses_list,
+            ethertype=ethertype,
+            inst=inst,
+            table_id=table_id,
+            priority=priority,
+            rule_id=rule_id,
+            ip_match_item=ip_match_item,
+            match_list=match_list,
+            command=ofproto.OFPFC_ADD)
+        self._rule_flow_counts[secgroup_rule.id] = (secgroup_id, flow_count)
+
+    def _uninstall_security_group_rule_flows(self, secgroup_id,
+                                             secgroup_rule):
+        if secgroup_rule.remote_group_id is not None:
+            self._apply_compiled_flow_changes(
+                self._sg_compiler.remove_rule(secgroup_id, secgroup_rule))
+            return
+
         # uninstall rule flows by its cookie
         ofproto = self.ofproto
+        self._rule_flow_counts.pop(secgroup_rule.id, None)
 
         direction = secgroup_rule.direction
         if direction == DIRECTION_INGRESS:
@@ -764,6 +813,73 @@ class SGApp(df_base_app.DFlowApp):
         self.remote_secgroup_ref.clear()
         self.secgroup_aggregate_addresses.clear()
         self.secgroup_ip_refs.clear()
+        self._sg_compiler.clear()
+        self._rule_flow_counts.clear()
+        if self._pending_ports:
+            # The controller reinitializes, and binds the ports again
+            del self._pending_ports[:]
+
+    def nb_sync_started(self):
+        self._apply_pending_ports()
+        self._pending_ports = []
+
+    def nb_sync_finished(self):
+        self._apply_pending_ports()
+        self._pending_ports = None
+
+    def _apply_pending_ports(self):
+        if not self._pending_ports:
+            return
+        pending_ports, self._pending_ports = self._pending_ports, []
+        self._add_ports_in_bulk(pending_ports)
+
+    def _add_ports_in_bulk(self, pending_ports):
+        """
+        Associate the ports with their security groups. The aggregate
+        addresses of every security group, and the flows of its remote group
+        rules, are updated once for all the ports, rather than once per port.
+        """
+        added_ips = collections.defaultdict(list)
+        local_lports = collections.defaultdict(list)
+        for lport, is_local in pending_ports:
+            for secgroup in lport.security_groups:
+                added_ips[secgroup.id].extend(
+                    self._get_lport_added_ips_for_secgroup(secgroup.id, lport))
+                if is_local:
+                    local_lports[secgroup.id].append(lport)
+
+        for secgroup_id, ips in added_ips.items():
+            if not ips:
+                continue
+            new_cidr_set, added_cidr, removed_cidr = \
+                SGApp._get_cidr_changes_after_adding_addresses(
+                    self.secgroup_aggregate_addresses[secgroup_id],
+                    ips,
+                )
+            self.secgroup_aggregate_addresses[secgroup_id] = new_cidr_set
+            self._update_remote_group_addresses(secgroup_id, added_cidr,
+                                                removed_cidr)
+
+        for secgroup_id, lports in local_lports.items():
+            associate_ports = \
+                self.secgroup_associate_local_ports.get(secgroup_id)
+            is_new = associate_ports is None
+            if is_new:
+                associate_ports = []
+                self.secgroup_associate_local_ports[secgroup_id] = \
+                    associate_ports
+            for lport in lports:
+                if lport.id not in associate_ports:
+                    associate_ports.append(lport.id)
+            if is_new:
+                self._install_security_group_flows(secgroup_id)
+
+            for lport in lports:
+                self._install_associating_flows(secgroup_id, lport)
+
+        for lport, is_local in pending_ports:
+            if is_local:
+                self._install_connection_track_flows(lport)
 
     def _get_security_rule_mapping(self, lrule_id):
         rule_id = self.secgroup_rule_mappings.get(lrule_id)
@@ -775,6 +891,13 @@ class SGApp(df_base_app.DFlowApp):
             self.secgroup_rule_mappings[lrule_id] = self.next_secgroup_rule_id
             return self.next_secgroup_rule_id
 
+    def _get_flow_counts(self):
+        flow_counts = collections.Counter(self._sg_compiler.get_flow_counts())
+        for secgroup_id, flow_count in self._rule_flow_counts.values():
+            flow_counts[secgroup_id] += flow_count
+        return {(secgroup_id,): flow_count
+                for secgroup_id, flow_count in flow_counts.items()}
+
     def _get_secgroup_conj_id_and_priority(self, secgroup_id):
         sg = self.db_store.get_one(sg_model.SecurityGroup(id=secgroup_id))
         sg_unique_key = sg.unique_key
@@ -795,14 +918,8 @@ class SGApp(df_base_app.DFlowApp):
         # update the flows representing those rules each of which specifies
         #  this security group as its parameter
         # of remote group.
-        secrules = self.remote_secgroup_ref.get(secgroup_id)
-        if secrules:
-            for rule_info in secrules.values():
-                self._update_security_group_rule_flows_by_addresses(
-                    rule_info.security_group_id,
-                    rule_info,
-                    added_cidr,
-                    removed_cidr)
+        self._update_remote_group_addresses(secgroup_id, added_cidr,
+                                            removed_cidr)
 
     def _disassociate_secgroup_lport_addresses(self, secgroup_id, lport):
         # update the record of aggregate addresses of ports associated
@@ -825,15 +942,11 @@ class SGApp(df_base_app.DFlowApp):
             # update the flows representing those rules each of which
             # specifies this security group as its
             # parameter of remote group.
+            self._update_remote_group_addresses(secgroup_id, added_cidr,
+                                                removed_cidr)
             secrules = self.remote_secgroup_ref.get(secgroup_id)
             if secrules:
                 for rule_info in secrules.values():
-                    self._update_security_group_rule_flows_by_addresses(
-                        rule_info.security_group_id,
-                        rule_info,
-                        added_cidr,
-                        removed_cidr
-                    )
                     # delete conntrack entities by rule and remote address
                     self._delete_conntrack_entries_by_remote_address(
                         removed_ips, rule_info)
@@ -906,15 +1019,11 @@ class SGApp(df_base_app.DFlowApp):
         # update the flows representing those rules each of which
         # specifies this security group as its
         # parameter of remote group.
+        self._update_remote_group_addresses(secgroup_id, added_cidr,
+                                            removed_cidr)
         secrules = self.remote_secgroup_ref.get(secgroup_id)
         if secrules is not None:
             for rule_info in secrules.values():
-                self._update_security_group_rule_flows_by_addresses(
-                    rule_info.security_group_id,
-                    rule_info,
-                    added_cidr,
-                    removed_cidr
-                )
                 # delete conntrack entities by rule and remote address
                 self._delete_conntrack_entries_by_remote_address(
                     removed_ips, rule_info)
@@ -939,6 +1048,7 @@ class SGApp(df_base_app.DFlowApp):
         return added_secgroups, removed_secgroups, unchanged_secgroups
 
     @df_base_app.register_event(l2.LogicalPort, l2.EVENT_UNBIND_LOCAL)
+    @_apply_pending_ports_first
     def _remove_local_port(self, lport):
         secgroups = lport.security_groups
         if not secgroups:
@@ -951,6 +1061,7 @@ class SGApp(df_base_app.DFlowApp):
             self._remove_local_port_associating(lport, secgroup.id)
 
     @df_base_app.register_event(l2.LogicalPort, l2.EVENT_UNBIND_REMOTE)
+    @_apply_pending_ports_first
     def _remove_remote_port(self, lport):
         secgroups = lport.security_groups
         if not secgroups:
@@ -960,6 +1071,7 @@ class SGApp(df_base_app.DFlowApp):
             self._remove_remote_port_associating(lport, secgroup.id)
 
     @df_base_app.register_event(l2.LogicalPort, l2.EVENT_LOCAL_UPDATED)
+    @_apply_pending_ports_first
     def update_local_port(self, lport, original_lport):
         secgroups = lport.security_groups
         original_secgroups = original_lport.security_groups
@@ -990,6 +1102,7 @@ class SGApp(df_base_app.DFlowApp):
             self._install_connection_track_flows(lport)
 
     @df_base_app.register_event(l2.LogicalPort, l2.EVENT_REMOTE_UPDATED)
+    @_apply_pending_ports_first
     def _update_remote_port(self, lport, original_lport):
         secgroups = lport.security_groups
         original_secgroups = original_lport.security_groups
@@ -1014,6 +1127,10 @@ class SGApp(df_base_app.DFlowApp):
         if not secgroups:
             return
 
+        if self._pending_ports is not None:
+            self._pending_ports.append((lport, True))
+            return
+
         for secgroup in secgroups:
             self._add_local_port_associating(lport, secgroup.id)
 
@@ -1026,6 +1143,10 @@ class SGApp(df_base_app.DFlowApp):
         if not secgroups:
             return
 
+        if self._pending_ports is not None:
+            self._pending_ports.append((lport, False))
+            return
+
         for secgroup in secgroups:
             self._add_remote_port_associating(lport, secgroup.id)
 
@@ -1034,12 +1155,14 @@ class SGApp(df_base_app.DFlowApp):
 
     @df_base_app.register_event(sg_model.SecurityGroup,
                                 model_constants.EVENT_CREATED)
+    @_apply_pending_ports_first
     def add_security_group(self, secgroup):
         for new_rule in secgroup.rules:
             self.add_security_group_rule(secgroup, new_rule)
 
     @df_base_app.register_event(sg_model.SecurityGroup,
                                 model_constants.EVENT_UPDATED)
+    @_apply_pending_ports_first
     def update_security_group(self, new_secgroup, old_secgroup):
         new_secgroup_rules = copy.copy(new_secgroup.rules)
         old_secgroup_rules = copy.copy(old_secgroup.rules)
@@ -1054,6 +1177,7 @@ class SGApp(df_base_app.DFlowApp):
 
     @df_base_app.register_event(sg_model.SecurityGroupRule,
                                 model_constants.EVENT_CREATED)
+    @_apply_pending_ports_first
     def add_security_group_rule(self, secgroup, secgroup_rule):
         secgroup_id = secgroup.id
         if self._is_sg_not_associated_with_local_port(secgroup_id):
@@ -1079,6 +1203,7 @@ class SGApp(df_base_app.DFlowApp):
 
     @df_base_app.register_event(sg_model.SecurityGroupRule,
                                 model_constants.EVENT_DELETED)
+    @_apply_pending_ports_first
     def remove_security_group_rule(self, secgroup, secgroup_rule):
         secgroup_id = secgroup.id
         if self._is_sg_not_associated_with_local_port(secgroup_id):
@@ -1102,13 +1227,13 @@ class SGApp(df_base_app.DFlowApp):
                 if len(associate_rules) == 0:
                     del self.remote_secgroup_ref[remote_group_id]
 
-        self._uninstall_security_group_rule_flows(secgroup_rule)
+        self._uninstall_security_group_rule_flows(secgroup_id, secgroup_rule)
 
         # delete conntrack entities by rule
         self._delete_conntrack_entries_by_rule(secgroup_rule)
 
-    def _delete_conntrack_entries_process(self, port_info, rule,
-                                          remote_address_list=None):
+    def _get_conntrack_filters_process(self, port_info, rule,
+                                       remote_address_list=None):
         ethertype = rule.ethertype
         if DIRECTION_INGRESS == rule.direction:
             nw_match_mark = 'nw_dst'
@@ -1116,6 +1241,7 @@ class SGApp(df_base_app.DFlowApp):
         else:
             nw_match_mark = 'nw_src'
             remote_match_mark = 'nw_dst'
+        filters = []
         for port_ip in port_info['removed_ips']:
             if port_ip.version == utils.ethertype_to_ip_version(ethertype):
                 entries_filter = {
@@ -1128,17 +1254,25 @@ class SGApp(df_base_app.DFlowApp):
                     entries_filter['protocol'] = protocol
                 if remote_address_list:
                     for remote_address in remote_address_list:
-                        entries_filter_tmp = entries_filter.copy()
-                        entries_filter_tmp[remote_match_mark] = remote_address
-                        utils.delete_conntrack_entries_by_filter(
-                            **entries_filter_tmp)
+                        entries_filter[remote_match_mark] = remote_address
+                        filters.append(
+                            conntrack.make_filter(**entries_filter))
                 else:
-                    utils.delete_conntrack_entries_by_filter(**entries_filter)
+                    filters.append(conntrack.make_filter(**entries_filter))
+        return filters
 
     def _delete_conntrack_entries_by_rule(self, rule, filter_port_info=None,
                                           filter_remote_addresses=None):
         """Delete connection track entries filtered by a security group rule
         and other filtering parameters.
+        """
+        self._conntrack_flusher.delete(self._get_conntrack_filters_by_rule(
+            rule, filter_port_info, filter_remote_addresses))
+
+    def _get_conntrack_filters_by_rule(self, rule, filter_port_info=None,
+                                       filter_remote_addresses=None):
+        """Returns the filters of the connection track entries of a security
+        group rule and other filtering parameters.
 
         :param rule:    a security group rule
         :type rule:     security group rule object
@@ -1171,9 +1305,11 @@ class SGApp(df_base_app.DFlowApp):
                 associating_ports_info.append({'removed_ips': removed_ips,
                                                'zone_id': zone_id})
 
+        filters = []
         for port_info in associating_ports_info:
-            self._delete_conntrack_entries_process(
-                port_info, rule, remote_address_list)
+            filters.extend(self._get_conntrack_filters_process(
+                port_info, rule, remote_address_list))
+        return filters
 
     def _delete_conntrack_entries_by_local_port_info(
             self, lport, original_lport, secgroup_id):
@@ -1192,9 +1328,11 @@ class SGApp(df_base_app.DFlowApp):
         sg_obj = sg_model.SecurityGroup(id=secgroup_id)
         secgroup = self.db_store.get_one(sg_obj)
         if secgroup is not None:
+            filters = []
             for rule in secgroup.rules:
-                self._delete_conntrack_entries_by_rule(
-                    rule, filter_port_info=local_port_info)
+                filters.extend(self._get_conntrack_filters_by_rule(
+                    rule, filter_port_info=local_port_info))
+            self._conntrack_flusher.delete(filters)
 
     def _delete_conntrack_entries_by_remote_address(self, remote_addresses,
                                                     rule):
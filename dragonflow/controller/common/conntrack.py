@@ -0,0 +1,259 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Batched deletion of connection tracking entries.
+
+Applications queue filters on a ConntrackFlusher. A worker green thread
+coalesces everything queued into one batch, and runs the deletion in a native
+thread (eventlet.tpool), so that dumping and deleting conntrack entries does
+not block the controller's event loop.
+"""
+import collections
+import errno
+import socket
+
+import eventlet
+from eventlet import queue
+from eventlet import tpool
+import netaddr
+from neutron_lib import constants as n_const
+from oslo_log import log
+
+from dragonflow.common import exceptions
+from dragonflow.common import metrics
+from dragonflow import conf as cfg
+from dragonflow.controller.common import utils
+
+try:
+    from pyroute2 import conntrack as pyroute2_conntrack
+    from pyroute2.netlink import exceptions as netlink_exceptions
+except ImportError:
+    pyroute2_conntrack = None
+    netlink_exceptions = None
+
+
+LOG = log.getLogger(__name__)
+
+_ENTRIES_DELETED = metrics.counter(
+    'df_conntrack_entries_deleted_total',
+    'Conntrack entries deleted, per driver',
+    labelnames=('driver',),
+)
+_FILTERS = metrics.counter(
+    'df_conntrack_filters_total',
+    'Conntrack filters applied, after removing duplicates, per driver',
+    labelnames=('driver',),
+)
+_FLUSH_SECONDS = metrics.histogram(
+    'df_conntrack_flush_seconds',
+    'Time spent deleting a batch of conntrack entries, per driver',
+    labelnames=('driver',),
+)
+
+_FAMILY_BY_ETHERTYPE = {
+    n_const.IPv4: socket.AF_INET,
+    n_const.IPv6: socket.AF_INET6,
+}
+
+
+ConntrackFilter = collections.namedtuple(
+    'ConntrackFilter', ('ethertype', 'protocol', 'nw_src', 'nw_dst', 'zone'))
+
+
+def make_filter(ethertype=n_const.IPv4, protocol=None, nw_src=None,
+                nw_dst=None, zone=None):
+    '''Returns a hashable ConntrackFilter. Like conntrack -D, None matches
+       any value.
+    '''
+    if protocol is not None:
+        protocol = int(protocol)
+    if nw_src is not None:
+        nw_src = str(netaddr.IPAddress(nw_src))
+    if nw_dst is not None:
+        nw_dst = str(netaddr.IPAddress(nw_dst))
+    return ConntrackFilter(ethertype, protocol, nw_src, nw_dst, zone)
+
+
+class CliConntrackDriver(object):
+    '''Runs conntrack -D once per filter'''
+    name = 'conntrack_cli'
+
+    def delete_entries(self, filters):
+        '''Returns None, as the number of deleted entries is unknown'''
+        for entries_filter in filters:
+            utils.delete_conntrack_entries_by_filter(
+                **entries_filter._asdict())
+
+
+class NetlinkConntrackDriver(object):
+    '''Dumps the conntrack table once per batch, and deletes the entries
+       that match any filter of the batch, over netlink.
+
+       conntrack_factory returns an object with the interface of
+       pyroute2.conntrack.Conntrack, i.e. dump_entries(), entry() and
+       close().
+
+       Requires CAP_NET_ADMIN. ConntrackPermissionDenied is raised without
+       it.
+    '''
+    name = 'netlink'
+
+    def __init__(self, conntrack_factory=None):
+        if conntrack_factory is None:
+            conntrack_factory = pyroute2_conntrack.Conntrack
+        self._conntrack_factory = conntrack_factory
+
+    @staticmethod
+    def _get_filters_by_zone(filters):
+        # zone -> [(family, protocol, nw_src, nw_dst)], where zone None
+        # matches every zone
+        filters_by_zone = collections.defaultdict(list)
+        for entries_filter in filters:
+            filters_by_zone[entries_filter.zone or None].append((
+                _FAMILY_BY_ETHERTYPE[entries_filter.ethertype],
+                entries_filter.protocol,
+                entries_filter.nw_src,
+                entries_filter.nw_dst,
+            ))
+        return filters_by_zone
+
+    @staticmethod
+    def _matches(zone_filters, tuple_orig):
+        for family, protocol, nw_src, nw_dst in zone_filters:
+            if family != tuple_orig.family:
+                continue
+            if protocol is not None and protocol != tuple_orig.proto:
+                continue
+            if nw_src is not None and nw_src != tuple_orig.saddr:
+                continue
+            if nw_dst is not None and nw_dst != tuple_orig.daddr:
+                continue
+            return True
+        return False
+
+    def delete_entries(self, filters):
+        '''Returns the number of deleted entries'''
+        try:
+            return self._delete_entries(filters)
+        except netlink_exceptions.NetlinkError as e:
+            if e.code != errno.EPERM:
+                raise
+            raise exceptions.ConntrackPermissionDenied(reason=e)
+        except (IOError, OSError) as e:
+            if e.errno != errno.EPERM:
+                raise
+            raise exceptions.ConntrackPermissionDenied(reason=e)
+
+    def _delete_entries(self, filters):
+        filters_by_zone = self._get_filters_by_zone(filters)
+        any_zone_filters = filters_by_zone.pop(None, ())
+        deleted = 0
+        conntrack = self._conntrack_factory()
+        try:
+            for entry in conntrack.dump_entries():
+                zone = entry.zone or None
+                tuple_orig = entry.tuple_orig
+                if not (self._matches(filters_by_zone.get(zone, ()),
+                                      tuple_orig) or
+                        self._matches(any_zone_filters, tuple_orig)):
+                    continue
+                try:
+                    conntrack.entry('del', tuple_orig=tuple_orig, zone=zone)
+                except netlink_exceptions.NetlinkError as e:
+                    # The entry expired since the dump
+                    if e.code != errno.ENOENT:
+                        raise
+                    continue
+                deleted += 1
+        finally:
+            conntrack.close()
+        return deleted
+
+
+def get_driver():
+    driver_name = cfg.CONF.df_sg_app.conntrack_driver
+    if driver_name == NetlinkConntrackDriver.name:
+        if pyroute2_conntrack is not None:
+            return NetlinkConntrackDriver()
+        LOG.warning('pyroute2 is not installed, deleting conntrack entries '
+                    'with the conntrack tool')
+    return CliConntrackDriver()
+
+
+class ConntrackFlusher(object):
+    '''Deletes conntrack entries off the event loop, in batches.
+
+       delete() only queues the filters. Filters queued while a batch is
+       being deleted are coalesced into the next batch, and duplicate
+       filters are applied once.
+    '''
+
+    def __init__(self, driver=None):
+        self._driver = driver
+        self._queue = queue.Queue()
+        self._worker = None
+
+    def delete(self, filters):
+        filters = list(filters)
+        if not filters:
+            return
+        if self._driver is None:
+            self._driver = get_driver()
+        if self._worker is None:
+            self._worker = eventlet.spawn(self._run)
+        self._queue.put(filters)
+
+    def wait(self):
+        '''Blocks until all the queued filters are applied'''
+        self._queue.join()
+
+    def stop(self):
+        if self._worker is not None:
+            self._worker.kill()
+            self._worker = None
+
+    def _run(self):
+        while True:
+            filters = self._queue.get()
+            batches = 1
+            while not self._queue.empty():
+                filters.extend(self._queue.get_nowait())
+                batches += 1
+            try:
+                self._flush(filters)
+            except Exception:
+                LOG.exception('Failed to delete conntrack entries')
+            finally:
+                for _i in range(batches):
+                    self._queue.task_done()
+
+    def _flush(self, filters):
+        filters = list(collections.OrderedDict.fromkeys(filters))
+        try:
+            self._flush_with_driver(filters)
+        except exceptions.ConntrackPermissionDenied as e:
+            # Entries left behind would keep allowing connections that the
+            # security groups no longer allow
+            LOG.warning('%s, deleting conntrack entries with the conntrack '
+                        'tool', e)
+            self._driver = CliConntrackDriver()
+            self._flush_with_driver(filters)
+
+    def _flush_with_driver(self, filters):
+        driver_name = self._driver.name
+        _FILTERS.labels(driver_name).inc(len(filters))
+        with _FLUSH_SECONDS.labels(driver_name).time():
+            deleted = tpool.execute(self._driver.delete_entries, filters)
+        if deleted is not None:
+            _ENTRIES_DELETED.labels(driver_name).inc(deleted)
+        LOG.debug('Applied %(filters)d conntrack filters, deleted '
+                  '%(deleted)s entries',
+                  {'filters': len(filters), 'deleted': deleted})
@@ -133,8 +133,11 @@ BROADCAST_IP = '255.255.255.255'
 CHASSIS_MAC_PREFIX = '91:92:'
 
 CONTROLLER_SYNC = 'sync'
+CONTROLLER_SYNC_TOPIC = 'sync_topic'
 CONTROLLER_REINITIALIZE = 'reinitialize'
 CONTROLLER_DBRESTART = 'dbrestart'
 CONTROLLER_SWITCH_SYNC_STARTED = 'switch_sync_started'
 CONTROLLER_SWITCH_SYNC_FINISHED = 'switch_sync_finished'
+CONTROLLER_NB_SYNC_STARTED = 'nb_sync_started'
+CONTROLLER_NB_SYNC_FINISHED = 'nb_sync_finished'
 CONTROLLER_LOG = 'log'
@@ -13,8 +13,51 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import collections
-import functools
+
+class _LocationPorts(object):
+    """The ports of one location (local or remote), by network and network
+    type, with a port count per network.
+    """
+    def __init__(self):
+        # network_id -> network_type -> {port_id: None}, i.e. an insertion
+        # ordered set of port ids
+        self.networks = {}
+        # network_id -> number of ports, of all network types
+        self.counts = {}
+
+    def add(self, port_id, network_id, network_type):
+        network_ports = self.networks.setdefault(network_id, {})
+        network_ports.setdefault(network_type, {})[port_id] = None
+        self.counts[network_id] = self.counts.get(network_id, 0) + 1
+
+    def remove(self, port_id, network_id, network_type):
+        network_ports = self.networks[network_id]
+        type_ports = network_ports[network_type]
+        del type_ports[port_id]
+        if not type_ports:
+            del network_ports[network_type]
+        if network_ports:
+            self.counts[network_id] -= 1
+        else:
+            del self.networks[network_id]
+            del self.counts[network_id]
+
+    def get_count(self, network_id, network_type):
+        if network_type:
+            network_ports = self.networks.get(network_id, {})
+            return len(network_ports.get(network_type, ()))
+        return self.counts.get(network_id, 0)
+
+    def get_ports(self, network_id, network_type):
+        network_ports = self.networks.get(network_id)
+        if not network_ports:
+            return []
+        if network_type:
+            return list(network_ports.get(network_type, ()))
+        ports = []
+        for type_ports in network_ports.values():
+            ports.extend(type_ports)
+        return ports
 
 
 class LogicalNetworks(object):
@@ -22,45 +65,54 @@ class LogicalNetworks(object):
     LogicalNetworks is a common infra class that cache local and remote
     ports according to their network id and network_type.
     The internal data structure can  be represnted as
-    {location:{network_id:{network_type:<port list>}}}
+    {location:{network_id:{network_type:<port set>}}}
+
+    Port counts are maintained per network, and the location and network of
+    every port are indexed by port id. A port is cached once: adding it
+    again, e.g. with another network or location, moves it.
+
+    Every app keeps its own instance, holding only the ports it installed
+    flows for. An app checks the port count of a network before it adds
+    or after it removes a port, to install or remove the network's flows,
+    and may reset its instance when the switch reconnects.
     """
     def __init__(self):
-        initializer = functools.partial(collections.defaultdict, list)
-        self.local_ports_net_cache = collections.defaultdict(initializer)
-        self.remote_ports_net_cache = collections.defaultdict(initializer)
+        self.local_ports_net_cache = _LocationPorts()
+        self.remote_ports_net_cache = _LocationPorts()
+        # port_id -> (location ports, network_id, network_type)
+        self._port_networks = {}
 
     def _add_port(self, ports, port_id, network_id, network_type):
-        network_ports = ports[network_id]
-        network_ports[network_type].append(port_id)
+        port_network = (ports, network_id, network_type)
+        old_port_network = self._port_networks.get(port_id)
+        if old_port_network == port_network:
+            return
+        if old_port_network is not None:
+            old_ports, old_network_id, old_network_type = old_port_network
+            old_ports.remove(port_id, old_network_id, old_network_type)
+        ports.add(port_id, network_id, network_type)
+        self._port_networks[port_id] = port_network
 
     def _remove_port(self, ports, port_id, network_id, network_type):
-        network_ports = ports.get(network_id)
-        if network_ports:
-            if port_id in network_ports[network_type]:
-                network_ports[network_type].remove(port_id)
+        # The port is removed from the network it was added to, which may
+        # differ from network_id if the port has moved since
+        port_network = self._port_networks.get(port_id)
+        if port_network is None or port_network[0] is not ports:
+            return
+        del self._port_networks[port_id]
+        ports.remove(port_id, port_network[1], port_network[2])
+
+    def _get_port_network(self, ports, port_id):
+        port_network = self._port_networks.get(port_id)
+        if port_network is None or port_network[0] is not ports:
+            return None
+        return port_network[1:]
 
     def _get_port_count(self, ports, network_id, network_type):
-        value = 0
-        network_ports = ports.get(network_id)
-        if network_ports:
-            if network_type:
-                value = len(network_ports[network_type])
-            else:
-                for port_list in network_ports.values():
-                    value += len(port_list)
-        return value
+        return ports.get_count(network_id, network_type)
 
     def _get_ports(self, ports, network_id, network_type):
-        network_ports = ports.get(network_id)
-        if network_ports:
-            if network_type:
-                return network_ports[network_type]
-            else:
-                ret_list = list()
-                for port_list in network_ports.values():
-                    ret_list += port_list
-                return ret_list
-        return None
+        return ports.get_ports(network_id, network_type)
 
     def add_local_port(self, port_id, network_id, network_type):
         """add local (on this compute host) logical port"""
@@ -125,3 +177,15 @@ class LogicalNetworks(object):
         return self._get_ports(ports=self.remote_ports_net_cache,
                                network_id=network_id,
                                network_type=network_type)
+
+    def get_local_port_network(self, port_id):
+        """get the (network_id, network_type) of a local port, or None if
+           the port is not a cached local port
+        """
+        return self._get_port_network(self.local_ports_net_cache, port_id)
+
+    def get_remote_port_network(self, port_id):
+        """get the (network_id, network_type) of a remote port, or None if
+           the port is not a cached remote port
+        """
+        return self._get_port_network(self.remote_ports_net_cache, port_id)
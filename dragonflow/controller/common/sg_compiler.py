@@ -0,0 +1,323 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Compiles security group rules with a remote group to conjunctive flows.
+
+Matching a rule's protocol and ports, and the addresses of its remote group,
+in the same flow takes one flow per match and address CIDR, for every rule.
+Instead, the rules of a security group that have the same remote group are
+compiled to one conjunction of three clauses:
+
+    0. the new connections of the local ports of the security group
+    1. the protocol and port matches of the rules
+    2. the address CIDRs of the remote group
+
+so the address flows of a remote group do not multiply with the rules that
+use it. Flows with the same match carry the conjunction actions of all the
+conjunctions they belong to, e.g. the address flows of a remote group that
+several security groups use are installed once per direction.
+
+The compiler keeps the actions of every flow, and returns the flows whose
+actions changed, so that membership churn only touches the flows of the
+CIDRs that changed.
+"""
+import collections
+
+import netaddr
+from neutron_lib import constants as n_const
+from os_ken.ofproto import ether
+
+from dragonflow.controller.common import constants as const
+
+SG_CT_STATE_MASK = const.CT_STATE_NEW | const.CT_STATE_EST | \
+                   const.CT_STATE_REL | const.CT_STATE_INV | const.CT_STATE_TRK
+N_CLAUSES = 3
+# Conjunction ids are allocated above the security group unique keys, which
+# are the conjunction ids of the security groups themselves
+_CONJ_ID_BASE = 1 << 31
+# The action of the flow that matches a completed conjunction
+COMMIT = 'commit'
+
+_PORT_FIELD_BY_DIRECTION = {
+    n_const.INGRESS_DIRECTION: 'reg7',
+    n_const.EGRESS_DIRECTION: 'reg6',
+}
+_ADDRESS_FIELD = {
+    (n_const.IP_VERSION_4, n_const.INGRESS_DIRECTION): 'ipv4_src',
+    (n_const.IP_VERSION_4, n_const.EGRESS_DIRECTION): 'ipv4_dst',
+    (n_const.IP_VERSION_6, n_const.INGRESS_DIRECTION): 'ipv6_src',
+    (n_const.IP_VERSION_6, n_const.EGRESS_DIRECTION): 'ipv6_dst',
+}
+_ETH_TYPE_BY_IP_VERSION = {
+    n_const.IP_VERSION_4: ether.ETH_TYPE_IP,
+    n_const.IP_VERSION_6: ether.ETH_TYPE_IPV6,
+}
+_IP_VERSION_BY_ETHERTYPE = {
+    n_const.IPv4: n_const.IP_VERSION_4,
+    n_const.IPv6: n_const.IP_VERSION_6,
+}
+
+# match is a sorted tuple of (field, value) items
+Flow = collections.namedtuple('Flow', ('direction', 'match'))
+Conjunction = collections.namedtuple('Conjunction', ('conj_id', 'clause'))
+FlowChange = collections.namedtuple('FlowChange',
+                                    ('direction', 'match', 'actions'))
+
+_CompiledRule = collections.namedtuple(
+    '_CompiledRule', ('direction', 'ip_version', 'matches'))
+
+
+def _to_match(items):
+    return tuple(sorted(items.items()))
+
+
+def _get_port_match(direction, port_key):
+    return _to_match({
+        'ct_state': (const.CT_STATE_TRK | const.CT_STATE_NEW,
+                     SG_CT_STATE_MASK),
+        _PORT_FIELD_BY_DIRECTION[direction]: port_key,
+    })
+
+
+def _get_address_match(direction, cidr):
+    cidr = netaddr.IPNetwork(cidr)
+    return _to_match({
+        'eth_type': _ETH_TYPE_BY_IP_VERSION[cidr.version],
+        _ADDRESS_FIELD[(cidr.version, direction)]: (int(cidr.network),
+                                                    int(cidr.netmask)),
+    })
+
+
+class SecurityGroupCompiler(object):
+    '''Keeps the conjunctive flows of the rules with a remote group.
+
+       The methods that change the input return a list of FlowChange, with
+       the new actions of every flow whose actions changed. Empty actions
+       mean the flow should be deleted. Changes that add or modify flows come
+       before deletions, so that replacing a CIDR with its aggregate does not
+       drop packets in between.
+    '''
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # secgroup_id -> local port unique keys
+        self._ports = collections.defaultdict(set)
+        # remote_group_id -> netaddr.IPSet
+        self._addresses = {}
+        # (secgroup_id, remote_group_id) -> rule_id -> _CompiledRule
+        self._rules = {}
+        self._keys_by_secgroup = collections.defaultdict(set)
+        self._keys_by_remote_group = collections.defaultdict(set)
+        self._conj_ids = {}
+        self._free_conj_ids = []
+        self._next_conj_id = _CONJ_ID_BASE
+        # (secgroup_id, remote_group_id) -> {Flow: action}
+        self._contributions = {}
+        # Flow -> set of actions, i.e. the flows as installed
+        self._flows = {}
+
+    def get_conj_id(self, secgroup_id, remote_group_id):
+        return self._conj_ids.get((secgroup_id, remote_group_id))
+
+    def get_flows(self):
+        '''Returns {Flow: frozenset of actions}'''
+        return {flow: frozenset(actions)
+                for flow, actions in self._flows.items()}
+
+    def get_flow_counts(self):
+        '''Returns {secgroup_id: the number of flows of its conjunctions}'''
+        counts = {}
+        for secgroup_id, keys in self._keys_by_secgroup.items():
+            flows = set()
+            for key in keys:
+                flows.update(self._contributions[key])
+            counts[secgroup_id] = len(flows)
+        return counts
+
+    def add_port(self, secgroup_id, port_key):
+        self._ports[secgroup_id].add(port_key)
+        before = {}
+        for key in self._keys_by_secgroup.get(secgroup_id, ()):
+            conjunction = Conjunction(self._conj_ids[key], 0)
+            for direction in self._get_ip_versions(key):
+                flow = Flow(direction, _get_port_match(direction, port_key))
+                self._contributions[key][flow] = conjunction
+                self._add_action(flow, conjunction, before)
+        return self._get_changes(before)
+
+    def remove_port(self, secgroup_id, port_key):
+        ports = self._ports.get(secgroup_id)
+        if not ports or port_key not in ports:
+            return []
+        ports.remove(port_key)
+        if not ports:
+            del self._ports[secgroup_id]
+        before = {}
+        for key in self._keys_by_secgroup.get(secgroup_id, ()):
+            for direction in self._get_ip_versions(key):
+                flow = Flow(direction, _get_port_match(direction, port_key))
+                action = self._contributions[key].pop(flow, None)
+                if action is not None:
+                    self._remove_action(flow, action, before)
+        return self._get_changes(before)
+
+    def add_rule(self, secgroup_id, rule, matches):
+        '''matches is the list of match dicts of the rule, without the
+           remote addresses
+        '''
+        key = (secgroup_id, rule.remote_group_id)
+        if key not in self._rules:
+            self._rules[key] = {}
+            self._keys_by_secgroup[secgroup_id].add(key)
+            self._keys_by_remote_group[rule.remote_group_id].add(key)
+            self._conj_ids[key] = self._allocate_conj_id()
+        self._rules[key][rule.id] = _CompiledRule(
+            direction=rule.direction,
+            ip_version=_IP_VERSION_BY_ETHERTYPE[rule.ethertype],
+            matches=tuple(_to_match(match) for match in matches),
+        )
+        return self._update_conjunctions([key])
+
+    def remove_rule(self, secgroup_id, rule):
+        key = (secgroup_id, rule.remote_group_id)
+        rules = self._rules.get(key)
+        if not rules or rules.pop(rule.id, None) is None:
+            return []
+        changes = self._update_conjunctions([key])
+        if not rules:
+            del self._rules[key]
+            del self._contributions[key]
+            self._discard_key(self._keys_by_secgroup, secgroup_id, key)
+            self._discard_key(self._keys_by_remote_group,
+                              rule.remote_group_id, key)
+            self._free_conj_ids.append(self._conj_ids.pop(key))
+        return changes
+
+    def update_addresses(self, remote_group_id, addresses, added_cidrs,
+                         removed_cidrs):
+        '''addresses is the netaddr.IPSet of the remote group, after adding
+           added_cidrs and removing removed_cidrs
+        '''
+        if addresses:
+            self._addresses[remote_group_id] = addresses
+        else:
+            self._addresses.pop(remote_group_id, None)
+
+        before = {}
+        for key in self._keys_by_remote_group.get(remote_group_id, ()):
+            conjunction = Conjunction(self._conj_ids[key], 2)
+            contributions = self._contributions[key]
+            for direction, ip_versions in self._get_ip_versions(key).items():
+                for cidr in removed_cidrs:
+                    if netaddr.IPNetwork(cidr).version in ip_versions:
+                        flow = Flow(direction,
+                                    _get_address_match(direction, cidr))
+                        if contributions.pop(flow, None) is not None:
+                            self._remove_action(flow, conjunction, before)
+                for cidr in added_cidrs:
+                    if netaddr.IPNetwork(cidr).version in ip_versions:
+                        flow = Flow(direction,
+                                    _get_address_match(direction, cidr))
+                        contributions[flow] = conjunction
+                        self._add_action(flow, conjunction, before)
+        return self._get_changes(before)
+
+    @staticmethod
+    def _discard_key(keys_by_id, object_id, key):
+        keys = keys_by_id[object_id]
+        keys.discard(key)
+        if not keys:
+            del keys_by_id[object_id]
+
+    def _allocate_conj_id(self):
+        if self._free_conj_ids:
+            return self._free_conj_ids.pop()
+        conj_id = self._next_conj_id
+        self._next_conj_id += 1
+        return conj_id
+
+    def _get_ip_versions(self, key):
+        '''Returns {direction: IP versions of the rules}'''
+        ip_versions = collections.defaultdict(set)
+        for rule in self._rules[key].values():
+            ip_versions[rule.direction].add(rule.ip_version)
+        return ip_versions
+
+    def _compile(self, key):
+        '''Returns {Flow: action} of the conjunction of key'''
+        secgroup_id, remote_group_id = key
+        conj_id = self._conj_ids[key]
+        flows = {}
+        for rule in self._rules[key].values():
+            for match in rule.matches:
+                flows[Flow(rule.direction, match)] = Conjunction(conj_id, 1)
+
+        ports = self._ports.get(secgroup_id, ())
+        addresses = self._addresses.get(remote_group_id)
+        cidrs = addresses.iter_cidrs() if addresses else ()
+        for direction, ip_versions in self._get_ip_versions(key).items():
+            for port_key in ports:
+                flows[Flow(direction, _get_port_match(direction, port_key))] \
+                    = Conjunction(conj_id, 0)
+            for cidr in cidrs:
+                if cidr.version in ip_versions:
+                    flows[Flow(direction,
+                               _get_address_match(direction, cidr))] = \
+                        Conjunction(conj_id, 2)
+            for ip_version in ip_versions:
+                match = _to_match({
+                    'conj_id': conj_id,
+                    'eth_type': _ETH_TYPE_BY_IP_VERSION[ip_version],
+                })
+                flows[Flow(direction, match)] = COMMIT
+        return flows
+
+    def _update_conjunctions(self, keys):
+        before = {}
+        for key in keys:
+            old_flows = self._contributions.get(key, {})
+            new_flows = self._compile(key)
+            for flow, action in old_flows.items():
+                if new_flows.get(flow) != action:
+                    self._remove_action(flow, action, before)
+            for flow, action in new_flows.items():
+                if old_flows.get(flow) != action:
+                    self._add_action(flow, action, before)
+            self._contributions[key] = new_flows
+        return self._get_changes(before)
+
+    def _add_action(self, flow, action, before):
+        actions = self._flows.setdefault(flow, set())
+        before.setdefault(flow, frozenset(actions))
+        actions.add(action)
+
+    def _remove_action(self, flow, action, before):
+        actions = self._flows[flow]
+        before.setdefault(flow, frozenset(actions))
+        actions.discard(action)
+        if not actions:
+            del self._flows[flow]
+
+    def _get_changes(self, before):
+        modified = []
+        deleted = []
+        for flow, old_actions in before.items():
+            actions = frozenset(self._flows.get(flow, ()))
+            if actions == old_actions:
+                continue
+            change = FlowChange(flow.direction, flow.match, actions)
+            if actions:
+                modified.append(change)
+            else:
+                deleted.append(change)
+        return modified + deleted
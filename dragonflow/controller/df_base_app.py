@@ -155,7 +155,13 @@ class DFlowApp(object):
                                                      match,
                                                      inst)
 
-        datapath.send_msg(message)
+        self._send_msg(datapath, message)
+
+    def _send_msg(self, datapath, message):
+        """Send an OpenFlow message, batched with the other messages sent
+        while handling the current event, if batching is enabled
+        """
+        self.api.send_msg(datapath, message)
 
     def get_flows(self, datapath=None, table_id=None, timeout=None):
         if datapath is None:
@@ -165,6 +171,8 @@ class DFlowApp(object):
         if not timeout:
             timeout = DEFAULT_GET_FLOWS_TIMEOUT
         parser = datapath.ofproto_parser
+        # Include the flows of the current event in the reply
+        self.api.flow_batcher.flush()
         msg = parser.OFPFlowStatsRequest(datapath, table_id=table_id)
         try:
             with eventlet.timeout.Timeout(seconds=timeout):
@@ -183,6 +191,35 @@ class DFlowApp(object):
         LOG.debug("Got the following flows: %s", flows)
         return flows
 
+    def get_groups(self, datapath=None, timeout=None):
+        """Returns the group descriptions of all the groups on the switch,
+        or None if they could not be dumped.
+        """
+        if datapath is None:
+            datapath = self.datapath
+        if not timeout:
+            timeout = DEFAULT_GET_FLOWS_TIMEOUT
+        parser = datapath.ofproto_parser
+        # Include the groups of the current event in the reply
+        self.api.flow_batcher.flush()
+        msg = parser.OFPGroupDescStatsRequest(datapath)
+        try:
+            with eventlet.timeout.Timeout(seconds=timeout):
+                replies = ofctl_api.send_msg(
+                    self.api,
+                    msg,
+                    reply_cls=parser.OFPGroupDescStatsReply,
+                    reply_multi=True)
+        except BaseException:
+            LOG.exception("Failed to get groups")
+            return None
+        if replies is None:
+            LOG.error("No reply for get groups")
+            return None
+        groups = [body for reply in replies for body in reply.body]
+        LOG.debug("Got the following groups: %s", groups)
+        return groups
+
     def add_group(self, group_id, group_type, buckets, replace=False):
         """Add an entry to the groups table:
 
@@ -219,7 +256,8 @@ class DFlowApp(object):
 
     def _mod_group(self, command, group_id, group_type, buckets=None):
         """Convenince function that sends a group modification message"""
-        self.datapath.send_msg(
+        self._send_msg(
+            self.datapath,
             self.parser.OFPGroupMod(
                 datapath=self.datapath,
                 command=command,
@@ -247,7 +285,10 @@ class DFlowApp(object):
         if table_id is not None:
             actions.append(parser.NXActionResubmitTable(table_id=table_id))
 
-        datapath.send_msg(
+        # Sent in order after the flows of the current event, which the
+        # packet may need
+        self._send_msg(
+            datapath,
             parser.OFPPacketOut(
                 datapath=datapath,
                 buffer_id=ofproto.OFP_NO_BUFFER,
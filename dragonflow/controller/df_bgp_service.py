@@ -42,6 +42,7 @@ class BGPService(service.Service):
             update_cb=self.update_model_object,
             delete_cb=self.delete_model_object,
             selective=False,
+            incremental=cfg.CONF.df.enable_incremental_sync,
         )
         self.bgp_pulse = loopingcall.FixedIntervalLoopingCall(
             self.sync_data_from_nb_db)
@@ -14,21 +14,24 @@
 #    under the License.
 
 import collections
+import contextlib
 import itertools
 import sys
 import time
 
-from eventlet import queue
 from oslo_log import log
 from oslo_service import loopingcall
+from oslo_utils import timeutils
 
 from dragonflow.common import exceptions
+from dragonflow.common import metrics
 from dragonflow.common import utils as df_utils
 from dragonflow import conf as cfg
 from dragonflow.controller.common import constants as ctrl_const
 from dragonflow.controller import df_config
 from dragonflow.controller import service
 from dragonflow.controller import topology
+from dragonflow.controller import update_queue
 from dragonflow.db import api_nb
 from dragonflow.db import db_common
 from dragonflow.db import db_store
@@ -42,17 +45,31 @@ from dragonflow.db import sync
 
 LOG = log.getLogger(__name__)
 
+_UPDATES = metrics.counter(
+    'df_controller_updates_total',
+    'Updates received by the controller',
+    labelnames=('table', 'action'),
+)
+_UPDATE_LATENCY = metrics.histogram(
+    'df_controller_update_seconds',
+    'Time spent handling an update',
+    labelnames=('table',),
+)
+
 
 class DfLocalController(object):
 
     def __init__(self, chassis_name, nb_api):
         self.db_store = db_store.get_instance()
-        self._queue = queue.PriorityQueue()
+        self._queue = update_queue.CoalescingUpdateQueue()
         # pending_id -> (model, pender_id)
         #       'pending_id' is the ID of the object for which we are waiting.
         #       'model' and 'pender_id' are the model and the ID of the object
         #       which is waiting for the object described by 'pending_id'
         self._pending_objects = collections.defaultdict(set)
+        # (model, ID) of cached objects whose references were all resolved
+        # since they were last updated
+        self._resolved_objects = set()
 
         self.chassis_name = chassis_name
         self.nb_api = nb_api
@@ -80,16 +97,36 @@ class DfLocalController(object):
             update_cb=self.update,
             delete_cb=self.delete,
             selective=self.enable_selective_topo_dist,
+            incremental=cfg.CONF.df.enable_incremental_sync,
         )
+        # Nesting depth of _nb_sync, e.g. topics registered during a sync
+        self._nb_sync_depth = 0
         self._sync_pulse = loopingcall.FixedIntervalLoopingCall(
             self._submit_sync_event)
 
         self.sync_rate_limiter = df_utils.RateLimiter(
                 max_rate=1, time_unit=db_common.DB_SYNC_MINIMUM_INTERVAL)
 
+        metrics.gauge(
+            'df_controller_queue_depth',
+            'Updates waiting to be handled by the controller',
+            func=self._queue.pending_count,
+        )
+        metrics.gauge(
+            'df_controller_oldest_update_age_seconds',
+            'Age of the oldest update waiting to be handled',
+            func=self._get_oldest_update_age,
+        )
+        self._metrics_server = metrics.MetricsServer(
+            socket_path=cfg.CONF.df.metrics_socket,
+            host=cfg.CONF.df.metrics_host,
+            port=cfg.CONF.df.metrics_port,
+        )
+
     def db_change_callback(self, table, key, action, value, topic=None):
         update = db_common.DbUpdate(table, key, action, value, topic=topic)
         LOG.debug("Pushing Update to Queue: %s", update)
+        _UPDATES.labels(table or '', action).inc()
         self._queue.put(update)
         time.sleep(0)
 
@@ -97,9 +134,22 @@ class DfLocalController(object):
         while True:
             next_update = self._queue.get(block=True)
             LOG.debug("Event update: %s", next_update)
-            self.nb_api._notification_cb(next_update)
+            with _UPDATE_LATENCY.labels(next_update.table or '').time():
+                self.nb_api._notification_cb(next_update)
             self._queue.task_done()
 
+    def _get_oldest_update_age(self):
+        timestamp = self._queue.get_oldest_timestamp()
+        if timestamp is None:
+            return 0
+        return (timeutils.utcnow() - timestamp).total_seconds()
+
+    def get_folded_update_counts(self):
+        '''Returns the number of queued updates that were replaced by a newer
+           update of the same object before being handled, per table.
+        '''
+        return dict(self._queue.folded)
+
     def run(self):
         self.nb_api.register_notification_callback(self._handle_update)
         if self.neutron_notifier:
@@ -111,6 +161,7 @@ class DfLocalController(object):
             initial_delay=cfg.CONF.df.db_sync_time,
         )
 
+        self._metrics_server.start()
         self.switch_backend.start()
         self._register_models()
         self.register_chassis()
@@ -123,18 +174,38 @@ class DfLocalController(object):
 
     def _register_models(self):
         ignore_models = self.switch_backend.sync_ignore_models()
-        for model in model_framework.iter_models_by_dependency_order():
+        models = list(model_framework.iter_models_by_dependency_order())
+        self._queue.set_model_order(models)
+        for model in models:
             # FIXME (dimak) generalize sync to support non-northbound models
             if model not in ignore_models:
                 self._sync.add_model(model)
 
+    @contextlib.contextmanager
+    def _nb_sync(self):
+        '''Notifies the switch backend when a northbound database sync
+           starts and when it is done, so that applications may apply the
+           objects of the sync together.
+        '''
+        self._nb_sync_depth += 1
+        try:
+            if self._nb_sync_depth == 1:
+                self.switch_backend.nb_sync_started()
+            yield
+        finally:
+            self._nb_sync_depth -= 1
+            if self._nb_sync_depth == 0:
+                self.switch_backend.nb_sync_finished()
+
     def sync(self):
-        self.topology.check_topology_info()
-        self._sync.sync()
+        with self._nb_sync():
+            self.topology.check_topology_info()
+            self._sync.sync()
 
     def register_topic(self, topic):
         self.nb_api.subscriber.register_topic(topic)
-        self._sync.add_topic(topic)
+        with self._nb_sync():
+            self._sync.add_topic(topic)
 
     def unregister_topic(self, topic):
         self.nb_api.subscriber.unregister_topic(topic)
@@ -264,6 +335,7 @@ class DfLocalController(object):
         return getattr(self, method_name, self.delete_model_object)
 
     def update(self, obj):
+        self._resolved_objects.discard(self._get_object_key(obj))
         handler = getattr(
             self,
             'update_{0}'.format(obj.table_name),
@@ -272,6 +344,8 @@ class DfLocalController(object):
         return handler(obj)
 
     def delete(self, obj):
+        # Objects referencing the deleted one have to be resolved again
+        self._resolved_objects.clear()
         handler = self._get_delete_handler(obj.table_name)
         return handler(obj)
 
@@ -281,7 +355,8 @@ class DfLocalController(object):
 
     def _handle_update(self, update):
         try:
-            self._handle_db_change(update)
+            with self.switch_backend.flow_batch():
+                self._handle_db_change(update)
         except Exception as e:
             if "port_num is 0" not in str(e):
                 LOG.exception(e)
@@ -292,11 +367,16 @@ class DfLocalController(object):
         action = update.action
         if action == ctrl_const.CONTROLLER_REINITIALIZE:
             self.db_store.clear()
+            self._resolved_objects.clear()
+            self._sync.reset()
             self.switch_backend.initialize(self.db_change_callback,
                                            self.neutron_notifier)
             self.sync()
         elif action == ctrl_const.CONTROLLER_SYNC:
             self.sync()
+        elif action == ctrl_const.CONTROLLER_SYNC_TOPIC:
+            with self._nb_sync():
+                self._sync.sync_topic(update.topic)
         elif action == ctrl_const.CONTROLLER_DBRESTART:
             self.nb_api.db_recover_callback()
         elif action == ctrl_const.CONTROLLER_SWITCH_SYNC_FINISHED:
@@ -315,7 +395,7 @@ class DfLocalController(object):
                 if action == 'delete':
                     self.delete_by_id(model_class, update.key)
                 else:
-                    obj = model_class.from_json(update.value)
+                    obj = self.nb_api.codec.decode(model_class, update.value)
                     self._send_updates_for_object(obj)
         else:
             LOG.warning('Unfamiliar update: %s', str(update))
@@ -325,17 +405,23 @@ class DfLocalController(object):
             return obj.get_proxied_model()
         return type(obj)
 
+    def _get_object_key(self, obj):
+        return self._get_model(obj), obj.id
+
     def _send_updates_for_object(self, obj):
         try:
-            references = self.get_model_references_deep(obj)
+            references = self._resolve_references(obj)
         except exceptions.ReferencedObjectNotFound as e:
             proxy = e.kwargs['proxy']
             reference_id = proxy.id
             model = self._get_model(obj)
             self._pending_objects[reference_id].add((model, obj.id))
         else:
-            queue = itertools.chain(reversed(references), (obj,))
+            queue = list(itertools.chain(references, (obj,)))
             self._send_update_events(queue)
+            # Everything sent is now cached with all of its references
+            self._resolved_objects.update(
+                self._get_object_key(item) for item in queue)
             self._send_pending_events(obj)
 
     def _send_pending_events(self, obj):
@@ -343,9 +429,11 @@ class DfLocalController(object):
             pending = self._pending_objects.pop(obj.id)
         except KeyError:
             return  # Nothing to do
-        for model, item_id in pending:
-            lean_obj = model(id=item_id)
-            item = self.nb_api.get(lean_obj)
+        lean_objs = [model(id=item_id) for model, item_id in pending]
+        for item in self.nb_api.get_many(lean_objs):
+            if item is None:
+                # Pending object was deleted in the meantime
+                continue
             self._send_updates_for_object(item)
 
     def get_model_references_deep(self, obj):
@@ -398,6 +486,93 @@ class DfLocalController(object):
             for submodel in item.iter_submodels():
                 queue.append(submodel)
 
+    def _resolve_references(self, obj):
+        """
+        Return a list of the model instances referenced by the given model
+        instance, including indirect references, ordered so that an instance
+        comes after the instances it references.
+
+        References to objects that are cached and were resolved since they
+        were last changed are skipped, along with their own references, as
+        there is nothing to send for them. References missing from the
+        db_store are read from the NB DB with a single request for each level
+        of references.
+
+        :param obj: Model instance
+        :type obj:  model_framework.ModelBase
+        :return:    list
+        :raises:    exceptions.ReferencedObjectNotFound
+        """
+        # key -> instance, and key -> keys of the instances it references
+        resolved = {}
+        edges = collections.defaultdict(list)
+        root_key = self._get_object_key(obj)
+        wave = [(root_key, obj)]
+        seen = {root_key}
+
+        while wave:
+            missing = []
+            next_wave = []
+            for key, item in wave:
+                for reference in self._iter_direct_references(item):
+                    ref_key = self._get_object_key(reference)
+                    if ref_key in self._resolved_objects:
+                        continue
+                    edges[key].append(ref_key)
+                    if ref_key in seen:
+                        continue
+                    seen.add(ref_key)
+                    cached = reference.get_object()
+                    if cached is None:
+                        missing.append((ref_key, reference))
+                    else:
+                        next_wave.append((ref_key, cached))
+
+            if missing:
+                fetched = self.nb_api.get_many(
+                    [reference for _key, reference in missing])
+                for (ref_key, reference), item in zip(missing, fetched):
+                    if item is None:
+                        raise exceptions.ReferencedObjectNotFound(
+                            proxy=reference)
+                    next_wave.append((ref_key, item))
+
+            for ref_key, item in next_wave:
+                resolved[ref_key] = item
+            wave = next_wave
+
+        # Post-order walk, so references are sent before their referrers
+        ordered = []
+        visited = {root_key}
+        stack = [(root_key, iter(edges[root_key]))]
+        while stack:
+            key, children = stack[-1]
+            for child in children:
+                if child not in visited:
+                    visited.add(child)
+                    stack.append((child, iter(edges[child])))
+                    break
+            else:
+                stack.pop()
+                if key != root_key:
+                    ordered.append(resolved[key])
+        return ordered
+
+    @staticmethod
+    def _iter_direct_references(obj):
+        """
+        Yield the model proxies in the given model instance and its embedded
+        (non-proxy) submodels.
+        """
+        queue = collections.deque((obj,))
+        while queue:
+            item = queue.pop()
+            for submodel in item.iter_submodels():
+                if model_proxy.is_model_proxy(submodel):
+                    yield submodel
+                else:
+                    queue.append(submodel)
+
     def _dereference(self, reference):
         """
         Dereference a model proxy object. Return first from the db_store, and
@@ -10,6 +10,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 from eventlet import queue
 import sys
 import time
@@ -18,6 +19,7 @@ import traceback
 from oslo_log import log as logging
 
 from dragonflow.common import exceptions
+from dragonflow.common import metrics
 from dragonflow.common import utils as df_utils
 from dragonflow import conf as cfg
 from dragonflow.controller import df_config
@@ -30,6 +32,12 @@ from dragonflow.db import pub_sub_api
 
 LOG = logging.getLogger(__name__)
 
+_BATCH_SIZE = metrics.histogram(
+    'df_publisher_batch_updates',
+    'Updates sent in a single pub/sub message by the publisher service',
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+
 
 def _get_publisher():
     pub_sub_driver = df_utils.load_driver(
@@ -82,18 +90,70 @@ class PublisherService(object):
                 except queue.Empty:
                     self._update_timestamp_in_db()
                     continue
-                self.publisher.send_event(event)
-                if event.table != core.Publisher.table_name:
+                events = self._get_batch(event)
+                self._send_events(events)
+                if any(event.table != core.Publisher.table_name
+                       for event in events):
                     self._update_timestamp_in_db()
                 time.sleep(0)
             except Exception as e:
-                LOG.warning("Exception in main loop: {}, {}").format(
-                    e, traceback.format_exc())
+                LOG.warning("Exception in main loop: %s, %s",
+                            e, traceback.format_exc())
                 # Ignore
 
+    def _get_batch(self, event):
+        """Returns event, followed by the events queued after it, within the
+        batch size and latency bounds.
+        """
+        events = [event]
+        max_size = cfg.CONF.df.publisher_batch_max_size
+        deadline = time.time() + cfg.CONF.df.publisher_batch_max_latency
+        while len(events) < max_size:
+            timeout = deadline - time.time()
+            try:
+                if timeout > 0:
+                    events.append(self._queue.get(timeout=timeout))
+                else:
+                    events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def _send_events(self, events):
+        """Sends the events in one message per topic. Subscribers split
+        batch messages back into the events.
+        """
+        events_by_topic = collections.OrderedDict()
+        for event in events:
+            topic = event.topic or db_common.SEND_ALL_TOPIC
+            events_by_topic.setdefault(topic, []).append(event)
+
+        for topic, topic_events in events_by_topic.items():
+            _BATCH_SIZE.observe(len(topic_events))
+            if len(topic_events) == 1:
+                self.publisher.send_event(topic_events[0])
+                continue
+            self.publisher.send_event(
+                db_common.DbUpdate(
+                    None,
+                    None,
+                    db_common.BATCH_ACTION,
+                    [event.to_dict() for event in topic_events],
+                    topic=topic,
+                ),
+            )
+
     def _update_timestamp_in_db(self):
         if self._rate_limit():
             return
+        publisher = core.Publisher(id=self.uuid)
+        if self.nb_api.get_heartbeat(publisher) is None:
+            # The last heartbeat expired, so other publisher services may
+            # have removed this publisher as stale
+            self._update_publisher()
+        self.nb_api.heartbeat(publisher, cfg.CONF.df.publisher_timeout)
+
+    def _update_publisher(self):
         try:
             self.nb_api.update(
                 core.Publisher(
@@ -0,0 +1,136 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import collections
+import itertools
+
+from eventlet import queue
+from oslo_log import log
+
+from dragonflow.common import metrics
+
+
+LOG = log.getLogger(__name__)
+
+DELETE_ACTION = 'delete'
+
+_FOLDED_UPDATES = metrics.counter(
+    'df_controller_updates_folded_total',
+    'Queued updates replaced by a newer update of the same object',
+    labelnames=('table',),
+)
+
+
+class _Entry(object):
+    '''A queued update, ordered by timestamp, then by the dependency order of
+       its model, then by arrival.
+    '''
+    __slots__ = ('priority', 'update', 'superseded')
+
+    def __init__(self, priority, update):
+        self.priority = priority
+        self.update = update
+        self.superseded = False
+
+    def __lt__(self, other):
+        return self.priority < other.priority
+
+
+class CoalescingUpdateQueue(object):
+    '''A priority queue of DbUpdates that keeps only the latest pending update
+    of each object, identified by (table, key).
+
+    A newer update of an object replaces the pending one, and takes its own
+    place in the queue, so it is still handled after the objects it depends
+    on. Pending deletes are never replaced by a non-delete update, so a
+    delete followed by a re-create is handled as both. Updates without a
+    table or a key (controller events) are never coalesced.
+
+    The number of replaced (folded) updates is counted per table.
+    '''
+
+    def __init__(self):
+        self._queue = queue.PriorityQueue()
+        self._pending = {}
+        self._sequence = itertools.count()
+        self._model_ranks = {}
+        self._superseded_count = 0
+        self.folded = collections.Counter()
+
+    def set_model_order(self, models):
+        '''Updates of the same timestamp are handled in the order of their
+           models in models, e.g. iter_models_by_dependency_order()
+        '''
+        self._model_ranks = {model.table_name: rank
+                             for rank, model in enumerate(models)}
+
+    def _get_priority(self, update):
+        return (
+            update.timestamp,
+            self._model_ranks.get(update.table, -1),
+            next(self._sequence),
+        )
+
+    def put(self, update):
+        entry = _Entry(self._get_priority(update), update)
+
+        if update.table is not None and update.key is not None:
+            obj_key = (update.table, update.key)
+            pending = self._pending.get(obj_key)
+            if pending is not None and (
+                    pending.update.action != DELETE_ACTION or
+                    update.action == DELETE_ACTION):
+                pending.superseded = True
+                self._superseded_count += 1
+                self.folded[update.table] += 1
+                _FOLDED_UPDATES.labels(update.table).inc()
+                LOG.debug("Folded pending update: %s", pending.update)
+            self._pending[obj_key] = entry
+
+        self._queue.put(entry)
+
+    def get(self, block=True):
+        '''Returns the next update that was not replaced by a newer one'''
+        while True:
+            entry = self._queue.get(block=block)
+            update = entry.update
+            obj_key = (update.table, update.key)
+            if self._pending.get(obj_key) is entry:
+                del self._pending[obj_key]
+
+            if not entry.superseded:
+                return update
+            self._superseded_count -= 1
+            self._queue.task_done()
+
+    def task_done(self):
+        self._queue.task_done()
+
+    def qsize(self):
+        '''Number of queued entries, including ones replaced by newer
+           updates and not yet skipped.
+        '''
+        return self._queue.qsize()
+
+    def pending_count(self):
+        '''Number of queued updates that are still to be handled'''
+        return self._queue.qsize() - self._superseded_count
+
+    def get_oldest_timestamp(self):
+        '''Returns the timestamp of the oldest update still to be handled, or
+           None if there is none.
+        '''
+        timestamps = [entry.update.timestamp for entry in self._queue.queue
+                      if not entry.superseded]
+        return min(timestamps) if timestamps else None
+
+    def get_folded_count(self):
+        return sum(self.folded.values())
@@ -14,7 +14,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import contextlib
 import copy
+import threading
 import time
 import traceback
 
@@ -27,6 +30,7 @@ import dragonflow.common.exceptions as df_exceptions
 from dragonflow.common import utils as df_utils
 from dragonflow.controller.common import constants as ctrl_const
 from dragonflow.db import db_common
+from dragonflow.db import model_framework
 from dragonflow.db import model_proxy as mproxy
 from dragonflow.db.models import core
 
@@ -55,6 +59,12 @@ def _get_topic(obj):
         return None
 
 
+def _get_lean_obj(obj):
+    if mproxy.is_model_proxy(obj):
+        return obj.get_proxied_model()(id=obj.id)
+    return obj
+
+
 class NbApi(object):
 
     def __init__(self, db_driver):
@@ -65,6 +75,9 @@ class NbApi(object):
         self.subscriber = None
         self.enable_selective_topo_dist = \
             cfg.CONF.df.enable_selective_topology_distribution
+        self.codec = model_framework.get_codec(cfg.CONF.df.model_codec)
+        # Holds the operations of the current thread's open batch
+        self._batch_local = threading.local()
 
     @staticmethod
     def get_instance():
@@ -149,16 +162,44 @@ class NbApi(object):
     def support_publish_subscribe(self):
         return self.use_pubsub
 
+    def _get_event_topic(self, topic):
+        if not self.enable_selective_topo_dist or topic is None:
+            return db_common.SEND_ALL_TOPIC
+        return topic
+
     def _send_db_change_event(self, table, key, action, value, topic):
         if not self.use_pubsub:
             return
 
-        if not self.enable_selective_topo_dist or topic is None:
-            topic = db_common.SEND_ALL_TOPIC
+        topic = self._get_event_topic(topic)
         update = db_common.DbUpdate(table, key, action, value, topic=topic)
         self.publisher.send_event(update)
         time.sleep(0)
 
+    def _send_db_change_events(self, events):
+        """Publish the (table, key, action, value, topic) events, coalesced
+           into a single batch update per topic.
+        """
+        if not self.use_pubsub:
+            return
+
+        updates_by_topic = collections.OrderedDict()
+        for table, key, action, value, topic in events:
+            topic = self._get_event_topic(topic)
+            update = db_common.DbUpdate(table, key, action, value,
+                                        topic=topic)
+            updates_by_topic.setdefault(topic, []).append(update)
+
+        for topic, updates in updates_by_topic.items():
+            if len(updates) == 1:
+                update = updates[0]
+            else:
+                update = db_common.DbUpdate(
+                    None, None, db_common.BATCH_ACTION,
+                    [u.to_dict() for u in updates], topic=topic)
+            self.publisher.send_event(update)
+        time.sleep(0)
+
     def register_notification_callback(self, notification_cb):
         self._notification_cb = notification_cb
 
@@ -180,19 +221,125 @@ class NbApi(object):
         self.subscriber.register_topic(topic)
         self.subscriber.daemonize()
 
+    def _get_batch(self):
+        return getattr(self._batch_local, 'operations', None)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Collect the create, update and delete calls made by this thread
+           within the context, and write them to the database at once when
+           the context exits. Events about the changes are published as a
+           single batch update per topic. If the context exits with an
+           exception, nothing is written.
+
+           Note that get calls within the context do not see the collected
+           changes, and that updating a missing object raises DBKeyNotFound
+           only when the batch is written. Nested batches are written with
+           the outermost one.
+
+           >>> with nb_api.batch():
+           ...     nb_api.create(subport1)
+           ...     nb_api.create(subport2)
+
+        """
+        if self._get_batch() is not None:
+            yield
+            return
+
+        operations = []
+        self._batch_local.operations = operations
+        try:
+            yield
+        finally:
+            self._batch_local.operations = None
+        self._flush_batch(operations)
+
+    def _flush_batch(self, operations):
+        # (model, id) -> the object's state, as of the operations so far
+        objs = {}
+        # Read all objects that are updated but not created in the batch
+        to_read = []
+        for action, obj, _ in operations:
+            key = (type(obj), obj.id)
+            if key not in objs:
+                objs[key] = None
+                if action == 'update':
+                    to_read.append(obj)
+        for obj, db_obj in zip(to_read, self.get_many(to_read)):
+            objs[(type(obj), obj.id)] = db_obj
+
+        # (table, id) -> [action, obj, topic, send_event], ordered by the
+        # last write of each object.
+        writes = collections.OrderedDict()
+        for action, obj, skip_send_event in operations:
+            model = type(obj)
+            key = (model, obj.id)
+            if action == 'create':
+                objs[key] = copy.copy(obj)
+                self._add_batch_write(writes, 'create', objs[key],
+                                      skip_send_event)
+            elif action == 'update':
+                full_obj = objs[key]
+                if full_obj is None:
+                    raise df_exceptions.DBKeyNotFound(key=obj.id)
+                db_obj = copy.copy(full_obj)
+                if not full_obj.update(obj):
+                    continue
+                full_obj.on_update_pre(db_obj)
+                self._add_batch_write(writes, 'set', full_obj,
+                                      skip_send_event)
+            else:
+                objs[key] = None
+                self._add_batch_write(writes, 'delete', obj, skip_send_event)
+
+        if not writes:
+            return
+
+        db_operations = []
+        events = []
+        for (table, obj_id), (action, obj, topic, send_event) in (
+                writes.items()):
+            value = event_value = None
+            if action != 'delete':
+                value, event_value = self.codec.encode(obj)
+            db_operations.append((action, table, obj_id, value, topic))
+            if send_event:
+                events.append((table, obj_id, action, event_value, topic))
+        self.driver.execute_batch(db_operations)
+        self._send_db_change_events(events)
+
+    @staticmethod
+    def _add_batch_write(writes, action, obj, skip_send_event):
+        key = (type(obj).table_name, obj.id)
+        send_event = not skip_send_event
+        previous = writes.pop(key, None)
+        if previous is not None:
+            previous_action, _, _, previous_send_event = previous
+            if action != 'delete':
+                if previous_action == 'create':
+                    action = 'create'
+                elif previous_action == 'delete':
+                    action = 'set'
+            send_event = send_event or previous_send_event
+        writes[key] = (action, obj, _get_topic(obj), send_event)
+
     def create(self, obj, skip_send_event=False):
         """Create the provided object in the database and publish an event
            about its creation.
         """
         model = type(obj)
         obj.on_create_pre()
-        serialized_obj = obj.to_json()
+        operations = self._get_batch()
+        if operations is not None:
+            operations.append(('create', obj, skip_send_event))
+            return
+        serialized_obj, event_value = self.codec.encode(obj)
         topic = _get_topic(obj)
         self.driver.create_key(model.table_name, obj.id,
                                serialized_obj, topic)
         if not skip_send_event:
             self._send_db_change_event(model.table_name, obj.id, 'create',
-                                       serialized_obj, topic)
+                                       event_value, topic)
 
     def update(self, obj, skip_send_event=False):
         """Update the provided object in the database and publish an event
@@ -202,6 +349,11 @@ class NbApi(object):
            any non-empty fields of the provided object. Retrieval happens by
            id/topic fields.
         """
+        operations = self._get_batch()
+        if operations is not None:
+            operations.append(('update', obj, skip_send_event))
+            return
+
         model = type(obj)
         full_obj = self.get(obj)
         db_obj = copy.copy(full_obj)
@@ -215,14 +367,14 @@ class NbApi(object):
             return
 
         full_obj.on_update_pre(db_obj)
-        serialized_obj = full_obj.to_json()
+        serialized_obj, event_value = self.codec.encode(full_obj)
         topic = _get_topic(full_obj)
 
         self.driver.set_key(model.table_name, full_obj.id,
                             serialized_obj, topic)
         if not skip_send_event:
             self._send_db_change_event(model.table_name, full_obj.id, 'set',
-                                       serialized_obj, topic)
+                                       event_value, topic)
 
     def delete(self, obj, skip_send_event=False):
         """Delete the provided object from the database and publish the event
@@ -233,6 +385,11 @@ class NbApi(object):
         """
         model = type(obj)
         obj.on_delete_pre()
+        operations = self._get_batch()
+        if operations is not None:
+            operations.append(('delete', obj, skip_send_event))
+            return
+
         topic = _get_topic(obj)
         try:
             self.driver.delete_key(model.table_name, obj.id, topic)
@@ -254,8 +411,7 @@ class NbApi(object):
            Chassis(id="One", ip="192.168.121.22", tunnel_types=["vxlan"])
 
         """
-        if mproxy.is_model_proxy(lean_obj):
-            lean_obj = lean_obj.get_proxied_model()(id=lean_obj.id)
+        lean_obj = _get_lean_obj(lean_obj)
         model = type(lean_obj)
         try:
             serialized_obj = self.driver.get_key(
@@ -270,12 +426,84 @@ class NbApi(object):
                 {'id': lean_obj.id, 'table': model.table_name})
             LOG.debug('%s', (exception_tb,))
         else:
-            return model.from_json(serialized_obj)
+            obj = self.codec.decode(model, serialized_obj)
+            self._read_heartbeats(model, (obj,))
+            return obj
+
+    def get_many(self, lean_objs):
+        """Retrieve several model instances from the database at once. The
+           objects may be of different models. Returns a list in the order
+           of lean_objs, where objects that were not found are None.
+
+           >>> nb_api.get_many([Chassis(id="one"), LogicalSwitch(id="two")])
+           [Chassis(id="one", ...), None]
+
+        """
+        # (model, topic) -> [(index in lean_objs, id)]
+        requests = collections.defaultdict(list)
+        for index, lean_obj in enumerate(lean_objs):
+            lean_obj = _get_lean_obj(lean_obj)
+            key = (type(lean_obj), _get_topic(lean_obj))
+            requests[key].append((index, lean_obj.id))
+
+        result = [None] * len(lean_objs)
+        for (model, topic), entries in requests.items():
+            indices, ids = zip(*entries)
+            values = self.driver.get_keys(model.table_name, ids, topic)
+            for index, serialized_obj in zip(indices, values):
+                if serialized_obj is not None:
+                    result[index] = self.codec.decode(model, serialized_obj)
+            self._read_heartbeats(
+                model, [result[index] for index in indices
+                        if result[index] is not None])
+        return result
 
     def get_all(self, model, topic=None):
         """Get all instances of provided model, can be limited to instances
            with a specific topic.
         """
         all_values = self.driver.get_all_entries(model.table_name, topic)
-        all_objects = [model.from_json(e) for e in all_values]
+        all_objects = [self.codec.decode(model, e) for e in all_values]
+        self._read_heartbeats(model, all_objects)
         return model.on_get_all_post(all_objects)
+
+    def get_revision(self, model, topic=None):
+        """Get the revision of the provided model's table, can be limited to
+           instances with a specific topic. Returns None if the database
+           driver does not track revisions.
+        """
+        return self.driver.get_table_revision(model.table_name, topic)
+
+    def heartbeat(self, obj, ttl):
+        """Record that the provided object is alive for the next ttl
+           seconds, without reading or writing the object itself. No event
+           is published.
+
+           >>> nb_api.heartbeat(Service(id="one"), 60)
+
+        """
+        obj = _get_lean_obj(obj)
+        self.driver.heartbeat(type(obj).table_name, obj.id, ttl)
+
+    def get_heartbeat(self, obj):
+        """Get the time of the last heartbeat of the provided object, or
+           None if it has expired.
+        """
+        obj = _get_lean_obj(obj)
+        return self.driver.get_heartbeat(type(obj).table_name, obj.id)
+
+    def _read_heartbeats(self, model, instances):
+        """Set the heartbeat field of the instances, of models that have
+           one, to the time of their last heartbeat, if it is later.
+        """
+        field = getattr(model, 'heartbeat_field', None)
+        if field is None:
+            return
+        if not instances:
+            return
+        timestamps = self.driver.get_heartbeats(
+            model.table_name, [instance.id for instance in instances])
+        for instance, timestamp in zip(instances, timestamps):
+            if timestamp is not None and timestamp > (
+                    getattr(instance, field) or 0):
+                setattr(instance, field, timestamp)
@@ -11,13 +11,24 @@
 #    under the License.
 
 import abc
+import time
 
+from oslo_serialization import jsonutils
 import six
 
+from dragonflow.common import exceptions as df_exceptions
+from dragonflow.db import db_common
+
+
+def get_heartbeat_key(table, key):
+    return '{}.{}'.format(table, key)
+
 
 @six.add_metaclass(abc.ABCMeta)
 class DbApi(object):
 
+    _heartbeat_table_created = False
+
     @abc.abstractmethod
     def initialize(self, db_ip, db_port, **args):
         """Initialize the DB client
@@ -70,6 +81,29 @@ class DbApi(object):
         :raises DragonflowException.DBKeyNotFound: if key not found
         """
 
+    def get_keys(self, table, keys, topic=None):
+        """Get the values of several keys in a table at once. Keys that do
+        not exist are returned as None.
+
+        Drivers should override this method with a batched implementation.
+        The default implementation reads the keys one by one.
+
+        :param table:      table name
+        :type table:       string
+        :param keys:       key names
+        :type keys:        list of strings
+        :param topic:      optional topic to aid in key lookup
+        :type topic:       string
+        :returns:          list of values (or None), in the order of keys
+        """
+        values = []
+        for key in keys:
+            try:
+                values.append(self.get_key(table, key, topic))
+            except df_exceptions.DBKeyNotFound:
+                values.append(None)
+        return values
+
     @abc.abstractmethod
     def set_key(self, table, key, value, topic=None):
         """Set a specific key in a table with value. If the key does not
@@ -106,6 +140,27 @@ class DbApi(object):
         :returns:          None
         """
 
+    def execute_batch(self, operations):
+        """Write several keys at once. Drivers should override this method
+        to apply all the operations in as few transactions as possible. The
+        default implementation applies the operations one by one.
+
+        A key appears at most once in operations.
+
+        :param operations: the writes to apply, in order
+        :type operations:  list of (action, table, key, value, topic), where
+                           action is one of 'create', 'set' or 'delete', and
+                           value is None for 'delete'
+        :returns:          None
+        """
+        for action, table, key, value, topic in operations:
+            if action == 'create':
+                self.create_key(table, key, value, topic)
+            elif action == 'set':
+                self.set_key(table, key, value, topic)
+            else:
+                self.delete_key(table, key, topic)
+
     @abc.abstractmethod
     def delete_key(self, table, key, topic=None):
         """Delete a specific key from a table. If the key does not exist,
@@ -145,6 +200,112 @@ class DbApi(object):
         :returns:          list of keys
         """
 
+    def get_table_revision(self, table, topic=None):
+        """Returns an opaque revision of the table. The revision changes
+        whenever an entry in the table is created, modified or deleted, so
+        that two equal revisions mean the table did not change in between.
+        Drivers that can't track table revisions return None, in which case
+        the table should always be re-read.
+
+        :param table:      table name
+        :type table:       string
+        :param topic:      optional topic to limit the revision to
+        :type topic:       string
+        :returns:          revision object, or None if not supported
+        """
+        return None
+
+    def heartbeat(self, table, key, ttl):
+        """Record that the entity with the given key is alive, for the next
+        ttl seconds. The entity itself is neither read nor written.
+
+        Drivers should implement heartbeats with a TTL or a lease, refreshed
+        on every heartbeat. By default, the time of the heartbeat and its
+        expiry are written to the heartbeat table.
+
+        :param table:      table name of the entity
+        :type table:       string
+        :param key:        key of the entity
+        :type key:         string
+        :param ttl:        seconds the entity is considered alive for
+        :type ttl:         int
+        :returns:          None
+        """
+        now = time.time()
+        value = jsonutils.dumps({'timestamp': now, 'expires': now + ttl})
+        heartbeat_key = get_heartbeat_key(table, key)
+        if not self._heartbeat_table_created:
+            self.create_table(db_common.HEARTBEAT_TABLE)
+            self._heartbeat_table_created = True
+        try:
+            self.set_key(db_common.HEARTBEAT_TABLE, heartbeat_key, value)
+        except df_exceptions.DBKeyNotFound:
+            self.create_key(db_common.HEARTBEAT_TABLE, heartbeat_key, value)
+
+    def get_heartbeat(self, table, key):
+        """Returns the time of the last heartbeat of the entity with the
+        given key, or None if it has expired, or there was none.
+
+        :param table:      table name of the entity
+        :type table:       string
+        :param key:        key of the entity
+        :type key:         string
+        :returns:          timestamp in seconds, or None
+        """
+        try:
+            value = self.get_key(db_common.HEARTBEAT_TABLE,
+                                 get_heartbeat_key(table, key))
+        except df_exceptions.DBKeyNotFound:
+            return None
+        value = jsonutils.loads(value)
+        if value['expires'] < time.time():
+            return None
+        return value['timestamp']
+
+    def get_heartbeats(self, table, keys):
+        """Returns the times of the last heartbeats of the entities with the
+        given keys, at once. Heartbeats that have expired, or that there were
+        none of, are returned as None.
+
+        Drivers that override get_heartbeat should override this method too.
+        By default, the heartbeats are read from the heartbeat table with
+        get_keys.
+
+        :param table:      table name of the entities
+        :type table:       string
+        :param keys:       keys of the entities
+        :type keys:        list of strings
+        :returns:          list of timestamps (or None), in the order of keys
+        """
+        values = self.get_keys(db_common.HEARTBEAT_TABLE,
+                               [get_heartbeat_key(table, key)
+                                for key in keys])
+        now = time.time()
+        timestamps = []
+        for value in values:
+            if value is not None:
+                value = jsonutils.loads(value)
+                if value['expires'] < now:
+                    value = None
+            timestamps.append(value and value['timestamp'])
+        return timestamps
+
+    def delete_heartbeat(self, table, key):
+        """Delete the heartbeat of the entity with the given key, if it
+        exists.
+
+        :param table:      table name of the entity
+        :type table:       string
+        :param key:        key of the entity
+        :type key:         string
+        :returns:          None
+        """
+        try:
+            self.delete_key(db_common.HEARTBEAT_TABLE,
+                            get_heartbeat_key(table, key))
+        except df_exceptions.DBKeyNotFound:
+            pass
+
     @abc.abstractmethod
     def allocate_unique_key(self, table):
         """Allocate a unique id in the controller
@@ -17,6 +17,10 @@ from oslo_utils import timeutils
 SEND_ALL_TOPIC = 'D'
 DB_SYNC_MINIMUM_INTERVAL = 180
 UNIQUE_KEY_TABLE = 'unique_key'
+REVISION_TABLE = 'revision'
+HEARTBEAT_TABLE = 'heartbeat'
+# Action of a DbUpdate whose value is a list of DbUpdate dicts
+BATCH_ACTION = 'batch'
 
 
 class DbUpdate(object):
@@ -9,18 +9,50 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+import bisect
 import collections
 import inspect
 import itertools
 import threading
+import weakref
+
+import netaddr
+import six
 
 from dragonflow._i18n import _
+from dragonflow import conf as cfg
+from dragonflow.db import model_framework
 from dragonflow.utils import radix_tree
 
 
 ANY = radix_tree.ANY
 MISSING = None
 
+# Marks fields that are not set in a compact record
+_UNSET = object()
+
+
+def _get_path_values(obj, path):
+    '''Returns the set of values found in obj at the dotted path, following
+       lists. MISSING is included if the path ends early at an unset field.
+    '''
+    extras = set()
+    nodes = [obj]
+
+    for p in path.split('.'):
+        new_nodes = []
+        for node in nodes:
+            attr = getattr(node, p)
+            if isinstance(attr, list):
+                new_nodes.extend(attr)
+            elif attr is None:
+                extras.add(MISSING)
+            else:
+                new_nodes.append(attr)
+        nodes = new_nodes
+
+    return set(nodes).union(extras)
+
 
 class _IndexCache(object):
     '''A cache for a specific index of a model.
@@ -71,24 +103,11 @@ class _IndexCache(object):
             for obj in self._tree.get_all(key):
                 yield obj
 
-    def _get_key_element(self, obj, key_element):
-        path = key_element.split('.')
-        extras = set()
-        nodes = [obj]
-
-        for p in path:
-            new_nodes = []
-            for node in nodes:
-                attr = getattr(node, p)
-                if isinstance(attr, list):
-                    new_nodes.extend(attr)
-                elif attr is None:
-                    extras.add(MISSING)
-                else:
-                    new_nodes.append(attr)
-            nodes = new_nodes
+    def get_by_key(self, key):
+        return self._tree.get_all(key)
 
-        return set(nodes).union(extras)
+    def _get_key_element(self, obj, key_element):
+        return _get_path_values(obj, key_element)
 
     def _get_keys(self, obj):
         keys = []
@@ -99,6 +118,257 @@ class _IndexCache(object):
         return itertools.product(*keys)
 
 
+class _RangeIndexCache(object):
+    '''A cache for a range index of a model.
+
+       (value, ID) pairs are kept in a sorted list, so that both exact and
+       range lookups are done in O(log n). Objects without a value are not
+       indexed.
+    '''
+
+    def __init__(self, index):
+        self._path = index[0]
+        self._sorted = []
+        self._keys = {}
+
+    def _get_values(self, obj):
+        values = _get_path_values(obj, self._path)
+        values.discard(MISSING)
+        return frozenset(values)
+
+    def _remove(self, value, obj_id):
+        del self._sorted[bisect.bisect_left(self._sorted, (value, obj_id))]
+
+    def delete(self, obj):
+        for value in self._keys.pop(obj.id, ()):
+            self._remove(value, obj.id)
+
+    def update(self, obj):
+        new_values = self._get_values(obj)
+        old_values = self._keys.get(obj.id, frozenset())
+
+        for value in new_values - old_values:
+            bisect.insort(self._sorted, (value, obj.id))
+
+        for value in old_values - new_values:
+            self._remove(value, obj.id)
+
+        if new_values:
+            self._keys[obj.id] = new_values
+        else:
+            self._keys.pop(obj.id, None)
+
+    def get_range(self, low=None, high=None):
+        '''Yields IDs of all objects with a value between low and high
+           (inclusive), in ascending order of values. None means unbounded.
+        '''
+        if low is None:
+            position = 0
+        else:
+            position = bisect.bisect_left(self._sorted, (low,))
+
+        while position < len(self._sorted):
+            value, obj_id = self._sorted[position]
+            if high is not None and value > high:
+                break
+            yield obj_id
+            position += 1
+
+    def get_all(self, obj):
+        for value in self._get_values(obj):
+            for obj_id in self.get_range(value, value):
+                yield obj_id
+
+
+def _get_network(value):
+    network = netaddr.IPNetwork(value)
+    return network.version, network.prefixlen, network.first
+
+
+class _LpmIndexCache(object):
+    '''A cache for a longest prefix match index of a model.
+
+       Networks are kept in a hash table per prefix length, so finding the
+       networks that contain an address takes one lookup per prefix length in
+       use, starting from the longest.
+    '''
+
+    def __init__(self, index):
+        self._path = index[0]
+        # (version, prefixlen) -> network address -> set of IDs
+        self._networks = {}
+        # version -> prefix lengths in use, longest first
+        self._prefixlens = {}
+        self._keys = {}
+
+    def _get_values(self, obj):
+        values = _get_path_values(obj, self._path)
+        values.discard(MISSING)
+        return frozenset(_get_network(value) for value in values)
+
+    def _add(self, network, obj_id):
+        version, prefixlen, first = network
+        table = self._networks.get((version, prefixlen))
+        if table is None:
+            table = self._networks[(version, prefixlen)] = {}
+            self._update_prefixlens(version)
+        table.setdefault(first, set()).add(obj_id)
+
+    def _remove(self, network, obj_id):
+        version, prefixlen, first = network
+        table = self._networks[(version, prefixlen)]
+        ids = table[first]
+        ids.discard(obj_id)
+        if not ids:
+            del table[first]
+        if not table:
+            del self._networks[(version, prefixlen)]
+            self._update_prefixlens(version)
+
+    def _update_prefixlens(self, version):
+        self._prefixlens[version] = sorted(
+            (p for v, p in self._networks if v == version),
+            reverse=True,
+        )
+
+    def delete(self, obj):
+        for network in self._keys.pop(obj.id, ()):
+            self._remove(network, obj.id)
+
+    def update(self, obj):
+        new_networks = self._get_values(obj)
+        old_networks = self._keys.get(obj.id, frozenset())
+
+        for network in new_networks - old_networks:
+            self._add(network, obj.id)
+
+        for network in old_networks - new_networks:
+            self._remove(network, obj.id)
+
+        if new_networks:
+            self._keys[obj.id] = new_networks
+        else:
+            self._keys.pop(obj.id, None)
+
+    def get_containing(self, address):
+        '''Yields IDs of all objects with a network containing address (an
+           IP address or network), longest prefix first.
+        '''
+        version, prefixlen, first = _get_network(address)
+        width = 32 if version == 4 else 128
+
+        for length in self._prefixlens.get(version, ()):
+            if length > prefixlen:
+                continue
+            shift = width - length
+            ids = self._networks[(version, length)].get(
+                (first >> shift) << shift)
+            if ids:
+                for obj_id in ids:
+                    yield obj_id
+
+    def get_all(self, obj):
+        for value in _get_path_values(obj, self._path):
+            if value is not MISSING:
+                for obj_id in self.get_containing(value):
+                    yield obj_id
+
+
+def _get_longest_prefix(obj, path, address):
+    '''Returns the longest prefix length of a network at path of obj that
+       contains address, or None if there is none.
+    '''
+    address = netaddr.IPNetwork(address)
+    prefixlens = [
+        network.prefixlen
+        for network in (netaddr.IPNetwork(value)
+                        for value in _get_path_values(obj, path)
+                        if value is not MISSING)
+        if network.version == address.version and address in network
+    ]
+    return max(prefixlens) if prefixlens else None
+
+
+def _in_range(value, low, high):
+    return (value is not MISSING and
+            (low is None or value >= low) and
+            (high is None or value <= high))
+
+
+def _matches(obj, equals, ranges, contains):
+    for path, value in equals.items():
+        if value not in _get_path_values(obj, path):
+            return False
+
+    for path, (low, high) in ranges.items():
+        if not any(_in_range(value, low, high)
+                   for value in _get_path_values(obj, path)):
+            return False
+
+    for path, address in contains.items():
+        if _get_longest_prefix(obj, path, address) is None:
+            return False
+
+    return True
+
+
+def _intern(value):
+    '''Intern all strings in a (possibly nested) struct, so that identical
+       values (IDs, topics, ...) are stored only once.
+    '''
+    if isinstance(value, str):
+        return six.moves.intern(value)
+    elif isinstance(value, list):
+        return [_intern(v) for v in value]
+    elif isinstance(value, dict):
+        return {_intern(k): _intern(v) for k, v in value.items()}
+    return value
+
+
+class _CompactIndexCache(_IndexCache):
+    '''An index cache that saves memory on the ID->keys mapping.
+
+       Most objects have a single key per index, so instead of a set we save
+       the key tuple itself, and a frozenset only when there are several.
+    '''
+
+    def __init__(self, index):
+        super(_CompactIndexCache, self).__init__(index)
+        self._keys = {}
+
+    def _get_saved_keys(self, obj_id):
+        keys = self._keys.get(obj_id)
+        if keys is None:
+            return frozenset()
+        elif isinstance(keys, frozenset):
+            return keys
+        return frozenset((keys,))
+
+    def delete(self, obj):
+        keys = self._get_saved_keys(obj.id)
+        del self._keys[obj.id]
+
+        for key in keys:
+            self._tree.delete(key, obj.id)
+
+    def update(self, obj):
+        obj_id = six.moves.intern(obj.id)
+        new_keys = frozenset(tuple(_intern(k) for k in key)
+                             for key in self._get_keys(obj))
+        old_keys = self._get_saved_keys(obj_id)
+
+        for key in new_keys - old_keys:
+            self._tree.set(key, obj_id)
+
+        for key in old_keys - new_keys:
+            self._tree.delete(key, obj_id)
+
+        if len(new_keys) == 1:
+            self._keys[obj_id] = next(iter(new_keys))
+        else:
+            self._keys[obj_id] = new_keys
+
+
 def _take_one(iterable):
     try:
         return next(iterable)
@@ -114,6 +384,8 @@ class _ModelCache(object):
     quick querying.
     '''
 
+    _index_cache_class = _IndexCache
+
     def __init__(self, model):
         self._objs = {}
         self._indexes = {}
@@ -124,7 +396,14 @@ class _ModelCache(object):
             if index == self._id_index:
                 continue
 
-            self._indexes[index] = _IndexCache(index)
+            self._indexes[index] = self._create_index_cache(index)
+
+    def _create_index_cache(self, index):
+        if isinstance(index, model_framework.RangeIndex):
+            return _RangeIndexCache(index)
+        elif isinstance(index, model_framework.LpmIndex):
+            return _LpmIndexCache(index)
+        return self._index_cache_class(index)
 
     def _get_by_id(self, obj_id):
         return self._objs[obj_id]
@@ -173,6 +452,166 @@ class _ModelCache(object):
         ids = self.get_keys(obj, index)
         return (self._get_by_id(id_) for id_ in ids)
 
+    def _plan_query(self, equals, ranges, contains):
+        '''Picks the index that best serves the query, and returns the IDs
+           it yields. Conditions served by the index are removed from the
+           dicts, the rest have to be checked on the returned objects.
+
+           Exact indexes covering more of the conditions are preferred, then
+           exact lookups on range indexes, then range and prefix lookups, and
+           a full scan if no index can be used.
+        '''
+        if 'id' in equals:
+            obj_id = equals.pop('id')
+            return (obj_id,) if obj_id in self._objs else ()
+
+        best_cost = None
+        best_index = None
+        for index in self._indexes:
+            path = index[0]
+            if isinstance(index, model_framework.RangeIndex):
+                if path in equals:
+                    cost = (1, 0)
+                elif path in ranges:
+                    cost = (2, 0)
+                else:
+                    continue
+            elif isinstance(index, model_framework.LpmIndex):
+                if path not in contains:
+                    continue
+                cost = (2, 0)
+            elif all(p in equals for p in index):
+                cost = (0, -len(index))
+            else:
+                continue
+
+            if best_cost is None or cost < best_cost:
+                best_cost = cost
+                best_index = index
+
+        if best_index is None:
+            return list(self._objs)
+
+        cache = self._indexes[best_index]
+        path = best_index[0]
+        if isinstance(best_index, model_framework.RangeIndex):
+            if path in equals:
+                value = equals.pop(path)
+                return cache.get_range(value, value)
+            return cache.get_range(*ranges.pop(path))
+        elif isinstance(best_index, model_framework.LpmIndex):
+            return cache.get_containing(contains.pop(path))
+
+        return cache.get_by_key(tuple(equals.pop(p) for p in best_index))
+
+    def query(self, equals, ranges, contains):
+        equals = dict(equals)
+        ranges = dict(ranges)
+        remaining_contains = dict(contains)
+        ids = self._plan_query(equals, ranges, remaining_contains)
+
+        seen = set()
+        results = []
+        for obj_id in ids:
+            if obj_id in seen:
+                continue
+            seen.add(obj_id)
+
+            obj = self._get_by_id(obj_id)
+            if _matches(obj, equals, ranges, remaining_contains):
+                results.append(obj)
+
+        if remaining_contains:
+            # Not ordered by a prefix index, order by longest prefix here
+            paths = sorted(contains)
+            results.sort(
+                key=lambda obj: tuple(
+                    _get_longest_prefix(obj, path, contains[path])
+                    for path in paths),
+                reverse=True,
+            )
+        return iter(results)
+
+
+class _CompactModelCache(_ModelCache):
+    '''A model cache that stores instances as compact records
+
+    Instead of keeping the model instances, every object is kept as a tuple
+    of its serialized field values, with all strings interned. Instances are
+    re-created on lookup from the trusted struct of the record, without
+    validating it again, and kept in a weak cache while they are referenced
+    elsewhere, so that all lookups return the same instance, and it can be
+    marked stale once the object is updated or deleted.
+
+    Changes made to a retrieved instance are not kept in the cache once the
+    instance is no longer referenced, objects should be changed only through
+    update().
+    '''
+
+    _index_cache_class = _CompactIndexCache
+
+    def __init__(self, model):
+        super(_CompactModelCache, self).__init__(model)
+        self._model = model
+        self._fields = model._field_specs
+        self._live_objs = weakref.WeakValueDictionary()
+
+    def _to_record(self, obj):
+        record = []
+        for name, _structure_name, field in self._fields:
+            if not obj.field_is_set(name):
+                record.append(_UNSET)
+                continue
+
+            value = getattr(obj, name)
+            if value is not None:
+                value = _intern(field.to_struct(value))
+            record.append(value)
+        return tuple(record)
+
+    def _from_record(self, record):
+        struct = {}
+        none_fields = []
+        for (name, structure_name, _field), value in zip(self._fields,
+                                                         record):
+            if value is None:
+                none_fields.append(name)
+            elif value is not _UNSET:
+                struct[structure_name] = value
+        # The record was validated when it was stored
+        obj = self._model.from_struct(struct)
+        # from_struct skips None values, they were explicitly set
+        obj._set_fields.update(none_fields)
+        return obj
+
+    def _mark_stale(self, obj_id):
+        old_obj = self._live_objs.pop(obj_id, None)
+        if old_obj is not None:
+            old_obj._is_object_stale = True
+
+    def _get_by_id(self, obj_id):
+        obj = self._live_objs.get(obj_id)
+        if obj is None:
+            obj = self._from_record(self._objs[obj_id])
+            self._live_objs[obj_id] = obj
+        return obj
+
+    def delete(self, obj):
+        for index in self._indexes.values():
+            index.delete(obj)
+
+        del self._objs[obj.id]
+        self._mark_stale(obj.id)
+
+    def update(self, obj):
+        for index in self._indexes.values():
+            index.update(obj)
+
+        obj_id = six.moves.intern(obj.id)
+        self._mark_stale(obj_id)
+        self._objs[obj_id] = self._to_record(obj)
+        self._live_objs[obj_id] = obj
+
 
 def _obj_key(obj):
     '''Returns a hashable representation of the objects: its type and ID'''
@@ -180,7 +619,11 @@ def _obj_key(obj):
 
 
 class DbStore(object):
-    def __init__(self):
+    def __init__(self, compact=False):
+        if compact:
+            self._model_cache_class = _CompactModelCache
+        else:
+            self._model_cache_class = _ModelCache
         self._cache = {}
 
         self._obj_to_embedded = collections.defaultdict(set)
@@ -190,7 +633,7 @@ class DbStore(object):
         try:
             return self._cache[model]
         except KeyError:
-            cache = _ModelCache(model)
+            cache = self._model_cache_class(model)
             self._cache[model] = cache
             return cache
 
@@ -240,6 +683,25 @@ class DbStore(object):
 
         return tuple(self._get_cache(model).get_keys(obj, index))
 
+    def query(self, model, equals=None, ranges=None, contains=None):
+        """Get all objects of a specific model matching all the conditions
+           provided. The index that best serves the conditions is picked, and
+           the conditions it does not serve are checked on each object.
+           Conditions map a (dotted) field path to:
+
+           * equals - a value, one of the values at path must be equal to it
+           * ranges - a (low, high) tuple, one of the values at path must be
+             within it (inclusive), None means unbounded
+           * contains - an IP address or network, one of the networks at path
+             must contain it. Results are ordered by longest prefix first
+
+            >>> db_store.query(Subnet, equals={'lswitch.id': 'lswitch1'},
+                               contains={'cidr': '10.0.0.1'})
+            (Subnet(...), ...)
+        """
+        return self._get_cache(model).query(
+            equals or {}, ranges or {}, contains or {})
+
     def delete(self, obj):
         """Deletes the object provided from the cache, by removing it from all
            the indexes, a partial object can be provided, since we retrieve the
@@ -323,5 +785,5 @@ def get_instance():
 
     with _instance_lock:
         if _instance is None:
-            _instance = DbStore()
+            _instance = DbStore(compact=cfg.CONF.df.compact_db_store)
         return _instance
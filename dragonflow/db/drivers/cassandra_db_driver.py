@@ -14,11 +14,13 @@ from cassandra import cluster
 from cassandra import policies
 from cassandra import query
 from oslo_log import log
+from oslo_serialization import jsonutils
 
 from dragonflow.common import exceptions as df_exceptions
 from dragonflow import conf as cfg
 from dragonflow.db import db_api
 from dragonflow.db import db_common
+from dragonflow.db import unique_key_pool
 
 LOG = log.getLogger(__name__)
 
@@ -26,6 +28,14 @@ ROOT_KS = 'openstack'
 
 CAS_TABLE = db_common.UNIQUE_KEY_TABLE
 
+# Tables are partitioned by topic, and named after the table with this
+# suffix. Tables named after the table itself use the former schema, with
+# the key as primary key, and are migrated by create_table.
+TABLE_SUFFIX = '_by_topic'
+
+# Topic of objects without a topic, since partition keys can't be empty
+NO_TOPIC = '-'
+
 # NOTE(nick-ma-z): http://datastax.github.io/python-driver/
 # api/cassandra.html
 CONSISTENCY_MAPPING = {
@@ -43,6 +53,21 @@ CONSISTENCY_MAPPING = {
 }
 
 
+_SELECT_VALUE = "SELECT value FROM {table} WHERE topic=? AND key=?;"
+_SELECT_VALUE_BY_KEY = "SELECT value FROM {table} WHERE key=?;"
+_SELECT_TOPIC_BY_KEY = "SELECT topic FROM {table} WHERE key=?;"
+_SELECT_ALL_VALUES = "SELECT value FROM {table};"
+_SELECT_ALL_VALUES_BY_TOPIC = "SELECT value FROM {table} WHERE topic=?;"
+_SELECT_ALL_KEYS = "SELECT key FROM {table};"
+_SELECT_ALL_KEYS_BY_TOPIC = "SELECT key FROM {table} WHERE topic=?;"
+_INSERT = ("INSERT INTO {table} (topic, key, value) VALUES (?, ?, ?) "
+           "IF NOT EXISTS;")
+_UPDATE = "UPDATE {table} SET value=? WHERE topic=? AND key=?;"
+_COMPARE_AND_SET = ("UPDATE {table} SET value=? WHERE topic=? AND key=? "
+                    "IF value=?;")
+_DELETE = "DELETE FROM {table} WHERE topic=? AND key=?;"
+
+
 def _check_valid_host(host_str):
     return ':' in host_str and host_str[-1] != ':'
 
@@ -69,6 +94,10 @@ class CassandraDbDriver(db_api.DbApi):
         super(CassandraDbDriver, self).__init__()
         self.client = None
         self.config = cfg.CONF.df_cassandra
+        # (CQL template, table) -> prepared statement
+        self._statements = {}
+        self._unique_keys = unique_key_pool.UniqueKeyPool(
+            self._allocate_unique_keys, self._release_unique_keys)
 
     def _get_consistency_level(self, consistency_level):
         if consistency_level in CONSISTENCY_MAPPING:
@@ -108,88 +137,153 @@ class CassandraDbDriver(db_api.DbApi):
         self.session = self.client.connect(ROOT_KS)
         self.session.default_consistency_level = consistency
         self.session.row_factory = query.dict_factory
+        self.session.default_fetch_size = self.config.fetch_size
+        self._statements = {}
+
+    def _get_statement(self, template, table):
+        """Returns the prepared statement of the CQL template for table.
+        Statements are prepared once per session.
+        """
+        statement = self._statements.get((template, table))
+        if statement is None:
+            statement = self.session.prepare(
+                template.format(table=table + TABLE_SUFFIX))
+            self._statements[(template, table)] = statement
+        return statement
+
+    def _execute(self, template, table, *args):
+        return self.session.execute(self._get_statement(template, table),
+                                    args)
 
     def create_table(self, table):
         self.session.execute("CREATE TABLE IF NOT EXISTS %s "
-                             "(key text PRIMARY KEY, value text);" % table)
+                             "(topic text, key text, value text, "
+                             "PRIMARY KEY (topic, key));" %
+                             (table + TABLE_SUFFIX))
+        # Lookups by key only, of objects whose topic is not known
+        self.session.execute("CREATE INDEX IF NOT EXISTS ON %s (key);" %
+                             (table + TABLE_SUFFIX))
+        self._migrate_table(table)
 
-    def delete_table(self, table):
+    def _migrate_table(self, table):
+        """Copies the rows of table from the former schema, if it exists,
+        to the schema partitioned by topic, and drops it.
+        """
+        keyspace = self.client.metadata.keyspaces.get(ROOT_KS)
+        if keyspace is None or table not in keyspace.tables:
+            return
+
+        LOG.info('Migrating table %s to a table partitioned by topic', table)
+        count = 0
+        for row in self.session.execute("SELECT key, value FROM %s;" % table):
+            topic = NO_TOPIC
+            try:
+                topic = jsonutils.loads(row['value']).get('topic') or topic
+            except (ValueError, TypeError, AttributeError):
+                # Not an object, e.g. a unique key counter
+                pass
+            self._execute(_INSERT, table, topic, row['key'], row['value'])
+            count += 1
         self.session.execute("DROP TABLE %s;" % table)
+        LOG.info('Migrated %(count)d rows of table %(table)s',
+                 {'count': count, 'table': table})
+
+    def delete_table(self, table):
+        self.session.execute("DROP TABLE %s;" % (table + TABLE_SUFFIX))
+        self._statements = {
+            (template, statement_table): statement
+            for (template, statement_table), statement
+            in self._statements.items() if statement_table != table
+        }
+
+    def _find_topic(self, table, key):
+        row = self._execute(_SELECT_TOPIC_BY_KEY, table, key).one()
+        if row is None:
+            raise df_exceptions.DBKeyNotFound(key=key)
+        return row['topic']
 
     def get_key(self, table, key, topic=None):
-        try:
-            rows = self.session.execute("SELECT value FROM %(table)s WHERE "
-                                        "key='%(key)s';" % {'table': table,
-                                                            'key': key})
-            return rows[0]['value']
-        except Exception:
+        if topic:
+            row = self._execute(_SELECT_VALUE, table, topic, key).one()
+        else:
+            row = self._execute(_SELECT_VALUE_BY_KEY, table, key).one()
+        if row is None:
             raise df_exceptions.DBKeyNotFound(key=key)
+        return row['value']
 
     def set_key(self, table, key, value, topic=None):
-        self.session.execute("UPDATE %(table)s SET value='%(value)s' WHERE "
-                             "key='%(key)s';" % {'table': table,
-                                                 'key': key,
-                                                 'value': value})
+        if not topic:
+            try:
+                topic = self._find_topic(table, key)
+            except df_exceptions.DBKeyNotFound:
+                topic = NO_TOPIC
+        self._execute(_UPDATE, table, value, topic, key)
 
     def create_key(self, table, key, value, topic=None):
-        self.session.execute("INSERT INTO %(table)s (key,value) VALUES "
-                             "('%(key)s','%(value)s') "
-                             "IF NOT EXISTS;" % {'table': table,
-                                                 'key': key,
-                                                 'value': value})
+        self._execute(_INSERT, table, topic or NO_TOPIC, key, value)
 
     def delete_key(self, table, key, topic=None):
+        if not topic:
+            topic = self._find_topic(table, key)
+        self._execute(_DELETE, table, topic, key)
+
+    def _get_all_column(self, table, topic, column, statement,
+                        topic_statement):
         try:
-            self.session.execute("DELETE FROM %(table)s WHERE "
-                                 "key='%(key)s';" % {'table': table,
-                                                     'key': key})
+            if topic:
+                rows = self._execute(topic_statement, table, topic)
+            else:
+                rows = self._execute(statement, table)
+            # Further pages are fetched while iterating, so paging errors
+            # are raised here too
+            return [row[column] for row in rows if row[column]]
         except Exception:
-            raise df_exceptions.DBKeyNotFound(key=key)
+            LOG.exception('Failed to read %(column)s column of %(table)s',
+                          {'column': column, 'table': table})
+            raise df_exceptions.DBKeyNotFound(key=table)
 
     def get_all_entries(self, table, topic=None):
-        res = []
-        try:
-            rows = self.session.execute("SELECT value FROM %s;" % table)
-        except Exception:
-            return res
-        for entry in rows:
-            if entry['value']:
-                res.append(entry['value'])
-        return res
+        return self._get_all_column(table, topic, 'value',
+                                    _SELECT_ALL_VALUES,
+                                    _SELECT_ALL_VALUES_BY_TOPIC)
 
     def get_all_keys(self, table, topic=None):
-        res = []
-        try:
-            rows = self.session.execute("SELECT key FROM %s;" % table)
-        except Exception:
-            raise df_exceptions.DBKeyNotFound(key=table)
-        for entry in rows:
-            res.append(entry['key'])
-        return res
+        return self._get_all_column(table, topic, 'key',
+                                    _SELECT_ALL_KEYS,
+                                    _SELECT_ALL_KEYS_BY_TOPIC)
 
-    def _allocate_unique_key(self, table):
-        orig_val = 0
+    def _allocate_unique_key(self, table, count):
         try:
-            orig_val = int(self.get_key(CAS_TABLE, table))
-            prev_val = str(orig_val)
-            post_val = str(orig_val + 1)
-            self.session.execute("UPDATE %(table)s SET value='%(post)s' "
-                                 "WHERE key=%(key)s "
-                                 "IF value='%(prev)s';" % {'table': CAS_TABLE,
-                                                           'post': post_val,
-                                                           'key': table,
-                                                           'prev': prev_val})
-            return orig_val + 1
-        except Exception:
-            self.create_key(CAS_TABLE, table, "1")
-            return 1
+            orig_val = int(self.get_key(CAS_TABLE, table, NO_TOPIC))
+        except df_exceptions.DBKeyNotFound:
+            rows = self._execute(_INSERT, CAS_TABLE, NO_TOPIC, table,
+                                 str(count))
+            return count if rows.was_applied else None
 
-    def allocate_unique_key(self, table):
+        rows = self._execute(_COMPARE_AND_SET, CAS_TABLE,
+                             str(orig_val + count), NO_TOPIC, table,
+                             str(orig_val))
+        return orig_val + count if rows.was_applied else None
+
+    def _allocate_unique_keys(self, table, count):
         while True:
             try:
-                return self._allocate_unique_key(table)
+                key = self._allocate_unique_key(table, count)
             except Exception:
-                pass
+                LOG.exception('Failed to allocate unique keys for %s',
+                              table)
+                continue
+            if key is not None:
+                return key
+
+    def _release_unique_keys(self, table, last, first_unused):
+        rows = self._execute(_COMPARE_AND_SET, CAS_TABLE,
+                             str(first_unused - 1), NO_TOPIC, table,
+                             str(last))
+        return rows.was_applied
+
+    def allocate_unique_key(self, table):
+        return self._unique_keys.allocate(table)
 
     def process_ha(self):
         pass
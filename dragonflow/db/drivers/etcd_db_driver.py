@@ -12,8 +12,10 @@
 
 from contextlib import contextmanager
 from socket import timeout as SocketTimeout
+import time
 
 import etcd3gw as etcd
+from etcd3gw import utils as etcd_utils
 from oslo_log import log
 import six
 import urllib3
@@ -23,6 +25,7 @@ from urllib3 import exceptions
 from dragonflow.common import exceptions as df_exceptions
 from dragonflow.db import db_api
 from dragonflow.db import db_common
+from dragonflow.db import unique_key_pool
 
 LOG = log.getLogger(__name__)
 
@@ -31,6 +34,13 @@ LOG = log.getLogger(__name__)
 
 ETCD_READ_TIMEOUT = 20
 
+# etcd's default limit on the number of operations in a transaction
+ETCD_MAX_TXN_OPS = 128
+
+# Indices into etcd's RangeRequest SortOrder and SortTarget enums
+ETCD_SORT_DESCEND = 2
+ETCD_SORT_TARGET_MOD = 3
+
 
 @contextmanager
 def _error_catcher(self):
@@ -95,6 +105,10 @@ class EtcdDbDriver(db_api.DbApi):
         self.client = None
         self.current_key = 0
         self.notify_callback = None
+        self._unique_keys = unique_key_pool.UniqueKeyPool(
+            self._allocate_unique_keys, self._release_unique_keys)
+        # etcd key -> lease the heartbeat key is attached to
+        self._heartbeat_leases = {}
 
     def initialize(self, db_ip, db_port, **args):
         self.client = etcd.client(host=db_ip, port=db_port)
@@ -126,12 +140,59 @@ class EtcdDbDriver(db_api.DbApi):
             return value.pop()
         raise df_exceptions.DBKeyNotFound(key=key)
 
+    def get_keys(self, table, keys, topic=None):
+        # Read the keys with as few transactions as possible, each holding
+        # a range request per key.
+        keys = list(keys)
+        values = []
+        for begin in range(0, len(keys), ETCD_MAX_TXN_OPS):
+            txn = {
+                'compare': [],
+                'success': [
+                    {'request_range': {
+                        'key': etcd_utils._encode(self._make_key(table, key)),
+                    }}
+                    for key in keys[begin:begin + ETCD_MAX_TXN_OPS]
+                ],
+                'failure': [],
+            }
+            result = self.client.transaction(txn)
+            for response in result.get('responses', ()):
+                kvs = response.get('response_range', {}).get('kvs')
+                if not kvs:
+                    values.append(None)
+                    continue
+                value = etcd_utils._decode(kvs[0].get('value', ''))
+                if not six.PY2:
+                    value = value.decode("utf-8")
+                values.append(value)
+        return values
+
     def set_key(self, table, key, value, topic=None):
         self.client.put(self._make_key(table, key), value)
 
     def create_key(self, table, key, value, topic=None):
         self.client.put(self._make_key(table, key), value)
 
+    def execute_batch(self, operations):
+        # Each chunk of up to ETCD_MAX_TXN_OPS operations is written
+        # atomically.
+        operations = list(operations)
+        for begin in range(0, len(operations), ETCD_MAX_TXN_OPS):
+            requests = []
+            for action, table, key, value, topic in (
+                    operations[begin:begin + ETCD_MAX_TXN_OPS]):
+                etcd_key = etcd_utils._encode(self._make_key(table, key))
+                if action == 'delete':
+                    requests.append(
+                        {'request_delete_range': {'key': etcd_key}})
+                else:
+                    requests.append(
+                        {'request_put': {'key': etcd_key,
+                                         'value': etcd_utils._encode(value)}})
+            self.client.transaction(
+                {'compare': [], 'success': requests, 'failure': []})
+
     def delete_key(self, table, key, topic=None):
         deleted = self.client.delete(self._make_key(table, key))
         if not deleted:
@@ -160,7 +221,26 @@ class EtcdDbDriver(db_api.DbApi):
             res.append(key)
         return res
 
-    def _allocate_unique_key(self, table):
+    def get_table_revision(self, table, topic=None):
+        # etcd does not keep per-prefix revisions. Use the highest
+        # mod_revision in the table together with the number of keys, so
+        # that deletions (which leave no trace behind) are detected as well.
+        prefix = self._make_key(table)
+        payload = {
+            'key': etcd_utils._encode(prefix),
+            'range_end': etcd_utils._increment_last_byte(prefix),
+            'sort_order': ETCD_SORT_DESCEND,
+            'sort_target': ETCD_SORT_TARGET_MOD,
+            'limit': 1,
+            'keys_only': True,
+        }
+        result = self.client.post(self.client.get_url('/kv/range'),
+                                  json=payload)
+        kvs = result.get('kvs')
+        mod_revision = int(kvs[0]['mod_revision']) if kvs else 0
+        return mod_revision, int(result.get('count', 0))
+
+    def _allocate_unique_key(self, table, count):
         table_key = self._make_key(db_common.UNIQUE_KEY_TABLE, table)
         prev_value = 0
         try:
@@ -168,22 +248,70 @@ class EtcdDbDriver(db_api.DbApi):
         except df_exceptions.DBKeyNotFound:
             if prev_value == 0:
                 # Create new key
-                if self.client.create(table_key, "1"):
-                    return 1
+                if self.client.create(table_key, str(count)):
+                    return count
             raise RuntimeError()  # Error occurred. Restart the allocation
 
-        new_unique = prev_value + 1
+        new_unique = prev_value + count
         if self.client.replace(table_key, str(prev_value), str(new_unique)):
             return new_unique
         raise RuntimeError()  # Error occurred. Restart the allocation
 
-    def allocate_unique_key(self, table):
+    def _allocate_unique_keys(self, table, count):
         while True:
             try:
-                return self._allocate_unique_key(table)
+                return self._allocate_unique_key(table, count)
             except RuntimeError:
                 pass
 
+    def _release_unique_keys(self, table, last, first_unused):
+        table_key = self._make_key(db_common.UNIQUE_KEY_TABLE, table)
+        return self.client.replace(table_key, str(last),
+                                   str(first_unused - 1))
+
+    def allocate_unique_key(self, table):
+        return self._unique_keys.allocate(table)
+
+    def _make_heartbeat_key(self, table, key):
+        return self._make_key(db_common.HEARTBEAT_TABLE,
+                              db_api.get_heartbeat_key(table, key))
+
+    def heartbeat(self, table, key, ttl):
+        # The heartbeat key is attached to a lease, so etcd deletes it when
+        # the lease expires. The time of the heartbeat is written to the key
+        # on every refresh, so that it can be read without the lease.
+        etcd_key = self._make_heartbeat_key(table, key)
+        lease = self._heartbeat_leases.get(etcd_key)
+        if lease is None or lease.refresh() <= 0:
+            lease = self.client.lease(ttl)
+            self._heartbeat_leases[etcd_key] = lease
+        self.client.put(etcd_key, str(time.time()), lease=lease)
+
+    def get_heartbeat(self, table, key):
+        values = self.client.get(self._make_heartbeat_key(table, key))
+        if not values:
+            return None
+        return float(values[0])
+
+    def get_heartbeats(self, table, keys):
+        # The heartbeats of the table are read with a single range request
+        prefix = self._make_heartbeat_key(table, '')
+        heartbeats = {}
+        for value, metadata in self.client.get_prefix(prefix):
+            key = metadata['key']
+            if not six.PY2:
+                key = key.decode("utf-8")
+            heartbeats[key[len(prefix):]] = float(value)
+        return [heartbeats.get(key) for key in keys]
+
+    def delete_heartbeat(self, table, key):
+        etcd_key = self._make_heartbeat_key(table, key)
+        lease = self._heartbeat_leases.pop(etcd_key, None)
+        if lease is not None:
+            lease.revoke()
+        else:
+            self.client.delete(etcd_key)
+
     def process_ha(self):
         # Not needed in etcd
         pass
@@ -10,12 +10,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+
 import crc16
 from oslo_log import log
 import re
 from redis import client as redis_client
 from redis import exceptions
 import six
+import time
 
 from dragonflow.common import exceptions as df_exceptions
 from dragonflow import conf as cfg
@@ -134,6 +137,7 @@ class RedisDbDriver(db_api.DbApi):
         self.config = cfg.CONF.df_redis
         self.BATCH_KEY_AMOUNT = self.config.batch_amount
         self.RETRY_COUNT = self.config.retries
+        self._track_revisions = cfg.CONF.df.enable_incremental_sync
 
     def initialize(self, db_ip, db_port, **args):
         nodes = self._config_to_nodes(args['config'].remote_db_hosts)
@@ -191,6 +195,7 @@ class RedisDbDriver(db_api.DbApi):
 
     def delete_table(self, table):
         self._bulk_operation(table, None, 'DEL')
+        self._bump_revision(table)
 
     def _get_key_topic(self, table, key, topic):
         real_key = self._key_name(table, topic, key)
@@ -220,16 +225,51 @@ class RedisDbDriver(db_api.DbApi):
         else:
             return self._get_key_topic(table, key, topic)
 
+    def get_keys(self, table, keys, topic=None):
+        keys = list(keys)
+        if not keys:
+            return []
+        if topic is None:
+            return self._get_keys_notopic(table, keys)
+        # All keys of the same table and topic share a hash slot
+        real_keys = [self._key_name(table, topic, key) for key in keys]
+        return self._key_command('MGET', *real_keys)
+
+    def _get_keys_notopic(self, table, keys):
+        # SCAN walks the whole keyspace regardless of the pattern, so find
+        # the topics of all the requested keys in a single pass, and then
+        # read them with one pipeline per node.
+        requested = set(keys)
+        keys_by_node = collections.defaultdict(list)
+        for real_key in self._scan(table):
+            if self._strip_table_topic(real_key) in requested:
+                node = self._cluster.get_node(real_key)
+                keys_by_node[node].append(real_key)
+
+        values = {}
+        for node, real_keys in keys_by_node.items():
+            result = self._bulk_execute(node, real_keys, 'GET')
+            if result is False:
+                LOG.error('Error reading keys from node %s:%s',
+                          node.ip, node.port)
+                continue
+            for real_key, value in result:
+                if not isinstance(value, exceptions.RedisError):
+                    values[self._strip_table_topic(real_key)] = value
+        return [values.get(key) for key in keys]
+
     def set_key(self, table, key, value, topic=None):
         if topic is None:
             real_key = self._key_name_infer_topic(table, key)
         else:
             real_key = self._key_name(table, topic, key)
         self._key_command('SET', real_key, value)
+        self._bump_revision(table)
 
     def create_key(self, table, key, value, topic=None):
         real_key = self._key_name(table, topic, key)
         self._key_command('SET', real_key, value)
+        self._bump_revision(table)
 
     def delete_key(self, table, key, topic=None):
         if topic is None:
@@ -237,6 +277,84 @@ class RedisDbDriver(db_api.DbApi):
         else:
             real_key = self._key_name(table, topic, key)
         self._key_command('DEL', real_key)
+        self._bump_revision(table)
+
+    def _heartbeat_key_name(self, table, key):
+        # The entity's table is the topic, so that the heartbeats of a table
+        # share a hash slot
+        return self._key_name(db_common.HEARTBEAT_TABLE, table, key)
+
+    def heartbeat(self, table, key, ttl):
+        self._key_command('SET', self._heartbeat_key_name(table, key),
+                          str(time.time()), 'EX', ttl)
+
+    def get_heartbeat(self, table, key):
+        value = self._key_command('GET', self._heartbeat_key_name(table, key))
+        if value is None:
+            return None
+        return float(value)
+
+    def get_heartbeats(self, table, keys):
+        # The heartbeats of a table are read with a single MGET
+        values = self.get_keys(db_common.HEARTBEAT_TABLE, keys, table)
+        return [None if value is None else float(value) for value in values]
+
+    def delete_heartbeat(self, table, key):
+        self._key_command('DEL', self._heartbeat_key_name(table, key))
+
+    def execute_batch(self, operations):
+        # Keys of the same table and topic share a hash slot. Write each
+        # slot's keys in a single MULTI/EXEC transaction.
+        commands_by_slot = collections.defaultdict(list)
+        tables = set()
+        for action, table, key, value, topic in operations:
+            if action == 'create' or topic is not None:
+                real_key = self._key_name(table, topic, key)
+            else:
+                real_key = self._key_name_infer_topic(table, key)
+            if action == 'delete':
+                command = ('DEL', real_key)
+            else:
+                command = ('SET', real_key, value)
+            commands_by_slot[key2slot(real_key)].append(command)
+            tables.add(table)
+
+        for commands in commands_by_slot.values():
+            self._transaction_execute(commands)
+        for table in tables:
+            self._bump_revision(table)
+
+    def _transaction_execute(self, commands):
+        key = commands[0][1]
+        retry = 0
+        while retry < self.RETRY_COUNT:
+            node = self._cluster.get_node(key)
+            pipeline = node.client.pipeline(transaction=True)
+            for command in commands:
+                pipeline.execute_command(*command)
+            try:
+                return pipeline.execute()
+            except exceptions.RedisError:
+                LOG.exception('Error executing transaction on node %s:%s '
+                              'retry %d', node.ip, node.port, retry)
+                self._cluster.populate_cluster()
+                retry += 1
+        raise df_exceptions.DBKeyNotFound(key=key)
+
+    def _revision_key(self, table):
+        return self._key_name(db_common.REVISION_TABLE, None, table)
+
+    def _bump_revision(self, table):
+        # Redis has no notion of table revisions, so keep a change counter
+        # per table. It costs an extra command per write, hence only
+        # maintained when incremental sync is enabled.
+        if self._track_revisions:
+            self._key_command('INCR', self._revision_key(table))
+
+    def get_table_revision(self, table, topic=None):
+        if not self._track_revisions:
+            return None
+        return int(self._key_command('GET', self._revision_key(table)) or 0)
 
     def _bulk_execute(self, node, keys, command, args=()):
         pipeline = node.client.pipeline(transaction=False)
@@ -381,12 +499,13 @@ class RedisDbDriver(db_api.DbApi):
             raise df_exceptions.DBKeyNotFound(key=key)
         return raw_keys.pop()
 
+    def _strip_table_topic(self, key):
+        match = self._table_strip_re.match(key)
+        return match.group(1) if match else key
+
     def get_all_keys(self, table, topic=None):
-        def _strip_table_topic(key):
-            match = self._table_strip_re.match(key)
-            return match.group(1) if match else key
         raw_keys = self._scan(table, topic=topic)
-        keys = [_strip_table_topic(raw_key) for raw_key in raw_keys]
+        keys = [self._strip_table_topic(raw_key) for raw_key in raw_keys]
         LOG.debug('found %d keys', len(keys))
         return keys
 
@@ -10,6 +10,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+
 import kazoo
 from kazoo import client
 from kazoo.handlers import eventlet
@@ -20,8 +22,12 @@ from dragonflow.common import exceptions as df_exceptions
 from dragonflow.common import utils
 from dragonflow.db import db_api
 from dragonflow.db import db_common
+from dragonflow.db import unique_key_pool
 
 ROOT_NS = '/openstack'
+# Empty nodes indexing the keys of each table by topic:
+# TOPIC_INDEX_NS/<table>/<topic>/<key>
+TOPIC_INDEX_NS = '/openstack_topics'
 
 CLIENT_CONNECTION_RETRIES = -1
 
@@ -49,6 +55,10 @@ class ZookeeperDbDriver(db_api.DbApi):
         self.db_ip = None
         self.db_port = None
         self.config = None
+        # Paths known to exist, i.e. tables and topics
+        self._known_paths = set()
+        self._unique_keys = unique_key_pool.UniqueKeyPool(
+            self._allocate_unique_keys, self._release_unique_keys)
 
     def initialize(self, db_ip, db_port, **args):
         self.db_ip = db_ip
@@ -75,6 +85,51 @@ class ZookeeperDbDriver(db_api.DbApi):
         else:
             return ROOT_NS + '/' + table + '/' + key
 
+    def _generate_index_path(self, table, topic=None, key=None):
+        path = TOPIC_INDEX_NS + '/' + table
+        if topic:
+            path += '/' + topic
+            if key:
+                path += '/' + key
+        return path
+
+    def _is_indexed(self, topic):
+        return bool(topic) and self.config.zookeeper_topic_index
+
+    def _ensure_path(self, path):
+        if path not in self._known_paths:
+            self.client.ensure_path(path)
+            self._known_paths.add(path)
+
+    @staticmethod
+    def _get_async_value(async_result):
+        try:
+            return async_result.get()[0]
+        except kazoo.exceptions.NoNodeError:
+            return None
+
+    def _get_values(self, paths):
+        """Reads the nodes at paths using the asynchronous API, with up to
+        zookeeper_max_concurrent_reads reads in flight. Returns the values
+        in the order of paths, and None for missing nodes.
+        """
+        max_pending = self.config.zookeeper_max_concurrent_reads
+        pending = collections.deque()
+        values = []
+        for path in paths:
+            if len(pending) >= max_pending:
+                values.append(self._get_async_value(pending.popleft()))
+            pending.append(self.client.get_async(path))
+        while pending:
+            values.append(self._get_async_value(pending.popleft()))
+        return values
+
+    @staticmethod
+    def _commit(transaction):
+        for result in transaction.commit():
+            if isinstance(result, Exception):
+                raise result
+
     def get_key(self, table, key, topic=None):
         path = self._generate_path(table, key)
         try:
@@ -84,6 +139,11 @@ class ZookeeperDbDriver(db_api.DbApi):
         except kazoo.exceptions.NoNodeError:
             raise df_exceptions.DBKeyNotFound(key=key)
 
+    def get_keys(self, table, keys, topic=None):
+        self._lazy_initialize()
+        return self._get_values([self._generate_path(table, key)
+                                 for key in keys])
+
     @utils.wrap_func_retry(max_retries=ZK_MAX_RETRIES,
                            retry_interval=1,
                            inc_retry_interval=True,
@@ -101,11 +161,18 @@ class ZookeeperDbDriver(db_api.DbApi):
                            _errors=[kazoo.exceptions.SessionExpiredError])
     def delete_table(self, table):
         path = self._generate_path(table, None)
+        self._known_paths.clear()
         try:
             self._lazy_initialize()
             self.client.delete(path, recursive=True)
         except kazoo.exceptions.NoNodeError:
             raise df_exceptions.DBKeyNotFound(key=table)
+        if self.config.zookeeper_topic_index:
+            try:
+                self.client.delete(self._generate_index_path(table),
+                                   recursive=True)
+            except kazoo.exceptions.NoNodeError:
+                pass
 
     @utils.wrap_func_retry(max_retries=ZK_MAX_RETRIES,
                            retry_interval=1,
@@ -128,7 +195,16 @@ class ZookeeperDbDriver(db_api.DbApi):
     def create_key(self, table, key, value, topic=None):
         path = self._generate_path(table, key)
         self._lazy_initialize()
-        self.client.create(path, value, makepath=True)
+        if not self._is_indexed(topic):
+            self.client.create(path, value, makepath=True)
+            return
+
+        self._ensure_path(self._generate_path(table, None))
+        self._ensure_path(self._generate_index_path(table, topic))
+        transaction = self.client.transaction()
+        transaction.create(path, value)
+        transaction.create(self._generate_index_path(table, topic, key), b'')
+        self._commit(transaction)
 
     @utils.wrap_func_retry(max_retries=ZK_MAX_RETRIES,
                            retry_interval=1,
@@ -139,31 +215,63 @@ class ZookeeperDbDriver(db_api.DbApi):
         path = self._generate_path(table, key)
         try:
             self._lazy_initialize()
-            self.client.delete(path)
+            index_path = self._find_index_path(table, key, topic)
+            if index_path is None:
+                self.client.delete(path)
+                return
+            transaction = self.client.transaction()
+            transaction.delete(path)
+            transaction.delete(index_path)
+            self._commit(transaction)
         except kazoo.exceptions.NoNodeError:
             raise df_exceptions.DBKeyNotFound(key=key)
 
+    def _find_index_path(self, table, key, topic):
+        """Returns the path of the key's node in the topic index, or None if
+        the key is not indexed. The topic is looked up if not given.
+        """
+        if not self.config.zookeeper_topic_index:
+            return None
+        if topic:
+            topics = [topic]
+        else:
+            try:
+                topics = self.client.get_children(
+                    self._generate_index_path(table))
+            except kazoo.exceptions.NoNodeError:
+                return None
+        index_paths = [self._generate_index_path(table, topic, key)
+                       for topic in topics]
+        async_results = [self.client.exists_async(index_path)
+                         for index_path in index_paths]
+        for index_path, async_result in zip(index_paths, async_results):
+            if async_result.get() is not None:
+                return index_path
+        return None
+
     def get_all_entries(self, table, topic=None):
-        res = []
-        path = self._generate_path(table, None)
-        try:
-            self._lazy_initialize()
-            directory = self.client.get_children(path)
-            for key in directory:
-                res.append(self.get_key(table, key))
-        except kazoo.exceptions.NoNodeError:
-            raise df_exceptions.DBKeyNotFound(key=table)
-        return res
+        self._lazy_initialize()
+        keys = self.get_all_keys(table, topic)
+        values = self._get_values([self._generate_path(table, key)
+                                   for key in keys])
+        # Keys deleted since they were listed are skipped
+        return [value for value in values if value is not None]
 
     def get_all_keys(self, table, topic=None):
-        path = self._generate_path(table, None)
+        if self._is_indexed(topic):
+            path = self._generate_index_path(table, topic)
+        else:
+            path = self._generate_path(table, None)
         try:
             self._lazy_initialize()
             return self.client.get_children(path)
         except kazoo.exceptions.NoNodeError:
+            if self._is_indexed(topic):
+                # No keys were created with this topic
+                return []
             raise df_exceptions.DBKeyNotFound(key=table)
 
-    def _allocate_unique_key(self, table):
+    def _allocate_unique_keys(self, table, count):
         path = self._generate_path(db_common.UNIQUE_KEY_TABLE, table)
 
         prev_value = 0
@@ -172,17 +280,31 @@ class ZookeeperDbDriver(db_api.DbApi):
                 prev_value, stat = self.client.get(path)
                 prev_value = int(prev_value)
                 prev_version = stat.version
-                self.client.set(path, str(prev_value + 1), prev_version)
-                return prev_value + 1
+                self.client.set(path, str(prev_value + count), prev_version)
+                return prev_value + count
             except kazoo.exceptions.BadVersionError:
                 pass
             except kazoo.exceptions.NoNodeError:
-                self.client.create(path, "1", makepath=True)
-                return 1
+                try:
+                    self.client.create(path, str(count), makepath=True)
+                    return count
+                except kazoo.exceptions.NodeExistsError:
+                    pass
+
+    def _release_unique_keys(self, table, last, first_unused):
+        path = self._generate_path(db_common.UNIQUE_KEY_TABLE, table)
+        value, stat = self.client.get(path)
+        if int(value) != last:
+            return False
+        try:
+            self.client.set(path, str(first_unused - 1), stat.version)
+        except kazoo.exceptions.BadVersionError:
+            return False
+        return True
 
     def allocate_unique_key(self, table):
         self._lazy_initialize()
-        return self._allocate_unique_key(table)
+        return self._unique_keys.allocate(table)
 
     def process_ha(self):
         # Not needed in zookeeper
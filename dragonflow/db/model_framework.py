@@ -14,6 +14,7 @@ import copy
 import functools
 import inspect
 
+from jsonmodels import errors
 from jsonmodels import fields
 from jsonmodels import models
 from oslo_log import log
@@ -21,11 +22,18 @@ from oslo_serialization import jsonutils
 import six
 
 from dragonflow._i18n import _
+from dragonflow.common import metrics
 from dragonflow.common import profiler as df_profiler
 
 
 LOG = log.getLogger(__name__)
 
+_CALLBACK_LATENCY = metrics.histogram(
+    'df_event_callback_seconds',
+    'Time spent in model event callbacks',
+    labelnames=('model', 'event', 'callback'),
+)
+
 
 def _normalize_tuple(v):
     """Convert strings to tuples of length one, other iterables to tuples
@@ -38,10 +46,65 @@ def _normalize_tuple(v):
     """
     if isinstance(v, six.string_types):
         return v,
+    elif isinstance(v, _TypedIndex):
+        return v
 
     return tuple(v)
 
 
+class _TypedIndex(tuple):
+    '''Base class for single field indexes that support lookups other than
+    exact match. Typed indexes never equal plain indexes on the same field,
+    so a model can define both.
+    '''
+    def __new__(cls, field):
+        return super(_TypedIndex, cls).__new__(cls, (field,))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((type(self).__name__,) + tuple(self))
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(type(self).__name__, self[0])
+
+
+class RangeIndex(_TypedIndex):
+    '''An index over an integer field, kept sorted to allow range lookups
+
+       >>> indexes={'segmentation_id': RangeIndex('segmentation_id')}
+    '''
+
+
+class LpmIndex(_TypedIndex):
+    '''An index over an IP network (or address) field, allowing longest
+    prefix match lookups of the networks containing an address
+
+       >>> indexes={'cidr': LpmIndex('cidr')}
+    '''
+
+
+def _parse_trusted_value(field, value):
+    '''Parse the value of field the way jsonmodels does, but construct
+    embedded models from trusted structs as well.
+    '''
+    field_type = type(field)
+    if field_type is fields.EmbeddedField and isinstance(value, dict):
+        model = field._get_embed_type()
+        if issubclass(model, _CommonBase):
+            return model.from_struct(value)
+    elif (field_type is fields.ListField and isinstance(value, list) and
+            value and len(field.items_types) == 1):
+        model = field.items_types[0]
+        if isinstance(model, type) and issubclass(model, _CommonBase):
+            return [model.from_struct(item) for item in value]
+    return field.parse_value(value)
+
+
 def is_submodel(instance):
     return (isinstance(instance, ModelBase) or
             hasattr(instance, 'get_object'))
@@ -80,6 +143,53 @@ class _CommonBase(models.Base):
         '''Convert object to JSON formatted string'''
         return jsonutils.dumps(self.to_struct())
 
+    @classmethod
+    def from_struct(cls, struct):
+        '''Instantiate current class from a trusted struct, e.g. one read
+        from the NB database. The field values are parsed, but not
+        validated, and unknown fields are ignored.
+        '''
+        obj = cls.__new__(cls)
+        obj._cache_key = models._CacheKey()
+        obj._set_fields = set()
+        obj._is_object_stale = False
+        for name, structure_name, field in cls._field_specs:
+            value = struct.get(structure_name)
+            if value is None:
+                continue
+            field._finish_initialization(cls)
+            field.memory[obj._cache_key] = _parse_trusted_value(field, value)
+            obj._set_fields.add(name)
+        return obj
+
+    def _validate_required_fields(self):
+        for name in self._required_field_names:
+            if getattr(self, name) is None:
+                raise errors.ValidationError(
+                    "Error for field '{}'.".format(name),
+                    errors.ValidationError('Field is required!'))
+
+    def to_struct_fast(self):
+        '''Convert object to a struct, like to_struct. Field values are
+        validated when they are set, so only the required fields are checked,
+        as neither the constructor nor from_struct enforces them.
+        '''
+        self._validate_required_fields()
+        struct = {}
+        for name, structure_name, field in self._field_specs:
+            value = getattr(self, name)
+            if value is None:
+                continue
+            if isinstance(value, _CommonBase):
+                struct[structure_name] = value.to_struct_fast()
+            elif type(field) is fields.ListField and all(
+                    isinstance(item, _CommonBase) for item in value):
+                struct[structure_name] = [item.to_struct_fast()
+                                          for item in value]
+            else:
+                struct[structure_name] = field.to_struct(value)
+        return struct
+
     def update(self, other):
         '''Update the set fields from other instance, taking only the fields
         that were explicitly set (e.g. setting a field to None will copy it
@@ -112,12 +222,18 @@ class _CommonBase(models.Base):
                        'module': cb.__module__,
                        'event': event,
                        'resource': self})
+            latency = _CALLBACK_LATENCY.labels(
+                type(self).__name__,
+                event,
+                '{0}.{1}'.format(cb.__module__,
+                                 getattr(cb, '__qualname__', cb.__name__)),
+            )
             try:
                 with df_profiler.profiler_context(
                         'emit',
                         info={'func': cb.__name__,
                               'module': cb.__module__,
-                              'event': event}):
+                              'event': event}), latency.time():
                     cb(self, *args, **kwargs)
             except Exception:
                 LOG.exception(
@@ -362,6 +478,12 @@ def construct_nb_db_model(cls_=None, indexes=None, events=frozenset()):
 
         fields = frozenset(n for n, _ in cls_.iterate_over_fields())
         cls_._field_names = fields
+        cls_._field_specs = tuple(
+            (name, field.structue_name(name), field)
+            for name, field in cls_.iterate_over_fields())
+        cls_._required_field_names = tuple(
+            name for name, field in cls_.iterate_over_fields()
+            if field.required)
 
         # Make sure profiler is properly initialized
         # if df_profiler.is_profiler_enabled():
@@ -504,3 +626,63 @@ def iter_models_by_dependency_order(first_class_only=True):
             unsorted_models[model] -= independent_models
 
     return sorted_models
+
+
+class JsonCodec(object):
+    '''Encodes objects as JSON, built and validated by jsonmodels, as
+    to_json and from_json do.
+    '''
+    # Whether pub/sub messages carry the objects as structs, rather than
+    # as their encoding in the database
+    native_structs = False
+
+    def to_struct(self, obj):
+        return obj.to_struct()
+
+    def from_struct(self, model, struct):
+        return model(**struct)
+
+    def encode(self, obj):
+        '''Returns obj encoded for the database, and for pub/sub messages'''
+        struct = self.to_struct(obj)
+        value = jsonutils.dumps(struct)
+        if self.native_structs:
+            return value, struct
+        return value, value
+
+    def decode(self, model, value):
+        '''Returns the instance of model encoded in value, read from the
+        database or from a pub/sub message
+        '''
+        if not isinstance(value, dict):
+            value = jsonutils.loads(value)
+        return self.from_struct(model, value)
+
+
+class TrustedJsonCodec(JsonCodec):
+    '''Encodes objects as JSON, and decodes them without validation'''
+
+    def to_struct(self, obj):
+        return obj.to_struct_fast()
+
+    def from_struct(self, model, struct):
+        return model.from_struct(struct)
+
+
+class MsgpackCodec(TrustedJsonCodec):
+    '''Like TrustedJsonCodec, but pub/sub messages, which are msgpack
+    encoded, carry the objects as native msgpack structs rather than as
+    JSON strings.
+    '''
+    native_structs = True
+
+
+_codecs = {
+    'json': JsonCodec,
+    'trusted_json': TrustedJsonCodec,
+    'msgpack': MsgpackCodec,
+}
+
+
+def get_codec(name):
+    return _codecs[name]()
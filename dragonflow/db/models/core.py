@@ -34,6 +34,7 @@ class Chassis(mf.ModelBase, mixins.BasicEvents):
 @mf.construct_nb_db_model
 class Publisher(mf.ModelBase, mixins.Name):
     table_name = 'publisher'
+    heartbeat_field = 'last_activity_timestamp'
     uri = fields.StringField()
     last_activity_timestamp = fields.FloatField()
 
@@ -48,8 +49,9 @@ class Publisher(mf.ModelBase, mixins.Name):
 
 @mf.register_model
 @mf.construct_nb_db_model
-class Listener(mf.ModelBase):
+class Listener(mf.ModelBase, mixins.BasicEvents):
     table_name = "listener"
+    heartbeat_field = 'timestamp'
 
     timestamp = df_fields.TimestampField()
     ppid = fields.IntField()
@@ -34,6 +34,7 @@ LOG = log.getLogger(__name__)
     indexes={
         'network_type': 'network_type',
         'physical_network': 'physical_network',
+        'segmentation_id': mf.RangeIndex('segmentation_id'),
     },
 )
 class LogicalSwitch(mf.ModelBase, mixins.Name, mixins.Version, mixins.Topic,
@@ -55,6 +56,7 @@ class LogicalSwitch(mf.ModelBase, mixins.Name, mixins.Version, mixins.Topic,
 @mf.construct_nb_db_model(
     indexes={
         'lswitch': 'lswitch.id',
+        'cidr': mf.LpmIndex('cidr'),
     },
 )
 class Subnet(mf.ModelBase, mixins.Name, mixins.Topic, mixins.Version,
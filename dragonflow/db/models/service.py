@@ -36,6 +36,7 @@ def generate_service_id(chassis, binary):
 @mf.construct_nb_db_model
 class Service(mf.ModelBase):
     table_name = 'service'
+    heartbeat_field = 'last_seen_up'
 
     chassis = df_fields.ReferenceField(core.Chassis, required=True)
     binary = fields.StringField(required=True)
@@ -45,6 +46,7 @@ class Service(mf.ModelBase):
 
     def on_create_pre(self):
         self.id = generate_service_id(self.chassis, self.binary)
+        self.refresh_last_seen()
 
     def refresh_last_seen(self):
         """Refresh the timestamp in the last_seen_up field to now"""
@@ -64,26 +66,22 @@ class Service(mf.ModelBase):
     @classmethod
     def _update_last_seen(cls, nb_api, service_id):
         """
-        Read the service for the given binary on the given chassis from the
-        given nb database. Refresh it's last_seen_up field, and save it back
-        into the database.
-        :param nb_api:  NB dataabse API
-        :type nb_api:   api_nb.NbApi
-        :param chassis: The chassis on which the service runs
-        :type chassis:  string or core.Chassis
-        :param binary:  The name of the service on the chassis
-        :type binary:   String
+        Send a heartbeat for the service with the given ID, that keeps it
+        alive for service_down_time seconds. The service itself is not read
+        or written, and its last_seen_up field is the time of its last
+        heartbeat when it is read.
+        :param nb_api:     NB dataabse API
+        :type nb_api:      api_nb.NbApi
+        :param service_id: The ID of the service
+        :type service_id:  String
         """
-        instance = nb_api.get(cls(id=service_id))
-        instance.refresh_last_seen()
-        nb_api.update(instance, skip_send_event=True)
+        nb_api.heartbeat(cls(id=service_id), cfg.CONF.df.service_down_time)
 
     @classmethod
     def update_last_seen(cls, nb_api, chassis, binary):
         """
-        Read the service for the given binary on the given chassis from the
-        given nb database. Refresh it's last_seen_up field, and save it back
-        into the database.
+        Send a heartbeat for the service for the given binary on the given
+        chassis to the given nb database.
         :param nb_api:  NB dataabse API
         :type nb_api:   api_nb.NbApi
         :param chassis: The chassis on which the service runs
@@ -97,9 +95,9 @@ class Service(mf.ModelBase):
     @classmethod
     def is_alive(cls, nb_api, chassis, binary):
         """
-        Read the service for the given binary on the given chassis from the
-        given nb database. Returns true if the service is alive (as defined
-        by the alive property)
+        Read the heartbeat of the service for the given binary on the given
+        chassis from the given nb database. Returns true if the service is
+        alive, i.e. its last heartbeat has not expired
         :param nb_api:  NB dataabse API
         :type nb_api:   api_nb.NbApi
         :param chassis: The chassis on which the service runs
@@ -109,5 +107,4 @@ class Service(mf.ModelBase):
         :return:        True if the service is alive
         """
         service_id = generate_service_id(chassis, binary)
-        instance = nb_api.get(cls(id=service_id))
-        return instance.alive
+        return nb_api.get_heartbeat(cls(id=service_id)) is not None
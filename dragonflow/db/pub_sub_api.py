@@ -11,10 +11,12 @@
 #    under the License.
 
 import abc
+import collections
 import socket
 import threading
 import time
 import uuid
+import zlib
 
 import msgpack
 from oslo_log import log as logging
@@ -23,15 +25,100 @@ from oslo_service import loopingcall
 import six
 
 from dragonflow.common import exceptions
+from dragonflow.common import metrics
 from dragonflow.common import utils as df_utils
+from dragonflow import conf as cfg
+from dragonflow.controller.common import constants
 from dragonflow.db import db_common
 from dragonflow.db.models import core
 
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None  # No lz4 compression
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # No zstd compression
+
 LOG = logging.getLogger(__name__)
 
 
 MONITOR_TABLES = [core.Chassis.table_name, core.Publisher.table_name]
 
+_SEQUENCE_GAPS = metrics.counter(
+    'df_pubsub_sequence_gaps_total',
+    'Gaps detected in the sequence numbers of received pub/sub messages',
+)
+
+
+# Compressed messages start with a byte that msgpack never uses, followed by
+# the ID of the codec
+_COMPRESSED_MESSAGE = b'\xc1'
+# Smaller messages are not worth compressing
+_COMPRESSION_MIN_SIZE = 256
+
+_Codec = collections.namedtuple(
+    '_Codec', ('id', 'is_available', 'compress', 'decompress'))
+
+
+def _lz4_compress(data):
+    return lz4_frame.compress(data)
+
+
+def _lz4_decompress(data):
+    return lz4_frame.decompress(data)
+
+
+def _zstd_compress(data):
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def _zstd_decompress(data):
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+_CODECS = {
+    'zlib': _Codec(b'z', True, zlib.compress, zlib.decompress),
+    'lz4': _Codec(b'l', lz4_frame is not None, _lz4_compress,
+                  _lz4_decompress),
+    'zstd': _Codec(b's', zstandard is not None, _zstd_compress,
+                   _zstd_decompress),
+}
+_CODECS_BY_ID = {codec.id: codec for codec in _CODECS.values()}
+
+
+def get_compression(name):
+    """Returns the name of the compression to use with compress_message,
+    or None if name is 'none' or its codec is not installed
+    """
+    if name == 'none':
+        return None
+    if not _CODECS[name].is_available:
+        LOG.error('%s compression is not installed, pub/sub messages are '
+                  'sent uncompressed', name)
+        return None
+    return name
+
+
+def compress_message(data, compression):
+    """Compresses a packed message, unless compression is None or the
+    message is too small. unpack_message decompresses it.
+    """
+    if (compression is None or data is None or
+            len(data) < _COMPRESSION_MIN_SIZE):
+        return data
+    codec = _CODECS[compression]
+    return _COMPRESSED_MESSAGE + codec.id + codec.compress(data)
+
+
+def _decompress_message(message):
+    if message[:1] != _COMPRESSED_MESSAGE:
+        return message
+    codec = _CODECS_BY_ID[message[1:2]]
+    return codec.decompress(message[2:])
+
 
 def pack_message(message):
     data = None
@@ -45,12 +132,31 @@ def pack_message(message):
 def unpack_message(message):
     entry = None
     try:
-        entry = msgpack.unpackb(message, encoding='utf-8')
+        entry = msgpack.unpackb(_decompress_message(message),
+                                encoding='utf-8')
     except Exception:
         LOG.exception("Error in unpack_message: ")
     return entry
 
 
+def dispatch_message(message, callback):
+    """Call callback for the update in the unpacked message. Batch messages
+    are split, and callback is called for each of the updates within.
+    """
+    if message['action'] == db_common.BATCH_ACTION:
+        updates = message['value']
+    else:
+        updates = (message,)
+    for update in updates:
+        callback(
+            update['table'],
+            update['key'],
+            update['action'],
+            update['value'],
+            update['topic'],
+        )
+
+
 def generate_publisher_uuid():
     """
     Generate a non-random uuid based on the fully qualified domain name.
@@ -127,9 +233,22 @@ class PublisherApi(object):
 
 
 class PublisherAgentBase(PublisherApi):
+    def __init__(self):
+        super(PublisherAgentBase, self).__init__()
+        # Identifies the sequence numbers of this instance, so that they
+        # start over when the publisher is restarted
+        self._publisher_id = str(uuid.uuid4())
+        # topic -> number of the last message sent to the topic
+        self._sequence_numbers = collections.defaultdict(int)
+        self._sequence_lock = threading.Lock()
+        self._compression = get_compression(cfg.CONF.df.pub_sub_compression)
+
     def send_event(self, update, topic=None):
         """Publish the update
 
+        Messages are stamped with a sequence number per topic, which lets
+        subscribers detect lost messages.
+
         :param update:  Encapsulates a Publisher update
         :type update:   DbUpdate object
         :param topic:   topic to send event to
@@ -139,12 +258,19 @@ class PublisherAgentBase(PublisherApi):
         if topic is None:
             topic = update.topic or db_common.SEND_ALL_TOPIC
 
-        topic = topic.encode('utf8', 'ignore')
-
         LOG.debug("Sending %s to %s", update, topic)
 
-        data = pack_message(update.to_dict())
-        self._send_event(data, topic)
+        message = update.to_dict()
+        # Stamp and send under the lock, so messages are sent in sequence
+        with self._sequence_lock:
+            self._sequence_numbers[topic] += 1
+            message['sequence'] = {
+                'publisher': self._publisher_id,
+                'topic': topic,
+                'number': self._sequence_numbers[topic],
+            }
+            data = compress_message(pack_message(message), self._compression)
+            self._send_event(data, topic.encode('utf8', 'ignore'))
 
 
 @six.add_metaclass(abc.ABCMeta)
@@ -226,6 +352,8 @@ class SubscriberAgentBase(SubscriberApi):
         self.daemon = None
         self.topic_list = []
         self.uri_list = []
+        # topic -> publisher -> number of the last message received
+        self._sequence_numbers = collections.defaultdict(dict)
 
     def initialize(self, callback):
         self.db_changes_callback = callback
@@ -258,6 +386,15 @@ class SubscriberAgentBase(SubscriberApi):
     def unregister_topic(self, topic):
         LOG.info('Unregister topic %s', topic)
         self.topic_list.remove(topic)
+        self._drop_sequence_numbers(topic)
+
+    def _drop_sequence_numbers(self, topic):
+        """Forgets the messages received on an unregistered topic, so that
+        registering it again is not taken for lost messages.
+        """
+        if isinstance(topic, bytes):
+            topic = topic.decode('utf-8', 'ignore')
+        self._sequence_numbers.pop(topic, None)
 
     def set_subscriber_for_failover(self, sub, callback):
         pass
@@ -270,13 +407,44 @@ class SubscriberAgentBase(SubscriberApi):
 
     def _handle_incoming_event(self, data):
         message = unpack_message(data)
-        self.db_changes_callback(
-            message['table'],
-            message['key'],
-            message['action'],
-            message['value'],
-            message['topic'],
-        )
+        dispatch_message(message, self.db_changes_callback)
+        self._check_sequence(message)
+
+    def _check_sequence(self, message):
+        """Requests a resync of the message's topic, if messages sent to it
+        before this one were lost.
+        """
+        sequence = message.get('sequence')
+        if sequence is None:
+            # Sent by a publisher without sequence numbers
+            return
+
+        topic = sequence['topic']
+        number = sequence['number']
+        publisher = sequence['publisher']
+        last_number = self._sequence_numbers[topic].get(publisher)
+        if last_number is not None and number <= last_number:
+            LOG.debug('Message %(number)d of topic %(topic)s received after '
+                      'message %(last)d',
+                      {'number': number, 'topic': topic, 'last': last_number})
+            return
+
+        self._sequence_numbers[topic][publisher] = number
+        if last_number is None or number == last_number + 1:
+            return
+
+        LOG.warning('Lost %(count)d messages of topic %(topic)s from '
+                    'publisher %(publisher)s, resyncing the topic',
+                    {'count': number - last_number - 1, 'topic': topic,
+                     'publisher': publisher})
+        _SEQUENCE_GAPS.inc()
+        if topic == db_common.SEND_ALL_TOPIC:
+            self.db_changes_callback(None, None, constants.CONTROLLER_SYNC,
+                                     None, None)
+        else:
+            self.db_changes_callback(None, None,
+                                     constants.CONTROLLER_SYNC_TOPIC, None,
+                                     topic)
 
 
 class TableMonitor(object):
@@ -349,7 +517,10 @@ class StalePublisherMonitor(TableMonitor):
             publisher = jsonutils.loads(publisher_json)
             if publisher['id'] == self._uuid:
                 continue
-            last_activity_timestamp = publisher['last_activity_timestamp']
+            last_activity_timestamp = self._driver.get_heartbeat(
+                self._table_name, entry_key)
+            if last_activity_timestamp is None:
+                last_activity_timestamp = publisher['last_activity_timestamp']
             if last_activity_timestamp < time.time() - self._timeout:
                 LOG.info('Removing publisher %s', publisher_json)
                 try:
@@ -357,4 +528,5 @@ class StalePublisherMonitor(TableMonitor):
                 except exceptions.DBKeyNotFound:
                     # Publisher already deleted. Ignore.
                     pass
+                self._driver.delete_heartbeat(self._table_name, entry_key)
         return super(StalePublisherMonitor, self)._poll_once(old_cache)
@@ -12,11 +12,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import etcd3gw
+import base64
 import threading
 
+import etcd3gw
 from oslo_log import log as logging
+from oslo_serialization import jsonutils
 
+from dragonflow import conf as cfg
+from dragonflow.controller.common import constants
 from dragonflow.db import api_nb
 from dragonflow.db import pub_sub_api
 
@@ -24,6 +28,9 @@ from dragonflow.db import pub_sub_api
 LOG = logging.getLogger(__name__)
 
 PUBSUB_DB_PREFIX = b"/pubsub"
+# All topic keys, i.e. [/pubsub/, /pubsub0)
+_ALL_TOPICS_PREFIX = PUBSUB_DB_PREFIX + b'/'
+_ALL_TOPICS_RANGE_END = PUBSUB_DB_PREFIX + b'0'
 
 
 def _get_topic_watch_prefix(topic):
@@ -81,6 +88,83 @@ class WatcherThread(threading.Thread):
             self._cancel()
 
 
+class MultiplexedWatcherThread(threading.Thread):
+    """Watches the keys of all the topics with a single prefix watch.
+
+    When the watch stream ends or fails, the watch is re-created from the
+    revision following the last seen one, so no event is missed. If etcd
+    already compacted that revision, handle_events_lost is called.
+    """
+
+    RETRY_INTERVAL = 1
+
+    def __init__(self, etcd_client, handle_event, handle_events_lost):
+        super(MultiplexedWatcherThread, self).__init__()
+        self.daemon = True
+        self.client = etcd_client
+        self._handle_event = handle_event
+        self._handle_events_lost = handle_events_lost
+        # Revision of the last seen event, or of the watch creation
+        self._revision = None
+        self._response = None
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                self._watch()
+            except Exception:
+                if self._stopped.is_set():
+                    break
+                LOG.exception('etcd pub/sub watch failed, resuming from '
+                              'revision %s', self._revision)
+            self._stopped.wait(self.RETRY_INTERVAL)
+
+    def _get_create_request(self):
+        request = {
+            'key': base64.b64encode(_ALL_TOPICS_PREFIX).decode('ascii'),
+            'range_end': base64.b64encode(
+                _ALL_TOPICS_RANGE_END).decode('ascii'),
+        }
+        if self._revision is not None:
+            request['start_revision'] = self._revision + 1
+        return {'create_request': request}
+
+    def _watch(self):
+        self._response = self.client.session.post(
+            self.client.get_url('/watch'),
+            json=self._get_create_request(),
+            stream=True,
+        )
+        for line in self._response.iter_lines():
+            if not line:
+                continue
+            result = jsonutils.loads(line)['result']
+            if result.get('created') and self._revision is None:
+                self._revision = int(result['header']['revision'])
+
+            compact_revision = int(result.get('compact_revision', 0))
+            if compact_revision:
+                LOG.warning('etcd pub/sub events before revision %s were '
+                            'compacted', compact_revision)
+                self._revision = compact_revision - 1
+                self._handle_events_lost()
+                return
+
+            for event in result.get('events', ()):
+                kv = event['kv']
+                self._revision = int(kv['mod_revision'])
+                if event.get('type') == 'DELETE':
+                    continue
+                self._handle_event(base64.b64decode(kv['key']),
+                                   base64.b64decode(kv['value']))
+
+    def cancel(self):
+        self._stopped.set()
+        if self._response is not None:
+            self._response.close()
+
+
 class EtcdSubscriberAgent(pub_sub_api.SubscriberApi):
     def __init__(self):
         self.topic_dict = {}
@@ -89,6 +173,8 @@ class EtcdSubscriberAgent(pub_sub_api.SubscriberApi):
         self.client = None
         self.db_changes_callback = None
         self.stop_event = None
+        self.single_watch = cfg.CONF.df.etcd_pubsub_single_watch
+        self._watcher = None
         super(EtcdSubscriberAgent, self).__init__()
 
     def initialize(self, callback):
@@ -107,6 +193,12 @@ class EtcdSubscriberAgent(pub_sub_api.SubscriberApi):
     def daemonize(self):
         # Start watching
         self.running = True
+        if self.single_watch:
+            self._watcher = MultiplexedWatcherThread(
+                self.client, self._handle_topic_event,
+                self._handle_events_lost)
+            self._watcher.start()
+            return
         for topic in self.topic_dict:
             self.topic_dict[topic].start()
 
@@ -117,11 +209,21 @@ class EtcdSubscriberAgent(pub_sub_api.SubscriberApi):
 
     def close(self):
         self.running = False
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
         for topic, thread in self.topic_dict.items():
-            self._stop_topic_thread(thread)
+            if thread is not None:
+                self._stop_topic_thread(thread)
 
     def register_topic(self, topic):
         LOG.info('Register topic %s', topic)
+        if self.single_watch:
+            if topic in self.topic_dict:
+                return False
+            # Events of the topic are taken from the single watch
+            self.topic_dict[topic] = None
+            return True
         if topic not in self.topic_dict:
             topic_thread = self._create_topic_thread(topic.encode('utf-8',
                                                                   'ignore'))
@@ -134,7 +236,7 @@ class EtcdSubscriberAgent(pub_sub_api.SubscriberApi):
     def unregister_topic(self, topic):
         LOG.info('Unregister topic %s', topic)
         topic_thread = self.topic_dict.pop(topic)
-        if self.running:
+        if self.running and topic_thread is not None:
             self._stop_topic_thread(topic_thread)
 
     def _stop_topic_thread(self, topic_thread):
@@ -142,13 +244,18 @@ class EtcdSubscriberAgent(pub_sub_api.SubscriberApi):
 
     def handle_event(self, event):
         unpacked_event = pub_sub_api.unpack_message(event["kv"]["value"])
-        self.db_changes_callback(
-            unpacked_event['table'],
-            unpacked_event['key'],
-            unpacked_event['action'],
-            unpacked_event['value'],
-            unpacked_event['topic'],
-        )
+        pub_sub_api.dispatch_message(unpacked_event, self.db_changes_callback)
+
+    def _handle_topic_event(self, key, value):
+        topic = key[len(_ALL_TOPICS_PREFIX):].decode('utf-8', 'ignore')
+        if topic not in self.topic_dict:
+            return
+        unpacked_event = pub_sub_api.unpack_message(value)
+        pub_sub_api.dispatch_message(unpacked_event, self.db_changes_callback)
+
+    def _handle_events_lost(self):
+        self.db_changes_callback(None, None, constants.CONTROLLER_SYNC, None,
+                                 None)
 
     def process_ha(self):
         pass
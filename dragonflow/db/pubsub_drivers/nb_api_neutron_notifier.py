@@ -14,8 +14,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import os
 import random
+import time
 
 from neutron_lib import context as n_context
 from neutron_lib.plugins import directory
@@ -38,6 +40,13 @@ class NbApiNeutronNotifier(neutron_notifier_api.NeutronNotifierDriver):
     # pub/sub driver at present.
     def __init__(self):
         self.nb_api = None
+        # Listener ID -> Listener, refreshed from the NB DB when older than
+        # neutron_listener_cache_ttl, and updated by listener events
+        self._listeners = None
+        self._listeners_refresh_time = 0
+        # (table, key) -> DbUpdate, in order, sent by _flush
+        self._pending_updates = collections.OrderedDict()
+        self._flush_loop = None
 
     def initialize(self, nb_api, is_neutron_server=False):
         self.nb_api = nb_api
@@ -49,6 +58,14 @@ class NbApiNeutronNotifier(neutron_notifier_api.NeutronNotifierDriver):
                             "work when enable_df_pub_sub is disabled")
                 return
             self.nb_api.publisher.initialize()
+            core.Listener.register_created(self._update_listener)
+            core.Listener.register_updated(self._update_listener)
+            core.Listener.register_deleted(self._delete_listener)
+            interval = cfg.CONF.df.neutron_notify_flush_interval
+            if interval > 0:
+                self._flush_loop = loopingcall.FixedIntervalLoopingCall(
+                    self._flush)
+                self._flush_loop.start(interval, initial_delay=interval)
 
     @lock_db.wrap_db_lock(lock_db.RESOURCE_NEUTRON_LISTENER)
     def create_heart_beat_reporter(self, host):
@@ -79,8 +96,28 @@ class NbApiNeutronNotifier(neutron_notifier_api.NeutronNotifierDriver):
         self.heart_beat_reporter = HeartBeatReporter(self.nb_api, listener)
         self.heart_beat_reporter.daemonize()
 
-    def _send_event(self, table, key, action, value):
-        listeners = self.nb_api.get_all(core.Listener)
+    def _update_listener(self, listener, orig_listener=None):
+        if self._listeners is not None:
+            self._listeners[listener.id] = listener
+
+    def _delete_listener(self, listener):
+        if self._listeners is not None:
+            self._listeners.pop(listener.id, None)
+
+    def _get_listeners(self):
+        now = time.time()
+        ttl = cfg.CONF.df.neutron_listener_cache_ttl
+        if (self._listeners is None or
+                now - self._listeners_refresh_time >= ttl):
+            self._listeners = {
+                listener.id: listener
+                for listener in self.nb_api.get_all(core.Listener)
+            }
+            self._listeners_refresh_time = now
+        return list(self._listeners.values())
+
+    def _select_listener(self):
+        listeners = self._get_listeners()
         listeners_num = len(listeners)
         if listeners_num > 1:
             # Sort by timestamp and choose from the latest ones randomly.
@@ -92,17 +129,56 @@ class NbApiNeutronNotifier(neutron_notifier_api.NeutronNotifierDriver):
             # one is chosen. For users, do not need to figure out what is
             # the best report interval. A big interval increase the possility a
             # dead one is chosen, while a small one may affect the performance
-            listeners.sort(key=lambda l: l.timestamp, reverse=True)
-            selected = random.choice(listeners[:len(listeners) / 2])
+            listeners.sort(key=lambda listener: listener.timestamp,
+                           reverse=True)
+            return random.choice(listeners[:listeners_num // 2])
         elif listeners_num == 1:
-            selected = listeners[0]
+            return listeners[0]
         else:
             LOG.warning("No neutron listener found")
+            return None
+
+    def _send_event(self, table, key, action, value):
+        selected = self._select_listener()
+        if selected is None:
             return
         topic = selected.topic
         update = db_common.DbUpdate(table, key, action, value, topic=topic)
-        LOG.info("Publish to neutron %s", topic)
-        self.nb_api.publisher.send_event(update)
+        if self._flush_loop is None:
+            LOG.info("Publish to neutron %s", topic)
+            self.nb_api.publisher.send_event(update)
+            return
+
+        # A newer notification of the same object replaces the pending one,
+        # and is sent to the same listener
+        pending = self._pending_updates.pop((table, key), None)
+        if pending is not None:
+            update.topic = pending.topic
+        self._pending_updates[(table, key)] = update
+
+    def _flush(self):
+        if not self._pending_updates:
+            return
+        pending_updates = self._pending_updates
+        self._pending_updates = collections.OrderedDict()
+
+        updates_by_topic = collections.defaultdict(list)
+        for update in pending_updates.values():
+            updates_by_topic[update.topic].append(update)
+
+        for topic, updates in updates_by_topic.items():
+            if len(updates) == 1:
+                update = updates[0]
+            else:
+                update = db_common.DbUpdate(
+                    None, None, db_common.BATCH_ACTION,
+                    [u.to_dict() for u in updates], topic=topic)
+            LOG.info("Publish %(count)d updates to neutron %(topic)s",
+                     {'count': len(updates), 'topic': topic})
+            try:
+                self.nb_api.publisher.send_event(update)
+            except Exception:
+                LOG.exception("Failed to publish to neutron %s", topic)
 
     @staticmethod
     def _neutron_server_update_core_plugin(table, key, action,
@@ -140,5 +216,8 @@ class HeartBeatReporter(object):
         return self._loopingcall.stop()
 
     def run(self):
-        self.api_nb.update(self.listener)
+        # Outlive the longest delay until the next heartbeat
+        ttl = 2 * (cfg.CONF.df.neutron_listener_report_interval +
+                   cfg.CONF.df.neutron_listener_report_delay)
+        self.api_nb.heartbeat(self.listener, ttl)
         return self.get_delay()
@@ -169,6 +169,7 @@ class RedisSubscriberAgent(pub_sub_api.SubscriberAgentBase):
 
     def unregister_topic(self, topic):
         self.pub_sub.unsubscribe(topic)
+        self._drop_sequence_numbers(topic)
 
     def set_subscriber_for_failover(self, sub, callback):
         self.redis_mgt.set_subscriber(sub, callback)
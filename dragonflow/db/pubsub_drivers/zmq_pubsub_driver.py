@@ -31,6 +31,7 @@ SUPPORTED_TRANSPORTS = set(['tcp', 'epgm'])
 
 class ZMQPublisherAgentBase(pub_sub_api.PublisherAgentBase):
     def __init__(self):
+        super(ZMQPublisherAgentBase, self).__init__()
         self.socket = None
         self.context = None
 
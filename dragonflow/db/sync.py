@@ -13,21 +13,21 @@ from dragonflow.db import db_store
 from dragonflow.db.models import mixins
 
 
-def _make_dict(iterable):
-    return {o.id: o for o in iterable}
-
-
 class Sync(object):
     '''Class that keeps local cache in sync with the NB database'''
 
-    def __init__(self, nb_api, update_cb, delete_cb, selective=True):
+    def __init__(self, nb_api, update_cb, delete_cb, selective=True,
+                 incremental=False):
         self._nb_api = nb_api
         self._update_cb = update_cb
         self._delete_cb = delete_cb
         self._db_store = db_store.get_instance()
         self._topics = set()
         self._selective = selective
+        self._incremental = incremental
         self._models = []
+        # (model, topic) -> NB revision at the time of the last sync
+        self._revisions = {}
 
     def add_model(self, model):
         self._models.append(model)
@@ -46,8 +46,10 @@ class Sync(object):
             if not issubclass(model, mixins.Topic):
                 continue
 
+            revision = self._get_revision(model, topic)
             for nb_obj in self._nb_api.get_all(model, topic):
                 self._update_cb(nb_obj)
+            self._set_revision(model, topic, revision)
 
         self._topics.add(topic)
 
@@ -65,62 +67,127 @@ class Sync(object):
             if not issubclass(model, mixins.Topic):
                 continue
 
+            self._revisions.pop((model, topic), None)
             cached_objs = list(self._db_store.get_all_by_topic(model, topic))
             for cached_obj in cached_objs:
                 self._delete_cb(cached_obj)
 
+    def sync_topic(self, topic):
+        '''Syncs the models of a single watched topic, e.g. when updates
+           to the topic were lost. Syncs everything if the topic is not
+           watched on its own.
+        '''
+        if not self._selective or topic not in self._topics:
+            self.sync()
+            return
+
+        models = [model for model in self._models
+                  if issubclass(model, mixins.Topic)]
+        # model -> (revision, IDs of the objects in NB)
+        snapshot = {}
+        for model in models:
+            revision = self._get_revision(model, topic)
+            desired = self._nb_api.get_all(model, topic)
+            self._update_objects(desired)
+            snapshot[model] = (revision, {o.id for o in desired})
+
+        for model in reversed(models):
+            _, desired_ids = snapshot[model]
+            present_ids = self._db_store.get_keys_by_topic(model, topic)
+            self._cleanup_objects(model, desired_ids, present_ids)
+
+        for model, (revision, _) in snapshot.items():
+            self._set_revision(model, topic, revision)
+
+    def reset(self):
+        '''Forgets the known NB revisions, so that the next sync re-reads
+           all the models.
+        '''
+        self._revisions.clear()
+
     def sync(self):
         '''Syncs all the models for all relevant topics.
+
+           In incremental mode, only (model, topic) pairs whose NB revision
+           changed since the last sync are read. The objects read are used
+           for both the update and the cleanup passes.
         '''
+        # (model, topic) -> (revision, IDs of the objects in NB)
+        snapshot = {}
         for model in self._models:
-            self._update_model(model)
+            self._update_model(model, snapshot)
 
         # Reverse order when deleting objects
         for model in reversed(self._models):
-            self._cleanup_model(model)
+            self._cleanup_model(model, snapshot)
 
-    def _update_model(self, model):
-        if not self._selective or not issubclass(model, mixins.Topic):
-            desired = self._nb_api.get_all(model)
-            self._update_objects(desired)
+        # Save revisions only once all passes are done, so that a failed
+        # sync is retried in full.
+        for (model, topic), (revision, _) in snapshot.items():
+            self._set_revision(model, topic, revision)
+
+    def _is_topic_model(self, model):
+        return self._selective and issubclass(model, mixins.Topic)
+
+    def _get_revision(self, model, topic):
+        if not self._incremental:
+            return None
+        return self._nb_api.get_revision(model, topic)
+
+    def _set_revision(self, model, topic, revision):
+        if revision is not None:
+            self._revisions[(model, topic)] = revision
+
+    def _is_unchanged(self, model, topic, revision):
+        return (revision is not None and
+                self._revisions.get((model, topic)) == revision)
+
+    def _update_model(self, model, snapshot):
+        if self._is_topic_model(model):
+            topics = self._topics
         else:
-            for topic in self._topics:
-                desired = self._nb_api.get_all(model, topic)
-                self._update_objects(desired)
+            topics = (None,)
+
+        for topic in topics:
+            revision = self._get_revision(model, topic)
+            if self._is_unchanged(model, topic, revision):
+                continue
+            desired = self._nb_api.get_all(model, topic)
+            self._update_objects(desired)
+            snapshot[(model, topic)] = (revision, {o.id for o in desired})
 
     def _update_objects(self, desired):
         for o in desired:
             self._update_cb(o)
 
-    def _cleanup_model(self, model):
-        if not self._selective or not issubclass(model, mixins.Topic):
-            desired = self._nb_api.get_all(model)
-            present = self._db_store.get_all(model)
-            self._cleanup_objects(desired, present)
+    def _cleanup_model(self, model, snapshot):
+        # Only the IDs are read from the cache, the objects are looked up
+        # only when they are deleted
+        if not self._is_topic_model(model):
+            if (model, None) not in snapshot:
+                return
+            _, desired_ids = snapshot[(model, None)]
+            present_ids = self._db_store.get_keys(model)
+            self._cleanup_objects(model, desired_ids, present_ids)
         else:
-            present_all = self._db_store.get_all(model)
-            present_by_topic = {}
-            for o in present_all:
-                present_by_topic.setdefault(o.topic, []).append(o)
-
+            other_ids = set(self._db_store.get_keys(model))
             for topic in self._topics:
-                # FIXME (dimak) can be avoided, we do this once in
-                # _update_model for the exact same topics/models.
-                # Maybe we can pass on the result somehow.
-                desired = self._nb_api.get_all(model, topic)
-                present = present_by_topic.pop(topic, [])
-                self._cleanup_objects(desired, present)
-
-            for objects in present_by_topic.values():
-                for o in objects:
-                    self._delete_cb(o)
-
-    def _cleanup_objects(self, desired, present):
-        desired = _make_dict(desired)
-        present = _make_dict(present)
-
-        desired_ids = set(desired.keys())
-        present_ids = set(present.keys())
-
-        for deleted_id in present_ids.difference(desired_ids):
-            self._delete_cb(present[deleted_id])
+                present_ids = self._db_store.get_keys_by_topic(model, topic)
+                other_ids.difference_update(present_ids)
+                if (model, topic) not in snapshot:
+                    # Unchanged since last sync
+                    continue
+                _, desired_ids = snapshot[(model, topic)]
+                self._cleanup_objects(model, desired_ids, present_ids)
+
+            # Objects of topics that are not watched
+            self._cleanup_objects(model, (), other_ids)
+
+    def _cleanup_objects(self, model, desired_ids, present_ids):
+        deleted_ids = [obj_id for obj_id in present_ids
+                       if obj_id not in desired_ids]
+        for obj_id in deleted_ids:
+            o = self._db_store.get_one(model(id=obj_id))
+            # Might have been deleted along with an earlier object
+            if o is not None:
+                self._delete_cb(o)
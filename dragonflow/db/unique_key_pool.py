@@ -0,0 +1,77 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import atexit
+import threading
+
+from oslo_log import log
+
+from dragonflow import conf as cfg
+
+LOG = log.getLogger(__name__)
+
+
+class UniqueKeyPool(object):
+    '''Hands out unique keys from blocks of consecutive keys, allocated from
+    the database with a single compare-and-swap each.
+
+    allocate_block(table, count) allocates count keys for table in the
+    database, and returns the last of them. release_block(table, last,
+    first_unused) returns the keys from first_unused to last to the
+    database, if no keys were allocated after last, and returns whether it
+    did. Unused keys are released when the process exits.
+    '''
+
+    def __init__(self, allocate_block, release_block):
+        self._allocate_block = allocate_block
+        self._release_block = release_block
+        # table -> [next key, last key]
+        self._blocks = {}
+        self._lock = threading.Lock()
+        self._release_registered = False
+
+    def allocate(self, table):
+        with self._lock:
+            block = self._blocks.get(table)
+            if block is None or block[0] > block[1]:
+                block = self._allocate_new_block(table)
+            key = block[0]
+            block[0] += 1
+            return key
+
+    def _allocate_new_block(self, table):
+        block_size = cfg.CONF.df.unique_key_block_size
+        last = self._allocate_block(table, block_size)
+        block = [last - block_size + 1, last]
+        self._blocks[table] = block
+        if block_size > 1 and not self._release_registered:
+            atexit.register(self.release)
+            self._release_registered = True
+        return block
+
+    def release(self):
+        '''Returns the unused keys of all the tables to the database'''
+        with self._lock:
+            blocks = self._blocks
+            self._blocks = {}
+        for table, (next_key, last) in blocks.items():
+            if next_key > last:
+                continue
+            try:
+                released = self._release_block(table, last, next_key)
+            except Exception:
+                LOG.exception('Failed to release the unique keys of %s',
+                              table)
+                continue
+            if not released:
+                LOG.debug('Unique keys %(first)d to %(last)d of %(table)s '
+                          'were not released, more keys were allocated',
+                          {'first': next_key, 'last': last, 'table': table})
@@ -288,12 +288,13 @@ class DFL3AgentlessRouterPlugin(service_base.ServicePluginBase,
                       self).disassociate_floatingips(
                     context, port_id, do_notify))
 
-            for floating_ip in floating_ips:
-                self.nb_api.update(
-                    neutron_l3.build_floating_ip_from_ovo_floating_ip(
-                        floating_ip
-                    ),
-                )
+            with self.nb_api.batch():
+                for floating_ip in floating_ips:
+                    self.nb_api.update(
+                        neutron_l3.build_floating_ip_from_ovo_floating_ip(
+                            floating_ip
+                        ),
+                    )
         return router_ids
 
     def get_number_of_agents_for_scheduling(self, context):
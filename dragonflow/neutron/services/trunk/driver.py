@@ -100,8 +100,9 @@ class DfTrunkDriver(base.DriverBase, mixins.LazyNbApiMixin):
         Dragonflow NB DB
         """
         df_parent = self.nb_api.get(l2.LogicalPort(id=trunk.port_id))
-        for subport in subports:
-            self._add_subport(trunk, subport, df_parent)
+        with self.nb_api.batch():
+            for subport in subports:
+                self._add_subport(trunk, subport, df_parent)
         self._update_subport_statuses(trunk.port_id, subports)
 
     def _update_subport_statuses(self, parent_id, subports):
@@ -143,8 +144,9 @@ class DfTrunkDriver(base.DriverBase, mixins.LazyNbApiMixin):
         Dragonflow NB DB
         """
         df_parent = self.nb_api.get(l2.LogicalPort(id=trunk.port_id))
-        for subport in subports:
-            self._delete_subport(trunk, subport, df_parent)
+        with self.nb_api.batch():
+            for subport in subports:
+                self._delete_subport(trunk, subport, df_parent)
 
     def _delete_subport(self, trunk, subport, df_parent):
         """
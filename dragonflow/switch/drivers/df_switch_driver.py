@@ -15,6 +15,8 @@
 
 
 import abc
+import contextlib
+
 import six
 
 
@@ -58,6 +60,21 @@ class DfSwitchDriver(object):
     def switch_sync_finished(self):
         """Callback on switch sync done"""
 
+    def nb_sync_started(self):
+        """Callback on northbound database sync start. The objects of the
+        sync are updated before nb_sync_finished is called
+        """
+
+    def nb_sync_finished(self):
+        """Callback on northbound database sync done"""
+
+    @contextlib.contextmanager
+    def flow_batch(self):
+        """Context manager, within which changes to the switch may be
+        deferred, and sent to the switch together when it exits
+        """
+        yield
+
     def sync_ignore_models(self):
         """Which models to ignore on sync
         :returns list of model names
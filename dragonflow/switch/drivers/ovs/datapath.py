@@ -79,6 +79,7 @@ class Datapath(object):
         Wire the applications (including translating registers)
         """
         self.clear_old_set_up()
+        self._os_ken_base = os_ken_base
         self._dp = os_ken_base.datapath
         self._table_generator = _sequence_generator(
             cfg.CONF.df.datapath_autoalloc_table_offset)
@@ -274,7 +275,7 @@ class Datapath(object):
             match=parser.OFPMatch(),
             instructions=instructions,
         )
-        self._dp.send_msg(message)
+        self._os_ken_base.send_msg(self._dp, message)
 
     def log_datapath_allocation(self, name, dp_alloc):
         """
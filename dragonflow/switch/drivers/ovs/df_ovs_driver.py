@@ -100,6 +100,19 @@ class DfOvsDriver(df_switch_driver.DfSwitchDriver):
     def switch_sync_finished(self):
         self.open_flow_app.notify_switch_sync_finished()
 
+    def nb_sync_started(self):
+        if self.open_flow_app is not None:
+            self.open_flow_app.notify_nb_sync_started()
+
+    def nb_sync_finished(self):
+        if self.open_flow_app is not None:
+            self.open_flow_app.notify_nb_sync_finished()
+
+    def flow_batch(self):
+        if self.open_flow_app is None:
+            return super(DfOvsDriver, self).flow_batch()
+        return self.open_flow_app.flow_batcher.batch()
+
     def sync_ignore_models(self):
         return [switch.SwitchPort, ]
 
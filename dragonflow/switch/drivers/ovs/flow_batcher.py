@@ -0,0 +1,132 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import contextlib
+import itertools
+import threading
+
+from oslo_log import log
+
+from dragonflow.common import metrics
+
+
+LOG = log.getLogger(__name__)
+
+_BATCH_SIZE = metrics.histogram(
+    'df_flow_batch_messages',
+    'OpenFlow messages sent to the switch per batched write',
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+
+
+class FlowBatcher(object):
+    '''Accumulates the OpenFlow messages sent while a batch is open, and
+    sends them in one write to the switch when the outermost batch is closed,
+    or when max_size messages are pending.
+
+    Batches are per (green) thread, so e.g. a packet-in handled while a
+    controller event waits on the NB database does not join its batch.
+
+    If use_bundles is set, consecutive flow and group modifications are
+    wrapped in an atomic and ordered ONF bundle (OpenFlow 1.3 extension
+    230), so the switch applies them together. Other messages, e.g.
+    packet-outs, are sent between bundles, in order.
+
+        >>> with batcher.batch():
+        ...     batcher.send_msg(datapath, flow_mod1)
+        ...     batcher.send_msg(datapath, flow_mod2)
+    '''
+
+    def __init__(self, enabled=True, max_size=1000, use_bundles=False):
+        self.enabled = enabled
+        self.max_size = max_size
+        self.use_bundles = use_bundles
+        self._local = threading.local()
+        self._bundle_ids = itertools.count(1)
+
+    def _get_state(self):
+        state = self._local
+        if not hasattr(state, 'depth'):
+            state.depth = 0
+            state.datapath = None
+            state.messages = []
+        return state
+
+    @contextlib.contextmanager
+    def batch(self):
+        state = self._get_state()
+        state.depth += 1
+        try:
+            yield
+        finally:
+            state.depth -= 1
+            if state.depth == 0:
+                self.flush()
+
+    def send_msg(self, datapath, msg):
+        state = self._get_state()
+        if not self.enabled or state.depth == 0:
+            datapath.send_msg(msg)
+            return
+
+        if state.datapath is not datapath:
+            self.flush()
+            state.datapath = datapath
+        state.messages.append(msg)
+        if len(state.messages) >= self.max_size:
+            self.flush()
+
+    def flush(self):
+        '''Sends the messages pending in the current thread'''
+        state = self._get_state()
+        datapath, messages = state.datapath, state.messages
+        state.datapath, state.messages = None, []
+        if not messages:
+            return
+
+        if self.use_bundles:
+            messages = self._wrap_in_bundles(datapath, messages)
+
+        buf = bytearray()
+        for msg in messages:
+            if msg.xid is None:
+                datapath.set_xid(msg)
+            msg.serialize()
+            buf += msg.buf
+        LOG.debug('Sending %d batched OpenFlow messages', len(messages))
+        _BATCH_SIZE.observe(len(messages))
+        datapath.send(bytes(buf))
+
+    def _is_bundleable(self, datapath, msg):
+        parser = datapath.ofproto_parser
+        return isinstance(msg, (parser.OFPFlowMod, parser.OFPGroupMod))
+
+    def _wrap_in_bundles(self, datapath, messages):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        flags = ofproto.ONF_BF_ATOMIC | ofproto.ONF_BF_ORDERED
+        result = []
+        for bundleable, group in itertools.groupby(
+                messages, lambda msg: self._is_bundleable(datapath, msg)):
+            if not bundleable:
+                result.extend(group)
+                continue
+
+            bundle_id = next(self._bundle_ids) & 0xffffffff
+            result.append(parser.ONFBundleCtrlMsg(
+                datapath, bundle_id, ofproto.ONF_BCT_OPEN_REQUEST, flags, []))
+            for msg in group:
+                result.append(parser.ONFBundleAddMsg(
+                    datapath, bundle_id, flags, msg, []))
+            result.append(parser.ONFBundleCtrlMsg(
+                datapath, bundle_id, ofproto.ONF_BCT_COMMIT_REQUEST, flags,
+                []))
+        return result
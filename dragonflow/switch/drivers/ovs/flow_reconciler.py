@@ -0,0 +1,344 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import collections
+
+import netaddr
+from os_ken.ofproto import ofproto_v1_3 as ofproto
+from os_ken.ofproto import ofproto_v1_3_parser as parser
+from oslo_log import log
+import six
+
+from dragonflow.common import metrics
+
+
+LOG = log.getLogger(__name__)
+
+_RECONCILED_FLOWS = metrics.counter(
+    'df_flows_reconciled_total',
+    'Flows added, modified or deleted when reconciling the switch flows',
+    labelnames=('operation',),
+)
+_RECONCILED_GROUPS = metrics.counter(
+    'df_groups_reconciled_total',
+    'Groups added, modified or deleted when reconciling the switch groups',
+    labelnames=('operation',),
+)
+
+_MODIFY_COMMANDS = (ofproto.OFPFC_MODIFY, ofproto.OFPFC_MODIFY_STRICT)
+_DELETE_COMMANDS = (ofproto.OFPFC_DELETE, ofproto.OFPFC_DELETE_STRICT)
+_STRICT_COMMANDS = (ofproto.OFPFC_MODIFY_STRICT, ofproto.OFPFC_DELETE_STRICT)
+
+
+def _get_match_key(match):
+    return tuple(sorted(match.items()))
+
+
+def _get_flow_key(flow):
+    return flow.priority, _get_match_key(flow.match)
+
+
+def _serialize_instructions(instructions):
+    buf = bytearray()
+    for instruction in instructions:
+        instruction.serialize(buf, len(buf))
+    return bytes(buf)
+
+
+def _serialize_buckets(buckets):
+    buf = bytearray()
+    for bucket in buckets:
+        bucket.serialize(buf, len(buf))
+    return bytes(buf)
+
+
+def _is_chained(group):
+    '''Whether the buckets of a group forward to other groups'''
+    return any(isinstance(action, parser.OFPActionGroup)
+               for bucket in group.buckets
+               for action in bucket.actions)
+
+
+def _is_ephemeral(flow):
+    '''Flows that expire, or are learned, are not reconciled'''
+    return bool(flow.idle_timeout or flow.hard_timeout)
+
+
+def _to_int(value):
+    if isinstance(value, six.integer_types):
+        return value
+    if value.count(':') == 5 and len(value) == 17:
+        # MAC address
+        return int(value.replace(':', ''), 16)
+    return int(netaddr.IPAddress(value))
+
+
+def _split_mask(value):
+    if isinstance(value, tuple):
+        return _to_int(value[0]), _to_int(value[1])
+    return _to_int(value), None
+
+
+def _covers(match_items, flow_match):
+    '''Whether a non-strict match selects a flow, i.e. the flow matches on
+       every field of the match, and is at least as specific
+    '''
+    for field, value in match_items:
+        if field not in flow_match:
+            return False
+        flow_value = flow_match[field]
+        if flow_value == value:
+            continue
+
+        value, mask = _split_mask(value)
+        flow_value, flow_mask = _split_mask(flow_value)
+        if mask is None:
+            return False
+        if flow_mask is not None and flow_mask & mask != mask:
+            return False
+        if flow_value & mask != value & mask:
+            return False
+    return True
+
+
+class FlowReconciler(object):
+    '''Keeps the flows and groups the applications expect on the switch
+    (the desired flows and groups), by following the flow and group
+    modifications they send.
+
+    While reconciling, i.e. during a switch resync, flow and group
+    modifications only update the desired flows and groups, and are not
+    sent. Once the resync is done, get_changes() compares them with the flows
+    and groups dumped from the switch, and returns the modifications that
+    bring the switch to the desired state: adds for missing flows and
+    groups, modifications of different ones, and deletes of unexpected ones.
+    Groups are never deleted and added again, since deleting a group deletes
+    the flows that forward to it.
+
+    Flows with an idle or hard timeout (including learned flows) are not
+    tracked, and are always sent. Non-strict modifications and deletions are
+    applied to the desired flows as the switch would apply them, except for
+    their out_port and out_group filters.
+    '''
+
+    def __init__(self):
+        # table_id -> (priority, match key) -> OFPFlowMod
+        self._flows = collections.defaultdict(dict)
+        # group_id -> OFPGroupMod
+        self._groups = {}
+        self.reconciling = False
+
+    def __len__(self):
+        return sum(len(flows) for flows in self._flows.values())
+
+    def start(self):
+        LOG.info('Started reconciling the switch flows')
+        self.reconciling = True
+
+    def update(self, msg):
+        '''Applies msg to the desired flows and groups. Returns True if msg
+           should be sent to the switch now.
+        '''
+        if isinstance(msg, parser.OFPGroupMod):
+            self._update_group(msg)
+            return not self.reconciling
+        if not isinstance(msg, parser.OFPFlowMod):
+            return True
+
+        command = msg.command
+        if command == ofproto.OFPFC_ADD:
+            if _is_ephemeral(msg):
+                return True
+            self._flows[msg.table_id][_get_flow_key(msg)] = msg
+        elif command in _MODIFY_COMMANDS:
+            for table_id, key in self._get_selected(msg):
+                flow = self._flows[table_id][key]
+                self._flows[table_id][key] = self._copy_flow(
+                    flow, msg.datapath, msg.instructions)
+        elif command in _DELETE_COMMANDS:
+            for table_id, key in self._get_selected(msg):
+                del self._flows[table_id][key]
+
+        return not self.reconciling
+
+    def _update_group(self, msg):
+        if msg.command != ofproto.OFPGC_DELETE:
+            self._groups[msg.group_id] = msg
+        elif msg.group_id == ofproto.OFPG_ALL:
+            self._groups.clear()
+        else:
+            self._groups.pop(msg.group_id, None)
+
+    def _get_selected(self, msg):
+        '''Returns the (table_id, key) of the desired flows that msg modifies
+           or deletes
+        '''
+        if msg.table_id == ofproto.OFPTT_ALL:
+            table_ids = list(self._flows)
+        else:
+            table_ids = [msg.table_id]
+
+        cookie_mask = msg.cookie_mask
+        cookie = msg.cookie & cookie_mask
+        strict_key = None
+        if msg.command in _STRICT_COMMANDS:
+            strict_key = _get_flow_key(msg)
+        match_items = list(msg.match.items())
+
+        selected = []
+        for table_id in table_ids:
+            flows = self._flows.get(table_id)
+            if not flows:
+                continue
+            if strict_key is not None:
+                candidates = [strict_key] if strict_key in flows else []
+            elif not match_items:
+                candidates = list(flows)
+            else:
+                candidates = [key for key, flow in flows.items()
+                              if _covers(match_items, flow.match)]
+            selected.extend(
+                (table_id, key) for key in candidates
+                if flows[key].cookie & cookie_mask == cookie)
+        return selected
+
+    @staticmethod
+    def _copy_flow(flow, datapath, instructions=None):
+        if instructions is None:
+            instructions = flow.instructions
+        return parser.OFPFlowMod(
+            datapath,
+            cookie=flow.cookie,
+            table_id=flow.table_id,
+            command=ofproto.OFPFC_ADD,
+            priority=flow.priority,
+            flags=flow.flags,
+            match=flow.match,
+            instructions=instructions,
+        )
+
+    @staticmethod
+    def _copy_group(group, datapath, command):
+        return parser.OFPGroupMod(
+            datapath,
+            command=command,
+            type_=group.type,
+            group_id=group.group_id,
+            buckets=group.buckets,
+        )
+
+    def _get_group_changes(self, datapath, actual_groups):
+        '''Returns the group modifications that add and modify groups, to
+           be sent before the flows that may forward to them, and the group
+           deletions, to be sent after the flows
+        '''
+        actual = {group.group_id: group for group in actual_groups}
+        changes = []
+        # Groups that forward to other groups are added and modified last,
+        # and deleted first
+        for group in sorted(self._groups.values(), key=_is_chained):
+            actual_group = actual.pop(group.group_id, None)
+            if actual_group is None:
+                changes.append(self._copy_group(group, datapath,
+                                                ofproto.OFPGC_ADD))
+                _RECONCILED_GROUPS.labels('add').inc()
+            elif (actual_group.type != group.type or
+                    _serialize_buckets(actual_group.buckets) !=
+                    _serialize_buckets(group.buckets)):
+                changes.append(self._copy_group(group, datapath,
+                                                ofproto.OFPGC_MODIFY))
+                _RECONCILED_GROUPS.labels('modify').inc()
+
+        deletions = []
+        for group in sorted(actual.values(),
+                            key=lambda group: not _is_chained(group)):
+            deletions.append(parser.OFPGroupMod(
+                datapath,
+                command=ofproto.OFPGC_DELETE,
+                type_=group.type,
+                group_id=group.group_id,
+            ))
+            _RECONCILED_GROUPS.labels('delete').inc()
+        return changes, deletions
+
+    def get_changes(self, datapath, actual_flows, actual_groups):
+        '''Stops reconciling, and returns the flow and group modifications
+           that change actual_flows and actual_groups, the flow stats and
+           group descriptions of all the flows and groups on the switch, to
+           the desired flows and groups. If either is None, i.e. the flows or
+           groups on the switch are unknown, all the flows and groups of the
+           switch are deleted and the desired ones are added.
+        '''
+        self.reconciling = False
+        desired = {table_id: dict(flows)
+                   for table_id, flows in self._flows.items() if flows}
+        changes = []
+        unchanged = 0
+        if actual_flows is None or actual_groups is None:
+            changes.append(parser.OFPFlowMod(
+                datapath,
+                table_id=ofproto.OFPTT_ALL,
+                command=ofproto.OFPFC_DELETE,
+                out_port=ofproto.OFPP_ANY,
+                out_group=ofproto.OFPG_ANY,
+                match=parser.OFPMatch(),
+            ))
+            _RECONCILED_FLOWS.labels('delete').inc()
+            changes.append(parser.OFPGroupMod(
+                datapath,
+                command=ofproto.OFPGC_DELETE,
+                type_=ofproto.OFPGT_ALL,
+                group_id=ofproto.OFPG_ALL,
+            ))
+            _RECONCILED_GROUPS.labels('delete').inc()
+            actual_flows = ()
+            actual_groups = ()
+
+        group_changes, group_deletions = self._get_group_changes(
+            datapath, actual_groups)
+        changes.extend(group_changes)
+
+        for flow in actual_flows:
+            if _is_ephemeral(flow):
+                continue
+            key = _get_flow_key(flow)
+            desired_flow = desired.get(flow.table_id, {}).pop(key, None)
+            if desired_flow is None:
+                changes.append(parser.OFPFlowMod(
+                    datapath,
+                    cookie=flow.cookie,
+                    cookie_mask=0xffffffffffffffff,
+                    table_id=flow.table_id,
+                    command=ofproto.OFPFC_DELETE_STRICT,
+                    priority=flow.priority,
+                    out_port=ofproto.OFPP_ANY,
+                    out_group=ofproto.OFPG_ANY,
+                    match=flow.match,
+                ))
+                _RECONCILED_FLOWS.labels('delete').inc()
+            elif (desired_flow.cookie != flow.cookie or
+                    _serialize_instructions(desired_flow.instructions) !=
+                    _serialize_instructions(flow.instructions)):
+                changes.append(self._copy_flow(desired_flow, datapath))
+                _RECONCILED_FLOWS.labels('modify').inc()
+            else:
+                unchanged += 1
+
+        for flows in desired.values():
+            for flow in flows.values():
+                changes.append(self._copy_flow(flow, datapath))
+                _RECONCILED_FLOWS.labels('add').inc()
+
+        changes.extend(group_deletions)
+        LOG.info('Reconciled the switch flows and groups: %(changes)d '
+                 'changes, %(unchanged)d unchanged flows',
+                 {'changes': len(changes), 'unchanged': unchanged})
+        return changes
@@ -25,13 +25,22 @@ from os_ken import utils
 from oslo_config import cfg
 from oslo_log import log
 
+from dragonflow.common import metrics
 from dragonflow.common import profiler as df_profiler
 from dragonflow.controller.common import constants
 from dragonflow.controller import dispatcher
+from dragonflow.switch.drivers.ovs import flow_batcher
+from dragonflow.switch.drivers.ovs import flow_reconciler
 
 
 LOG = log.getLogger(__name__)
 
+_PACKET_IN_LATENCY = metrics.histogram(
+    'df_packet_in_seconds',
+    'Time spent handling packet-in messages',
+    labelnames=('table', 'handler'),
+)
+
 
 class OsKenDFAdapter(ofp_handler.OFPHandler):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
@@ -50,6 +59,12 @@ class OsKenDFAdapter(ofp_handler.OFPHandler):
         self.table_handlers = {}
         self.first_connect = True
         self.db_change_callback = db_change_callback
+        self.flow_batcher = flow_batcher.FlowBatcher(
+            enabled=cfg.CONF.df_os_ken.enable_flow_batching,
+            max_size=cfg.CONF.df_os_ken.flow_batch_max_size,
+            use_bundles=cfg.CONF.df_os_ken.enable_flow_bundles,
+        )
+        self.flow_reconciler = flow_reconciler.FlowReconciler()
 
     @property
     def datapath(self):
@@ -73,6 +88,14 @@ class OsKenDFAdapter(ofp_handler.OFPHandler):
         while not self.is_ready():
             time.sleep(3)
 
+    def send_msg(self, datapath, msg):
+        '''Sends an OpenFlow message of an application. Flow modifications
+           update the desired flows of the switch, and are held back while
+           they are reconciled.
+        '''
+        if self.flow_reconciler.update(msg):
+            self.flow_batcher.send_msg(datapath, msg)
+
     def register_table_handler(self, table_id, handler):
         if table_id in self.table_handlers:
             raise RuntimeError(
@@ -96,6 +119,12 @@ class OsKenDFAdapter(ofp_handler.OFPHandler):
     def notify_switch_sync_started(self):
         self.dispatcher.dispatch(constants.CONTROLLER_SWITCH_SYNC_STARTED)
 
+    def notify_nb_sync_started(self):
+        self.dispatcher.dispatch(constants.CONTROLLER_NB_SYNC_STARTED)
+
+    def notify_nb_sync_finished(self):
+        self.dispatcher.dispatch(constants.CONTROLLER_NB_SYNC_FINISHED)
+
     @handler.set_ev_handler(ofp_event.EventOFPSwitchFeatures,
                             handler.CONFIG_DISPATCHER)
     def switch_features_handler(self, ev):
@@ -140,7 +169,10 @@ class OsKenDFAdapter(ofp_handler.OFPHandler):
             handler = self.table_handlers[table_id]
             with df_profiler.profiler_context('packet_in',
                                               info={"func": handler.__name__}):
-                handler(event)
+                with _PACKET_IN_LATENCY.labels(table_id,
+                                               handler.__name__).time():
+                    with self.flow_batcher.batch():
+                        handler(event)
         else:
             LOG.info("No handler for table id %(table)s with message "
                      "%(msg)", {'table': table_id, 'msg': msg})
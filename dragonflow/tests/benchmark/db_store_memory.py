@@ -0,0 +1,181 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Compare memory use and lookup latency of the DbStore backends.
+
+Loads LogicalPorts into a default and a compact DbStore, each in its own
+process, and reports the RSS growth, the lookup latencies, and the time
+the periodic sync takes to find the deleted ports when none were deleted:
+
+    python -m dragonflow.tests.benchmark.db_store_memory --ports 100000
+"""
+import argparse
+import collections
+import gc
+import random
+import resource
+import subprocess
+import sys
+import timeit
+import uuid
+
+from oslo_serialization import jsonutils
+
+from dragonflow.db import db_store
+from dragonflow.db.models import core
+from dragonflow.db.models import l2
+from dragonflow.db.models import secgroups
+from dragonflow.db import sync
+
+
+def _get_rss_kb():
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * resource.getpagesize() // 1024
+
+
+def _make_port(i, lswitch, topic, chassis, secgroup):
+    return l2.LogicalPort(
+        id=str(uuid.uuid4()),
+        topic=topic,
+        name='port{}'.format(i),
+        version=1,
+        unique_key=i + 1,
+        lswitch=lswitch.id,
+        ips=['10.{}.{}.{}'.format(i >> 16, (i >> 8) & 0xff, i & 0xff)],
+        macs=['fa:16:3e:{:02x}:{:02x}:{:02x}'.format(
+            i >> 16, (i >> 8) & 0xff, i & 0xff)],
+        subnets=[lswitch.id + '-subnet'],
+        security_groups=[secgroup],
+        enabled=True,
+        port_security_enabled=True,
+        device_owner='compute:nova',
+        device_id=str(uuid.uuid4()),
+        binding=l2.PortBinding(type=l2.BINDING_CHASSIS, chassis=chassis),
+    )
+
+
+def _run(compact, args):
+    store = db_store.DbStore(compact=compact)
+    # Index keys dereference the port's lswitch through the global instance
+    db_store._instance = store
+
+    rnd = random.Random(args.seed)
+    topics = [str(uuid.uuid4()) for _i in range(args.topics)]
+    chassis = ['chassis{}'.format(i) for i in range(args.chassis)]
+    secgroups_ = [str(uuid.uuid4()) for _i in range(args.topics)]
+    lswitches = []
+    for i in range(args.lswitches):
+        lswitch = l2.LogicalSwitch(id=str(uuid.uuid4()), unique_key=i + 1,
+                                   topic=rnd.choice(topics))
+        store.update(lswitch)
+        lswitches.append(lswitch)
+    for i in range(args.chassis):
+        store.update(core.Chassis(id=chassis[i], ip='172.16.0.1'))
+    for i, sg in enumerate(secgroups_):
+        store.update(secgroups.SecurityGroup(id=sg, topic=topics[i],
+                                             unique_key=i + 1))
+
+    gc.collect()
+    rss_before = _get_rss_kb()
+    port_ids = []
+    port_ids_by_topic = collections.defaultdict(set)
+    for i in range(args.ports):
+        topic_idx = rnd.randrange(len(topics))
+        port = _make_port(i, rnd.choice(lswitches), topics[topic_idx],
+                          rnd.choice(chassis), secgroups_[topic_idx])
+        store.update(port)
+        port_ids.append(port.id)
+        port_ids_by_topic[port.topic].add(port.id)
+        del port
+    gc.collect()
+    rss_after = _get_rss_kb()
+
+    lookup_ids = [rnd.choice(port_ids) for _i in range(args.lookups)]
+    lookup_keys = [rnd.randrange(args.ports) + 1
+                   for _i in range(args.lookups)]
+    unique_key_index = l2.LogicalPort.get_index('unique_key')
+    topic_index = l2.LogicalPort.get_index('topic')
+
+    def get_by_id():
+        for port_id in lookup_ids:
+            store.get_one(l2.LogicalPort(id=port_id))
+
+    def get_by_unique_key():
+        for key in lookup_keys:
+            store.get_one(l2.LogicalPort(unique_key=key),
+                          index=unique_key_index)
+
+    sync_ = sync.Sync(nb_api=None, update_cb=store.update,
+                      delete_cb=store.delete)
+    sync_._topics = set(topics)
+    snapshot = {(l2.LogicalPort, topic): (None, ids)
+                for topic, ids in port_ids_by_topic.items()}
+
+    def cleanup():
+        sync_._cleanup_model(l2.LogicalPort, snapshot)
+
+    def get_all_by_topic():
+        for topic in topics:
+            list(store.get_all(l2.LogicalPort(topic=topic),
+                               index=topic_index))
+
+    return {
+        'rss_kb': rss_after - rss_before,
+        'get_one': min(timeit.repeat(get_by_id, number=1, repeat=3)) /
+        args.lookups,
+        'get_one_index': min(
+            timeit.repeat(get_by_unique_key, number=1, repeat=3)) /
+        args.lookups,
+        'get_all_topic': min(
+            timeit.repeat(get_all_by_topic, number=1, repeat=3)) /
+        args.ports,
+        'cleanup': min(timeit.repeat(cleanup, number=1, repeat=3)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--ports', type=int, default=100000)
+    parser.add_argument('--lswitches', type=int, default=1000)
+    parser.add_argument('--topics', type=int, default=100)
+    parser.add_argument('--chassis', type=int, default=200)
+    parser.add_argument('--lookups', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backend', choices=('default', 'compact'),
+                        help='Run a single backend and print JSON results')
+    args = parser.parse_args()
+
+    if args.backend:
+        print(jsonutils.dumps(_run(args.backend == 'compact', args)))
+        return
+
+    print('{:<10} {:>12} {:>14} {:>16} {:>16} {:>14}'.format(
+        'backend', 'RSS (MiB)', 'get_one (us)', 'by index (us)',
+        'get_all (us/obj)', 'cleanup (ms)'))
+    for name in ('default', 'compact'):
+        # A fresh process for each backend, so RSS growth is comparable
+        output = subprocess.check_output(
+            [sys.executable, sys.argv[0], '--backend', name] + sys.argv[1:])
+        result = jsonutils.loads(output.decode().splitlines()[-1])
+        row = '{:<10} {:>12.1f} {:>14.2f} {:>16.2f} {:>16.2f} {:>14.1f}'
+        print(row.format(
+            name,
+            result['rss_kb'] / 1024.0,
+            result['get_one'] * 1e6,
+            result['get_one_index'] * 1e6,
+            result['get_all_topic'] * 1e6,
+            result['cleanup'] * 1e3,
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Compare port-bind throughput with and without flow batching.
+
+Installs the flows of each simulated port bind through DFlowApp.mod_flow,
+one controller event per port, towards a fake datapath that writes to a
+local socket drained by a fake switch. Reports the ports bound per second
+and the number of socket writes, without batching, with batching, and with
+batching in bundles:
+
+    python -m dragonflow.tests.benchmark.flow_batching --ports 2000
+"""
+import argparse
+import socket
+import time
+
+import eventlet
+from os_ken.ofproto import ofproto_v1_3
+from os_ken.ofproto import ofproto_v1_3_parser
+
+from dragonflow.controller import df_base_app
+from dragonflow.switch.drivers.ovs import flow_batcher
+
+
+class _FakeDatapath(object):
+    '''Sends like os_ken's Datapath, one sendall() per send()'''
+    ofproto = ofproto_v1_3
+    ofproto_parser = ofproto_v1_3_parser
+
+    def __init__(self, sock):
+        self.id = 1
+        self.xid = 0
+        self.writes = 0
+        self.sent_bytes = 0
+        self._sock = sock
+
+    def set_xid(self, msg):
+        self.xid = (self.xid + 1) & self.ofproto.MAX_XID
+        msg.set_xid(self.xid)
+        return self.xid
+
+    def send_msg(self, msg):
+        if msg.xid is None:
+            self.set_xid(msg)
+        msg.serialize()
+        self.send(msg.buf)
+
+    def send(self, buf):
+        self.writes += 1
+        self.sent_bytes += len(buf)
+        self._sock.sendall(buf)
+
+
+class _FakeSwitch(object):
+    def __init__(self, sock):
+        self.received_bytes = 0
+        self._sock = sock
+        self._thread = eventlet.spawn(self._drain)
+
+    def _drain(self):
+        while True:
+            data = self._sock.recv(65536)
+            if not data:
+                return
+            self.received_bytes += len(data)
+
+    def wait_for(self, byte_count):
+        while self.received_bytes < byte_count:
+            eventlet.sleep(0)
+
+    def stop(self):
+        self._thread.kill()
+        self._sock.close()
+
+
+class _FakeApi(object):
+    def __init__(self, datapath, batcher):
+        self.datapath = datapath
+        self.flow_batcher = batcher
+
+
+def _bind_port(app, port_key, flows_per_port):
+    '''Roughly the flows of l2, portsec, sg, dhcp, tunneling and l3 for a
+       local port: a match on the port's key and MAC, and a few actions
+    '''
+    parser = app.parser
+    mac = 'fa:16:3e:{:02x}:{:02x}:{:02x}'.format(
+        port_key >> 16, (port_key >> 8) & 0xff, port_key & 0xff)
+    for table in range(flows_per_port):
+        match = parser.OFPMatch(reg7=port_key, eth_dst=mac)
+        actions = [
+            parser.OFPActionSetField(reg6=port_key),
+            parser.OFPActionSetField(metadata=table),
+            parser.NXActionResubmitTable(table_id=table + 1),
+        ]
+        app.mod_flow(table_id=table, priority=100, match=match,
+                     actions=actions)
+
+
+def _run(mode, args):
+    controller_sock, switch_sock = socket.socketpair()
+    datapath = _FakeDatapath(controller_sock)
+    switch = _FakeSwitch(switch_sock)
+    batcher = flow_batcher.FlowBatcher(
+        enabled=mode != 'unbatched',
+        max_size=args.max_batch_size,
+        use_bundles=mode == 'bundles',
+    )
+    app = df_base_app.DFlowApp(_FakeApi(datapath, batcher))
+
+    start = time.time()
+    for port_key in range(1, args.ports + 1):
+        # One controller event per bound port
+        with batcher.batch():
+            _bind_port(app, port_key, args.flows_per_port)
+    switch.wait_for(datapath.sent_bytes)
+    elapsed = time.time() - start
+
+    switch.stop()
+    controller_sock.close()
+    return {
+        'ports_per_sec': args.ports / elapsed,
+        'writes': datapath.writes,
+        'bytes': datapath.sent_bytes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--ports', type=int, default=2000)
+    parser.add_argument('--flows-per-port', type=int, default=30)
+    parser.add_argument('--max-batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    print('{:<10} {:>12} {:>10} {:>12}'.format(
+        'mode', 'ports/s', 'writes', 'MiB sent'))
+    for mode in ('unbatched', 'batched', 'bundles'):
+        result = _run(mode, args)
+        print('{:<10} {:>12.1f} {:>10} {:>12.2f}'.format(
+            mode,
+            result['ports_per_sec'],
+            result['writes'],
+            result['bytes'] / 1024.0 / 1024.0,
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Compare the OpenFlow bytes sent per port join for BUM replication.
+
+Joins local ports to one network, one at a time, and serializes the messages
+that update the broadcast, unknown unicast and multicast replication: with
+one flow per direction that lists every port (as L2App did before it used
+groups), and with L2App's ALL groups. Reports the messages and bytes of the
+average and of the last port join:
+
+    python -m dragonflow.tests.benchmark.l2_bum_replication --ports 1000
+"""
+import argparse
+import time
+
+from os_ken.ofproto import ofproto_v1_3
+from os_ken.ofproto import ofproto_v1_3_parser
+
+from dragonflow.controller.apps import l2
+from dragonflow.controller.common import constants as const
+
+_NETWORK_ID = 5
+
+
+class _FakeDatapath(object):
+    ofproto = ofproto_v1_3
+    ofproto_parser = ofproto_v1_3_parser
+
+    def __init__(self):
+        self.id = 1
+        self.messages = 0
+        self.sent_bytes = 0
+
+    def send_msg(self, msg):
+        msg.set_xid(1)
+        msg.serialize()
+        self.messages += 1
+        self.sent_bytes += len(msg.buf)
+
+
+class _FakeApi(object):
+    def __init__(self, datapath):
+        self.datapath = datapath
+
+    def send_msg(self, datapath, msg):
+        datapath.send_msg(msg)
+
+
+def _join_with_flows(app, port_keys):
+    '''The flow modifications of a port join, before BUM groups'''
+    parser = app.parser
+    ofproto = app.ofproto
+    egress = []
+    ingress = []
+    for port_key in port_keys:
+        egress.append(parser.OFPActionSetField(reg7=port_key))
+        egress.append(parser.NXActionResubmitTable(
+            table_id=const.EGRESS_TABLE))
+        ingress.append(parser.OFPActionSetField(reg7=port_key))
+        ingress.append(parser.NXActionResubmitTable(
+            table_id=const.INGRESS_CONNTRACK_TABLE))
+    egress.append(parser.OFPActionSetField(reg7=0))
+    egress.append(parser.NXActionResubmitTable(table_id=const.EGRESS_TABLE))
+
+    command = ofproto.OFPFC_MODIFY if len(port_keys) > 1 else \
+        ofproto.OFPFC_ADD
+    for table_id, priority, actions in (
+            (const.L2_LOOKUP_TABLE, const.PRIORITY_MEDIUM, egress),
+            (const.INGRESS_DESTINATION_PORT_LOOKUP_TABLE,
+             const.PRIORITY_HIGH, ingress)):
+        app.mod_flow(
+            inst=[parser.OFPInstructionActions(
+                ofproto.OFPIT_APPLY_ACTIONS, actions)],
+            table_id=table_id,
+            command=command,
+            priority=priority,
+            match=app._get_multicast_broadcast_match(_NETWORK_ID))
+
+
+def _run(mode, ports):
+    datapath = _FakeDatapath()
+    app = l2.L2App(_FakeApi(datapath))
+
+    port_keys = []
+    last = (0, 0)
+    start = time.time()
+    for port_key in range(1, ports + 1):
+        port_keys.append(port_key)
+        messages, sent_bytes = datapath.messages, datapath.sent_bytes
+        if mode == 'flows':
+            _join_with_flows(app, port_keys)
+        else:
+            app._add_multicast_broadcast_handling_for_local_port(
+                'port{}'.format(port_key), port_key, _NETWORK_ID, 'vxlan')
+        last = (datapath.messages - messages,
+                datapath.sent_bytes - sent_bytes)
+    elapsed = time.time() - start
+
+    return {
+        'avg_messages': float(datapath.messages) / ports,
+        'avg_bytes': float(datapath.sent_bytes) / ports,
+        'last_messages': last[0],
+        'last_bytes': last[1],
+        'elapsed': elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--ports', type=int, default=1000)
+    args = parser.parse_args()
+
+    print('{:<8} {:>12} {:>12} {:>12} {:>12} {:>10}'.format(
+        'mode', 'avg msgs', 'avg bytes', 'last msgs', 'last bytes',
+        'seconds'))
+    for mode in ('flows', 'groups'):
+        result = _run(mode, args.ports)
+        print('{:<8} {:>12.2f} {:>12.1f} {:>12} {:>12} {:>10.2f}'.format(
+            mode,
+            result['avg_messages'],
+            result['avg_bytes'],
+            result['last_messages'],
+            result['last_bytes'],
+            result['elapsed'],
+        ))
+
+
+if __name__ == '__main__':
+    main()
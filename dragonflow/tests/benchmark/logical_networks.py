@@ -0,0 +1,156 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Compare the LogicalNetworks port cache with the list based one.
+
+Binds and unbinds local and remote ports as TunnelingApp does, i.e. counts
+the ports of the network before adding a port and after removing it. Then
+counts the local ports of all types, and lists the remote ports, of the
+network of every port. Reports microseconds per operation, for the list
+based cache LogicalNetworks used to be, and for the current one:
+
+    python -m dragonflow.tests.benchmark.logical_networks --ports 10000
+"""
+import argparse
+import collections
+import functools
+import random
+import time
+
+from dragonflow.controller.common import logical_networks
+
+
+class _ListLogicalNetworks(object):
+    '''LogicalNetworks before it used sets, with the same interface'''
+
+    def __init__(self):
+        initializer = functools.partial(collections.defaultdict, list)
+        self.local_ports_net_cache = collections.defaultdict(initializer)
+        self.remote_ports_net_cache = collections.defaultdict(initializer)
+
+    def _get_ports(self, ports, network_id, network_type):
+        network_ports = ports.get(network_id)
+        if network_ports:
+            if network_type:
+                return network_ports[network_type]
+            ret_list = list()
+            for port_list in network_ports.values():
+                ret_list += port_list
+            return ret_list
+        return None
+
+    def add_local_port(self, port_id, network_id, network_type):
+        self.local_ports_net_cache[network_id][network_type].append(port_id)
+
+    def add_remote_port(self, port_id, network_id, network_type):
+        self.remote_ports_net_cache[network_id][network_type].append(port_id)
+
+    def remove_local_port(self, port_id, network_id, network_type):
+        network_ports = self.local_ports_net_cache.get(network_id)
+        if network_ports and port_id in network_ports[network_type]:
+            network_ports[network_type].remove(port_id)
+
+    def remove_remote_port(self, port_id, network_id, network_type):
+        network_ports = self.remote_ports_net_cache.get(network_id)
+        if network_ports and port_id in network_ports[network_type]:
+            network_ports[network_type].remove(port_id)
+
+    def get_local_port_count(self, network_id, network_type=None):
+        return len(self._get_ports(self.local_ports_net_cache, network_id,
+                                   network_type) or ())
+
+    def get_remote_port_count(self, network_id, network_type=None):
+        return len(self._get_ports(self.remote_ports_net_cache, network_id,
+                                   network_type) or ())
+
+    def get_remote_ports(self, network_id, network_type=None):
+        return self._get_ports(self.remote_ports_net_cache, network_id,
+                               network_type)
+
+
+def _get_ports(args):
+    ports = [
+        ('port{}'.format(i), i % args.networks, 'vxlan',
+         i % 2 == 0)
+        for i in range(args.ports)
+    ]
+    random.Random(0).shuffle(ports)
+    return ports
+
+
+def _run(cache, ports):
+    start = time.time()
+    for port_id, network_id, network_type, is_local in ports:
+        if is_local:
+            cache.get_local_port_count(network_id=network_id,
+                                       network_type=network_type)
+            cache.add_local_port(port_id=port_id, network_id=network_id,
+                                 network_type=network_type)
+        else:
+            cache.add_remote_port(port_id=port_id, network_id=network_id,
+                                  network_type=network_type)
+            cache.get_remote_port_count(network_id=network_id)
+    bind_time = time.time() - start
+
+    start = time.time()
+    for _port_id, network_id, _network_type, _is_local in ports:
+        cache.get_local_port_count(network_id=network_id)
+    count_time = time.time() - start
+
+    start = time.time()
+    for _port_id, network_id, _network_type, _is_local in ports:
+        cache.get_remote_ports(network_id=network_id)
+    list_time = time.time() - start
+
+    start = time.time()
+    for port_id, network_id, network_type, is_local in ports:
+        if is_local:
+            cache.remove_local_port(port_id=port_id, network_id=network_id,
+                                    network_type=network_type)
+            cache.get_local_port_count(network_id=network_id,
+                                       network_type=network_type)
+        else:
+            cache.remove_remote_port(port_id=port_id, network_id=network_id,
+                                     network_type=network_type)
+            cache.get_remote_port_count(network_id=network_id)
+    unbind_time = time.time() - start
+
+    return {
+        'bind_us': bind_time * 1e6 / len(ports),
+        'unbind_us': unbind_time * 1e6 / len(ports),
+        'count_us': count_time * 1e6 / len(ports),
+        'list_us': list_time * 1e6 / len(ports),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--ports', type=int, default=10000)
+    parser.add_argument('--networks', type=int, default=10)
+    args = parser.parse_args()
+
+    ports = _get_ports(args)
+    print('{:<8} {:>10} {:>10} {:>10} {:>10}'.format(
+        'cache', 'bind us', 'unbind us', 'count us', 'list us'))
+    for name, cache_class in (('lists', _ListLogicalNetworks),
+                              ('sets', logical_networks.LogicalNetworks)):
+        result = _run(cache_class(), ports)
+        print('{:<8} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}'.format(
+            name,
+            result['bind_us'],
+            result['unbind_us'],
+            result['count_us'],
+            result['list_us'],
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Compare the encode and decode time of NB objects per model codec.
+
+Encodes typical objects of a few models as NbApi does, i.e. for the database
+and for a pub/sub message, and decodes them as a subscriber does, i.e. from
+the value unpacked from the message. Reports microseconds per object, per
+model and codec:
+
+    python -m dragonflow.tests.benchmark.model_codec --iterations 2000
+"""
+import argparse
+import time
+
+import msgpack
+
+from dragonflow.db import model_framework as mf
+from dragonflow.db.models import core
+from dragonflow.db.models import l2
+from dragonflow.db.models import l3
+from dragonflow.db.models import secgroups
+
+CODECS = ('json', 'trusted_json', 'msgpack')
+
+
+def _get_objects():
+    lswitch = l2.LogicalSwitch(
+        id='net1', topic='tenant1', name='private', version=3,
+        unique_key=10, is_external=False, mtu=1450, segmentation_id=1234,
+        network_type='vxlan')
+    lport = l2.LogicalPort(
+        id='port1', topic='tenant1', name='vm1-port', version=5,
+        unique_key=100, ips=['10.0.0.5', 'fd00::5'],
+        macs=['fa:16:3e:00:00:05'], subnets=['subnet1', 'subnet2'],
+        enabled=True, lswitch='net1', security_groups=['sg1', 'sg2'],
+        allowed_address_pairs=[
+            l2.AddressPair(ip_address='10.0.0.100',
+                           mac_address='fa:16:3e:00:00:05'),
+        ],
+        binding=l2.PortBinding(type=l2.BINDING_CHASSIS, chassis='host1'),
+        port_security_enabled=True, device_owner='compute:nova',
+        device_id='vm1')
+    lrouter = l3.LogicalRouter(
+        id='router1', topic='tenant1', name='router', version=2,
+        unique_key=20,
+        ports=[
+            l3.LogicalRouterPort(
+                id='rport{}'.format(i), topic='tenant1',
+                unique_key=200 + i, mac='fa:16:3e:00:01:{:02x}'.format(i),
+                lswitch='net{}'.format(i),
+                network='10.0.{}.1/24'.format(i))
+            for i in range(4)
+        ])
+    secgroup = secgroups.SecurityGroup(
+        id='sg1', topic='tenant1', name='default', version=7, unique_key=30,
+        rules=[
+            secgroups.SecurityGroupRule(
+                id='rule{}'.format(i), topic='tenant1',
+                direction='ingress', ethertype='IPv4', protocol=6,
+                port_range_min=1000 + i, port_range_max=1000 + i,
+                remote_ip_prefix='192.168.{}.0/24'.format(i),
+                security_group_id='sg1')
+            for i in range(10)
+        ])
+    chassis = core.Chassis(id='host1', ip='192.168.0.1',
+                           tunnel_types=['vxlan'])
+    return [lswitch, lport, lrouter, secgroup, chassis]
+
+
+def _measure(codec, obj, iterations):
+    model = type(obj)
+    start = time.time()
+    for _i in range(iterations):
+        value, event_value = codec.encode(obj)
+        message = msgpack.packb({'value': event_value}, use_bin_type=True)
+    encode_time = time.time() - start
+
+    start = time.time()
+    for _i in range(iterations):
+        event_value = msgpack.unpackb(message, raw=False)['value']
+        codec.decode(model, event_value)
+    decode_time = time.time() - start
+    return {
+        'encode_us': encode_time * 1e6 / iterations,
+        'decode_us': decode_time * 1e6 / iterations,
+        'db_bytes': len(value),
+        'message_bytes': len(message),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    print('{:<16} {:<14} {:>10} {:>10} {:>10} {:>10}'.format(
+        'model', 'codec', 'encode us', 'decode us', 'db bytes',
+        'msg bytes'))
+    for obj in _get_objects():
+        for codec_name in CODECS:
+            result = _measure(mf.get_codec(codec_name), obj, args.iterations)
+            print('{:<16} {:<14} {:>10.1f} {:>10.1f} {:>10} {:>10}'.format(
+                type(obj).__name__,
+                codec_name,
+                result['encode_us'],
+                result['decode_us'],
+                result['db_bytes'],
+                result['message_bytes'],
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Compare binding the local ports of a restart one at a time and in bulk.
+
+Binds the local ports of a controller restart to SGApp. Every port is a
+member of the "default" security group and of one of the other security
+groups, which allow TCP from their own members and from the members of the
+default group. The ports have consecutive addresses, and are bound in a
+random order. Reports the seconds, and the flow modifications and bytes sent
+to the switch, when SGApp applies every port as it is bound, and when the
+ports are bound during a northbound database sync, and applied together:
+
+    python -m dragonflow.tests.benchmark.sg_bulk_sync --ports 500
+"""
+import argparse
+import random
+import time
+
+import netaddr
+from neutron_lib import constants as n_const
+from os_ken.ofproto import ofproto_v1_3
+from os_ken.ofproto import ofproto_v1_3_parser
+
+from dragonflow.controller.apps import sg
+from dragonflow.db import db_store
+from dragonflow.db.models import l2
+from dragonflow.db.models import secgroups
+
+_DEFAULT_SECGROUP_ID = 'default'
+
+
+class _FakeDatapath(object):
+    ofproto = ofproto_v1_3
+    ofproto_parser = ofproto_v1_3_parser
+
+    def __init__(self):
+        self.id = 1
+        self.messages = 0
+        self.sent_bytes = 0
+
+    def send_msg(self, msg):
+        msg.set_xid(1)
+        msg.serialize()
+        self.messages += 1
+        self.sent_bytes += len(msg.buf)
+
+
+class _FakeApi(object):
+    def __init__(self, datapath):
+        self.datapath = datapath
+
+    def send_msg(self, datapath, msg):
+        datapath.send_msg(msg)
+
+
+def _get_rule(secgroup_id, remote_group_id, port):
+    return secgroups.SecurityGroupRule(
+        id='{}-{}-{}'.format(secgroup_id, remote_group_id, port),
+        direction=n_const.INGRESS_DIRECTION,
+        ethertype=n_const.IPv4,
+        protocol=n_const.PROTO_NUM_TCP,
+        port_range_min=port,
+        port_range_max=port,
+        remote_group_id=remote_group_id,
+        security_group_id=secgroup_id,
+        topic='tenant',
+    )
+
+
+def _get_secgroups(args):
+    secgroup_ids = [_DEFAULT_SECGROUP_ID] + [
+        'sg{}'.format(i) for i in range(1, args.secgroups)]
+    return [
+        secgroups.SecurityGroup(
+            id=secgroup_id,
+            topic='tenant',
+            version=1,
+            unique_key=unique_key,
+            rules=[_get_rule(secgroup_id, secgroup_id, 22),
+                   _get_rule(secgroup_id, _DEFAULT_SECGROUP_ID, 80)],
+        )
+        for unique_key, secgroup_id in enumerate(secgroup_ids, 1)
+    ]
+
+
+def _get_lports(args, secgroup_list):
+    network = netaddr.IPNetwork('10.0.0.0/16')
+    lports = [
+        l2.LogicalPort(
+            id='port{}'.format(i),
+            topic='tenant',
+            version=1,
+            unique_key=i,
+            ips=[network[i]],
+            security_groups=[
+                _DEFAULT_SECGROUP_ID,
+                secgroup_list[1 + i % (len(secgroup_list) - 1)].id,
+            ],
+        )
+        for i in range(1, args.ports + 1)
+    ]
+    random.Random(0).shuffle(lports)
+    return lports
+
+
+def _run(mode, lports):
+    datapath = _FakeDatapath()
+    app = sg.SGApp(_FakeApi(datapath))
+
+    start = time.time()
+    if mode == 'bulk':
+        app.nb_sync_started()
+    for lport in lports:
+        app._add_local_port(lport)
+    if mode == 'bulk':
+        app.nb_sync_finished()
+    elapsed = time.time() - start
+
+    return {
+        'elapsed': elapsed,
+        'messages': datapath.messages,
+        'sent_bytes': datapath.sent_bytes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--ports', type=int, default=500)
+    parser.add_argument('--secgroups', type=int, default=50)
+    args = parser.parse_args()
+
+    secgroup_list = _get_secgroups(args)
+    store = db_store.get_instance()
+    for secgroup in secgroup_list:
+        store.update(secgroup)
+    lports = _get_lports(args, secgroup_list)
+
+    print('{:<8} {:>10} {:>12} {:>12}'.format(
+        'mode', 'seconds', 'flow mods', 'bytes'))
+    for mode in ('ports', 'bulk'):
+        result = _run(mode, lports)
+        print('{:<8} {:>10.2f} {:>12} {:>12}'.format(
+            mode,
+            result['elapsed'],
+            result['messages'],
+            result['sent_bytes'],
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Compare the flows of security group rules with a remote group.
+
+Builds a "default" security group whose ingress rules allow a number of TCP
+ports from the group itself, and joins its members one at a time, with
+random addresses. Reports the number of rule flows, and the flow
+modifications of all the member joins, when every rule has one flow per
+address CIDR (as SGApp did before it compiled these rules to conjunctions),
+and with SecurityGroupCompiler:
+
+    python -m dragonflow.tests.benchmark.sg_remote_group_flows --members 1000
+"""
+import argparse
+import random
+
+import netaddr
+from neutron_lib import constants as n_const
+from os_ken.ofproto import ether
+
+from dragonflow.controller.common import sg_compiler
+from dragonflow.db.models import secgroups
+
+_SECGROUP_ID = 'default'
+
+
+def _get_rules(args):
+    return [
+        secgroups.SecurityGroupRule(
+            id='rule{}'.format(port),
+            direction=n_const.INGRESS_DIRECTION,
+            ethertype=n_const.IPv4,
+            protocol=n_const.PROTO_NUM_TCP,
+            port_range_min=port,
+            port_range_max=port,
+            remote_group_id=_SECGROUP_ID,
+            security_group_id=_SECGROUP_ID,
+        )
+        for port in range(1, args.rules + 1)
+    ]
+
+
+def _get_matches(rule):
+    return [{'eth_type': ether.ETH_TYPE_IP,
+             'ip_proto': rule.protocol,
+             'tcp_dst': rule.port_range_min}]
+
+
+def _get_addresses(args):
+    network = netaddr.IPNetwork('10.0.0.0/16')
+    return [network[i] for i in
+            random.Random(0).sample(range(1, network.size - 1), args.members)]
+
+
+def _join(addresses, address):
+    old_cidrs = set(addresses.iter_cidrs())
+    addresses = addresses | netaddr.IPSet([address])
+    new_cidrs = set(addresses.iter_cidrs())
+    return addresses, new_cidrs - old_cidrs, old_cidrs - new_cidrs
+
+
+def _run_flows(rules, member_addresses):
+    '''One flow per rule match and address CIDR'''
+    addresses = netaddr.IPSet()
+    flow_mods = 0
+    for address in member_addresses:
+        addresses, added_cidrs, removed_cidrs = _join(addresses, address)
+        for rule in rules:
+            flow_mods += len(_get_matches(rule)) * (len(added_cidrs) +
+                                                    len(removed_cidrs))
+    flows = sum(len(_get_matches(rule)) for rule in rules) * \
+        len(addresses.iter_cidrs())
+    return flows, flow_mods
+
+
+def _run_conjunctions(rules, member_addresses):
+    compiler = sg_compiler.SecurityGroupCompiler()
+    compiler.add_port(_SECGROUP_ID, 1)
+    for rule in rules:
+        compiler.add_rule(_SECGROUP_ID, rule, _get_matches(rule))
+
+    addresses = netaddr.IPSet()
+    flow_mods = 0
+    for address in member_addresses:
+        addresses, added_cidrs, removed_cidrs = _join(addresses, address)
+        flow_mods += len(compiler.update_addresses(
+            _SECGROUP_ID, addresses, added_cidrs, removed_cidrs))
+    return compiler.get_flow_counts()[_SECGROUP_ID], flow_mods
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--members', type=int, default=1000)
+    parser.add_argument('--rules', type=int, default=5)
+    args = parser.parse_args()
+
+    rules = _get_rules(args)
+    member_addresses = _get_addresses(args)
+    print('{:<14} {:>10} {:>12}'.format('mode', 'flows', 'join mods'))
+    for mode, run in (('flows', _run_flows),
+                      ('conjunctions', _run_conjunctions)):
+        flows, flow_mods = run(rules, member_addresses)
+        print('{:<14} {:>10} {:>12}'.format(mode, flows, flow_mods))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Compare unique key allocation under contention, per block size.
+
+Runs concurrent workers, each with its own etcd NB database driver, as
+Neutron API workers would have, allocating unique keys for the same table.
+The drivers share a fake etcd server that delays every request by a round
+trip. Reports the keys allocated per second, and the failed compare-and-swap
+requests per allocated key:
+
+    python -m dragonflow.tests.benchmark.unique_key_contention --workers 16
+"""
+import argparse
+import time
+
+import eventlet
+
+from dragonflow import conf as cfg
+from dragonflow.db.drivers import etcd_db_driver
+
+
+class _FakeEtcdServer(object):
+    def __init__(self, round_trip):
+        self.values = {}
+        self.requests = 0
+        self.failed_swaps = 0
+        self._round_trip = round_trip
+
+    def request(self):
+        self.requests += 1
+        eventlet.sleep(self._round_trip)
+
+
+class _FakeEtcdClient(object):
+    '''The compare-and-swap subset of the etcd3gw client'''
+    def __init__(self, server):
+        self._server = server
+
+    def get(self, key):
+        self._server.request()
+        value = self._server.values.get(key)
+        return [] if value is None else [value.encode('utf-8')]
+
+    def create(self, key, value):
+        self._server.request()
+        if key in self._server.values:
+            self._server.failed_swaps += 1
+            return False
+        self._server.values[key] = value
+        return True
+
+    def replace(self, key, initial_value, new_value):
+        self._server.request()
+        if self._server.values.get(key) != initial_value:
+            self._server.failed_swaps += 1
+            return False
+        self._server.values[key] = new_value
+        return True
+
+
+def _work(driver, keys_per_worker, allocated):
+    for _ in range(keys_per_worker):
+        allocated.append(driver.allocate_unique_key('lport'))
+
+
+def _run(block_size, args):
+    cfg.CONF.set_override('unique_key_block_size', block_size, group='df')
+    server = _FakeEtcdServer(args.round_trip_ms / 1000.0)
+    drivers = []
+    for _ in range(args.workers):
+        driver = etcd_db_driver.EtcdDbDriver()
+        driver.client = _FakeEtcdClient(server)
+        drivers.append(driver)
+
+    allocated = []
+    start = time.time()
+    pool = eventlet.GreenPool(args.workers)
+    for driver in drivers:
+        pool.spawn(_work, driver, args.keys_per_worker, allocated)
+    pool.waitall()
+    elapsed = time.time() - start
+
+    assert len(set(allocated)) == len(allocated), 'Duplicate unique keys'
+    for driver in drivers:
+        driver._unique_keys.release()
+    return {
+        'keys_per_sec': len(allocated) / elapsed,
+        'failed_swaps_per_key': server.failed_swaps / float(len(allocated)),
+        'requests': server.requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--keys-per-worker', type=int, default=200)
+    parser.add_argument('--round-trip-ms', type=float, default=1.0)
+    parser.add_argument('--block-sizes', type=int, nargs='+',
+                        default=[1, 8, 64])
+    args = parser.parse_args()
+
+    print('{:>10} {:>12} {:>18} {:>10}'.format(
+        'block', 'keys/s', 'failed CAS/key', 'requests'))
+    for block_size in args.block_sizes:
+        result = _run(block_size, args)
+        print('{:>10} {:>12.1f} {:>18.2f} {:>10}'.format(
+            block_size,
+            result['keys_per_sec'],
+            result['failed_swaps_per_key'],
+            result['requests'],
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -144,13 +144,47 @@ class OvsFlowsParser(object):
             flows_as_dicts.append(res)
         return flows_as_dicts
 
+    def get_ovs_groups(self, integration_bridge):
+        full_args = ["ovs-ofctl", "dump-groups", integration_bridge,
+                     "-O Openflow13"]
+        groups = agent_utils.execute(full_args, run_as_root=True,
+                                     process_input=None)
+        return groups
+
+    def dump_groups(self, integration_bridge):
+        """Returns the actions of the buckets of each group, by group ID"""
+        groups = {}
+        for group in self.get_ovs_groups(integration_bridge).split("\n"):
+            m = re.search(r'group_id=(\d+)', group)
+            if not m:
+                continue
+            groups[m.group(1)] = [
+                bucket.strip().rstrip(',').split('actions=', 1)[-1]
+                for bucket in group.split('bucket=')[1:]
+            ]
+        return groups
+
+    def _expand_group_actions(self, actions, groups):
+        def expand(m):
+            return ','.join(self._expand_group_actions(bucket, groups)
+                            for bucket in groups.get(m.group(1), ()))
+        return re.sub(r'group:(\d+)', expand, actions)
+
     def diff_flows(self, list1, list2):
         result = [v for v in list2 if v not in list1]
         return result
 
-    def dump(self, integration_bridge):
-        flows = self.get_ovs_flows(integration_bridge)
-        return self._parse_ovs_flows(flows)
+    def dump(self, integration_bridge, expand_groups=False):
+        """Returns the flows of the bridge. With expand_groups, group actions
+        are replaced with the actions of the group buckets.
+        """
+        flows = self._parse_ovs_flows(self.get_ovs_flows(integration_bridge))
+        if expand_groups:
+            groups = self.dump_groups(integration_bridge)
+            for flow in flows:
+                flow['actions'] = self._expand_group_actions(flow['actions'],
+                                                             groups)
+        return flows
 
 
 class OvsTestApi(vswitch_impl.OvsApi):
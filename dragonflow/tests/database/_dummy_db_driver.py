@@ -28,6 +28,7 @@ class _DummyDbDriver(db_api.DbApi):
         super(_DummyDbDriver, self).__init__()
         self._db = collections.defaultdict(dict)
         self._unique_keys_lock = threading.Lock()
+        self._revisions = collections.Counter()
 
     def initialize(self, db_ip, db_port, **args):
         # Do nothing. Initialized automatically in construction
@@ -39,6 +40,7 @@ class _DummyDbDriver(db_api.DbApi):
 
     def delete_table(self, table):
         self._db.pop(table, None)
+        self._revisions[table] += 1
 
     def get_key(self, table, key, topic=None):
         try:
@@ -52,14 +54,17 @@ class _DummyDbDriver(db_api.DbApi):
         self.get_key(table, key, topic)
         table_dict = self._db[table]
         table_dict[key] = value
+        self._revisions[table] += 1
 
     def create_key(self, table, key, value, topic=None):
         table_dict = self._db[table]
         table_dict[key] = value
+        self._revisions[table] += 1
 
     def delete_key(self, table, key, topic=None):
         table_dict = self._db[table]
         del table_dict[key]
+        self._revisions[table] += 1
 
     def get_all_entries(self, table, topic=None):
         table_dict = self._db[table]
@@ -69,6 +74,9 @@ class _DummyDbDriver(db_api.DbApi):
         table_dict = self._db[table]
         return [key for key in table_dict.keys()]
 
+    def get_table_revision(self, table, topic=None):
+        return self._revisions[table]
+
     def allocate_unique_key(self, table):
         with self._unique_keys_lock:
             unique_key_table = self._db[db_common.UNIQUE_KEY_TABLE]
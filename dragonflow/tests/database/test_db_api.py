@@ -12,6 +12,9 @@
 
 import functools
 import threading
+import time
+
+import mock
 
 from dragonflow.common import exceptions as df_exceptions
 from dragonflow.tests import base
@@ -60,6 +63,30 @@ class TestDbApi(base.BaseTestCase):
         self.assertEqual('v1_2', self.driver.get_key('test_table', 'k1'))
         self.assertEqual('v2', self.driver.get_key('test_table', 'k2'))
 
+    def test_get_keys(self):
+        self.driver.create_table('test_table')
+        self.addCleanup(self.driver.delete_table, 'test_table')
+        self.assertEqual([], self.driver.get_keys('test_table', []))
+        self.driver.create_key('test_table', 'k1', 'v1')
+        self.driver.create_key('test_table', 'k2', 'v2')
+        self.assertEqual(['v2', None, 'v1'],
+                         self.driver.get_keys('test_table',
+                                              ['k2', 'k3', 'k1']))
+
+    def test_execute_batch(self):
+        self.driver.create_table('test_table')
+        self.addCleanup(self.driver.delete_table, 'test_table')
+        self.driver.create_key('test_table', 'k1', 'v1')
+        self.driver.create_key('test_table', 'k2', 'v2')
+        self.driver.execute_batch([
+            ('create', 'test_table', 'k3', 'v3', None),
+            ('set', 'test_table', 'k1', 'v1_2', None),
+            ('delete', 'test_table', 'k2', None, None),
+        ])
+        self.assertEqual(['v1_2', None, 'v3'],
+                         self.driver.get_keys('test_table',
+                                              ['k1', 'k2', 'k3']))
+
     def test_get_all_entries(self):
         self.assertEqual([], self.driver.get_all_entries('test_table'))
         self.driver.create_table('test_table')
@@ -94,3 +121,37 @@ class TestDbApi(base.BaseTestCase):
         self.assertNotEqual(unique_keys[0], unique_keys[1])
         self.assertFalse(thread1.is_alive())
         self.assertFalse(thread2.is_alive())
+
+    def test_heartbeat(self):
+        self.assertIsNone(self.driver.get_heartbeat('test_table', 'k1'))
+        with mock.patch.object(time, 'time', return_value=100.0):
+            self.driver.heartbeat('test_table', 'k1', 10)
+        self.addCleanup(self.driver.delete_heartbeat, 'test_table', 'k1')
+        with mock.patch.object(time, 'time', return_value=105.0):
+            self.driver.heartbeat('test_table', 'k1', 10)
+        with mock.patch.object(time, 'time', return_value=110.0):
+            self.assertEqual(105.0,
+                             self.driver.get_heartbeat('test_table', 'k1'))
+        with mock.patch.object(time, 'time', return_value=116.0):
+            self.assertIsNone(self.driver.get_heartbeat('test_table', 'k1'))
+        self.assertIsNone(self.driver.get_heartbeat('test_table', 'k2'))
+
+    def test_get_heartbeats(self):
+        self.assertEqual([None, None],
+                         self.driver.get_heartbeats('test_table',
+                                                    ['k1', 'k2']))
+        with mock.patch.object(time, 'time', return_value=100.0):
+            self.driver.heartbeat('test_table', 'k1', 10)
+        self.addCleanup(self.driver.delete_heartbeat, 'test_table', 'k1')
+        with mock.patch.object(time, 'time', return_value=103.0):
+            self.driver.heartbeat('test_table', 'k3', 5)
+        self.addCleanup(self.driver.delete_heartbeat, 'test_table', 'k3')
+        with mock.patch.object(time, 'time', return_value=105.0):
+            self.assertEqual(
+                [100.0, None, 103.0],
+                self.driver.get_heartbeats('test_table', ['k1', 'k2', 'k3']))
+        with mock.patch.object(time, 'time', return_value=109.0):
+            self.assertEqual(
+                [None, 100.0],
+                self.driver.get_heartbeats('test_table', ['k3', 'k1']))
+        self.assertEqual([], self.driver.get_heartbeats('test_table', []))
@@ -80,7 +80,8 @@ class TestL2FLows(test_base.DFTestBase):
         tunnel_key_hex = hex(tunnel_key)
         n_type = network.get_network()['network']['provider:network_type']
         port_num = self.vswitch_api.get_vtp_ofport(n_type)
-        r = self._check_tunnel_flows(ovs.dump(self.integration_bridge),
+        flows = ovs.dump(self.integration_bridge, expand_groups=True)
+        r = self._check_tunnel_flows(flows,
                                      metadataid,
                                      hex(segmentation_id),
                                      tunnel_key_hex,
@@ -140,7 +141,8 @@ class TestL2FLows(test_base.DFTestBase):
         port_key = port.unique_key
         port_key_hex = hex(port_key)
 
-        r = self._check_vlan_flows(ovs.dump(self.integration_bridge),
+        flows = ovs.dump(self.integration_bridge, expand_groups=True)
+        r = self._check_vlan_flows(flows,
                                    metadataid,
                                    vlan_min,
                                    port_key_hex,
@@ -315,7 +317,8 @@ class TestL2FLows(test_base.DFTestBase):
         )
         port_key = port.unique_key
         port_key_hex = hex(port_key)
-        r = self._check_flat_flows(ovs.dump(self.integration_bridge),
+        flows = ovs.dump(self.integration_bridge, expand_groups=True)
+        r = self._check_flat_flows(flows,
                                    metadataid, port_key_hex, mac)
         for key, value in r.items():
             self.assertIsNotNone(value, key)
@@ -511,7 +514,8 @@ class TestL2FLows(test_base.DFTestBase):
         )
         tunnel_key = port.unique_key
         tunnel_key_hex = hex(tunnel_key)
-        r = self._check_multicast_rule(ovs.dump(self.integration_bridge),
+        flows = ovs.dump(self.integration_bridge, expand_groups=True)
+        r = self._check_multicast_rule(flows,
                                        metadataid, tunnel_key_hex)
         self.assertIsNotNone(r)
         vm.close()
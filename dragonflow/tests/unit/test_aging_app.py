@@ -0,0 +1,122 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import mock
+
+from dragonflow.controller.common import constants as const
+from dragonflow.tests.unit import test_app_base
+
+
+class TestAgingApp(test_app_base.DFAppTestBase):
+    apps_list = ["aging"]
+
+    def setUp(self):
+        super(TestAgingApp, self).setUp()
+        self.app = self.open_flow_app.dispatcher.apps['aging']
+        self.reconciler = self.open_flow_app.flow_reconciler
+        self.app.get_flows = mock.Mock()
+        self.app.get_groups = mock.Mock(return_value=[])
+
+    def test_no_canary_flow(self):
+        self.app.get_flows.return_value = []
+        del_group = self.app.del_group = mock.Mock()
+        self.app.switch_sync_started()
+        self.assertFalse(self.reconciler.reconciling)
+        self.app.mod_flow.assert_called_once_with(table_id=const.CANARY_TABLE)
+        # Groups left on the switch are deleted
+        del_group.assert_called_once_with(self.datapath.ofproto.OFPG_ALL,
+                                          self.datapath.ofproto.OFPGT_ALL)
+
+        self.app.switch_sync_finished()
+        self.app.get_flows.assert_called_once_with(
+            table_id=const.CANARY_TABLE)
+
+    def test_reconcile(self):
+        canary_flow = mock.Mock()
+        self.app.get_flows.return_value = [canary_flow]
+        self.app.switch_sync_started()
+        self.assertTrue(self.reconciler.reconciling)
+
+        change = mock.Mock()
+        with mock.patch.object(self.reconciler, 'get_changes',
+                               return_value=[change]) as get_changes, \
+                mock.patch.object(self.open_flow_app.flow_batcher,
+                                  'send_msg') as send_msg:
+            self.app.switch_sync_finished()
+        get_changes.assert_called_once_with(self.datapath, [canary_flow],
+                                            [])
+        send_msg.assert_called_once_with(self.datapath, change)
+
+    def test_reconcile_group_dump_failed(self):
+        canary_flow = mock.Mock()
+        self.app.get_flows.return_value = [canary_flow]
+        self.app.switch_sync_started()
+
+        self.app.get_groups.return_value = None
+        with mock.patch.object(self.reconciler, 'get_changes',
+                               return_value=[]) as get_changes:
+            self.app.switch_sync_finished()
+        get_changes.assert_called_once_with(self.datapath, [canary_flow],
+                                            None)
+
+    def test_reconcile_dump_failed(self):
+        self.app.get_flows.return_value = [mock.Mock()]
+        self.app.switch_sync_started()
+        self.app.get_flows.reset_mock()
+
+        # An empty dump is retried, and the flows of the switch are
+        # replaced once all the attempts fail
+        self.app.get_flows.return_value = []
+        with mock.patch.object(self.reconciler, 'get_changes',
+                               return_value=[]) as get_changes:
+            self.app.switch_sync_finished()
+        self.assertEqual(3, self.app.get_flows.call_count)
+        get_changes.assert_called_once_with(self.datapath, None, [])
+
+    def test_reconcile_dump_retried(self):
+        canary_flow = mock.Mock()
+        self.app.get_flows.return_value = [canary_flow]
+        self.app.switch_sync_started()
+
+        self.app.get_flows.side_effect = [[], [canary_flow]]
+        with mock.patch.object(self.reconciler, 'get_changes',
+                               return_value=[]) as get_changes:
+            self.app.switch_sync_finished()
+        get_changes.assert_called_once_with(self.datapath, [canary_flow],
+                                            [])
+
+    @mock.patch('eventlet.spawn_after')
+    def test_reconcile_timeout(self, spawn_after):
+        self.app.get_flows.return_value = [mock.Mock()]
+        self.app.switch_sync_started()
+        spawn_after.assert_called_once_with(
+            120, self.app._reconcile_timed_out)
+
+        # The switch sync never finishes, it is finished by the timer on the
+        # controller's event loop
+        with mock.patch.object(self.open_flow_app,
+                               'db_change_callback') as db_change_callback:
+            self.app._reconcile_timed_out()
+        db_change_callback.assert_called_once_with(
+            None, None, const.CONTROLLER_SWITCH_SYNC_FINISHED, None)
+
+        self.app.switch_sync_finished()
+        self.assertFalse(self.reconciler.reconciling)
+        spawn_after.return_value.cancel.assert_not_called()
+
+    @mock.patch('eventlet.spawn_after')
+    def test_reconcile_timer_cancelled(self, spawn_after):
+        self.app.get_flows.return_value = [mock.Mock()]
+        self.app.switch_sync_started()
+        with mock.patch.object(self.reconciler, 'get_changes',
+                               return_value=[]):
+            self.app.switch_sync_finished()
+        spawn_after.return_value.cancel.assert_called_once_with()
@@ -11,6 +11,7 @@
 #    under the License.
 from jsonmodels import fields
 import mock
+import testtools
 
 from oslo_config import cfg
 
@@ -32,6 +33,14 @@ class ModelTest(mf.ModelBase):
     field1 = fields.StringField()
 
 
+@mf.construct_nb_db_model
+class HeartbeatModelTest(mf.ModelBase):
+    table_name = 'heartbeat_model_test'
+    heartbeat_field = 'timestamp'
+
+    timestamp = df_fields.TimestampField()
+
+
 @mf.construct_nb_db_model
 class TopicModelTest(mf.ModelBase, mixins.Topic):
     table_name = 'topic_model_test'
@@ -153,8 +162,42 @@ class TestNbApi(tests_base.BaseTestCase):
                               (o.to_struct() for o in res))
         ModelTest.on_get_all_post.assert_called_once()
 
-    @mock.patch.object(TopicModelTest, 'from_json')
-    def test_get_topic(self, from_json):
+    def test_heartbeat(self):
+        self.api_nb.heartbeat(HeartbeatModelTest(id='id1'), 30)
+        self.api_nb.driver.heartbeat.assert_called_once_with(
+            'heartbeat_model_test', 'id1', 30)
+        self.api_nb.driver.set_key.assert_not_called()
+        self.api_nb.publisher.send_event.assert_not_called()
+
+    def test_get_reads_heartbeat(self):
+        m = HeartbeatModelTest(id='id1', timestamp=100.0)
+        self.api_nb.driver.get_key.return_value = m.to_json()
+        self.api_nb.driver.get_heartbeats.return_value = [150.0]
+        obj = self.api_nb.get(HeartbeatModelTest(id='id1'))
+        self.assertEqual(150.0, obj.timestamp)
+        self.api_nb.driver.get_heartbeats.assert_called_once_with(
+            'heartbeat_model_test', ['id1'])
+
+        # Expired heartbeats leave the stored timestamp
+        self.api_nb.driver.get_heartbeats.return_value = [None]
+        obj = self.api_nb.get(HeartbeatModelTest(id='id1'))
+        self.assertEqual(100.0, obj.timestamp)
+
+    def test_get_all_reads_heartbeats(self):
+        self.api_nb.driver.get_all_entries.return_value = (
+            HeartbeatModelTest(id='id1', timestamp=100.0).to_json(),
+            HeartbeatModelTest(id='id2', timestamp=100.0).to_json(),
+        )
+        self.api_nb.driver.get_heartbeats.return_value = [150.0, None]
+        res = self.api_nb.get_all(HeartbeatModelTest)
+        self.assertEqual({'id1': 150.0, 'id2': 100.0},
+                         {o.id: o.timestamp for o in res})
+        self.api_nb.driver.get_heartbeats.assert_called_once_with(
+            'heartbeat_model_test', ['id1', 'id2'])
+        self.api_nb.driver.get_heartbeat.assert_not_called()
+
+    def test_get_topic(self):
+        self.api_nb.codec = mock.Mock()
         self.api_nb.get(TopicModelTest(id='id1'))
         self.api_nb.driver.get_key.assert_called_once_with('topic_model_test',
                                                            'id1', None)
@@ -174,3 +217,104 @@ class TestNbApi(tests_base.BaseTestCase):
         self.api_nb.get(m.reffering_field)
         self.api_nb.driver.get_key.assert_called_once_with('dummy_table',
                                                            'id2', None)
+
+    def test_get_many(self):
+        m1 = ModelTest(id='id1')
+        m3 = TopicModelTest(id='id3', topic='topic1')
+
+        def get_keys(table, keys, topic):
+            values = {'id1': m1.to_json(), 'id3': m3.to_json()}
+            return [values.get(key) for key in keys]
+
+        self.api_nb.driver.get_keys.side_effect = get_keys
+        res = self.api_nb.get_many([
+            TopicModelTest(id='id3', topic='topic1'),
+            ModelTest(id='id1'),
+            TopicModelTest(id='id2', topic='topic1'),
+        ])
+        self.assertEqual(m3.to_struct(), res[0].to_struct())
+        self.assertEqual(m1.to_struct(), res[1].to_struct())
+        self.assertIsNone(res[2])
+        self.api_nb.driver.get_keys.assert_has_calls(
+            [mock.call('topic_model_test', ('id3', 'id2'), 'topic1'),
+             mock.call('dummy_table', ('id1',), None)],
+            any_order=True,
+        )
+        self.assertEqual(2, self.api_nb.driver.get_keys.call_count)
+
+    def test_batch(self):
+        m1 = ModelTest(id='id1', topic='topic')
+        m2 = ModelTest(id='id2', topic='topic', field1='a')
+        m3 = ModelTest(id='id3', topic='topic2')
+        m1.on_create_pre = mock.Mock()
+        self.api_nb.driver.get_keys.return_value = [m2.to_json()]
+
+        with self.api_nb.batch():
+            self.api_nb.create(m1)
+            self.api_nb.update(ModelTest(id='id2', topic='topic',
+                                         field1='b'))
+            self.api_nb.delete(m3)
+            self.api_nb.driver.execute_batch.assert_not_called()
+            self.api_nb.publisher.send_event.assert_not_called()
+
+        self.api_nb.driver.get_keys.assert_called_once_with(
+            'dummy_table', ('id2',), 'topic')
+        m2.field1 = 'b'
+        self.api_nb.driver.execute_batch.assert_called_once_with([
+            ('create', 'dummy_table', 'id1', m1.to_json(), 'topic'),
+            ('set', 'dummy_table', 'id2', m2.to_json(), 'topic'),
+            ('delete', 'dummy_table', 'id3', None, 'topic2'),
+        ])
+
+        self.assertEqual(2, self.api_nb.publisher.send_event.call_count)
+        update1, = self.api_nb.publisher.send_event.call_args_list[0][0]
+        self.assertEqual(db_common.BATCH_ACTION, update1.action)
+        self.assertEqual('topic', update1.topic)
+        self.assertEqual(['id1', 'id2'], [u['key'] for u in update1.value])
+        self.assertEqual(['create', 'set'],
+                         [u['action'] for u in update1.value])
+        update2, = self.api_nb.publisher.send_event.call_args_list[1][0]
+        self.assertEqual('delete', update2.action)
+        self.assertEqual('id3', update2.key)
+
+    def test_batch_coalesce_writes(self):
+        m1 = ModelTest(id='id1', topic='topic', field1='a')
+        m1.on_create_pre = mock.Mock()
+
+        with self.api_nb.batch():
+            self.api_nb.create(m1)
+            self.api_nb.update(ModelTest(id='id1', topic='topic',
+                                         field1='b'))
+
+        self.api_nb.driver.get_keys.assert_not_called()
+        self.api_nb.driver.execute_batch.assert_called_once_with([
+            ('create', 'dummy_table', 'id1',
+             ModelTest(id='id1', topic='topic', field1='b').to_json(),
+             'topic'),
+        ])
+        self.api_nb.publisher.send_event.assert_called_once()
+        # The object passed to create is not modified by the update
+        self.assertEqual('a', m1.field1)
+
+    def test_batch_update_nonexistent(self):
+        self.api_nb.driver.get_keys.return_value = [None]
+        with testtools.ExpectedException(exceptions.DBKeyNotFound):
+            with self.api_nb.batch():
+                self.api_nb.update(ModelTest(id='id1', topic='topic'))
+        self.api_nb.driver.execute_batch.assert_not_called()
+        self.api_nb.publisher.send_event.assert_not_called()
+
+    def test_batch_discarded_on_error(self):
+        m1 = ModelTest(id='id1', topic='topic')
+        m1.on_create_pre = mock.Mock()
+
+        with testtools.ExpectedException(ValueError):
+            with self.api_nb.batch():
+                self.api_nb.create(m1)
+                raise ValueError()
+        self.api_nb.driver.execute_batch.assert_not_called()
+        self.api_nb.publisher.send_event.assert_not_called()
+
+        # Not in a batch anymore
+        self.api_nb.create(m1)
+        self.api_nb.driver.create_key.assert_called_once()
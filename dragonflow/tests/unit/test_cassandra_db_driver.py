@@ -0,0 +1,294 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import re
+import sys
+
+import mock
+from oslo_serialization import jsonutils
+
+from dragonflow.common import exceptions as df_exceptions
+from dragonflow.tests import base as tests_base
+
+# The driver is tested against a fake session, so the cassandra driver is
+# not needed
+with mock.patch.dict(sys.modules, {
+    'cassandra': mock.MagicMock(),
+    'cassandra.cluster': mock.MagicMock(),
+    'cassandra.policies': mock.MagicMock(),
+    'cassandra.query': mock.MagicMock(),
+}):
+    from dragonflow.db.drivers import cassandra_db_driver
+
+
+_TEMPLATES = (
+    cassandra_db_driver._SELECT_VALUE,
+    cassandra_db_driver._SELECT_VALUE_BY_KEY,
+    cassandra_db_driver._SELECT_TOPIC_BY_KEY,
+    cassandra_db_driver._SELECT_ALL_VALUES,
+    cassandra_db_driver._SELECT_ALL_VALUES_BY_TOPIC,
+    cassandra_db_driver._SELECT_ALL_KEYS,
+    cassandra_db_driver._SELECT_ALL_KEYS_BY_TOPIC,
+    cassandra_db_driver._INSERT,
+    cassandra_db_driver._UPDATE,
+    cassandra_db_driver._COMPARE_AND_SET,
+    cassandra_db_driver._DELETE,
+)
+
+
+class _FakeRows(list):
+    def __init__(self, rows=(), was_applied=True):
+        super(_FakeRows, self).__init__(rows)
+        self.was_applied = was_applied
+
+    def one(self):
+        return self[0] if self else None
+
+
+class _FailingRows(object):
+    '''Fails to fetch the second page'''
+    def __iter__(self):
+        yield {'key': 'key1', 'value': 'value1'}
+        raise Exception('Failed to fetch page')
+
+
+class _FakeSession(object):
+    '''Keeps the tables partitioned by topic in dicts of (topic, key) to
+    value, and the tables of the former schema in dicts of key to value.
+    '''
+    def __init__(self):
+        self.tables = {}
+        self.former_tables = {}
+        self.prepared = []
+
+    def prepare(self, statement):
+        self.prepared.append(statement)
+        for template in _TEMPLATES:
+            match = re.match(
+                re.escape(template).replace(r'\{table\}', r'(\w+)') + '$',
+                statement)
+            if match:
+                return template, match.group(1)
+        raise AssertionError('Unexpected statement %s' % statement)
+
+    def execute(self, statement, args=()):
+        if isinstance(statement, tuple):
+            return self._execute_prepared(statement[0],
+                                          self.tables[statement[1]], *args)
+
+        match = re.match(r'CREATE TABLE IF NOT EXISTS (\w+) ', statement)
+        if match:
+            self.tables.setdefault(match.group(1), {})
+            return _FakeRows()
+        if statement.startswith('CREATE INDEX IF NOT EXISTS '):
+            return _FakeRows()
+        match = re.match(r'SELECT key, value FROM (\w+);$', statement)
+        if match:
+            return _FakeRows(
+                {'key': key, 'value': value}
+                for key, value in self.former_tables[match.group(1)].items())
+        match = re.match(r'DROP TABLE (\w+);$', statement)
+        if match:
+            if match.group(1) in self.former_tables:
+                del self.former_tables[match.group(1)]
+            else:
+                del self.tables[match.group(1)]
+            return _FakeRows()
+        raise AssertionError('Unexpected statement %s' % statement)
+
+    def _execute_prepared(self, template, rows, *args):
+        if template == cassandra_db_driver._SELECT_VALUE:
+            topic, key = args
+            if (topic, key) not in rows:
+                return _FakeRows()
+            return _FakeRows([{'value': rows[(topic, key)]}])
+        if template in (cassandra_db_driver._SELECT_VALUE_BY_KEY,
+                        cassandra_db_driver._SELECT_TOPIC_BY_KEY):
+            return _FakeRows({'topic': topic, 'value': value}
+                             for (topic, key), value in rows.items()
+                             if key == args[0])
+        if template in (cassandra_db_driver._SELECT_ALL_VALUES,
+                        cassandra_db_driver._SELECT_ALL_KEYS):
+            return _FakeRows({'key': key, 'value': value}
+                             for (_topic, key), value in rows.items())
+        if template in (cassandra_db_driver._SELECT_ALL_VALUES_BY_TOPIC,
+                        cassandra_db_driver._SELECT_ALL_KEYS_BY_TOPIC):
+            return _FakeRows({'key': key, 'value': value}
+                             for (topic, key), value in rows.items()
+                             if topic == args[0])
+        if template == cassandra_db_driver._INSERT:
+            topic, key, value = args
+            if (topic, key) in rows:
+                return _FakeRows(was_applied=False)
+            rows[(topic, key)] = value
+            return _FakeRows()
+        if template == cassandra_db_driver._UPDATE:
+            value, topic, key = args
+            rows[(topic, key)] = value
+            return _FakeRows()
+        if template == cassandra_db_driver._COMPARE_AND_SET:
+            value, topic, key, orig_value = args
+            if rows.get((topic, key)) != orig_value:
+                return _FakeRows(was_applied=False)
+            rows[(topic, key)] = value
+            return _FakeRows()
+        if template == cassandra_db_driver._DELETE:
+            rows.pop(args, None)
+            return _FakeRows()
+
+
+class _FakeKeyspace(object):
+    def __init__(self, session):
+        self._session = session
+
+    @property
+    def tables(self):
+        return dict.fromkeys(self._session.former_tables)
+
+
+class TestCassandraDbDriver(tests_base.BaseTestCase):
+    def setUp(self):
+        super(TestCassandraDbDriver, self).setUp()
+        self.session = _FakeSession()
+        self.driver = cassandra_db_driver.CassandraDbDriver()
+        self.driver.session = self.session
+        self.driver.client = mock.Mock()
+        self.driver.client.metadata.keyspaces = {
+            cassandra_db_driver.ROOT_KS: _FakeKeyspace(self.session),
+        }
+
+    def _rows(self, table):
+        return self.session.tables[table + cassandra_db_driver.TABLE_SUFFIX]
+
+    def test_create_table(self):
+        self.driver.create_table('lport')
+        self.assertEqual({}, self._rows('lport'))
+
+    def test_migrate_table(self):
+        lport = jsonutils.dumps({'id': 'lport1', 'topic': 'tenant1'})
+        lswitch = jsonutils.dumps({'id': 'lswitch1'})
+        self.session.former_tables['lport'] = {
+            'lport1': lport,
+            'lswitch1': lswitch,
+            'counter': '7',
+        }
+
+        self.driver.create_table('lport')
+        expected = {
+            ('tenant1', 'lport1'): lport,
+            (cassandra_db_driver.NO_TOPIC, 'lswitch1'): lswitch,
+            (cassandra_db_driver.NO_TOPIC, 'counter'): '7',
+        }
+        self.assertEqual(expected, self._rows('lport'))
+        self.assertNotIn('lport', self.session.former_tables)
+
+        # Migrating again keeps the migrated rows, and does not read the
+        # dropped table
+        self.driver.create_table('lport')
+        self.assertEqual(expected, self._rows('lport'))
+
+    def test_get_key(self):
+        self.driver.create_table('lport')
+        self.driver.create_key('lport', 'lport1', 'value1', 'tenant1')
+        self.driver.create_key('lport', 'lport2', 'value2')
+
+        self.assertEqual('value1',
+                         self.driver.get_key('lport', 'lport1', 'tenant1'))
+        self.assertEqual('value1', self.driver.get_key('lport', 'lport1'))
+        self.assertEqual('value2', self.driver.get_key('lport', 'lport2'))
+        self.assertRaises(df_exceptions.DBKeyNotFound,
+                          self.driver.get_key, 'lport', 'lport1', 'tenant2')
+        self.assertRaises(df_exceptions.DBKeyNotFound,
+                          self.driver.get_key, 'lport', 'lport3')
+
+    def test_set_key_keeps_topic(self):
+        self.driver.create_table('lport')
+        self.driver.create_key('lport', 'lport1', 'value1', 'tenant1')
+
+        self.driver.set_key('lport', 'lport1', 'value2')
+        self.driver.set_key('lport', 'lport2', 'value3')
+        self.assertEqual({
+            ('tenant1', 'lport1'): 'value2',
+            (cassandra_db_driver.NO_TOPIC, 'lport2'): 'value3',
+        }, self._rows('lport'))
+
+    def test_get_all_entries(self):
+        self.driver.create_table('lport')
+        self.driver.create_key('lport', 'lport1', 'value1', 'tenant1')
+        self.driver.create_key('lport', 'lport2', 'value2', 'tenant2')
+        self.driver.create_key('lport', 'lport3', 'value3')
+
+        self.assertItemsEqual(['value1', 'value2', 'value3'],
+                              self.driver.get_all_entries('lport'))
+        self.assertEqual(['value1'],
+                         self.driver.get_all_entries('lport', 'tenant1'))
+        self.assertEqual([],
+                         self.driver.get_all_entries('lport', 'tenant3'))
+
+    def test_get_all_paging_error(self):
+        self.driver.create_table('lport')
+        with mock.patch.object(self.driver, '_execute',
+                               return_value=_FailingRows()), \
+                mock.patch.object(cassandra_db_driver.LOG,
+                                  'exception') as log_exception:
+            for method in (self.driver.get_all_entries,
+                           self.driver.get_all_keys):
+                self.assertRaises(df_exceptions.DBKeyNotFound,
+                                  method, 'lport')
+                self.assertRaises(df_exceptions.DBKeyNotFound,
+                                  method, 'lport', 'tenant1')
+        self.assertEqual(4, log_exception.call_count)
+
+    def test_get_all_missing_table(self):
+        with mock.patch.object(cassandra_db_driver.LOG, 'exception'):
+            self.assertRaises(df_exceptions.DBKeyNotFound,
+                              self.driver.get_all_entries, 'lport')
+            self.assertRaises(df_exceptions.DBKeyNotFound,
+                              self.driver.get_all_keys, 'lport')
+
+    def test_get_all_keys(self):
+        self.driver.create_table('lport')
+        self.driver.create_key('lport', 'lport1', 'value1', 'tenant1')
+        self.driver.create_key('lport', 'lport2', 'value2')
+
+        self.assertItemsEqual(['lport1', 'lport2'],
+                              self.driver.get_all_keys('lport'))
+        self.assertEqual(['lport1'],
+                         self.driver.get_all_keys('lport', 'tenant1'))
+
+    def test_delete_key(self):
+        self.driver.create_table('lport')
+        self.driver.create_key('lport', 'lport1', 'value1', 'tenant1')
+        self.driver.create_key('lport', 'lport2', 'value2', 'tenant1')
+
+        self.driver.delete_key('lport', 'lport1', 'tenant1')
+        self.driver.delete_key('lport', 'lport2')
+        self.assertEqual({}, self._rows('lport'))
+        self.assertRaises(df_exceptions.DBKeyNotFound,
+                          self.driver.delete_key, 'lport', 'lport1')
+
+    def test_delete_table(self):
+        self.driver.create_table('lport')
+        self.driver.get_all_keys('lport')
+        self.assertTrue(self.driver._statements)
+
+        self.driver.delete_table('lport')
+        self.assertNotIn('lport' + cassandra_db_driver.TABLE_SUFFIX,
+                         self.session.tables)
+        self.assertFalse(self.driver._statements)
+
+    def test_statements_prepared_once(self):
+        self.driver.create_table('lport')
+        self.driver.create_key('lport', 'lport1', 'value1', 'tenant1')
+        self.driver.get_key('lport', 'lport1', 'tenant1')
+        self.driver.get_key('lport', 'lport1', 'tenant1')
+        self.assertEqual(2, len(self.session.prepared))
@@ -0,0 +1,204 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import collections
+import errno
+import socket
+
+import mock
+import netaddr
+from oslo_config import cfg
+
+from dragonflow.common import exceptions
+from dragonflow.common import metrics
+from dragonflow.controller.common import conntrack
+from dragonflow.tests import base as tests_base
+
+_Tuple = collections.namedtuple(
+    '_Tuple', ('family', 'proto', 'saddr', 'daddr'))
+_Entry = collections.namedtuple('_Entry', ('tuple_orig', 'zone'))
+
+
+class _NetlinkError(Exception):
+    def __init__(self, code):
+        super(_NetlinkError, self).__init__(code)
+        self.code = code
+
+
+class FakeConntrack(object):
+    def __init__(self, entries, expired=(), permitted=True):
+        self.entries = entries
+        self.expired = expired
+        self.permitted = permitted
+        self.deleted = []
+        self.closed = False
+
+    def dump_entries(self):
+        if not self.permitted:
+            raise _NetlinkError(errno.EPERM)
+        return iter(list(self.entries))
+
+    def entry(self, cmd, tuple_orig, zone=None):
+        if tuple_orig in self.expired:
+            raise _NetlinkError(errno.ENOENT)
+        self.deleted.append((cmd, tuple_orig, zone))
+
+    def close(self):
+        self.closed = True
+
+
+class TestNetlinkConntrackDriver(tests_base.BaseTestCase):
+    def setUp(self):
+        super(TestNetlinkConntrackDriver, self).setUp()
+        exceptions = mock.patch.object(
+            conntrack, 'netlink_exceptions',
+            mock.Mock(NetlinkError=_NetlinkError))
+        exceptions.start()
+        self.addCleanup(exceptions.stop)
+
+    def test_delete_entries(self):
+        tcp_out = _Tuple(socket.AF_INET, 6, '10.0.0.5', '10.0.0.8')
+        udp_out = _Tuple(socket.AF_INET, 17, '10.0.0.5', '10.0.0.9')
+        tcp_in = _Tuple(socket.AF_INET, 6, '10.0.0.8', '10.0.0.5')
+        ipv6_out = _Tuple(socket.AF_INET6, 6, 'fd00::5', 'fd00::8')
+        expired = _Tuple(socket.AF_INET6, 17, 'fd00::5', 'fd00::9')
+        fake_conntrack = FakeConntrack(
+            [_Entry(tcp_out, 1), _Entry(udp_out, 1), _Entry(tcp_in, 1),
+             _Entry(tcp_out, 2), _Entry(ipv6_out, 1), _Entry(expired, 1)],
+            expired=(expired,))
+        driver = conntrack.NetlinkConntrackDriver(lambda: fake_conntrack)
+
+        deleted = driver.delete_entries([
+            conntrack.make_filter(protocol=6, nw_src='10.0.0.5', zone=1),
+            conntrack.make_filter(ethertype='IPv6',
+                                  nw_src=netaddr.IPAddress('fd00::5'),
+                                  zone=1),
+        ])
+        self.assertEqual(2, deleted)
+        self.assertEqual([('del', tcp_out, 1), ('del', ipv6_out, 1)],
+                         fake_conntrack.deleted)
+        self.assertTrue(fake_conntrack.closed)
+
+    def test_delete_entries_any_zone(self):
+        tcp_out = _Tuple(socket.AF_INET, 6, '10.0.0.5', '10.0.0.8')
+        fake_conntrack = FakeConntrack(
+            [_Entry(tcp_out, 1), _Entry(tcp_out, None)])
+        driver = conntrack.NetlinkConntrackDriver(lambda: fake_conntrack)
+
+        deleted = driver.delete_entries(
+            [conntrack.make_filter(nw_dst='10.0.0.8')])
+        self.assertEqual(2, deleted)
+        self.assertEqual([('del', tcp_out, 1), ('del', tcp_out, None)],
+                         fake_conntrack.deleted)
+
+    def test_delete_entries_not_permitted(self):
+        fake_conntrack = FakeConntrack([], permitted=False)
+        driver = conntrack.NetlinkConntrackDriver(lambda: fake_conntrack)
+        self.assertRaises(exceptions.ConntrackPermissionDenied,
+                          driver.delete_entries,
+                          [conntrack.make_filter(zone=1)])
+        self.assertTrue(fake_conntrack.closed)
+
+        def conntrack_factory():
+            raise OSError(errno.EPERM, 'Operation not permitted')
+
+        driver = conntrack.NetlinkConntrackDriver(conntrack_factory)
+        self.assertRaises(exceptions.ConntrackPermissionDenied,
+                          driver.delete_entries,
+                          [conntrack.make_filter(zone=1)])
+
+    def test_delete_entries_error(self):
+        fake_conntrack = FakeConntrack([])
+        fake_conntrack.dump_entries = mock.Mock(
+            side_effect=_NetlinkError(errno.EINVAL))
+        driver = conntrack.NetlinkConntrackDriver(lambda: fake_conntrack)
+        self.assertRaises(_NetlinkError, driver.delete_entries,
+                          [conntrack.make_filter(zone=1)])
+
+
+class TestConntrackFlusher(tests_base.BaseTestCase):
+    def setUp(self):
+        super(TestConntrackFlusher, self).setUp()
+        self.driver = mock.Mock()
+        self.driver.name = 'fake'
+        self.driver.delete_entries.return_value = 3
+        self.flusher = conntrack.ConntrackFlusher(self.driver)
+        self.addCleanup(self.flusher.stop)
+
+    def test_delete_batches_and_dedups(self):
+        filter1 = conntrack.make_filter(nw_src='10.0.0.5', zone=1)
+        filter2 = conntrack.make_filter(nw_dst='10.0.0.5', zone=1)
+        # Queued before the worker runs, so applied as one batch
+        self.flusher.delete([filter1, filter2])
+        self.flusher.delete([conntrack.make_filter(
+            nw_src=netaddr.IPAddress('10.0.0.5'), zone=1)])
+        self.flusher.delete([])
+        self.flusher.wait()
+
+        self.driver.delete_entries.assert_called_once_with(
+            [filter1, filter2])
+        deleted = metrics.REGISTRY.get('df_conntrack_entries_deleted_total')
+        self.assertEqual(3, deleted.labels('fake').value)
+
+    def test_delete_failure(self):
+        self.driver.delete_entries.side_effect = RuntimeError
+        self.flusher.delete([conntrack.make_filter(zone=1)])
+        self.flusher.wait()
+        self.driver.delete_entries.side_effect = None
+        self.flusher.delete([conntrack.make_filter(zone=2)])
+        self.flusher.wait()
+        self.assertEqual(2, self.driver.delete_entries.call_count)
+
+    @mock.patch.object(conntrack.CliConntrackDriver, 'delete_entries')
+    def test_netlink_not_permitted(self, cli_delete_entries):
+        exceptions_mock = mock.patch.object(
+            conntrack, 'netlink_exceptions',
+            mock.Mock(NetlinkError=_NetlinkError))
+        exceptions_mock.start()
+        self.addCleanup(exceptions_mock.stop)
+        fake_conntrack = FakeConntrack([], permitted=False)
+        self.flusher._driver = conntrack.NetlinkConntrackDriver(
+            lambda: fake_conntrack)
+
+        # The batch is applied with the conntrack tool instead
+        filter1 = conntrack.make_filter(nw_src='10.0.0.5', zone=1)
+        self.flusher.delete([filter1])
+        self.flusher.wait()
+        cli_delete_entries.assert_called_once_with([filter1])
+        self.assertIsInstance(self.flusher._driver,
+                              conntrack.CliConntrackDriver)
+
+        # And so are the next batches
+        filter2 = conntrack.make_filter(nw_src='10.0.0.6', zone=1)
+        self.flusher.delete([filter2])
+        self.flusher.wait()
+        cli_delete_entries.assert_called_with([filter2])
+        self.assertEqual(2, cli_delete_entries.call_count)
+
+    def test_get_driver(self):
+        self.assertIsInstance(conntrack.get_driver(),
+                              conntrack.CliConntrackDriver)
+
+        cfg.CONF.set_override('conntrack_driver', 'conntrack_cli',
+                              group='df_sg_app')
+        self.addCleanup(cfg.CONF.clear_override, 'conntrack_driver',
+                        group='df_sg_app')
+        self.assertIsInstance(conntrack.get_driver(),
+                              conntrack.CliConntrackDriver)
+
+        cfg.CONF.set_override('conntrack_driver', 'netlink',
+                              group='df_sg_app')
+        with mock.patch.object(conntrack, 'pyroute2_conntrack', None):
+            self.assertIsInstance(conntrack.get_driver(),
+                                  conntrack.CliConntrackDriver)
+        with mock.patch.object(conntrack, 'pyroute2_conntrack'):
+            self.assertIsInstance(conntrack.get_driver(),
+                                  conntrack.NetlinkConntrackDriver)
@@ -62,6 +62,19 @@ class EmbeddingModel(model_framework.ModelBase):
     list_field = fields.ListField(EmbeddedModel)
 
 
+@model_framework.construct_nb_db_model(
+    indexes={
+        'name': 'name',
+        'value': model_framework.RangeIndex('value'),
+        'networks': model_framework.LpmIndex('networks'),
+    },
+)
+class QueryModel(model_framework.ModelBase):
+    name = fields.StringField()
+    value = fields.IntField()
+    networks = df_fields.ListOfField(df_fields.IpNetworkField())
+
+
 class TestDbStore(tests_base.BaseTestCase):
     def setUp(self):
         super(TestDbStore, self).setUp()
@@ -349,6 +362,103 @@ class TestDbStore(tests_base.BaseTestCase):
             ),
         )
 
+    def _get_query_ids(self, *args, **kwargs):
+        return [o.id for o in self.db_store.query(QueryModel, *args, **kwargs)]
+
+    def test_range_index(self):
+        for i in range(10):
+            self.db_store.update(QueryModel(id='id{}'.format(i), value=i))
+        self.db_store.update(QueryModel(id='id_none'))
+        self.db_store.update(QueryModel(id='id3', value=30))
+        self.db_store.delete(QueryModel(id='id5'))
+
+        index = QueryModel.get_index('value')
+        self.assertEqual(
+            ('id4',),
+            self.db_store.get_keys(QueryModel(value=4), index=index))
+        self.assertEqual(
+            ['id2', 'id4', 'id6'],
+            self._get_query_ids(ranges={'value': (2, 6)}))
+        self.assertEqual(
+            ['id8', 'id9', 'id3'],
+            self._get_query_ids(ranges={'value': (8, None)}))
+        self.assertEqual(['id3'], self._get_query_ids(equals={'value': 30}))
+
+    def test_lpm_index(self):
+        self.db_store.update(QueryModel(id='id1', networks=['10.0.0.0/8']))
+        self.db_store.update(QueryModel(id='id2', networks=['10.1.0.0/16']))
+        self.db_store.update(QueryModel(id='id3',
+                                        networks=['10.1.2.0/24',
+                                                  'fd00::/64']))
+        self.db_store.update(QueryModel(id='id4', networks=['20.0.0.0/8']))
+
+        self.assertEqual(
+            ['id3', 'id2', 'id1'],
+            self._get_query_ids(contains={'networks': '10.1.2.3'}))
+        self.assertEqual(
+            ['id2', 'id1'],
+            self._get_query_ids(contains={'networks': '10.1.0.0/20'}))
+        self.assertEqual(
+            ['id3'],
+            self._get_query_ids(contains={'networks': 'fd00::1'}))
+        self.assertEqual(
+            [], self._get_query_ids(contains={'networks': '30.0.0.1'}))
+
+        self.db_store.update(QueryModel(id='id3', networks=['fd00::/64']))
+        self.db_store.delete(QueryModel(id='id2'))
+        self.assertEqual(
+            ['id1'],
+            self._get_query_ids(contains={'networks': '10.1.2.3'}))
+
+    def test_query_filters_and_orders(self):
+        self.db_store.update(QueryModel(id='id1', name='a', value=1,
+                                        networks=['10.0.0.0/8']))
+        self.db_store.update(QueryModel(id='id2', name='a', value=2,
+                                        networks=['10.1.0.0/16']))
+        self.db_store.update(QueryModel(id='id3', name='b', value=3,
+                                        networks=['10.1.0.0/16']))
+
+        # Served by the exact index on name, ordered by longest prefix
+        self.assertEqual(
+            ['id2', 'id1'],
+            self._get_query_ids(equals={'name': 'a'},
+                                contains={'networks': '10.1.0.1'}))
+        self.assertEqual(
+            ['id3'],
+            self._get_query_ids(ranges={'value': (2, None)},
+                                contains={'networks': '10.1.0.1'},
+                                equals={'name': 'b'}))
+        self.assertEqual(['id1'], self._get_query_ids(equals={'id': 'id1'}))
+        self.assertEqual([], self._get_query_ids(equals={'id': 'id4'}))
+        self.assertEqual(['id1', 'id2', 'id3'],
+                         sorted(self._get_query_ids()))
+
+    def test_query_index_selection(self):
+        self.db_store.update(QueryModel(id='id1', name='a', value=1))
+        cache = self.db_store._get_cache(QueryModel)
+
+        with mock.patch.object(
+            cache._indexes[QueryModel.get_index('name')], 'get_by_key',
+            return_value=iter(['id1']),
+        ) as get_by_key:
+            self._get_query_ids(equals={'name': 'a', 'value': 1})
+            get_by_key.assert_called_once_with(('a',))
+
+        with mock.patch.object(
+            cache._indexes[QueryModel.get_index('value')], 'get_range',
+            return_value=iter(['id1']),
+        ) as get_range:
+            self._get_query_ids(equals={'value': 1},
+                                contains={'networks': '10.0.0.1'})
+            get_range.assert_called_once_with(1, 1)
+
+    def test_typed_index_differs_from_plain_index(self):
+        self.assertNotEqual(('value',), QueryModel.get_index('value'))
+        self.assertNotEqual(model_framework.LpmIndex('value'),
+                            QueryModel.get_index('value'))
+        self.assertEqual(model_framework.RangeIndex('value'),
+                         QueryModel.get_index('value'))
+
     def test_store_clear(self):
         o1 = ModelTest(id='id1', topic='topic')
         self.db_store.update(o1)
@@ -457,3 +567,37 @@ class TestDbStore(tests_base.BaseTestCase):
         self.assertEqual(o1, o2.ref1.get_object())
         self.db_store.clear()
         self.assertIsNone(o2.ref1.get_object())
+
+
+class TestCompactDbStore(TestDbStore):
+    def setUp(self):
+        super(TestCompactDbStore, self).setUp()
+        self.db_store = db_store.DbStore(compact=True)
+
+    def test_object_recreated_from_record(self):
+        self.db_store.update(
+            ModelTest(id='id1', topic='topic', extra_field=None,
+                      submodel1=NestedModel(
+                          submodel2=NestedNestedModel(name='name1'))))
+        o1 = self.db_store.get_one(ModelTest(id='id1'))
+        self.assertEqual('name1', o1.submodel1.submodel2.name)
+        self.assertTrue(o1.field_is_set('extra_field'))
+        self.assertFalse(o1.field_is_set('ref1'))
+        self.assertIs(o1, self.db_store.get_one(ModelTest(id='id1')))
+
+        self.db_store.update(ModelTest(id='id1', topic='topic2'))
+        self.assertTrue(o1._is_object_stale)
+        self.assertEqual(
+            ModelTest(id='id1', topic='topic2'),
+            self.db_store.get_one(ModelTest(id='id1')),
+        )
+
+    def test_strings_interned(self):
+        o1 = ModelTest(id=''.join(['i', 'd', '1']), topic='topic')
+        o2 = ModelTest(id=''.join(['i', 'd', '2']), topic=''.join('topic'))
+        self.db_store.update(o1)
+        self.db_store.update(o2)
+        cache = self.db_store._get_cache(ModelTest)
+        records = [cache._objs['id1'], cache._objs['id2']]
+        topic_idx = [name for name, _s, _f in cache._fields].index('topic')
+        self.assertIs(records[0][topic_idx], records[1][topic_idx])
@@ -13,6 +13,7 @@
 import mock
 from oslo_config import cfg
 
+from dragonflow.common import metrics
 from dragonflow.controller import df_local_controller
 from dragonflow.db import db_store
 from dragonflow.db import field_types as df_fields
@@ -34,6 +35,23 @@ class _ModelNoEvents(model_framework.ModelBase, mixins.Version):
     table_name = 'another_table'
 
 
+@model_framework.construct_nb_db_model
+class _ReffedModel(model_framework.ModelBase, mixins.Version):
+    table_name = 'reffed_table'
+
+
+@model_framework.construct_nb_db_model
+class _ReffingModel(model_framework.ModelBase, mixins.Version):
+    table_name = 'reffing_table'
+    ref = df_fields.ReferenceField(_ReffedModel)
+
+
+@model_framework.construct_nb_db_model
+class _ListReffingModel(model_framework.ModelBase, mixins.Version):
+    table_name = 'list_reffing_table'
+    refs = df_fields.ReferenceListField(_ReffingModel)
+
+
 class DfLocalControllerTestCase(test_app_base.DFAppTestBase):
 
     apps_list = ["l2"]
@@ -50,6 +68,26 @@ class DfLocalControllerTestCase(test_app_base.DFAppTestBase):
         self.controller.switch_sync_started()
         mock_notify.assert_called_once()
 
+    @mock.patch.object(os_ken_base_app.OsKenDFAdapter,
+                       'notify_nb_sync_finished')
+    @mock.patch.object(os_ken_base_app.OsKenDFAdapter,
+                       'notify_nb_sync_started')
+    def test_nb_sync(self, mock_started, mock_finished):
+        def _sync():
+            mock_started.assert_called_once_with()
+            # Topics registered during the sync are part of it
+            self.controller.register_topic('fake_tenant2')
+            mock_finished.assert_not_called()
+
+        with mock.patch.object(self.controller.topology,
+                               'check_topology_info'), \
+                mock.patch.object(self.controller._sync, 'add_topic'), \
+                mock.patch.object(self.controller._sync, 'sync',
+                                  side_effect=_sync):
+            self.controller.sync()
+        mock_started.assert_called_once_with()
+        mock_finished.assert_called_once_with()
+
     @mock.patch.object(df_local_controller.DfLocalController,
                        'delete_model_object')
     @mock.patch.object(db_store.DbStore, 'get_all')
@@ -206,3 +244,109 @@ class DfLocalControllerTestCase(test_app_base.DFAppTestBase):
         self.assertItemsEqual(['2', '3', '4', '5'], references)
         self.assertLess(references.index('2'), references.index('3'))
         self.assertLess(references.index('4'), references.index('5'))
+
+    def test_send_pending_events_batched(self):
+        self.controller._pending_objects['ref'] = {
+            (_Model, 'id1'), (_Model, 'id2'), (_ModelNoEvents, 'id3')}
+        obj1 = _Model(id='id1')
+        obj3 = _ModelNoEvents(id='id3')
+
+        def get_many(lean_objs):
+            objs = {'id1': obj1, 'id3': obj3}
+            return [objs.get(o.id) for o in lean_objs]
+
+        nb_api_mocker = mock.patch.object(self.controller, 'nb_api')
+        nb_api = nb_api_mocker.start()
+        self.addCleanup(nb_api_mocker.stop)
+        nb_api.get_many.side_effect = get_many
+        with mock.patch.object(self.controller,
+                               '_send_updates_for_object') as send:
+            self.controller._send_pending_events(_Model(id='ref'))
+        nb_api.get_many.assert_called_once()
+        nb_api.get.assert_not_called()
+        self.assertItemsEqual([mock.call(obj1), mock.call(obj3)],
+                              send.mock_calls)
+        self.assertNotIn('ref', self.controller._pending_objects)
+
+    def _mock_nb_api_objects(self, *objs):
+        models = {obj.id: obj for obj in objs}
+        nb_api_mocker = mock.patch.object(self.controller, 'nb_api')
+        nb_api = nb_api_mocker.start()
+        self.addCleanup(nb_api_mocker.stop)
+        nb_api.get_many.side_effect = (
+            lambda lean_objs: [models.get(o.id) for o in lean_objs])
+        return nb_api
+
+    def _get_reffing_objects(self):
+        return (
+            _ReffedModel(id='3', version=1),
+            _ReffingModel(id='2', ref='3', version=1),
+            _ReffedModel(id='5', version=1),
+            _ReffingModel(id='4', ref='5', version=1),
+        )
+
+    def test_send_updates_for_object_batches_references(self):
+        nb_api = self._mock_nb_api_objects(*self._get_reffing_objects())
+        model = _ListReffingModel(id='1', refs=['2', '4'], version=1)
+        with mock.patch.object(self.controller, 'update') as update:
+            self.controller._send_updates_for_object(model)
+
+        # One request per level of references
+        self.assertEqual(2, nb_api.get_many.call_count)
+        nb_api.get.assert_not_called()
+        updated = [c[1][0].id for c in update.mock_calls]
+        self.assertItemsEqual(['1', '2', '3', '4', '5'], updated)
+        self.assertLess(updated.index('3'), updated.index('2'))
+        self.assertLess(updated.index('5'), updated.index('4'))
+        self.assertEqual('1', updated[-1])
+
+    def test_send_updates_for_object_skips_resolved_references(self):
+        nb_api = self._mock_nb_api_objects(*self._get_reffing_objects())
+        model = _ListReffingModel(id='1', refs=['2', '4'], version=1)
+        self.controller._send_updates_for_object(model)
+        nb_api.get_many.reset_mock()
+
+        model = _ListReffingModel(id='1', refs=['2', '4'], version=2)
+        with mock.patch.object(self.controller, 'update') as update:
+            self.controller._send_updates_for_object(model)
+        nb_api.get_many.assert_not_called()
+        update.assert_called_once_with(model)
+
+        # An updated reference is resolved again, from the cache
+        self.controller.update(_ReffingModel(id='2', ref='3', version=2))
+        with mock.patch.object(self.controller, 'update') as update:
+            self.controller._send_updates_for_object(model)
+        nb_api.get_many.assert_not_called()
+        self.assertEqual(['2', '1'], [c[1][0].id for c in update.mock_calls])
+
+    def test_send_updates_for_object_missing_reference(self):
+        reffed, reffing = self._get_reffing_objects()[:2]
+        nb_api = self._mock_nb_api_objects(reffing)
+        model = _ListReffingModel(id='1', refs=['2'], version=1)
+        with mock.patch.object(self.controller, 'update') as update:
+            self.controller._send_updates_for_object(model)
+        update.assert_not_called()
+        self.assertIn((_ListReffingModel, '1'),
+                      self.controller._pending_objects['3'])
+        self.assertEqual(2, nb_api.get_many.call_count)
+
+    def test_db_change_callback_folds_updates(self):
+        self.controller.db_change_callback('lport', 'port1', 'set', 'v1')
+        self.controller.db_change_callback('lport', 'port1', 'set', 'v2')
+        self.assertEqual({'lport': 1},
+                         self.controller.get_folded_update_counts())
+        update = self.controller._queue.get(block=False)
+        self.assertEqual('v2', update.value)
+
+    def test_queue_metrics(self):
+        self.controller.db_change_callback('lport', 'port1', 'set', 'v1')
+        self.controller.db_change_callback('lport', 'port1', 'set', 'v2')
+        self.controller.db_change_callback('lport', 'port2', 'set', 'v1')
+        rendered = metrics.REGISTRY.render()
+        self.assertIn('df_controller_queue_depth 2.0', rendered)
+        self.assertIn(
+            'df_controller_updates_total{table="lport",action="set"}',
+            rendered)
+        self.assertIn(
+            'df_controller_updates_folded_total{table="lport"}', rendered)
+        self.assertGreaterEqual(self.controller._get_oldest_update_age(), 0)
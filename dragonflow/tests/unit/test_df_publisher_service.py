@@ -0,0 +1,87 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from dragonflow import conf as cfg
+from dragonflow.controller import df_publisher_service
+from dragonflow.db import db_common
+from dragonflow.db.models import core
+from dragonflow.tests import base as tests_base
+
+
+class TestPublisherService(tests_base.BaseTestCase):
+    def setUp(self):
+        super(TestPublisherService, self).setUp()
+        for patch in (
+            mock.patch.object(df_publisher_service, '_get_publisher'),
+            mock.patch.object(df_publisher_service.PublisherService,
+                              '_get_subscriber'),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.service = df_publisher_service.PublisherService(mock.Mock())
+        self.publisher = self.service.publisher
+
+    def _set_max_size(self, max_size):
+        cfg.CONF.set_override('publisher_batch_max_size', max_size,
+                              group='df')
+        self.addCleanup(cfg.CONF.clear_override, 'publisher_batch_max_size',
+                        group='df')
+
+    def _queue_events(self, count, topic='topic1'):
+        events = [db_common.DbUpdate('lport', 'key{}'.format(i), 'create',
+                                     'value', topic=topic)
+                  for i in range(count)]
+        for event in events:
+            self.service._queue.put(event)
+        return events
+
+    def test_get_batch(self):
+        self._set_max_size(3)
+        events = self._queue_events(4)
+        first = self.service._queue.get()
+        self.assertEqual(events[:3], self.service._get_batch(first))
+        self.assertEqual([events[3]],
+                         self.service._get_batch(self.service._queue.get()))
+
+    def test_send_events_per_topic(self):
+        events = (self._queue_events(2, topic='topic1') +
+                  self._queue_events(1, topic='topic2') +
+                  self._queue_events(1, topic=None))
+        self.service._send_events(events)
+        self.assertEqual(3, self.publisher.send_event.call_count)
+
+        batch, single, send_all = [
+            call[0][0] for call in self.publisher.send_event.call_args_list]
+        self.assertEqual(db_common.BATCH_ACTION, batch.action)
+        self.assertEqual('topic1', batch.topic)
+        self.assertEqual([event.to_dict() for event in events[:2]],
+                         batch.value)
+        self.assertIs(events[2], single)
+        self.assertIs(events[3], send_all)
+
+    def test_update_timestamp_in_db(self):
+        nb_api = self.service.nb_api
+        self.service._rate_limit = mock.Mock(return_value=False)
+        nb_api.get_heartbeat.return_value = 100.0
+        self.service._update_timestamp_in_db()
+        nb_api.heartbeat.assert_called_once_with(
+            core.Publisher(id=self.service.uuid),
+            cfg.CONF.df.publisher_timeout)
+        nb_api.update.assert_not_called()
+
+        # The publisher is written again once its heartbeat expired
+        nb_api.get_heartbeat.return_value = None
+        self.service._update_timestamp_in_db()
+        nb_api.update.assert_called_once()
+        self.assertEqual(2, nb_api.heartbeat.call_count)
@@ -0,0 +1,232 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import sys
+import types
+
+import mock
+
+from dragonflow.controller.common import constants as ctrl_const
+from dragonflow.db import model_framework as mf
+from dragonflow.db.models import l2
+from dragonflow.tests import base as tests_base
+
+
+class _FakeWSClientDebugProtocol(object):
+    def onClose(self, wasClean, code, reason):
+        pass
+
+
+def _get_skydive_modules():
+    '''Returns the skydive modules the service imports, with a websocket
+    client whose messages can be compared.
+    '''
+    skydive = types.ModuleType('skydive')
+    skydive.rest = types.ModuleType('skydive.rest')
+    skydive.rest.client = types.ModuleType('skydive.rest.client')
+    skydive.rest.client.RESTClient = mock.Mock()
+    skydive.websocket = types.ModuleType('skydive.websocket')
+    client = skydive.websocket.client = types.ModuleType(
+        'skydive.websocket.client')
+    client.WSClient = mock.Mock()
+    client.WSClientDebugProtocol = _FakeWSClientDebugProtocol
+    client.WSMessage = collections.namedtuple(
+        'WSMessage', ('namespace', 'type', 'obj'))
+    for msg_type in ('NodeAdded', 'NodeUpdated', 'NodeDeleted',
+                     'EdgeAdded', 'EdgeDeleted'):
+        setattr(client, msg_type + 'MsgType', msg_type)
+    return {
+        'skydive': skydive,
+        'skydive.rest': skydive.rest,
+        'skydive.rest.client': skydive.rest.client,
+        'skydive.websocket': skydive.websocket,
+        'skydive.websocket.client': client,
+    }
+
+
+# The service is tested against a mocked skydive client, so skydive is not
+# needed
+with mock.patch.dict(sys.modules, _get_skydive_modules()):
+    from dragonflow.cmd import df_skydive_service
+
+
+class TestWSClientDragonflowProtocol(tests_base.BaseTestCase):
+    def setUp(self):
+        super(TestWSClientDragonflowProtocol, self).setUp()
+        self.lswitch = l2.LogicalSwitch(id='switch1', topic='tenant1',
+                                        name='switch1', unique_key=1)
+        self.lport = l2.LogicalPort(id='port1', topic='tenant1',
+                                    name='port1', lswitch='switch1',
+                                    unique_key=2)
+        # Model -> objects returned by get_all
+        self.objects = {
+            l2.LogicalSwitch: [self.lswitch],
+            l2.LogicalPort: [self.lport],
+        }
+        self.nb_api = mock.Mock()
+        self.nb_api.support_publish_subscribe.return_value = True
+        self.nb_api.enable_selective_topo_dist = False
+        self.nb_api.codec = mf.JsonCodec()
+        self.nb_api.get_all.side_effect = lambda model: self.objects[model]
+        self.nb_api.get.side_effect = self._get
+        iter_tables = mock.patch.object(
+            mf, 'iter_tables',
+            return_value=[l2.LogicalSwitch.table_name,
+                          l2.LogicalPort.table_name])
+        iter_tables.start()
+        self.addCleanup(iter_tables.stop)
+
+        self.protocol = df_skydive_service.WSClientDragonflowProtocol(
+            self.nb_api)
+        self.protocol.factory = mock.Mock()
+        self.protocol.sendWSMessage = mock.Mock()
+
+    def _get(self, lean_obj):
+        for objects in self.objects.values():
+            for obj in objects:
+                if obj.id == lean_obj.id:
+                    return obj
+
+    def _get_sent(self):
+        sent = [(msg.type, msg.obj['ID'])
+                for (msg,), _kwargs
+                in self.protocol.sendWSMessage.call_args_list]
+        self.protocol.sendWSMessage.reset_mock()
+        return sent
+
+    def _get_edge_id(self):
+        edge = self.protocol._build_edge_message(
+            'LogicalPort', 'port1', 'LogicalSwitch', 'switch1')
+        return edge['ID']
+
+    def test_on_open_sends_snapshot(self):
+        self.nb_api.set_db_change_callback.assert_called_once_with(
+            self.protocol._db_change_callback)
+        self.protocol.onOpen()
+        sent = self._get_sent()
+        # Nodes are sent before the edges between them
+        self.assertItemsEqual([('NodeAdded', 'DF-switch1'),
+                               ('NodeAdded', 'DF-port1')], sent[:2])
+        self.assertEqual([('EdgeAdded', self._get_edge_id())], sent[2:])
+        # Changes are streamed, rather than polled
+        self.protocol.factory.client.loop.call_later.assert_not_called()
+
+        # The snapshot is sent in full on reconnect
+        self.protocol.onClose(True, 0, None)
+        self.protocol.onOpen()
+        self.assertEqual(3, len(self._get_sent()))
+
+    def test_create(self):
+        self.objects[l2.LogicalPort] = []
+        self.protocol.onOpen()
+        self.assertEqual([('NodeAdded', 'DF-switch1')], self._get_sent())
+
+        self.protocol._handle_db_change('lport', 'port1', 'create',
+                                        self.lport.to_json())
+        self.assertEqual([('NodeAdded', 'DF-port1'),
+                          ('EdgeAdded', self._get_edge_id())],
+                         self._get_sent())
+
+    def test_update(self):
+        self.protocol.onOpen()
+        self._get_sent()
+
+        self.protocol._handle_db_change('lport', 'port1', 'set',
+                                        self.lport.to_json())
+        self.assertEqual([], self._get_sent())
+
+        self.lport.name = 'port2'
+        self.protocol._handle_db_change('lport', 'port1', 'set',
+                                        self.lport.to_json())
+        self.assertEqual([('NodeUpdated', 'DF-port1')], self._get_sent())
+
+        self.lport.lswitch = None
+        self.protocol._handle_db_change('lport', 'port1', 'set',
+                                        self.lport.to_json())
+        self.assertEqual([('NodeUpdated', 'DF-port1'),
+                          ('EdgeDeleted', self._get_edge_id())],
+                         self._get_sent())
+
+    def test_delete(self):
+        self.protocol.onOpen()
+        self._get_sent()
+
+        # The edges of the node are deleted along with it
+        self.protocol._handle_db_change('lswitch', 'switch1', 'delete', None)
+        self.assertEqual([('NodeDeleted', 'DF-switch1')], self._get_sent())
+        self.assertEqual({}, self.protocol._edges)
+
+        self.protocol._handle_db_change('lport', 'port1', 'delete', None)
+        self.assertEqual([('NodeDeleted', 'DF-port1')], self._get_sent())
+        self.protocol._handle_db_change('lport', 'port1', 'delete', None)
+        self.assertEqual([], self._get_sent())
+
+    def test_unknown_table_ignored(self):
+        self.protocol.onOpen()
+        self._get_sent()
+        self.protocol._handle_db_change('unknown', 'id1', 'create', '{}')
+        self.assertEqual([], self._get_sent())
+
+    def test_sync_action_resyncs(self):
+        self.protocol.onOpen()
+        self._get_sent()
+
+        self.objects[l2.LogicalPort] = []
+        self.lswitch.name = 'switch2'
+        for action in df_skydive_service.SYNC_ACTIONS:
+            self.protocol._handle_db_change(None, None, action, None)
+        self.assertEqual([('NodeDeleted', 'DF-port1'),
+                          ('NodeUpdated', 'DF-switch1')],
+                         self._get_sent())
+        # Every table is read once on open, and once on every action
+        self.assertEqual(2 * (1 + len(df_skydive_service.SYNC_ACTIONS)),
+                         self.nb_api.get_all.call_count)
+
+    def test_db_change_callback(self):
+        self.protocol.onOpen()
+        loop = self.protocol.factory.client.loop
+        self.protocol._db_change_callback(
+            'lport', 'port1', 'delete', None, 'tenant1')
+        loop.call_soon_threadsafe.assert_called_once_with(
+            self.protocol._handle_db_change, 'lport', 'port1', 'delete', None)
+
+    def test_ignored_while_disconnected(self):
+        loop = self.protocol.factory.client.loop
+        self.protocol._db_change_callback(
+            'lport', 'port1', 'delete', None, 'tenant1')
+        self.protocol._handle_db_change(None, None, ctrl_const.CONTROLLER_SYNC,
+                                        None)
+        loop.call_soon_threadsafe.assert_not_called()
+        self.nb_api.get_all.assert_not_called()
+
+        # Changes queued before disconnecting are ignored too
+        self.protocol.onOpen()
+        self.protocol.onClose(True, 0, None)
+        self._get_sent()
+        self.protocol._db_change_callback(
+            'lport', 'port1', 'delete', None, 'tenant1')
+        self.protocol._handle_db_change('lport', 'port1', 'delete', None)
+        loop.call_soon_threadsafe.assert_not_called()
+        self.assertEqual([], self._get_sent())
+
+    def test_polled_without_streaming(self):
+        self.nb_api.support_publish_subscribe.return_value = False
+        self.nb_api.set_db_change_callback.reset_mock()
+        protocol = df_skydive_service.WSClientDragonflowProtocol(self.nb_api)
+        protocol.factory = mock.Mock()
+        protocol.sendWSMessage = mock.Mock()
+        self.nb_api.set_db_change_callback.assert_not_called()
+
+        protocol.onOpen()
+        protocol.factory.client.loop.call_later.assert_called_once_with(
+            mock.ANY, protocol.send_df_updates)
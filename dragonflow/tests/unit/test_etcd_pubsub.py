@@ -0,0 +1,137 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import base64
+
+import mock
+from oslo_serialization import jsonutils
+
+from dragonflow import conf as cfg
+from dragonflow.controller.common import constants
+from dragonflow.db import db_common
+from dragonflow.db import pub_sub_api
+from dragonflow.db.pubsub_drivers import etcd_pubsub_driver
+from dragonflow.tests import base as tests_base
+
+
+def _b64(value):
+    return base64.b64encode(value).decode('ascii')
+
+
+def _watch_line(events=(), revision=1, **kwargs):
+    result = {'header': {'revision': str(revision)}}
+    result.update(kwargs)
+    if events:
+        result['events'] = [
+            {'kv': {'key': _b64(key), 'value': _b64(value),
+                    'mod_revision': str(mod_revision)}}
+            for key, value, mod_revision in events
+        ]
+    return jsonutils.dump_as_bytes({'result': result})
+
+
+def _topic_key(topic):
+    return etcd_pubsub_driver._get_topic_watch_prefix(topic)
+
+
+class TestEtcdPubSubSingleWatch(tests_base.BaseTestCase):
+
+    def setUp(self):
+        super(TestEtcdPubSubSingleWatch, self).setUp()
+        cfg.CONF.set_override('etcd_pubsub_single_watch', True, group='df')
+        self.addCleanup(cfg.CONF.clear_override, 'etcd_pubsub_single_watch',
+                        group='df')
+        self.callback = mock.Mock()
+        self.subscriber = etcd_pubsub_driver.EtcdSubscriberAgent()
+        self.subscriber.db_changes_callback = self.callback
+        self.client = mock.Mock()
+        self.client.get_url.return_value = 'http://etcd/v3alpha/watch'
+        self.subscriber.client = self.client
+
+    def _get_watcher(self):
+        return etcd_pubsub_driver.MultiplexedWatcherThread(
+            self.client, self.subscriber._handle_topic_event,
+            self.subscriber._handle_events_lost)
+
+    def _set_watch_responses(self, *responses):
+        self.client.session.post.side_effect = [
+            mock.Mock(iter_lines=mock.Mock(return_value=lines))
+            for lines in responses
+        ]
+
+    def _get_start_revisions(self):
+        return [
+            call[1]['json']['create_request'].get('start_revision')
+            for call in self.client.session.post.call_args_list
+        ]
+
+    def test_register_topic_without_thread(self):
+        self.assertTrue(self.subscriber.register_topic('topic1'))
+        self.assertFalse(self.subscriber.register_topic('topic1'))
+        self.assertIsNone(self.subscriber.topic_dict['topic1'])
+        self.subscriber.unregister_topic('topic1')
+        self.assertEqual({}, self.subscriber.topic_dict)
+
+    def test_demultiplex_registered_topics(self):
+        self.subscriber.register_topic('topic1')
+        update = db_common.DbUpdate('lport', 'key', 'create', 'value',
+                                    topic='topic1')
+        self._set_watch_responses([
+            _watch_line(created=True, revision=10),
+            _watch_line(events=[(_topic_key(b'topic1'), b'message', 11),
+                                (_topic_key(b'topic2'), b'message', 12)]),
+        ])
+
+        with mock.patch.object(pub_sub_api, 'unpack_message',
+                               return_value=update.to_dict()) as unpack:
+            self._get_watcher()._watch()
+        unpack.assert_called_once_with(b'message')
+        self.callback.assert_called_once_with(
+            'lport', 'key', 'create', 'value', 'topic1')
+
+    def test_resume_after_reconnect(self):
+        watcher = self._get_watcher()
+        self._set_watch_responses(
+            [_watch_line(created=True, revision=10)],
+            [_watch_line(created=True, revision=10),
+             _watch_line(events=[(_topic_key(b'topic1'), b'', 14)])],
+            [],
+        )
+        # The watch resumes after the creation revision, then after the
+        # last seen event
+        for _response in range(3):
+            watcher._watch()
+        self.assertEqual([None, 11, 15], self._get_start_revisions())
+
+    def test_compaction_triggers_sync(self):
+        watcher = self._get_watcher()
+        watcher._revision = 5
+        self._set_watch_responses(
+            [_watch_line(created=True, revision=30, canceled=True,
+                         compact_revision='20')],
+            [],
+        )
+        watcher._watch()
+        self.callback.assert_called_once_with(
+            None, None, constants.CONTROLLER_SYNC, None, None)
+        watcher._watch()
+        self.assertEqual([6, 20], self._get_start_revisions())
+
+    def test_daemonize_and_close(self):
+        self.subscriber.register_topic('topic1')
+        with mock.patch.object(etcd_pubsub_driver,
+                               'MultiplexedWatcherThread') as watcher_class:
+            self.subscriber.daemonize()
+            watcher = watcher_class.return_value
+            watcher.start.assert_called_once_with()
+            self.subscriber.close()
+            watcher.cancel.assert_called_once_with()
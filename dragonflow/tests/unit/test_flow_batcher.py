@@ -0,0 +1,161 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import struct
+
+from os_ken.ofproto import ofproto_parser
+from os_ken.ofproto import ofproto_v1_3
+from os_ken.ofproto import ofproto_v1_3_parser
+
+from dragonflow.switch.drivers.ovs import flow_batcher
+from dragonflow.tests import base as tests_base
+
+
+class _FakeDatapath(object):
+    ofproto = ofproto_v1_3
+    ofproto_parser = ofproto_v1_3_parser
+
+    def __init__(self):
+        self.id = 1
+        self.xid = 0
+        self.writes = []
+
+    def set_xid(self, msg):
+        self.xid += 1
+        msg.set_xid(self.xid)
+        return self.xid
+
+    def send_msg(self, msg):
+        if msg.xid is None:
+            self.set_xid(msg)
+        msg.serialize()
+        self.send(msg.buf)
+
+    def send(self, buf):
+        self.writes.append(bytes(buf))
+
+    def get_messages(self, write):
+        '''Returns (type, xid, message) for each message in write, where
+           type is the experimenter type of experimenter messages
+        '''
+        messages = []
+        while write:
+            _version, msg_type, msg_len, xid = ofproto_parser.header(write)
+            if msg_type == self.ofproto.OFPT_EXPERIMENTER:
+                msg_type = struct.unpack_from('!I', write, 12)[0]
+            messages.append((msg_type, xid, write[:msg_len]))
+            write = write[msg_len:]
+        return messages
+
+
+class TestFlowBatcher(tests_base.BaseTestCase):
+    def setUp(self):
+        super(TestFlowBatcher, self).setUp()
+        self.datapath = _FakeDatapath()
+        self.batcher = flow_batcher.FlowBatcher()
+
+    def _flow_mod(self, priority=1):
+        parser = self.datapath.ofproto_parser
+        return parser.OFPFlowMod(
+            self.datapath,
+            priority=priority,
+            match=parser.OFPMatch(reg7=priority),
+        )
+
+    def _packet_out(self):
+        parser = self.datapath.ofproto_parser
+        return parser.OFPPacketOut(
+            self.datapath,
+            buffer_id=self.datapath.ofproto.OFP_NO_BUFFER,
+            in_port=self.datapath.ofproto.OFPP_CONTROLLER,
+            actions=[],
+            data=b'packet',
+        )
+
+    def test_send_outside_batch(self):
+        self.batcher.send_msg(self.datapath, self._flow_mod())
+        self.batcher.send_msg(self.datapath, self._flow_mod())
+        self.assertEqual(2, len(self.datapath.writes))
+
+    def test_batch(self):
+        with self.batcher.batch():
+            with self.batcher.batch():
+                for priority in range(3):
+                    self.batcher.send_msg(self.datapath,
+                                          self._flow_mod(priority))
+            self.batcher.send_msg(self.datapath, self._packet_out())
+            self.assertEqual([], self.datapath.writes)
+
+        self.assertEqual(1, len(self.datapath.writes))
+        messages = self.datapath.get_messages(self.datapath.writes[0])
+        ofproto = self.datapath.ofproto
+        self.assertEqual(
+            [ofproto.OFPT_FLOW_MOD] * 3 + [ofproto.OFPT_PACKET_OUT],
+            [msg_type for msg_type, _xid, _msg in messages])
+        self.assertEqual([1, 2, 3, 4], [xid for _type, xid, _msg in messages])
+
+    def test_batch_disabled(self):
+        self.batcher.enabled = False
+        with self.batcher.batch():
+            self.batcher.send_msg(self.datapath, self._flow_mod())
+            self.batcher.send_msg(self.datapath, self._flow_mod())
+            self.assertEqual(2, len(self.datapath.writes))
+
+    def test_batch_max_size(self):
+        self.batcher.max_size = 2
+        with self.batcher.batch():
+            for priority in range(5):
+                self.batcher.send_msg(self.datapath,
+                                      self._flow_mod(priority))
+            self.assertEqual(2, len(self.datapath.writes))
+        self.assertEqual(3, len(self.datapath.writes))
+
+    def test_flush_on_error(self):
+        def send_and_fail():
+            with self.batcher.batch():
+                self.batcher.send_msg(self.datapath, self._flow_mod())
+                raise RuntimeError()
+
+        self.assertRaises(RuntimeError, send_and_fail)
+        self.assertEqual(1, len(self.datapath.writes))
+
+    def test_bundles(self):
+        self.batcher.use_bundles = True
+        with self.batcher.batch():
+            self.batcher.send_msg(self.datapath, self._flow_mod(1))
+            self.batcher.send_msg(self.datapath, self._flow_mod(2))
+            self.batcher.send_msg(self.datapath, self._packet_out())
+            self.batcher.send_msg(self.datapath, self._flow_mod(3))
+
+        self.assertEqual(1, len(self.datapath.writes))
+        messages = self.datapath.get_messages(self.datapath.writes[0])
+        ofproto = self.datapath.ofproto
+        control = ofproto.ONF_ET_BUNDLE_CONTROL
+        add = ofproto.ONF_ET_BUNDLE_ADD_MESSAGE
+        self.assertEqual(
+            [control, add, add, control, ofproto.OFPT_PACKET_OUT,
+             control, add, control],
+            [msg_type for msg_type, _xid, _msg in messages])
+
+        # (bundle_id, type, flags)
+        controls = [
+            struct.unpack_from(ofproto.ONF_BUNDLE_CTRL_PACK_STR, msg,
+                               ofproto.OFP_EXPERIMENTER_HEADER_SIZE)
+            for msg_type, _xid, msg in messages if msg_type == control
+        ]
+        self.assertEqual(
+            [ofproto.ONF_BCT_OPEN_REQUEST, ofproto.ONF_BCT_COMMIT_REQUEST] * 2,
+            [control[1] for control in controls])
+        self.assertEqual(controls[0][0], controls[1][0])
+        self.assertNotEqual(controls[0][0], controls[2][0])
+        self.assertEqual(ofproto.ONF_BF_ATOMIC | ofproto.ONF_BF_ORDERED,
+                         controls[0][2])
@@ -0,0 +1,262 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from os_ken.ofproto import ofproto_v1_3 as ofproto
+from os_ken.ofproto import ofproto_v1_3_parser as parser
+
+from dragonflow.switch.drivers.ovs import flow_reconciler
+from dragonflow.tests import base as tests_base
+
+
+def _flow_mod(table_id=1, priority=100, cookie=0, cookie_mask=0,
+              command=ofproto.OFPFC_ADD, idle_timeout=0, port=1,
+              match=None, resubmit=2):
+    if match is None:
+        match = parser.OFPMatch(reg7=port, eth_dst='fa:16:3e:00:00:01')
+    return parser.OFPFlowMod(
+        None,
+        cookie=cookie,
+        cookie_mask=cookie_mask,
+        table_id=table_id,
+        command=command,
+        idle_timeout=idle_timeout,
+        priority=priority,
+        match=match,
+        instructions=[
+            parser.OFPInstructionActions(
+                ofproto.OFPIT_APPLY_ACTIONS,
+                [parser.NXActionResubmitTable(table_id=resubmit)]),
+        ],
+    )
+
+
+def _flow_stats(flow_mod):
+    return parser.OFPFlowStats(
+        table_id=flow_mod.table_id,
+        priority=flow_mod.priority,
+        idle_timeout=flow_mod.idle_timeout,
+        hard_timeout=flow_mod.hard_timeout,
+        flags=flow_mod.flags,
+        cookie=flow_mod.cookie,
+        match=flow_mod.match,
+        instructions=flow_mod.instructions,
+    )
+
+
+def _group_mod(group_id, command=ofproto.OFPGC_ADD, ports=(1,),
+               groups=()):
+    buckets = [
+        parser.OFPBucket(actions=[parser.OFPActionSetField(reg7=port)])
+        for port in ports
+    ] + [
+        parser.OFPBucket(actions=[parser.OFPActionGroup(chained_group_id)])
+        for chained_group_id in groups
+    ]
+    return parser.OFPGroupMod(
+        None,
+        command=command,
+        type_=ofproto.OFPGT_ALL,
+        group_id=group_id,
+        buckets=buckets,
+    )
+
+
+def _group_desc_stats(group_mod):
+    return parser.OFPGroupDescStats(
+        type_=group_mod.type,
+        group_id=group_mod.group_id,
+        buckets=group_mod.buckets,
+    )
+
+
+class TestFlowReconciler(tests_base.BaseTestCase):
+    def setUp(self):
+        super(TestFlowReconciler, self).setUp()
+        self.reconciler = flow_reconciler.FlowReconciler()
+
+    def test_add_and_delete_strict(self):
+        self.assertTrue(self.reconciler.update(_flow_mod(port=1)))
+        self.assertTrue(self.reconciler.update(_flow_mod(port=2)))
+        # Same table, priority and match replace the flow
+        self.assertTrue(self.reconciler.update(_flow_mod(port=2,
+                                                         resubmit=3)))
+        self.assertEqual(2, len(self.reconciler))
+
+        self.reconciler.update(_flow_mod(
+            port=2, priority=1, command=ofproto.OFPFC_DELETE_STRICT))
+        self.assertEqual(2, len(self.reconciler))
+        self.reconciler.update(_flow_mod(
+            port=2, command=ofproto.OFPFC_DELETE_STRICT))
+        self.assertEqual(1, len(self.reconciler))
+
+    def test_delete_non_strict(self):
+        self.reconciler.update(_flow_mod(port=1))
+        self.reconciler.update(_flow_mod(port=1, table_id=2, priority=1))
+        self.reconciler.update(_flow_mod(port=2))
+        self.reconciler.update(_flow_mod(port=3, cookie=0x10))
+        self.reconciler.update(_flow_mod(
+            match=parser.OFPMatch(eth_type=0x800,
+                                  ipv4_dst=('10.0.0.0', '255.255.255.0'))))
+
+        self.reconciler.update(_flow_mod(
+            table_id=ofproto.OFPTT_ALL, command=ofproto.OFPFC_DELETE,
+            match=parser.OFPMatch(reg7=1)))
+        self.assertEqual(3, len(self.reconciler))
+
+        self.reconciler.update(_flow_mod(
+            table_id=ofproto.OFPTT_ALL, command=ofproto.OFPFC_DELETE,
+            cookie=0x10, cookie_mask=0x10, match=parser.OFPMatch()))
+        self.assertEqual(2, len(self.reconciler))
+
+        # A wider mask selects the more specific flow
+        self.reconciler.update(_flow_mod(
+            command=ofproto.OFPFC_DELETE,
+            match=parser.OFPMatch(eth_type=0x800,
+                                  ipv4_dst=('10.0.0.0', '255.255.0.0'))))
+        self.assertEqual(1, len(self.reconciler))
+
+    def test_modify(self):
+        self.reconciler.update(_flow_mod(port=1))
+        self.reconciler.update(_flow_mod(port=2))
+        self.reconciler.update(_flow_mod(
+            command=ofproto.OFPFC_MODIFY, match=parser.OFPMatch(reg7=1),
+            resubmit=5))
+
+        changes = self.reconciler.get_changes(
+            None, [_flow_stats(_flow_mod(port=1)),
+                   _flow_stats(_flow_mod(port=2))], [])
+        self.assertEqual(1, len(changes))
+        self.assertEqual(ofproto.OFPFC_ADD, changes[0].command)
+        self.assertEqual(1, changes[0].match['reg7'])
+        self.assertEqual(
+            5, changes[0].instructions[0].actions[0].table_id)
+
+    def test_ephemeral_flows_not_tracked(self):
+        self.reconciler.start()
+        self.assertTrue(self.reconciler.update(_flow_mod(idle_timeout=30)))
+        self.assertEqual(0, len(self.reconciler))
+        self.assertEqual(
+            [], self.reconciler.get_changes(
+                None, [_flow_stats(_flow_mod(port=5, idle_timeout=30))], []))
+
+    def test_reconcile(self):
+        unchanged = _flow_mod(port=1)
+        modified = _flow_mod(port=2)
+        added = _flow_mod(port=3)
+        stale = _flow_mod(port=4, cookie=0x20)
+
+        self.reconciler.start()
+        self.assertTrue(self.reconciler.reconciling)
+        for flow in (unchanged, _flow_mod(port=2, resubmit=7), added):
+            self.assertFalse(self.reconciler.update(flow))
+        # Other messages are sent
+        self.assertTrue(self.reconciler.update(
+            parser.OFPBarrierRequest(None)))
+
+        changes = self.reconciler.get_changes(
+            None, [_flow_stats(flow) for flow in (unchanged, modified,
+                                                  stale)], [])
+        self.assertFalse(self.reconciler.reconciling)
+        self.assertTrue(self.reconciler.update(_flow_mod(port=6)))
+
+        changes = {(msg.command, msg.match['reg7']): msg for msg in changes}
+        self.assertEqual(
+            {(ofproto.OFPFC_ADD, 2), (ofproto.OFPFC_ADD, 3),
+             (ofproto.OFPFC_DELETE_STRICT, 4)},
+            set(changes))
+        delete = changes[(ofproto.OFPFC_DELETE_STRICT, 4)]
+        self.assertEqual(0x20, delete.cookie)
+        self.assertEqual(stale.priority, delete.priority)
+        self.assertEqual(
+            7, changes[(ofproto.OFPFC_ADD, 2)].instructions[0].actions[0]
+            .table_id)
+
+    def test_reconcile_unknown_flows(self):
+        self.reconciler.start()
+        self.reconciler.update(_flow_mod(port=1))
+        self.reconciler.update(_flow_mod(port=2))
+
+        changes = self.reconciler.get_changes(None, None, [])
+        self.assertFalse(self.reconciler.reconciling)
+        # All the flows and groups are deleted first, then the desired flows
+        # are added
+        self.assertEqual(ofproto.OFPFC_DELETE, changes[0].command)
+        self.assertEqual(ofproto.OFPTT_ALL, changes[0].table_id)
+        self.assertEqual(ofproto.OFPGC_DELETE, changes[1].command)
+        self.assertEqual(ofproto.OFPG_ALL, changes[1].group_id)
+        self.assertEqual(
+            [(ofproto.OFPFC_ADD, 1), (ofproto.OFPFC_ADD, 2)],
+            sorted((msg.command, msg.match['reg7']) for msg in changes[2:]))
+
+    def test_reconcile_unknown_groups(self):
+        self.reconciler.start()
+        self.reconciler.update(_flow_mod(port=1))
+        self.reconciler.update(_group_mod(1))
+
+        changes = self.reconciler.get_changes(
+            None, [_flow_stats(_flow_mod(port=1))], None)
+        # The flows are replaced too, since deleting the groups deletes the
+        # flows that forward to them
+        self.assertEqual(
+            [(parser.OFPFlowMod, ofproto.OFPFC_DELETE),
+             (parser.OFPGroupMod, ofproto.OFPGC_DELETE),
+             (parser.OFPGroupMod, ofproto.OFPGC_ADD),
+             (parser.OFPFlowMod, ofproto.OFPFC_ADD)],
+            [(type(msg), msg.command) for msg in changes])
+
+    def test_reconcile_groups(self):
+        flow = _flow_mod(port=1)
+        self.reconciler.update(flow)
+        self.reconciler.update(_group_mod(1, ports=(1,)))
+        self.reconciler.update(_group_mod(2, ports=(2,)))
+        self.reconciler.update(_group_mod(3, ports=(), groups=(1,)))
+
+        self.reconciler.start()
+        # Group modifications are held, and re-adding a group does not
+        # delete it
+        self.assertFalse(self.reconciler.update(_group_mod(1, ports=(1,))))
+        self.assertFalse(self.reconciler.update(
+            _group_mod(2, command=ofproto.OFPGC_MODIFY, ports=(2, 3))))
+        self.assertFalse(self.reconciler.update(
+            _group_mod(3, command=ofproto.OFPGC_DELETE)))
+        self.assertFalse(self.reconciler.update(
+            _group_mod(5, ports=(), groups=(4,))))
+        self.assertFalse(self.reconciler.update(_group_mod(4, ports=(4,))))
+
+        changes = self.reconciler.get_changes(
+            None, [_flow_stats(flow)],
+            [_group_desc_stats(group) for group in (
+                _group_mod(1, ports=(1,)),
+                _group_mod(2, ports=(2,)),
+                _group_mod(3, ports=(), groups=(1,)),
+                _group_mod(6, ports=(6,)),
+                _group_mod(7, ports=(), groups=(6,)),
+            )])
+        # Unchanged groups are left, groups that forward to other groups
+        # are added last, and deleted first
+        self.assertEqual(
+            [(ofproto.OFPGC_MODIFY, 2),
+             (ofproto.OFPGC_ADD, 4),
+             (ofproto.OFPGC_ADD, 5),
+             (ofproto.OFPGC_DELETE, 3),
+             (ofproto.OFPGC_DELETE, 7),
+             (ofproto.OFPGC_DELETE, 6)],
+            [(msg.command, msg.group_id) for msg in changes])
+        self.assertEqual(2, len(changes[0].buckets))
+
+    def test_delete_all_groups(self):
+        self.reconciler.update(_group_mod(1))
+        self.reconciler.update(_group_mod(2))
+        self.reconciler.update(_group_mod(ofproto.OFPG_ALL,
+                                          command=ofproto.OFPGC_DELETE))
+        self.assertEqual(
+            [], self.reconciler.get_changes(None, [], []))
@@ -15,7 +15,11 @@
 
 import copy
 import mock
+from os_ken.ofproto import ofproto_v1_3 as ofproto
+from os_ken.ofproto import ofproto_v1_3_parser as parser
 
+from dragonflow.common import exceptions
+from dragonflow.controller.apps import l2 as l2_app
 from dragonflow.controller.common import constants as const
 from dragonflow.db.models import l2
 from dragonflow.tests.unit import test_app_base
@@ -41,6 +45,21 @@ class TestL2App(test_app_base.DFAppTestBase):
         subnet.lswitch = 'fake_local_switch1'
         self.controller.update(subnet)
         self.app = self.open_flow_app.dispatcher.apps['l2']
+        self.datapath.ofproto = ofproto
+        self.datapath.ofproto_parser = parser
+        send_msg = mock.patch.object(self.app, '_send_msg')
+        self.send_msg = send_msg.start()
+        self.addCleanup(send_msg.stop)
+
+    def _get_group_mods(self):
+        group_mods = [
+            (msg.command, msg.group_id, len(msg.buckets or ()))
+            for _datapath, msg in (
+                call[0] for call in self.send_msg.call_args_list)
+            if isinstance(msg, parser.OFPGroupMod)
+        ]
+        self.send_msg.reset_mock()
+        return group_mods
 
     def test_multicast_local_port(self):
         fake_local_port1 = test_app_base.make_fake_local_port(
@@ -60,11 +79,91 @@ class TestL2App(test_app_base.DFAppTestBase):
                 lswitch='fake_local_switch1',
                 macs=['1a:0b:0c:0d:0e:0f'],
                 ips=['10.0.0.12'])
+        self.send_msg.reset_mock()
         self.controller.update(fake_local_port2)
-        self.app.mod_flow.assert_any_call(
-            inst=mock.ANY,
-            command=self.app.ofproto.OFPFC_MODIFY,
-            table_id=const.INGRESS_DESTINATION_PORT_LOOKUP_TABLE,
-            priority=const.PRIORITY_HIGH,
-            match=mock.ANY)
+        for call in self.app.mod_flow.call_args_list:
+            self.assertNotEqual(ofproto.OFPFC_MODIFY, call[1].get('command'))
+        # Only the port groups are modified
+        self.assertEqual(
+            [(ofproto.OFPGC_MODIFY,
+              l2_app._get_bum_group_id(1, l2_app._BUM_EGRESS, 1), 2),
+             (ofproto.OFPGC_MODIFY,
+              l2_app._get_bum_group_id(1, l2_app._BUM_INGRESS, 1), 2)],
+            self._get_group_mods())
         self.app.mod_flow.reset_mock()
+
+    def test_multicast_port_groups(self):
+        egress = l2_app._BUM_EGRESS
+        ingress = l2_app._BUM_INGRESS
+        ports_per_group = l2_app._BUM_PORTS_PER_GROUP
+        for port_key in range(1, ports_per_group + 1):
+            self.app._add_multicast_broadcast_handling_for_local_port(
+                'port{}'.format(port_key), port_key, 5, 'vxlan')
+        self._get_group_mods()
+
+        # A full port group: a new port group, and one more bucket in the
+        # network groups
+        self.app._add_multicast_broadcast_handling_for_local_port(
+            'port0', 100, 5, 'vxlan')
+        self.assertEqual(
+            [(ofproto.OFPGC_ADD, l2_app._get_bum_group_id(5, egress, 2), 1),
+             (ofproto.OFPGC_ADD, l2_app._get_bum_group_id(5, ingress, 2), 1),
+             (ofproto.OFPGC_MODIFY, l2_app._get_bum_group_id(5, egress), 3),
+             (ofproto.OFPGC_MODIFY, l2_app._get_bum_group_id(5, ingress), 2)],
+            self._get_group_mods())
+
+        # An empty port group is removed from the network groups, and
+        # deleted
+        self.app._del_multicast_broadcast_handling_for_local('port0')
+        self.assertEqual(
+            [(ofproto.OFPGC_MODIFY, l2_app._get_bum_group_id(5, egress), 2),
+             (ofproto.OFPGC_MODIFY, l2_app._get_bum_group_id(5, ingress), 1),
+             (ofproto.OFPGC_DELETE, l2_app._get_bum_group_id(5, egress, 2),
+              0),
+             (ofproto.OFPGC_DELETE, l2_app._get_bum_group_id(5, ingress, 2),
+              0)],
+            self._get_group_mods())
+
+        # The freed slot is reused
+        self.app._del_multicast_broadcast_handling_for_local('port1')
+        self._get_group_mods()
+        self.app._add_multicast_broadcast_handling_for_local_port(
+            'port0', 100, 5, 'vxlan')
+        self.assertEqual(
+            [(ofproto.OFPGC_MODIFY, l2_app._get_bum_group_id(5, egress, 1),
+              ports_per_group),
+             (ofproto.OFPGC_MODIFY, l2_app._get_bum_group_id(5, ingress, 1),
+              ports_per_group)],
+            self._get_group_mods())
+
+        for port_key in range(2, ports_per_group + 1):
+            self.app._del_multicast_broadcast_handling_for_local(
+                'port{}'.format(port_key))
+        self._get_group_mods()
+        self.app._del_multicast_broadcast_handling_for_local('port0')
+        self.assertEqual(
+            [(ofproto.OFPGC_DELETE, l2_app._get_bum_group_id(5, egress), 0),
+             (ofproto.OFPGC_DELETE, l2_app._get_bum_group_id(5, ingress), 0),
+             (ofproto.OFPGC_DELETE, l2_app._get_bum_group_id(5, egress, 1),
+              0),
+             (ofproto.OFPGC_DELETE, l2_app._get_bum_group_id(5, ingress, 1),
+              0)],
+            self._get_group_mods())
+        self.assertNotIn(5, self.app.local_networks)
+
+    def test_bum_group_id_bounds(self):
+        max_network_id = l2_app._BUM_MAX_NETWORK_ID
+        group_id = l2_app._get_bum_group_id(
+            max_network_id, l2_app._BUM_INGRESS, l2_app._BUM_MAX_PORT_GROUPS)
+        self.assertLess(group_id, ofproto.OFPG_MAX)
+        self.assertRaises(exceptions.GroupIdOverflowException,
+                          l2_app._get_bum_group_id, max_network_id + 1,
+                          l2_app._BUM_EGRESS)
+
+        # Ports of networks without group IDs are not replicated to
+        self.app._add_multicast_broadcast_handling_for_local_port(
+            'port1', 1, max_network_id + 1, 'vxlan')
+        self.assertEqual([], self._get_group_mods())
+        self.app.mod_flow.assert_not_called()
+        self.app._del_multicast_broadcast_handling_for_local('port1')
+        self.assertEqual([], self._get_group_mods())
@@ -58,6 +58,23 @@ class TestL3App(test_app_base.DFAppTestBase,
             idle_timeout=self.app.idle_timeout,
             hard_timeout=self.app.hard_timeout)
 
+    def test_install_flow_by_packet_and_continue(self):
+        self.controller.update(test_app_base.fake_local_port1)
+        msg = mock.Mock(match={'reg5': self.router.unique_key})
+        with mock.patch.object(
+            self.app, '_install_flow_by_ports_and_continue',
+        ) as install_flow:
+            self.app._install_flow_by_packet_and_continue(
+                mock.Mock(dst='10.0.0.6'), mock.sentinel.network_id, msg)
+            install_flow.assert_called_once_with(
+                self.router.ports[0], test_app_base.fake_local_port1, msg,
+                mock.sentinel.network_id)
+
+            install_flow.reset_mock()
+            self.app._install_flow_by_packet_and_continue(
+                mock.Mock(dst='30.0.0.1'), mock.sentinel.network_id, msg)
+            install_flow.assert_not_called()
+
     def test_add_del_lport_after_router_route(self):
         # add route
         routes = [{"destination": "10.100.0.0/16",
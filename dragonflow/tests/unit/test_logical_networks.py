@@ -122,3 +122,85 @@ class TestLogicalNetworks(tests_base.BaseTestCase):
                 network_id=2,
                 network_type='gre')
         self.assertEqual(0, net_2_gre_ports)
+
+    def test_untyped_count_and_ports(self):
+        self.logical_networks.add_local_port(
+                port_id='port1', network_id=1, network_type='vlan')
+        self.logical_networks.add_local_port(
+                port_id='port2', network_id=1, network_type='flat')
+        self.logical_networks.add_local_port(
+                port_id='port3', network_id=1, network_type='vlan')
+        self.assertEqual(
+                3, self.logical_networks.get_local_port_count(network_id=1))
+        self.assertEqual(
+                ['port1', 'port3'],
+                self.logical_networks.get_local_ports(network_id=1,
+                                                      network_type='vlan'))
+        self.assertItemsEqual(
+                ['port1', 'port2', 'port3'],
+                self.logical_networks.get_local_ports(network_id=1))
+        self.assertEqual(
+                [], self.logical_networks.get_local_ports(network_id=2))
+
+        self.logical_networks.remove_local_port(
+                port_id='port2', network_id=1, network_type='flat')
+        self.assertEqual(
+                2, self.logical_networks.get_local_port_count(network_id=1))
+        self.assertEqual(
+                0, self.logical_networks.get_local_port_count(
+                    network_id=1, network_type='flat'))
+
+    def test_port_added_once(self):
+        for _i in range(2):
+            self.logical_networks.add_local_port(
+                    port_id='port1', network_id=1, network_type='vlan')
+        self.assertEqual(
+                1, self.logical_networks.get_local_port_count(network_id=1))
+        self.logical_networks.remove_local_port(
+                port_id='port1', network_id=1, network_type='vlan')
+        self.assertEqual(
+                0, self.logical_networks.get_local_port_count(network_id=1))
+        # Removing an unknown port is a no-op
+        self.logical_networks.remove_local_port(
+                port_id='port1', network_id=1, network_type='vlan')
+
+    def test_port_moved(self):
+        self.logical_networks.add_local_port(
+                port_id='port1', network_id=1, network_type='vlan')
+        self.assertEqual(
+                (1, 'vlan'),
+                self.logical_networks.get_local_port_network('port1'))
+        self.assertIsNone(
+                self.logical_networks.get_remote_port_network('port1'))
+
+        # To another network
+        self.logical_networks.add_local_port(
+                port_id='port1', network_id=2, network_type='gre')
+        self.assertEqual(
+                0, self.logical_networks.get_local_port_count(network_id=1))
+        self.assertEqual(
+                (2, 'gre'),
+                self.logical_networks.get_local_port_network('port1'))
+
+        # To another location
+        self.logical_networks.add_remote_port(
+                port_id='port1', network_id=2, network_type='gre')
+        self.assertEqual(
+                0, self.logical_networks.get_local_port_count(network_id=2))
+        self.assertEqual(
+                1, self.logical_networks.get_remote_port_count(network_id=2))
+        self.assertIsNone(
+                self.logical_networks.get_local_port_network('port1'))
+        # Not a local port anymore
+        self.logical_networks.remove_local_port(
+                port_id='port1', network_id=2, network_type='gre')
+        self.assertEqual(
+                1, self.logical_networks.get_remote_port_count(network_id=2))
+
+        # Removed from the network it was added to
+        self.logical_networks.remove_remote_port(
+                port_id='port1', network_id=3, network_type='vlan')
+        self.assertEqual(
+                0, self.logical_networks.get_remote_port_count(network_id=2))
+        self.assertIsNone(
+                self.logical_networks.get_remote_port_network('port1'))
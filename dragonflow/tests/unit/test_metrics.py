@@ -0,0 +1,111 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import socket
+
+import eventlet
+import fixtures
+
+from dragonflow.common import metrics
+from dragonflow.tests import base as tests_base
+
+
+class TestMetrics(tests_base.BaseTestCase):
+    def setUp(self):
+        super(TestMetrics, self).setUp()
+        self.registry = metrics.Registry()
+
+    def test_counter(self):
+        counter = self.registry.register(
+            metrics.Counter('updates_total', 'Updates', ('table',)))
+        counter.labels('lport').inc()
+        counter.labels('lport').inc(2)
+        counter.labels('lswitch').inc()
+        self.assertEqual(
+            '# HELP updates_total Updates\n'
+            '# TYPE updates_total counter\n'
+            'updates_total{table="lport"} 3.0\n'
+            'updates_total{table="lswitch"} 1.0\n',
+            self.registry.render(),
+        )
+        self.assertRaises(ValueError, counter.labels)
+
+    def test_gauge_func(self):
+        self.registry.register(
+            metrics.Gauge('depth', 'Depth', func=lambda: 5))
+        self.registry.register(
+            metrics.Gauge('by_table', 'By table', ('table',),
+                          func=lambda: {('b',): 2, ('a',): 1}))
+        self.assertEqual(
+            '# HELP depth Depth\n'
+            '# TYPE depth gauge\n'
+            'depth 5.0\n'
+            '# HELP by_table By table\n'
+            '# TYPE by_table gauge\n'
+            'by_table{table="a"} 1.0\n'
+            'by_table{table="b"} 2.0\n',
+            self.registry.render(),
+        )
+
+    def test_histogram(self):
+        histogram = self.registry.register(
+            metrics.Histogram('latency', 'Latency', buckets=(0.1, 1)))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        self.assertEqual(
+            '# HELP latency Latency\n'
+            '# TYPE latency histogram\n'
+            'latency_bucket{le="0.1"} 1.0\n'
+            'latency_bucket{le="1.0"} 2.0\n'
+            'latency_bucket{le="+Inf"} 3.0\n'
+            'latency_sum 5.55\n'
+            'latency_count 3.0\n',
+            self.registry.render(),
+        )
+
+    def test_label_escaping(self):
+        counter = self.registry.register(
+            metrics.Counter('c', 'C', ('name',)))
+        counter.labels('a"b\\c\n').inc()
+        self.assertIn(r'c{name="a\"b\\c\n"} 1.0', self.registry.render())
+
+    def test_register_existing(self):
+        counter = self.registry.register(metrics.Counter('c', 'C'))
+        self.assertIs(counter,
+                      self.registry.register(metrics.Counter('c', 'C')))
+        self.assertRaises(ValueError, self.registry.register,
+                          metrics.Gauge('c', 'C'))
+
+    def test_server_unix_socket(self):
+        self.registry.register(metrics.Gauge('depth', 'Depth',
+                                             func=lambda: 7))
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                            'metrics.sock')
+        server = metrics.MetricsServer(self.registry, socket_path=path)
+        server.start()
+        self.addCleanup(server.stop)
+
+        client = eventlet.connect(path, family=socket.AF_UNIX)
+        client.sendall(b'GET /metrics HTTP/1.0\r\n\r\n')
+        response = b''
+        while True:
+            data = client.recv(4096)
+            if not data:
+                break
+            response += data
+        client.close()
+
+        self.assertTrue(response.startswith(b'HTTP/1.0 200 OK\r\n'))
+        self.assertTrue(response.endswith(b'\r\n\r\n' +
+                                          self.registry.render().encode()))
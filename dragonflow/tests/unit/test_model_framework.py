@@ -12,6 +12,7 @@
 import contextlib
 import copy
 
+from jsonmodels import errors
 from jsonmodels import fields
 import mock
 
@@ -241,6 +242,18 @@ class TestModelFramework(tests_base.BaseTestCase):
         m.emit_event1(1, 2, 3, kw='hello')
         cb.assert_called_with(m, 1, 2, 3, kw='hello')
 
+    def test_emit_records_latency(self):
+        def callback(obj):
+            pass
+
+        ModelWithEvents.register_event1(callback)
+        latency = mf._CALLBACK_LATENCY.labels(
+            'ModelWithEvents', 'event1',
+            '{0}.{1}'.format(__name__, callback.__qualname__))
+        count = latency.count
+        ModelWithEvents().emit_event1()
+        self.assertEqual(count + 1, latency.count)
+
     def test_mixin_aggregate_events(self):
         self.assertItemsEqual(('event1', 'event2', 'foo', 'bar'),
                               ModelWithEventsMixin.get_events())
@@ -492,3 +505,56 @@ class TestModelFramework(tests_base.BaseTestCase):
         model = EmbeddingModel(id='1', embedded=ModelTest(id='2'))
         submodels = [inst.id for inst in model.iter_submodels()]
         self.assertEqual(['2'], submodels)
+
+    def test_from_struct(self):
+        embedding = EmbeddingModel2(
+            id='1',
+            emb_field=EmbeddedModel(id='2', field='a'),
+            emb_list=[EmbeddedModel(id='3'), EmbeddedModel(id='4')],
+            emb_required=EmbeddedModel(id='5'),
+        )
+        obj = EmbeddingModel2.from_struct(embedding.to_struct())
+        self.assertEqual(embedding, obj)
+        self.assertEqual(embedding.to_struct(), obj.to_struct())
+        self.assertTrue(obj.emb_field.field_is_set('field'))
+        self.assertFalse(obj.emb_list[0].field_is_set('field'))
+
+        reffing = ReffingModel2.from_struct({'id': '1', 'ref1': '2'})
+        self.assertEqual('2', reffing.ref1.id)
+        self.assertFalse(reffing.field_is_set('ref2'))
+
+    def test_to_struct_fast(self):
+        embedding = EmbeddingModel2(
+            id='1',
+            emb_field=EmbeddedModel(id='2', field='a'),
+            emb_list=[EmbeddedModel(id='3')],
+            emb_required=EmbeddedModel(id='5'),
+        )
+        self.assertEqual(embedding.to_struct(), embedding.to_struct_fast())
+        reffing = ReffingModel2(id='1', ref1='2')
+        self.assertEqual(reffing.to_struct(), reffing.to_struct_fast())
+
+        self.assertRaises(errors.ValidationError,
+                          EmbeddingModel2(id='1').to_struct_fast)
+        self.assertRaises(errors.ValidationError,
+                          EmbeddingModel2.from_struct({'id': '1'}).
+                          to_struct_fast)
+
+    def test_codecs(self):
+        reffing = ReffingModel2(id='1', ref1='2', ref2='3')
+        for name in ('json', 'trusted_json', 'msgpack'):
+            codec = mf.get_codec(name)
+            value, event_value = codec.encode(reffing)
+            self.assertEqual(reffing, codec.decode(ReffingModel2, value))
+            self.assertEqual(reffing,
+                             codec.decode(ReffingModel2, event_value))
+            if name == 'msgpack':
+                self.assertEqual(reffing.to_struct(), event_value)
+            else:
+                self.assertEqual(value, event_value)
+
+        # Only the compatible codec validates the objects read
+        self.assertRaises(errors.ValidationError,
+                          mf.get_codec('json').decode, ReffingModel2,
+                          '{"id": 1}')
+        mf.get_codec('trusted_json').decode(ReffingModel2, '{"id": 1}')
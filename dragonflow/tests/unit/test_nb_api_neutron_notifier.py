@@ -10,6 +10,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import time
+
 import mock
 from oslo_config import cfg
 
@@ -91,3 +93,55 @@ class TestNbApiNeutronNotifier(tests_base.BaseTestCase):
                 "fake_port1",
                 "create",
                 "down")
+
+    def _initialize_notifier(self):
+        cfg.CONF.set_override('enable_df_pub_sub', True, group='df')
+        self.addCleanup(cfg.CONF.clear_override, 'enable_df_pub_sub',
+                        group='df')
+        self.addCleanup(core.Listener.clear_registered_callbacks)
+        nb_api = mock.MagicMock()
+        with mock.patch('oslo_service.loopingcall.FixedIntervalLoopingCall'):
+            self.notifier.initialize(nb_api)
+        return nb_api
+
+    def test_listeners_cached(self):
+        nb_api = self._initialize_notifier()
+        listener1 = core.Listener(id='1', timestamp=1)
+        nb_api.get_all.return_value = [listener1]
+        self.assertEqual([listener1], self.notifier._get_listeners())
+        self.assertEqual([listener1], self.notifier._get_listeners())
+        nb_api.get_all.assert_called_once_with(core.Listener)
+
+        listener2 = core.Listener(id='2', timestamp=2)
+        listener2.emit_created()
+        self.assertItemsEqual([listener1, listener2],
+                              self.notifier._get_listeners())
+        listener1.emit_deleted()
+        self.assertEqual([listener2], self.notifier._get_listeners())
+        nb_api.get_all.assert_called_once_with(core.Listener)
+
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.notifier._get_listeners()
+        self.assertEqual(2, nb_api.get_all.call_count)
+
+    def test_notify_neutron_server_batched(self):
+        nb_api = self._initialize_notifier()
+        nb_api.get_all.return_value = [core.Listener(id='1', timestamp=1)]
+        self.notifier.notify_neutron_server('lport', 'port1', 'update', 'up')
+        self.notifier.notify_neutron_server('lport', 'port2', 'update', 'up')
+        self.notifier.notify_neutron_server('lport', 'port1', 'update',
+                                            'down')
+        nb_api.publisher.send_event.assert_not_called()
+
+        self.notifier._flush()
+        nb_api.publisher.send_event.assert_called_once()
+        update = nb_api.publisher.send_event.call_args[0][0]
+        self.assertEqual(db_common.BATCH_ACTION, update.action)
+        self.assertEqual('listener_1', update.topic)
+        self.assertEqual(
+            [('port2', 'up'), ('port1', 'down')],
+            [(u['key'], u['value']) for u in update.value])
+
+        nb_api.publisher.send_event.reset_mock()
+        self.notifier._flush()
+        nb_api.publisher.send_event.assert_not_called()
@@ -48,6 +48,32 @@ class TestRedisDB(tests_base.BaseTestCase):
             'GET', '{table.topic}key')
         self.assertEqual(expected, actual)
 
+    def test_heartbeat(self):
+        self.RedisDbDriver._cluster = mock.Mock()
+        node = mock.Mock()
+        self.RedisDbDriver._cluster.get_node.return_value = node
+        with mock.patch('time.time', return_value=100.0):
+            self.RedisDbDriver.heartbeat('table', 'key', 30)
+        node.client.execute_command.assert_called_once_with(
+            'SET', '{heartbeat.table}key', '100.0', 'EX', 30)
+
+        node.client.execute_command.return_value = b'100.0'
+        self.assertEqual(100.0,
+                         self.RedisDbDriver.get_heartbeat('table', 'key'))
+        node.client.execute_command.return_value = None
+        self.assertIsNone(self.RedisDbDriver.get_heartbeat('table', 'key'))
+
+    def test_get_heartbeats(self):
+        self.RedisDbDriver._cluster = mock.Mock()
+        node = mock.Mock()
+        node.client.execute_command.return_value = [b'100.0', None]
+        self.RedisDbDriver._cluster.get_node.return_value = node
+        self.assertEqual(
+            [100.0, None],
+            self.RedisDbDriver.get_heartbeats('table', ['key1', 'key2']))
+        node.client.execute_command.assert_called_once_with(
+            'MGET', '{heartbeat.table}key1', '{heartbeat.table}key2')
+
     def test_get_non_existent_key(self):
         self.RedisDbDriver._cluster = mock.Mock()
         node = mock.Mock()
@@ -127,6 +153,62 @@ class TestRedisDB(tests_base.BaseTestCase):
         node.client.execute_command.assert_called_once_with(
             'DEL', '{table.topic}key')
 
+    def test_revision_tracking(self):
+        self.RedisDbDriver._track_revisions = True
+        self.RedisDbDriver._cluster = mock.Mock()
+        node = mock.Mock()
+        self.RedisDbDriver._cluster.get_node.return_value = node
+        self.RedisDbDriver.create_key('table', 'key', 'value', 'topic')
+        node.client.execute_command.assert_has_calls([
+            mock.call('SET', '{table.topic}key', 'value'),
+            mock.call('INCR', '{revision.}table'),
+        ])
+
+        node.client.execute_command.reset_mock()
+        node.client.execute_command.return_value = '3'
+        self.assertEqual(3, self.RedisDbDriver.get_table_revision('table'))
+        node.client.execute_command.assert_called_once_with(
+            'GET', '{revision.}table')
+
+    def test_revision_tracking_disabled(self):
+        self.RedisDbDriver._cluster = mock.Mock()
+        self.assertIsNone(self.RedisDbDriver.get_table_revision('table'))
+        self.RedisDbDriver._cluster.get_node.assert_not_called()
+
+    def test_get_keys_topic(self):
+        self.RedisDbDriver._cluster = mock.Mock()
+        node = mock.Mock()
+        node.client.execute_command.return_value = ['value1', None]
+        self.RedisDbDriver._cluster.get_node.return_value = node
+        actual = self.RedisDbDriver.get_keys('table', ['key1', 'key2'],
+                                             'topic')
+        node.client.execute_command.assert_called_once_with(
+            'MGET', '{table.topic}key1', '{table.topic}key2')
+        self.assertEqual(['value1', None], actual)
+
+    def test_get_keys_notopic(self):
+        self.RedisDbDriver._cluster = mock.Mock()
+        node = mock.Mock()
+        node.client.scan.return_value = (
+            0, ['{table.topic1}key1', '{table.topic2}key2',
+                '{table.topic1}key3'])
+        values = {'{table.topic1}key1': 'value1',
+                  '{table.topic2}key2': 'value2'}
+        pipeline = node.client.pipeline.return_value
+        pipeline.execute.side_effect = lambda **kwargs: [
+            values[c[1][1]] for c in pipeline.execute_command.mock_calls]
+        self.RedisDbDriver._cluster.nodes = (node,)
+        self.RedisDbDriver._cluster.get_node.return_value = node
+        actual = self.RedisDbDriver.get_keys('table',
+                                             ['key2', 'key4', 'key1'])
+        node.client.scan.assert_called_once()
+        pipeline.execute_command.assert_has_calls(
+            [mock.call('GET', '{table.topic1}key1'),
+             mock.call('GET', '{table.topic2}key2')],
+            any_order=True,
+        )
+        self.assertEqual(['value2', None, 'value1'], actual)
+
     def test_get_all_keys_topic(self):
         expected = ['key1', 'key2', 'key3']
         keys_response = ['{table.topic}' + key for key in expected]
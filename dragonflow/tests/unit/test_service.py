@@ -81,26 +81,21 @@ class TestServiceHealth(tests_base.BaseTestCase):
             self.assertFalse(s.alive)
 
     def test_update_last_seen(self):
-        s = service_model.Service(chassis='test_host1', binary='test_binary')
-        self.nb_api.get.return_value = s
-        now = time.time()
         service_model.Service.update_last_seen(self.nb_api,
                                                'test_host1', 'test_binary')
-        self.nb_api.update.assert_called_once()
-        update_call_args = self.nb_api.update.call_args_list[0]
-        updated_service = update_call_args[0][0]
-        self.assertLessEqual(now, updated_service.last_seen_up)
-        self.assertTrue(update_call_args[1]['skip_send_event'])
+        service_id = service_model.generate_service_id('test_host1',
+                                                       'test_binary')
+        self.nb_api.heartbeat.assert_called_once_with(
+            service_model.Service(id=service_id),
+            cfg.CONF.df.service_down_time)
+        self.nb_api.get.assert_not_called()
+        self.nb_api.update.assert_not_called()
 
     def test_is_alive(self):
-        s = service_model.Service(chassis='test_host1', binary='test_binary')
-        timeout = cfg.CONF.df.service_down_time
-        s.last_seen_up = 3 * timeout
-        self.nb_api.get.return_value = s
-        with mock.patch.object(time, 'time') as t:
-            t.return_value = 3.5 * timeout
-            self.assertTrue(service_model.Service.is_alive(
-                self.nb_api, 'test_host1', 'test_binary'))
-            t.return_value = 5 * timeout
-            self.assertFalse(service_model.Service.is_alive(
-                self.nb_api, 'test_host1', 'test_binary'))
+        self.nb_api.get_heartbeat.return_value = time.time()
+        self.assertTrue(service_model.Service.is_alive(
+            self.nb_api, 'test_host1', 'test_binary'))
+        self.nb_api.get_heartbeat.return_value = None
+        self.assertFalse(service_model.Service.is_alive(
+            self.nb_api, 'test_host1', 'test_binary'))
+        self.nb_api.get.assert_not_called()
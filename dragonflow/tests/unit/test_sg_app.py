@@ -17,7 +17,9 @@ import mock
 import netaddr
 from neutron.agent.common import utils
 from neutron_lib import constants as n_const
+from oslo_config import cfg
 
+from dragonflow.common import metrics
 from dragonflow.db.models import l2
 from dragonflow.db.models import secgroups
 from dragonflow.tests.unit import test_app_base
@@ -37,6 +39,11 @@ class TestSGApp(test_app_base.DFAppTestBase):
         self.fake_local_lport = test_app_base.fake_local_port1
         self.fake_remote_lport = test_app_base.fake_remote_port1
         self.mock_execute = utils.execute
+        cfg.CONF.set_override('conntrack_driver', 'conntrack_cli',
+                              group='df_sg_app')
+        self.addCleanup(cfg.CONF.clear_override, 'conntrack_driver',
+                        group='df_sg_app')
+        self.addCleanup(self.app._conntrack_flusher.stop)
 
         self.datapath.ofproto.OFPFC_ADD = COMMAND_ADD
         self.datapath.ofproto.OFPFC_MODIFY = COMMAND_ADD
@@ -155,20 +162,23 @@ class TestSGApp(test_app_base.DFAppTestBase):
         # add flows:
         # 1. a flow in ingress conntrack table (ipv4)
         # 2. a flow in ingress conntrack table (ipv6)
-        # 3. a associating flow (conjunction) in ingress secgroup table (ipv4)
-        # 4. a associating flow (conjunction) in ingress secgroup table (ipv6)
-        # 5. a flow in egress conntrack table (ipv4)
-        # 6. a flow in egress conntrack table (ipv6)
-        # 7. a associating flow (conjunction) in egress secgroup table (ipv4)
-        # 8. a associating flow (conjunction) in egress secgroup table (ipv6)
-        # 9. a ingress rule flow (ipv4) in ingress secgroup table
-        # 10. a ingress rule flow (ipv6) in ingress secgroup table
-        # 11. the permit flow in ingress secgroup table
-        # 12. a egress rule flow (ipv4) in egress secgroup table
-        # 13. a egress rule flow (ipv6) in egress secgroup table
-        # 14. the permit flow in egress secgroup table
+        # 3. a associating flow (conjunction) in ingress secgroup table
+        # 4. a flow in egress conntrack table (ipv4)
+        # 5. a flow in egress conntrack table (ipv6)
+        # 6. a associating flow (conjunction) in egress secgroup table
+        # 7-8. the permit flow in ingress secgroup table (ipv4, ipv6)
+        # 9-10. the permit flow in egress secgroup table (ipv4, ipv6)
+        # 11. a egress rule flow (ipv4) in egress secgroup table
+        # 12. a egress rule flow (ipv6) in egress secgroup table
+        # 13-14. the ingress remote group rule flows in ingress secgroup
+        #    table (ipv4, ipv6)
+        # 15-16. the remote group address flows in ingress secgroup table
+        #    (ipv4, ipv6)
+        # 17-18. the remote group permit flows in ingress secgroup table
+        #    (ipv4, ipv6)
+        # 19. the remote group port flow in ingress secgroup table
 
-        self.assertEqual(14, self._get_call_count_of_add_flow())
+        self.assertEqual(19, self._get_call_count_of_add_flow())
         self.mock_mod_flow.reset_mock()
 
         # add local port two
@@ -181,10 +191,12 @@ class TestSGApp(test_app_base.DFAppTestBase):
         # 4. a flow in egress conntrack table (ipv4)
         # 5. a flow in egress conntrack table (ipv6)
         # 6. a associating flow in egress secgroup table
-        # 7-8. a ingress rule flow (caused by IP addresses represent
-        #    remote_group_id changed) in ingress secgroup table
+        # 7. the remote group port flow in ingress secgroup table
+        # 8-9. a remote group address flow (caused by IP addresses represent
+        #    remote_group_id changed) in ingress secgroup table (ipv4, and
+        #    ipv6 aggregated with the address of local port one)
 
-        self.assertEqual(8, self._get_call_count_of_add_flow())
+        self.assertEqual(9, self._get_call_count_of_add_flow())
         self.mock_mod_flow.reset_mock()
 
         # remove local port two
@@ -195,11 +207,12 @@ class TestSGApp(test_app_base.DFAppTestBase):
         # 3. a associating flow in ingress secgroup table
         # 4. a flow in egress conntrack table (ipv4)
         # 5. a flow in egress conntrack table (ipv6)
-        # 6. a associating flow in egress secgroup table (ipv4)
-        # 7. a associating flow in egress secgroup table (ipv6)
-        # 8. a ingress rule flow (caused by IP addresses represent
-        #    remote_group_id changed) in ingress secgroup table (ipv4 only)
-        self.assertEqual(8, self._get_call_count_of_del_flow())
+        # 6. a associating flow in egress secgroup table
+        # 7. the remote group port flow in ingress secgroup table
+        # 8-9. a remote group address flow (caused by IP addresses represent
+        #    remote_group_id changed) in ingress secgroup table (ipv4, and
+        #    the aggregated ipv6)
+        self.assertEqual(9, self._get_call_count_of_del_flow())
         self.mock_mod_flow.reset_mock()
         expected_conntrack_cmd1 = self._get_expected_conntrack_cmd(
             ethertype=n_const.IPv4, protocol=n_const.PROTO_NUM_UDP,
@@ -220,6 +233,7 @@ class TestSGApp(test_app_base.DFAppTestBase):
         expected_conntrack_cmd6 = self._get_expected_conntrack_cmd(
             ethertype=n_const.IPv6, protocol=None, nw_src='2222:2222::2',
             nw_dst='2222:2222::3', zone=1)
+        self.app._conntrack_flusher.wait()
         self.mock_execute.assert_has_calls([expected_conntrack_cmd1,
                                             expected_conntrack_cmd2,
                                             expected_conntrack_cmd3,
@@ -232,7 +246,7 @@ class TestSGApp(test_app_base.DFAppTestBase):
         # add remote port after adding a local port
         self.controller.update(self.fake_remote_lport)
         # add flows:
-        # 1. a ingress rule flow (caused by IP addresses represent
+        # 1. a remote group address flow (caused by IP addresses represent
         # remote_group_id changed) in ingress secgroup table
         self.assertEqual(1, self._get_call_count_of_add_flow())
         self.mock_mod_flow.reset_mock()
@@ -240,13 +254,14 @@ class TestSGApp(test_app_base.DFAppTestBase):
         # remove remote port after adding a local port
         self.controller.delete(self.fake_remote_lport)
         # remove flows:
-        # 1. a ingress rule flow (caused by IP addresses represent
+        # 1. a remote group address flow (caused by IP addresses represent
         # remote_group_id changed) in ingress secgroup table
         self.assertEqual(1, self._get_call_count_of_del_flow())
         self.mock_mod_flow.reset_mock()
         expected_conntrack_cmd1 = self._get_expected_conntrack_cmd(
             ethertype=n_const.IPv4, protocol=None, nw_src='10.0.0.8',
             nw_dst='10.0.0.6', zone=1)
+        self.app._conntrack_flusher.wait()
         self.mock_execute.assert_has_calls([expected_conntrack_cmd1],
                                            any_order=True)
         self.mock_execute.reset_mock()
@@ -256,22 +271,23 @@ class TestSGApp(test_app_base.DFAppTestBase):
         # remove flows:
         # 1. a flow in ingress conntrack table (ipv4)
         # 2. a flow in ingress conntrack table(ipv6)
-        # 3. a associating flow (conjunction) in ingress secgroup table (ipv4)
-        # 4. a associating flow (conjunction) in ingress secgroup table (ipv6)
-        # 5. a flow in egress conntrack table (ipv4)
-        # 6. a flow in egress conntrack table (ipv6)
-        # 7. a associating flow in egress secgroup table (ipv4)
-        # 8. a associating flow in egress secgroup table (ipv6)
-        # 9. a ingress rule flow (caused by IP addresses represent
-        #    remote_group_id changed) in ingress secgroup table
-        # 10-11. ingress rules deleted by cookie in ingress secgroup table
+        # 3. a associating flow (conjunction) in ingress secgroup table
+        # 4. a flow in egress conntrack table (ipv4)
+        # 5. a flow in egress conntrack table (ipv6)
+        # 6. a associating flow in egress secgroup table
+        # 7. the remote group port flow in ingress secgroup table
+        # 8-9. the remote group address flows (caused by IP addresses
+        #    represent remote_group_id changed) in ingress secgroup table
         #    (ipv4, ipv6)
-        # 12-13. egress rules deleted by cookie in egress secgroup table (ipv4,
+        # 10-11. the permit flow in ingress secgroup table (ipv4, ipv6)
+        # 12-13. the permit flow in egress secgroup table (ipv4, ipv6)
+        # 14-15. egress rules deleted by cookie in egress secgroup table (ipv4,
         #    ipv6)
-        # 14. the permit flow (ipv4) in ingress secgroup table
-        # 15. the permit flow (ipv6) in ingress secgroup table
-        # 16. the permit flow in egress secgroup table
-        self.assertEqual(16, self._get_call_count_of_del_flow())
+        # 16-17. the ingress remote group rule flows in ingress secgroup
+        #    table (ipv4, ipv6)
+        # 18-19. the remote group permit flows in ingress secgroup table
+        #    (ipv4, ipv6)
+        self.assertEqual(19, self._get_call_count_of_del_flow())
         self.mock_mod_flow.reset_mock()
         expected_conntrack_cmd1 = self._get_expected_conntrack_cmd(
             ethertype=n_const.IPv4, protocol=n_const.PROTO_NUM_UDP,
@@ -285,6 +301,7 @@ class TestSGApp(test_app_base.DFAppTestBase):
         expected_conntrack_cmd4 = self._get_expected_conntrack_cmd(
             ethertype=n_const.IPv6, protocol=None, nw_src=None,
             nw_dst='2222:2222::3', zone=1)
+        self.app._conntrack_flusher.wait()
         self.mock_execute.assert_has_calls([expected_conntrack_cmd1,
                                             expected_conntrack_cmd2,
                                             expected_conntrack_cmd3,
@@ -317,24 +334,30 @@ class TestSGApp(test_app_base.DFAppTestBase):
         fake_local_lport.version = fake_local_lport_version
         self.controller.update(fake_local_lport)
         # add flows:
-        # 1. a associating flow (conjunction) in ingress secgroup table (ipv4)
-        # 2. a associating flow (conjunction) in ingress secgroup table (ipv6)
-        # 3. a associating flow in egress secgroup table (ipv4)
-        # 4. a associating flow in egress secgroup table (ipv6)
-        # 5. a ingress rule flow in ingress secgroup table
-        # 6. the permit flow in ingress secgroup table (new ipv6 rule)
-        # 7. a egress rule flow in egress secgroup table
-        # 8. the permit flow in egress secgroup table (new ipv6 rule)
+        # 1-2. the permit flow in ingress secgroup table (ipv4, ipv6)
+        # 3-4. the permit flow in egress secgroup table (ipv4, ipv6)
+        # 5. a egress rule flow in egress secgroup table
+        # 6. the ingress remote group rule flow in ingress secgroup table
+        # 7. the remote group address flow in ingress secgroup table (ipv6)
+        # 8. the remote group permit flow in ingress secgroup table (ipv6)
+        # 9. a associating flow in ingress secgroup table
+        # 10. a associating flow in egress secgroup table
+        # 11. the remote group port flow in ingress secgroup table
+        # 12-14. the port flow, the ipv6 address flow and the ipv6 rule flow
+        #    of the remote group rules, shared with the old security group,
+        #    modified to remove its conjunction
         # remove flows:
-        # 1-2. a associating flow in ingress secgroup table (ipv4, ipv6)
-        # 3-4. a associating flow in egress secgroup table (ipv4, ipv6)
-        # 5-6. a ingress rule flow (caused by IP addresses represent
-        #    remote_group_id changed) in ingress secgroup table (ipv4, ipv6)
-        # 7-8. ingress rules deleted by cookie in ingress secgroup table
-        # 9-10. egress rules deleted by cookie in egress secgroup table
-        # 11. the permit flow in ingress secgroup table
-        # 12. the permit flow in egress secgroup table
-        self.assertEqual(8, self._get_call_count_of_add_flow())
+        # 1. a associating flow in ingress secgroup table
+        # 2. a associating flow in egress secgroup table
+        # 3. the remote group address flow (caused by IP addresses represent
+        #    remote_group_id changed) in ingress secgroup table (ipv4)
+        # 4-5. the permit flow in ingress secgroup table (ipv4, ipv6)
+        # 6-7. the permit flow in egress secgroup table (ipv4, ipv6)
+        # 8-9. egress rules deleted by cookie in egress secgroup table
+        # 10-11. the ipv4 remote group rule and permit flows in ingress
+        #    secgroup table
+        # 12. the ipv6 remote group permit flow in ingress secgroup table
+        self.assertEqual(14, self._get_call_count_of_add_flow())
         self.assertEqual(12, self._get_call_count_of_del_flow())
         self.mock_mod_flow.reset_mock()
         expected_conntrack_cmd1 = self._get_expected_conntrack_cmd(
@@ -343,6 +366,7 @@ class TestSGApp(test_app_base.DFAppTestBase):
         expected_conntrack_cmd2 = self._get_expected_conntrack_cmd(
             ethertype=n_const.IPv4, protocol=None, nw_src=None,
             nw_dst='10.0.0.10', zone=1)
+        self.app._conntrack_flusher.wait()
         self.mock_execute.assert_has_calls([expected_conntrack_cmd1,
                                             expected_conntrack_cmd2],
                                            any_order=True)
@@ -356,16 +380,18 @@ class TestSGApp(test_app_base.DFAppTestBase):
         self.controller.update(fake_local_lport)
         # remove flows:
         # 1-2. a flow in ingress conntrack table (ipv4, ipv6)
-        # 3-4. a associating flow in ingress secgroup table (ipv4, ipv6)
-        # 5-6. a flow in egress conntrack table (ipv4, ipv6)
-        # 7-8. a associating flow in egress secgroup table (ipv4, ipv6)
-        # 9. a ingress rule flow (caused by IP addresses represent
+        # 3. a associating flow in ingress secgroup table
+        # 4-5. a flow in egress conntrack table (ipv4, ipv6)
+        # 6. a associating flow in egress secgroup table
+        # 7. the remote group port flow in ingress secgroup table
+        # 8. the remote group address flow (caused by IP addresses represent
         #    remote_group_id changed) in ingress secgroup table
-        # 10. ingress rule deleted by cookie in ingress secgroup table
-        # 11. egress rule deleted by cookie in egress secgroup table
-        # 12. the permit flow in ingress secgroup table
-        # 13. the permit flow in egress secgroup table
-        self.assertEqual(13, self._get_call_count_of_del_flow())
+        # 9-10. the permit flow in ingress secgroup table (ipv4, ipv6)
+        # 11-12. the permit flow in egress secgroup table (ipv4, ipv6)
+        # 13. egress rule deleted by cookie in egress secgroup table
+        # 14. the ingress remote group rule flow in ingress secgroup table
+        # 15. the remote group permit flow in ingress secgroup table
+        self.assertEqual(15, self._get_call_count_of_del_flow())
 
         self.mock_mod_flow.reset_mock()
         # Only IPv6 rules were deleted
@@ -376,6 +402,7 @@ class TestSGApp(test_app_base.DFAppTestBase):
             ethertype=n_const.IPv6, protocol=None, nw_src=None,
             nw_dst='2222:2222::2', zone=1)
 
+        self.app._conntrack_flusher.wait()
         self.mock_execute.assert_has_calls([expected_conntrack_cmd1,
                                             expected_conntrack_cmd2],
                                            any_order=True)
@@ -434,6 +461,7 @@ class TestSGApp(test_app_base.DFAppTestBase):
         expected_conntrack_cmd1 = self._get_expected_conntrack_cmd(
             ethertype=n_const.IPv4, protocol=n_const.PROTO_NUM_UDP,
             nw_src='10.0.0.10', nw_dst=None, zone=1)
+        self.app._conntrack_flusher.wait()
         self.mock_execute.assert_has_calls([expected_conntrack_cmd1],
                                            any_order=True)
         self.mock_execute.reset_mock()
@@ -459,17 +487,22 @@ class TestSGApp(test_app_base.DFAppTestBase):
         self.controller.update(fake_local_lport)
         # add flows:
         # 1-2. a flow in ingress conntrack table (ipv4, ipv6
-        # 3-4. a associating flow in ingress secgroup table (ipv4, ipv6)
-        # 5-6. a flow in egress conntrack table (ipv4, ipv6)
-        # 7-8. a associating flow in egress secgroup table (ipv4, ipv6)
-        # 9-10. a ingress rule flow in ingress secgroup table(using fixed ip:
-        #      ipv4, ipv6)
-        # 11. a ingress rule flow in ingress secgroup table(using ip in allowed
-        #    address pairs)
-        # 12. the permit flow in ingress secgroup table
-        # 13-14. a egress rule flow in egress secgroup table (ipv4, ipv6)
-        # 15. the permit flow in egress secgroup table
-        self.assertEqual(15, self._get_call_count_of_add_flow())
+        # 3. a associating flow in ingress secgroup table
+        # 4-5. a flow in egress conntrack table (ipv4, ipv6)
+        # 6. a associating flow in egress secgroup table
+        # 7-8. the permit flow in ingress secgroup table (ipv4, ipv6)
+        # 9-10. the permit flow in egress secgroup table (ipv4, ipv6)
+        # 11-12. a egress rule flow in egress secgroup table (ipv4, ipv6)
+        # 13-14. the ingress remote group rule flows in ingress secgroup
+        #    table (ipv4, ipv6)
+        # 15-16. the remote group address flows in ingress secgroup table
+        #    (using fixed ip: ipv4, ipv6)
+        # 17. the remote group address flow in ingress secgroup table (using
+        #    ip in allowed address pairs)
+        # 18-19. the remote group permit flows in ingress secgroup table
+        #    (ipv4, ipv6)
+        # 20. the remote group port flow in ingress secgroup table
+        self.assertEqual(20, self._get_call_count_of_add_flow())
         self.mock_mod_flow.reset_mock()
 
         # update allowed address pairs of the lport
@@ -482,11 +515,11 @@ class TestSGApp(test_app_base.DFAppTestBase):
         fake_local_lport.version = fake_local_lport_version
         self.controller.update(fake_local_lport)
         # add flows:
-        # 1. a ingress rule flow in ingress secgroup table(using ip in the new
-        #    allowed address pairs)
+        # 1. a remote group address flow in ingress secgroup table(using ip in
+        #    the new allowed address pairs)
         # remove flows:
-        # 1. a ingress rule flow in ingress secgroup table(using ip in the old
-        #    allowed address pairs)
+        # 1. a remote group address flow in ingress secgroup table(using ip in
+        #    the old allowed address pairs)
         self.assertEqual(1, self._get_call_count_of_add_flow())
         self.assertEqual(1, self._get_call_count_of_del_flow())
         self.mock_mod_flow.reset_mock()
@@ -495,20 +528,24 @@ class TestSGApp(test_app_base.DFAppTestBase):
         self.controller.delete(fake_local_lport)
         # remove flows:
         # 1-2. a flow in ingress conntrack table (ipv4, ipv6)
-        # 3-4. a associating flow in ingress secgroup table (ipv4, ipv6)
-        # 5-6. a flow in egress conntrack table (ipv4, ipv6)
-        # 7-8. a associating flow in egress secgroup table (ipv4, ipv6)
-        # 9-10. two ingress rule flow (caused by IP addresses represent
-        #    remote_group_id changed) in ingress secgroup table (fixed ips)
-        # 11. a ingress rule flow (caused by IP addresses represent
+        # 3. a associating flow in ingress secgroup table
+        # 4-5. a flow in egress conntrack table (ipv4, ipv6)
+        # 6. a associating flow in egress secgroup table
+        # 7. the remote group port flow in ingress secgroup table
+        # 8-9. two remote group address flows (caused by IP addresses
+        #    represent remote_group_id changed) in ingress secgroup table
+        #    (fixed ips)
+        # 10. a remote group address flow (caused by IP addresses represent
         #    remote_group_id changed) in ingress secgroup table (allowes pairs)
-        # 12. ingress rules deleted by cookie in ingress secgroup table (ipv4)
-        # 13. ingress rules deleted by cookie in ingress secgroup table (ipv6)
-        # 14. egress rules deleted by cookie in egress secgroup table (ipv4)
-        # 15. egress rules deleted by cookie in egress secgroup table (ipv6)
-        # 16. the permit flow in ingress secgroup table
-        # 17. the permit flow in egress secgroup table
-        self.assertEqual(17, self._get_call_count_of_del_flow())
+        # 11-12. the permit flow in ingress secgroup table (ipv4, ipv6)
+        # 13-14. the permit flow in egress secgroup table (ipv4, ipv6)
+        # 15. egress rules deleted by cookie in egress secgroup table (ipv4)
+        # 16. egress rules deleted by cookie in egress secgroup table (ipv6)
+        # 17-18. the ingress remote group rule flows in ingress secgroup
+        #    table (ipv4, ipv6)
+        # 19-20. the remote group permit flows in ingress secgroup table
+        #    (ipv4, ipv6)
+        self.assertEqual(20, self._get_call_count_of_del_flow())
         self.mock_mod_flow.reset_mock()
 
         # delete fake security group
@@ -550,3 +587,68 @@ class TestSGApp(test_app_base.DFAppTestBase):
         self.assertEqual(new_cidr_set, expected_new_cidr_set)
         self.assertEqual(added_cidr, expected_added_cidr)
         self.assertEqual(deleted_cidr, expected_deleted_cidr)
+
+    def _bind_ports(self, lports):
+        self.mock_mod_flow.reset_mock()
+        for lport in lports:
+            self.controller.update(lport)
+        return self.mock_mod_flow.call_count
+
+    def test_bind_ports_in_nb_sync(self):
+        fake_remote_lport = test_app_base.make_fake_remote_port(
+            id='fake_remote_port2',
+            ips=['10.0.0.7'],
+            unique_key=6,
+            subnets=['fake_subnet1'])
+        lports = [self.fake_local_lport, self._get_another_local_lport(),
+                  fake_remote_lport]
+        self.controller.update(self.security_group)
+        mod_flow_count = self._bind_ports(lports)
+        expected_flows = self.app._sg_compiler.get_flows()
+        for lport in lports:
+            self.controller.delete(lport)
+        self.assertEqual({}, self.app._sg_compiler.get_flows())
+
+        self.app.nb_sync_started()
+        self._bind_ports(lports)
+        self.mock_mod_flow.assert_not_called()
+        self.app.nb_sync_finished()
+
+        self.assertEqual(expected_flows, self.app._sg_compiler.get_flows())
+        self.assertEqual(
+            netaddr.IPSet(['10.0.0.6/31', '10.0.0.10', '2222:2222::2',
+                           '2222:2222::3']),
+            self.app.secgroup_aggregate_addresses['fake_security_group_id1'])
+        self.assertEqual(
+            ['fake_port1', 'fake_port2'],
+            self.app.secgroup_associate_local_ports['fake_security_group_id1'])
+        # The address flows of 10.0.0.6/32 and 2222:2222::3/128 are neither
+        # installed nor replaced by the flows of their aggregates
+        self.assertEqual(mod_flow_count - 4, self.mock_mod_flow.call_count)
+
+        # Ports bound after the sync are applied at once
+        self.controller.delete(self.fake_local_lport)
+        self.mock_mod_flow.reset_mock()
+        self.controller.update(self.fake_local_lport)
+        self.mock_mod_flow.assert_called()
+
+    def test_rule_flow_counts(self):
+        self.controller.update(self.security_group)
+        self.controller.update(self.fake_local_lport)
+        # 1-2. a egress rule flow in egress secgroup table (ipv4, ipv6)
+        # 3-4. the ingress remote group rule flows (ipv4, ipv6)
+        # 5-6. the remote group address flows (ipv4, ipv6)
+        # 7-8. the remote group permit flows (ipv4, ipv6)
+        # 9. the remote group port flow
+        flow_counts = metrics.REGISTRY.get('df_sg_rule_flows')
+        self.assertEqual({('fake_security_group_id1',): 9},
+                         flow_counts.func())
+
+        # The address of the remote port is added to the address flows
+        self.controller.update(self.fake_remote_lport)
+        self.assertEqual({('fake_security_group_id1',): 10},
+                         flow_counts.func())
+
+        self.controller.delete(self.fake_remote_lport)
+        self.controller.delete(self.fake_local_lport)
+        self.assertEqual({}, flow_counts.func())
@@ -0,0 +1,156 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import netaddr
+from neutron_lib import constants as n_const
+from os_ken.ofproto import ether
+
+from dragonflow.controller.common import sg_compiler
+from dragonflow.db.models import secgroups
+from dragonflow.tests import base as tests_base
+
+
+def _make_rule(rule_id, remote_group_id, port=None,
+               ethertype=n_const.IPv4, direction='ingress'):
+    return secgroups.SecurityGroupRule(
+        id=rule_id,
+        direction=direction,
+        ethertype=ethertype,
+        protocol=n_const.PROTO_NUM_TCP,
+        port_range_min=port,
+        port_range_max=port,
+        remote_group_id=remote_group_id,
+        security_group_id='sg1',
+        topic='fake_tenant1',
+    )
+
+
+def _get_matches(rule):
+    eth_type = ether.ETH_TYPE_IP if rule.ethertype == n_const.IPv4 else \
+        ether.ETH_TYPE_IPV6
+    return [{'eth_type': eth_type, 'ip_proto': rule.protocol,
+             'tcp_dst': rule.port_range_min}]
+
+
+def _address_match(cidr):
+    cidr = netaddr.IPNetwork(cidr)
+    return (('eth_type', ether.ETH_TYPE_IP),
+            ('ipv4_src', (int(cidr.network), int(cidr.netmask))))
+
+
+class TestSecurityGroupCompiler(tests_base.BaseTestCase):
+    def setUp(self):
+        super(TestSecurityGroupCompiler, self).setUp()
+        self.compiler = sg_compiler.SecurityGroupCompiler()
+        self.addresses = netaddr.IPSet()
+
+    def _add_rule(self, secgroup_id, rule):
+        return self.compiler.add_rule(secgroup_id, rule, _get_matches(rule))
+
+    def _add_addresses(self, remote_group_id, addresses):
+        old_cidrs = set(self.addresses.iter_cidrs())
+        self.addresses = self.addresses | netaddr.IPSet(addresses)
+        new_cidrs = set(self.addresses.iter_cidrs())
+        return self.compiler.update_addresses(
+            remote_group_id, self.addresses, new_cidrs - old_cidrs,
+            old_cidrs - new_cidrs)
+
+    def _get_address_flows(self):
+        return {flow.match: actions
+                for flow, actions in self.compiler.get_flows().items()
+                if flow.match[-1][0] == 'ipv4_src'}
+
+    def test_rules_share_address_flows(self):
+        self._add_addresses('sg2', ['10.0.0.1', '10.0.0.3', '10.0.0.5'])
+        self.compiler.add_port('sg1', 7)
+        self._add_rule('sg1', _make_rule('rule1', 'sg2', port=22))
+        self._add_rule('sg1', _make_rule('rule2', 'sg2', port=80))
+        conj_id = self.compiler.get_conj_id('sg1', 'sg2')
+
+        address_flows = self._get_address_flows()
+        self.assertEqual(3, len(address_flows))
+        for actions in address_flows.values():
+            self.assertEqual(
+                frozenset([sg_compiler.Conjunction(conj_id, 2)]), actions)
+        # Port flow, 2 rule flows, 3 address flows and the permit flow
+        self.assertEqual({'sg1': 7}, self.compiler.get_flow_counts())
+
+    def test_security_groups_share_address_flows(self):
+        self._add_addresses('sg3', ['10.0.0.1'])
+        self._add_rule('sg1', _make_rule('rule1', 'sg3', port=22))
+        changes = self._add_rule('sg2', _make_rule('rule2', 'sg3', port=22))
+        conj_ids = [self.compiler.get_conj_id('sg1', 'sg3'),
+                    self.compiler.get_conj_id('sg2', 'sg3')]
+        self.assertNotEqual(conj_ids[0], conj_ids[1])
+
+        # The rule flow and the address flow are modified, and a permit flow
+        # is added
+        self.assertEqual(3, len(changes))
+        self.assertEqual(
+            frozenset(sg_compiler.Conjunction(conj_id, 2)
+                      for conj_id in conj_ids),
+            self._get_address_flows()[_address_match('10.0.0.1')])
+
+        changes = self.compiler.remove_rule('sg2', _make_rule('rule2', 'sg3'))
+        self.assertEqual(3, len(changes))
+        self.assertEqual(
+            frozenset([sg_compiler.Conjunction(conj_ids[0], 2)]),
+            self._get_address_flows()[_address_match('10.0.0.1')])
+        self.assertIsNone(self.compiler.get_conj_id('sg2', 'sg3'))
+
+    def test_address_changes(self):
+        self._add_rule('sg1', _make_rule('rule1', 'sg2', port=22))
+        self._add_rule('sg1', _make_rule('rule2', 'sg2', port=80))
+        changes = self._add_addresses('sg2', ['10.0.0.6'])
+        self.assertEqual([_address_match('10.0.0.6/32')],
+                         [change.match for change in changes])
+
+        # The aggregate replaces the address, and is added first
+        changes = self._add_addresses('sg2', ['10.0.0.7'])
+        self.assertEqual(
+            [(_address_match('10.0.0.6/31'), True),
+             (_address_match('10.0.0.6/32'), False)],
+            [(change.match, bool(change.actions)) for change in changes])
+
+        # IPv6 addresses are not matched by IPv4 rules
+        self.assertEqual([], self._add_addresses('sg2', ['fd00::1']))
+
+    def test_ports(self):
+        self._add_rule('sg1', _make_rule('rule1', 'sg2', port=22))
+        self._add_rule('sg1', _make_rule('rule2', 'sg2', port=22,
+                                         direction='egress'))
+        changes = self.compiler.add_port('sg1', 7)
+        self.assertEqual(['egress', 'ingress'],
+                         sorted(change.direction for change in changes))
+        self.assertEqual([], self.compiler.add_port('sg3', 7))
+
+        changes = self.compiler.remove_port('sg1', 7)
+        self.assertEqual(2, len(changes))
+        self.assertFalse(any(change.actions for change in changes))
+        self.assertEqual([], self.compiler.remove_port('sg1', 7))
+
+    def test_remove_rules(self):
+        self._add_addresses('sg2', ['10.0.0.1'])
+        self.compiler.add_port('sg1', 7)
+        rule = _make_rule('rule1', 'sg2', port=22)
+        self._add_rule('sg1', rule)
+        conj_id = self.compiler.get_conj_id('sg1', 'sg2')
+
+        changes = self.compiler.remove_rule('sg1', rule)
+        self.assertEqual(4, len(changes))
+        self.assertFalse(any(change.actions for change in changes))
+        self.assertEqual({}, self.compiler.get_flows())
+        self.assertEqual({}, self.compiler.get_flow_counts())
+        self.assertEqual([], self.compiler.remove_rule('sg1', rule))
+
+        # The conjunction id is reused
+        self._add_rule('sg3', _make_rule('rule2', 'sg2', port=22))
+        self.assertEqual(conj_id, self.compiler.get_conj_id('sg3', 'sg2'))
@@ -94,6 +94,18 @@ class TestSync(tests_base.BaseTestCase):
         self.sync.sync()
         self._delete.assert_called_once_with(topicless_a)
 
+    @utils.with_local_objects(topicless_a, topic1_a, topic1_b, topic2_c)
+    @utils.with_nb_objects(topicless_a, topic1_a)
+    def test_cleanup_reads_ids(self):
+        self.sync._topics = {'topic1'}
+        with mock.patch.object(self._db_store, 'get_all') as get_all:
+            self.sync.sync()
+        get_all.assert_not_called()
+        self.assertItemsEqual(
+            (mock.call(topic1_b), mock.call(topic2_c)),
+            self._delete.mock_calls,
+        )
+
     @utils.with_local_objects()
     @utils.with_nb_objects(topic1_a, topic1_b, topic1_c)
     def test_only_relevant_topic_pulled(self):
@@ -118,3 +130,119 @@ class TestSync(tests_base.BaseTestCase):
             (mock.call(topic1_c), mock.call(topic2_b)),
             self._delete.mock_calls,
         )
+
+    @utils.with_local_objects()
+    @utils.with_nb_objects(topicless_a, topic1_a, topic2_a)
+    def test_nb_read_once_per_sync(self):
+        self.sync._topics = {'topic1'}
+        self.sync.sync()
+        self.assertItemsEqual(
+            (mock.call(TopiclessModel, None),
+             mock.call(TopicModel1, 'topic1'),
+             mock.call(TopicModel2, 'topic1')),
+            self.nb_api.get_all.mock_calls,
+        )
+
+    @utils.with_local_objects(topicless_a, topic1_a, topic1_c, topic2_a)
+    @utils.with_nb_objects(topic1_b, topic1_c)
+    def test_sync_topic(self):
+        self.sync._topics = {'topic1', 'topic2'}
+        self.sync.sync_topic('topic1')
+        self.assertItemsEqual(
+            (mock.call(TopicModel1, 'topic1'),
+             mock.call(TopicModel2, 'topic1')),
+            self.nb_api.get_all.mock_calls,
+        )
+        self._update.assert_called_once_with(topic1_b)
+        self.assertItemsEqual(
+            (mock.call(topic2_a), mock.call(topic1_a)),
+            self._delete.mock_calls,
+        )
+
+    @utils.with_local_objects()
+    @utils.with_nb_objects(topicless_a)
+    def test_sync_unwatched_topic(self):
+        self.sync.sync_topic('topic1')
+        self._update.assert_called_once_with(topicless_a)
+
+
+class TestIncrementalSync(tests_base.BaseTestCase):
+    def setUp(self):
+        super(TestIncrementalSync, self).setUp()
+        self._db_store = db_store.get_instance()
+        self._db_store.clear()
+
+        self.nb_api = api_nb.NbApi(db_driver=mock.Mock())
+        self.nb_api.publisher = mock.Mock()
+        self.nb_api.enable_selective_topo_dist = True
+        self.revisions = {}
+        self.nb_api.get_revision = mock.Mock(
+            side_effect=lambda model, topic=None: self.revisions.get(model))
+        self._update = mock.Mock(side_effect=self._db_store.update)
+        self._delete = mock.Mock(side_effect=self._db_store.delete)
+        self.sync = sync.Sync(
+            self.nb_api,
+            self._update,
+            self._delete,
+            incremental=True,
+        )
+        self.sync.add_model(TopiclessModel)
+        self.sync.add_model(TopicModel1)
+        self.sync.add_model(TopicModel2)
+        self.sync._topics = {'topic1'}
+
+    @utils.with_local_objects()
+    @utils.with_nb_objects(topicless_a, topic1_a, topic2_a)
+    def test_unchanged_revision_skipped(self):
+        self.revisions = {TopiclessModel: 1, TopicModel1: 1, TopicModel2: 1}
+        self.sync.sync()
+        self.nb_api.get_all.reset_mock()
+        self._update.reset_mock()
+
+        self.sync.sync()
+        self.nb_api.get_all.assert_not_called()
+        self._update.assert_not_called()
+        self._delete.assert_not_called()
+
+    @utils.with_local_objects()
+    @utils.with_nb_objects(topicless_a, topic1_a, topic2_a)
+    def test_changed_revision_pulled(self):
+        self.revisions = {TopiclessModel: 1, TopicModel1: 1, TopicModel2: 1}
+        self.sync.sync()
+        self.nb_api.get_all.reset_mock()
+        self._update.reset_mock()
+
+        self.revisions[TopicModel1] = 2
+        self.sync.sync()
+        self.nb_api.get_all.assert_called_once_with(TopicModel1, 'topic1')
+        self._update.assert_called_once_with(topic1_a)
+
+    @utils.with_local_objects(topicless_a, topicless_b)
+    @utils.with_nb_objects(topicless_b)
+    def test_changed_revision_cleaned_up(self):
+        self.revisions = {TopiclessModel: 1}
+        self.sync._revisions[(TopiclessModel, None)] = 0
+        self.sync.sync()
+        self._delete.assert_called_once_with(topicless_a)
+
+    @utils.with_local_objects()
+    @utils.with_nb_objects(topicless_a)
+    def test_unsupported_revision_pulled(self):
+        self.sync.sync()
+        self.nb_api.get_all.reset_mock()
+
+        self.sync.sync()
+        self.assertIn(mock.call(TopiclessModel, None),
+                      self.nb_api.get_all.mock_calls)
+
+    @utils.with_local_objects()
+    @utils.with_nb_objects(topicless_a)
+    def test_reset(self):
+        self.revisions = {TopiclessModel: 1}
+        self.sync.sync()
+        self.nb_api.get_all.reset_mock()
+
+        self.sync.reset()
+        self.sync.sync()
+        self.assertIn(mock.call(TopiclessModel, None),
+                      self.nb_api.get_all.mock_calls)
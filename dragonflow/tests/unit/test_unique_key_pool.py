@@ -0,0 +1,73 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from dragonflow import conf as cfg
+from dragonflow.db import unique_key_pool
+from dragonflow.tests import base as tests_base
+
+
+class TestUniqueKeyPool(tests_base.BaseTestCase):
+    def setUp(self):
+        super(TestUniqueKeyPool, self).setUp()
+        cfg.CONF.set_override('unique_key_block_size', 3, group='df')
+        self.addCleanup(cfg.CONF.clear_override, 'unique_key_block_size',
+                        group='df')
+        # table -> last allocated key, shared by all the pools
+        self.counters = {}
+        self.pool = self._create_pool()
+        self.atexit = mock.patch.object(unique_key_pool.atexit,
+                                        'register').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _create_pool(self):
+        return unique_key_pool.UniqueKeyPool(self._allocate_block,
+                                             self._release_block)
+
+    def _allocate_block(self, table, count):
+        self.counters[table] = self.counters.get(table, 0) + count
+        return self.counters[table]
+
+    def _release_block(self, table, last, first_unused):
+        if self.counters[table] != last:
+            return False
+        self.counters[table] = first_unused - 1
+        return True
+
+    def test_allocate(self):
+        other_pool = self._create_pool()
+        self.assertEqual([1, 2], [self.pool.allocate('t1') for _ in range(2)])
+        self.assertEqual(4, other_pool.allocate('t1'))
+        self.assertEqual(1, self.pool.allocate('t2'))
+        self.assertEqual([3, 7], [self.pool.allocate('t1') for _ in range(2)])
+        self.assertEqual({'t1': 9, 't2': 3}, self.counters)
+        self.atexit.assert_has_calls([mock.call(self.pool.release),
+                                      mock.call(other_pool.release)],
+                                     any_order=True)
+        self.assertEqual(2, self.atexit.call_count)
+
+    def test_release(self):
+        other_pool = self._create_pool()
+        self.pool.allocate('t1')
+        self.pool.allocate('t2')
+        other_pool.allocate('t2')
+        self.pool.release()
+        # Keys of t2 were allocated by the other pool since
+        self.assertEqual({'t1': 1, 't2': 6}, self.counters)
+        # Released keys are allocated again
+        self.assertEqual(2, self.pool.allocate('t1'))
+
+    def test_block_size_one(self):
+        cfg.CONF.set_override('unique_key_block_size', 1, group='df')
+        self.assertEqual([1, 2], [self.pool.allocate('t1') for _ in range(2)])
+        self.atexit.assert_not_called()
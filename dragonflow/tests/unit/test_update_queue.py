@@ -0,0 +1,103 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from eventlet import queue
+import mock
+
+from dragonflow.controller import update_queue
+from dragonflow.db import db_common
+from dragonflow.tests import base as tests_base
+
+
+class TestCoalescingUpdateQueue(tests_base.BaseTestCase):
+    def setUp(self):
+        super(TestCoalescingUpdateQueue, self).setUp()
+        self.queue = update_queue.CoalescingUpdateQueue()
+        self.timestamp = 0
+
+    def _put(self, table, key, action, value=None, timestamp=None):
+        if timestamp is None:
+            self.timestamp += 1
+            timestamp = self.timestamp
+        update = db_common.DbUpdate(table, key, action, value,
+                                    timestamp=timestamp)
+        self.queue.put(update)
+        return update
+
+    def _get_all(self):
+        updates = []
+        while self.queue.qsize():
+            try:
+                update = self.queue.get(block=False)
+            except queue.Empty:
+                break
+            updates.append((update.table, update.key, update.action,
+                            update.value))
+            self.queue.task_done()
+        self.assertEqual(0, self.queue._queue.unfinished_tasks)
+        return updates
+
+    def test_fold_updates(self):
+        self._put('lport', 'port1', 'create', 'v1')
+        self._put('lswitch', 'switch1', 'set', 'v1')
+        self._put('lport', 'port1', 'set', 'v2')
+        self._put('lport', 'port1', 'set', 'v3')
+        self.assertEqual(
+            [('lswitch', 'switch1', 'set', 'v1'),
+             ('lport', 'port1', 'set', 'v3')],
+            self._get_all(),
+        )
+        self.assertEqual({'lport': 2}, self.queue.folded)
+        self.assertEqual(2, self.queue.get_folded_count())
+
+    def test_delete_after_create(self):
+        self._put('lport', 'port1', 'create', 'v1')
+        self._put('lport', 'port1', 'delete')
+        self.assertEqual([('lport', 'port1', 'delete', None)],
+                         self._get_all())
+
+    def test_create_after_delete(self):
+        self._put('lport', 'port1', 'delete')
+        self._put('lport', 'port1', 'create', 'v1')
+        self._put('lport', 'port1', 'set', 'v2')
+        self.assertEqual(
+            [('lport', 'port1', 'delete', None),
+             ('lport', 'port1', 'set', 'v2')],
+            self._get_all(),
+        )
+        self.assertEqual({'lport': 1}, self.queue.folded)
+
+    def test_no_fold_after_handled(self):
+        self._put('lport', 'port1', 'set', 'v1')
+        self.assertEqual([('lport', 'port1', 'set', 'v1')], self._get_all())
+        self._put('lport', 'port1', 'set', 'v2')
+        self.assertEqual([('lport', 'port1', 'set', 'v2')], self._get_all())
+        self.assertEqual(0, self.queue.get_folded_count())
+
+    def test_controller_events_not_folded(self):
+        self._put(None, None, 'sync')
+        self._put(None, None, 'sync')
+        self.assertEqual([(None, None, 'sync', None)] * 2, self._get_all())
+
+    def test_dependency_order(self):
+        lport_model = mock.Mock(table_name='lport')
+        lswitch_model = mock.Mock(table_name='lswitch')
+        self.queue.set_model_order((lswitch_model, lport_model))
+        self._put('lport', 'port1', 'set', timestamp=1)
+        self._put('lswitch', 'switch1', 'set', timestamp=1)
+        self._put('lport', 'port0', 'set', timestamp=0)
+        self.assertEqual(
+            [('lport', 'port0', 'set', None),
+             ('lswitch', 'switch1', 'set', None),
+             ('lport', 'port1', 'set', None)],
+            self._get_all(),
+        )
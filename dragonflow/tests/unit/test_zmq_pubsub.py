@@ -13,7 +13,9 @@
 #    under the License.
 import mock
 
+from dragonflow.controller.common import constants
 from dragonflow.db import db_common
+from dragonflow.db import pub_sub_api
 from dragonflow.db.pubsub_drivers import zmq_pubsub_driver
 from dragonflow.tests import base as tests_base
 
@@ -79,3 +81,97 @@ class TestZMQPubSub(tests_base.BaseTestCase):
         result = self.ZMQSubscriberAgent.unregister_topic('teststring')
         self.assertNotIn(b'teststring', self.ZMQSubscriberAgent.topic_list)
         self.assertIsNone(result)
+
+    def test_handle_batch_event(self):
+        update1 = db_common.DbUpdate('router', 'key1', 'create', 'value1',
+                                     topic='teststring')
+        update2 = db_common.DbUpdate('router', 'key2', 'delete', None,
+                                     topic='teststring')
+        batch = db_common.DbUpdate(None, None, db_common.BATCH_ACTION,
+                                   [update1.to_dict(), update2.to_dict()],
+                                   topic='teststring')
+        self.ZMQSubscriberAgent.db_changes_callback = mock.Mock()
+        with mock.patch.object(pub_sub_api, 'unpack_message',
+                               return_value=batch.to_dict()):
+            self.ZMQSubscriberAgent._handle_incoming_event(mock.sentinel.data)
+        self.ZMQSubscriberAgent.db_changes_callback.assert_has_calls([
+            mock.call('router', 'key1', 'create', 'value1', 'teststring'),
+            mock.call('router', 'key2', 'delete', None, 'teststring'),
+        ])
+        self.assertEqual(
+            2, self.ZMQSubscriberAgent.db_changes_callback.call_count)
+
+    def test_publish_sequence_numbers(self):
+        update = db_common.DbUpdate('router', 'key', 'create', 'value')
+        with mock.patch.object(pub_sub_api, 'pack_message') as pack_message:
+            for topic in ('topic1', 'topic1', 'topic2'):
+                self.ZMQPublisherAgent.send_event(update, topic)
+        sequences = [call[0][0]['sequence']
+                     for call in pack_message.call_args_list]
+        self.assertEqual(
+            [('topic1', 1), ('topic1', 2), ('topic2', 1)],
+            [(seq['topic'], seq['number']) for seq in sequences])
+        self.assertEqual(1, len({seq['publisher'] for seq in sequences}))
+
+    def _receive(self, publisher, topic, number):
+        message = db_common.DbUpdate('router', 'key', 'create', 'value',
+                                     topic=topic).to_dict()
+        message['sequence'] = {'publisher': publisher, 'topic': topic,
+                               'number': number}
+        with mock.patch.object(pub_sub_api, 'unpack_message',
+                               return_value=message):
+            self.ZMQSubscriberAgent._handle_incoming_event(mock.sentinel.data)
+
+    def test_sequence_gap_resyncs_topic(self):
+        callback = mock.Mock()
+        self.ZMQSubscriberAgent.db_changes_callback = callback
+        self._receive('publisher1', 'topic1', 5)
+        self._receive('publisher1', 'topic1', 6)
+        self._receive('publisher2', 'topic1', 1)
+        self._receive('publisher1', 'topic2', 3)
+        # Late message
+        self._receive('publisher1', 'topic1', 4)
+        self.assertEqual(5, callback.call_count)
+
+        self._receive('publisher1', 'topic1', 9)
+        callback.assert_called_with(None, None,
+                                    constants.CONTROLLER_SYNC_TOPIC, None,
+                                    'topic1')
+        self._receive('publisher1', db_common.SEND_ALL_TOPIC, 1)
+        self._receive('publisher1', db_common.SEND_ALL_TOPIC, 3)
+        callback.assert_called_with(None, None, constants.CONTROLLER_SYNC,
+                                    None, None)
+        self.assertEqual(10, callback.call_count)
+
+    def test_unregister_topic_drops_sequence(self):
+        callback = mock.Mock()
+        self.ZMQSubscriberAgent.db_changes_callback = callback
+        self.ZMQSubscriberAgent.sub_socket = None
+        self.ZMQSubscriberAgent.register_topic('topic1')
+        self.ZMQSubscriberAgent.register_topic('topic2')
+        self._receive('publisher1', 'topic1', 5)
+        self._receive('publisher1', 'topic2', 5)
+
+        self.ZMQSubscriberAgent.unregister_topic('topic1')
+        self.assertNotIn('topic1', self.ZMQSubscriberAgent._sequence_numbers)
+        self.assertIn('topic2', self.ZMQSubscriberAgent._sequence_numbers)
+
+        # Messages sent while the topic was not registered are not lost
+        self.ZMQSubscriberAgent.register_topic('topic1')
+        self._receive('publisher1', 'topic1', 9)
+        self.assertEqual(3, callback.call_count)
+        self.assertNotIn(
+            mock.call(None, None, constants.CONTROLLER_SYNC_TOPIC, None,
+                      'topic1'),
+            callback.mock_calls)
+
+    def test_compress_message(self):
+        small = b'\x81\xa5table\xa6router'
+        self.assertEqual(small, pub_sub_api.compress_message(small, 'zlib'))
+
+        data = small * 100
+        self.assertEqual(data, pub_sub_api.compress_message(data, None))
+        compressed = pub_sub_api.compress_message(data, 'zlib')
+        self.assertLess(len(compressed), len(data))
+        self.assertEqual(data, pub_sub_api._decompress_message(compressed))
+        self.assertEqual(small, pub_sub_api._decompress_message(small))
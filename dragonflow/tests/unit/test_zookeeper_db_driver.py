@@ -0,0 +1,164 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import kazoo
+import mock
+
+from dragonflow.common import exceptions as df_exceptions
+from dragonflow.db.drivers import zookeeper_db_driver
+from dragonflow.tests import base as tests_base
+
+
+class _FakeAsyncResult(object):
+    def __init__(self, client, value=None, exception=None):
+        self._client = client
+        self._value = value
+        self._exception = exception
+        client.pending += 1
+        client.max_pending = max(client.max_pending, client.pending)
+
+    def get(self):
+        self._client.pending -= 1
+        if self._exception is not None:
+            raise self._exception
+        return self._value
+
+
+class _FakeTransaction(object):
+    def __init__(self, client):
+        self._client = client
+        self._operations = []
+
+    def create(self, path, value):
+        self._operations.append((self._client.create, path, value))
+
+    def delete(self, path):
+        self._operations.append((self._client.delete, path))
+
+    def commit(self):
+        for operation in self._operations:
+            operation[0](*operation[1:])
+        return [True] * len(self._operations)
+
+
+class _FakeKazooClient(object):
+    '''Keeps the nodes in a dict of path to value'''
+    def __init__(self):
+        self.nodes = {}
+        self.pending = 0
+        self.max_pending = 0
+
+    def _get_children(self, path):
+        prefix = path + '/'
+        return [node[len(prefix):] for node in self.nodes
+                if node.startswith(prefix) and '/' not in node[len(prefix):]]
+
+    def ensure_path(self, path):
+        while path and path not in self.nodes:
+            self.nodes[path] = b''
+            path = path.rsplit('/', 1)[0]
+
+    def create(self, path, value, makepath=False):
+        if makepath:
+            self.ensure_path(path.rsplit('/', 1)[0])
+        self.nodes[path] = value
+
+    def delete(self, path, recursive=False):
+        if path not in self.nodes:
+            raise kazoo.exceptions.NoNodeError()
+        for node in list(self.nodes):
+            if node == path or (recursive and node.startswith(path + '/')):
+                del self.nodes[node]
+
+    def exists(self, path):
+        return path in self.nodes or None
+
+    def exists_async(self, path):
+        return _FakeAsyncResult(self, value=self.exists(path))
+
+    def get_async(self, path):
+        if path not in self.nodes:
+            return _FakeAsyncResult(
+                self, exception=kazoo.exceptions.NoNodeError())
+        return _FakeAsyncResult(self, value=(self.nodes[path], None))
+
+    def get_children(self, path):
+        if path not in self.nodes:
+            raise kazoo.exceptions.NoNodeError()
+        return self._get_children(path)
+
+    def transaction(self):
+        return _FakeTransaction(self)
+
+
+class TestZookeeperDbDriver(tests_base.BaseTestCase):
+    def setUp(self):
+        super(TestZookeeperDbDriver, self).setUp()
+        self.driver = zookeeper_db_driver.ZookeeperDbDriver()
+        self.driver.config = mock.Mock(zookeeper_max_concurrent_reads=2,
+                                       zookeeper_topic_index=True)
+        self.client = _FakeKazooClient()
+        self.driver.client = self.client
+        self.driver.create_table('lport')
+
+    def _create_keys(self, count, topic):
+        for i in range(count):
+            self.driver.create_key('lport', '{}{}'.format(topic, i),
+                                   '{}-value{}'.format(topic, i), topic)
+
+    def test_get_all_entries_bounded_concurrency(self):
+        self._create_keys(5, 'topic1')
+        self.assertItemsEqual(
+            ['topic1-value{}'.format(i) for i in range(5)],
+            self.driver.get_all_entries('lport'))
+        self.assertEqual(2, self.client.max_pending)
+        self.assertEqual(0, self.client.pending)
+
+    def test_get_keys(self):
+        self._create_keys(3, 'topic1')
+        self.assertEqual(
+            ['topic1-value2', None, 'topic1-value0'],
+            self.driver.get_keys('lport', ['topic12', 'missing', 'topic10']))
+
+    def test_get_all_entries_by_topic(self):
+        self._create_keys(2, 'topic1')
+        self._create_keys(3, 'topic2')
+        self.assertItemsEqual(['topic1-value0', 'topic1-value1'],
+                              self.driver.get_all_entries('lport', 'topic1'))
+        self.assertEqual([], self.driver.get_all_entries('lport', 'topic3'))
+        self.assertEqual(5, len(self.driver.get_all_entries('lport')))
+
+    def test_get_all_entries_without_index(self):
+        self.driver.config.zookeeper_topic_index = False
+        self._create_keys(2, 'topic1')
+        self._create_keys(1, 'topic2')
+        self.assertEqual(3, len(self.driver.get_all_entries('lport',
+                                                            'topic1')))
+        self.assertNotIn(zookeeper_db_driver.TOPIC_INDEX_NS,
+                         self.client.nodes)
+
+    def test_delete_key(self):
+        self._create_keys(2, 'topic1')
+        self.driver.delete_key('lport', 'topic10', 'topic1')
+        # Topic looked up in the index
+        self.driver.delete_key('lport', 'topic11')
+        self.assertEqual([], self.driver.get_all_entries('lport', 'topic1'))
+        self.assertEqual([], self.driver.get_all_entries('lport'))
+        self.assertRaises(df_exceptions.DBKeyNotFound,
+                          self.driver.delete_key, 'lport', 'topic11')
+
+    def test_delete_table(self):
+        self._create_keys(1, 'topic1')
+        self.driver.delete_table('lport')
+        self.assertEqual(
+            {zookeeper_db_driver.ROOT_NS, zookeeper_db_driver.TOPIC_INDEX_NS},
+            set(self.client.nodes))